@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""Benchmark the chunk-aligned read planner against the direct reading.
+
+A chunked (and optionally compressed) vis-like dataset is written to a
+temporary file, then a frequency and baseline selection of it distributed
+along the baseline axis is read by
+
+  * direct: each process reads its own selection with fancy indexing after the
+    lists have been converted by `_to_slice_obj` (the default loading);
+  * planner: each process reads its own selection by the read planner;
+  * node: one process reads the union of the selections of all processes and
+    hands out the pieces (run with mpiexec for a real scatter).
+
+Usage:   python bench_read_planner.py [-h] [--shape NT NF NBL] [--chunks CT CF CB] [--nproc N] [--compression C]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import h5py
+from caput import mpiutil
+from tlpipe.container import read_planner
+from tlpipe.container.container import _to_slice_obj
+
+
+def direct_read(dset, sel):
+    sel = [ ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in sel ]
+    return dset[tuple(sel)]
+
+
+def planner_read(dset, sel):
+    plan = read_planner.ReadPlan(dset.shape, sel, dset.chunks)
+    return plan.extract(plan.read(dset)), plan.num_reads
+
+
+def main(args):
+    comm = mpiutil.world
+    rank = 0 if comm is None else comm.rank
+    size = 1 if comm is None else comm.size
+    nt, nf, nbl = args.shape
+
+    tmp_dir = None
+    if rank == 0:
+        tmp_dir = tempfile.mkdtemp(prefix='bench_read_planner')
+        filename = os.path.join(tmp_dir, 'data.hdf5')
+        with h5py.File(filename, 'w') as f:
+            dset = f.create_dataset('vis', shape=(nt, nf, nbl), dtype=np.complex64, chunks=tuple(args.chunks), compression=args.compression)
+            for ti in xrange(0, nt, args.chunks[0]):
+                te = min(ti + args.chunks[0], nt)
+                dset[ti:te] = (np.random.randn(te-ti, nf, nbl) + 1.0J * np.random.randn(te-ti, nf, nbl)).astype(np.complex64)
+    filename = mpiutil.bcast(None if tmp_dir is None else os.path.join(tmp_dir, 'data.hdf5'), root=0, comm=comm)
+
+    # select every other frequency and some irregular baselines
+    fsel = range(0, nf, 2)
+    bsel = sorted(set(range(0, nbl, 3) + range(0, nbl, 5)))
+
+    with h5py.File(filename, 'r') as f:
+        dset = f['vis']
+
+        # simulate args.nproc processes if not run with MPI
+        nsim = args.nproc if size == 1 else 1
+        sels = []
+        for ri in xrange(nsim):
+            if size == 1:
+                lbsel = bsel[ri*len(bsel)/nsim:(ri+1)*len(bsel)/nsim]
+            else:
+                lbsel = mpiutil.mpilist(bsel, comm=comm)
+            sels.append([ slice(0, None), fsel, lbsel ])
+
+        t0 = time.time()
+        d0 = [ direct_read(dset, sel) for sel in sels ]
+        t_direct = time.time() - t0
+
+        t0 = time.time()
+        d1 = []
+        num_reads = 0
+        for sel in sels:
+            d, nr = planner_read(dset, sel)
+            d1.append(d)
+            num_reads += nr
+        t_planner = time.time() - t0
+
+        t0 = time.time()
+        if size == 1:
+            # one process reads the union and splits it
+            plan = read_planner.ReadPlan(dset.shape, [ slice(0, None), fsel, bsel ], dset.chunks)
+            buf = plan.read(dset)
+            d2 = [ np.ascontiguousarray(plan.extract(buf, sel[2], 2)) for sel in sels ]
+        else:
+            ncomm = read_planner.node_comm(comm)
+            out = np.empty(d0[0].shape, dtype=dset.dtype)
+            read_planner.node_read(dset, sels[0], 2, out, [ slice(0, None) ], comm=ncomm)
+            d2 = [ out ]
+        t_node = time.time() - t0
+
+    for a, b, c in zip(d0, d1, d2):
+        assert np.array_equal(a, b) and np.array_equal(a, c), 'Read data differ'
+
+    mpiutil.barrier(comm=comm)
+    if rank == 0:
+        print 'shape = %s, chunks = %s, compression = %s, %d procs' % (tuple(args.shape), tuple(args.chunks), args.compression, max(size, nsim))
+        print 'direct:  %8.3f s' % t_direct
+        print 'planner: %8.3f s (%d hyperslab reads)' % (t_planner, num_reads)
+        print 'node:    %8.3f s' % t_node
+        shutil.rmtree(tmp_dir)
+
+
+parser = argparse.ArgumentParser(description='Benchmark the chunk-aligned read planner.')
+parser.add_argument('--shape', type=int, nargs=3, default=[512, 256, 2016], help='Shape of the dataset.')
+parser.add_argument('--chunks', type=int, nargs=3, default=[16, 64, 256], help='Chunk shape of the dataset.')
+parser.add_argument('--nproc', type=int, default=8, help='Number of processes to simulate if not run with MPI.')
+parser.add_argument('--compression', type=str, default=None, help='Compression filter of the dataset, e.g., gzip.')
+
+if __name__ == '__main__':
+    main(parser.parse_args())
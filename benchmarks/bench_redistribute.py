@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""Measure the peak memory of redistributing a distributed array.
+
+A vis-like array distributed along the time axis is redistributed along the
+baseline axis, and the growth of the peak resident memory of each process is
+reported for
+
+  * keep: the caller keeps a reference to the array, so none of it can be
+    released until the redistribution is done;
+  * release: the caller hands over the only reference to the array, so its
+    rows are released as they are sent.
+
+Each case is run in a separate process, as the peak memory only grows. Run it
+with mpiexec, e.g., ``mpiexec -n 4 python bench_redistribute.py release``.
+
+Usage:   python bench_redistribute.py [-h] [--shape NT NF NBL] [--slab MB] {keep,release}
+"""
+
+import time
+import resource
+import argparse
+import numpy as np
+from caput import mpiutil
+from caput import mpiarray
+from tlpipe.container import redistribute
+
+
+def peak_rss():
+    # in MB, ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main(args):
+    comm = mpiutil.world
+    nt, nf, nbl = args.shape
+
+    arr = mpiarray.MPIArray((nt, nf, nbl), axis=0, comm=comm, dtype=np.complex64)
+    arr.local_array[:] = 1.0
+    local_mb = arr.local_array.nbytes / 2.0**20
+    mpiutil.barrier(comm=comm)
+    rss0 = peak_rss()
+
+    stats = {}
+    t0 = time.time()
+    if args.case == 'keep':
+        out = redistribute.redistribute(arr, 2, int(args.slab * 2**20), stats)
+    else:
+        holder = [ arr ]
+        del arr
+        out = redistribute.redistribute(holder, 2, int(args.slab * 2**20), stats)
+    elapsed = time.time() - t0
+    growth = peak_rss() - rss0
+
+    growths = mpiutil.gather_list([ growth ], comm=comm) if comm is None else comm.gather(growth, root=0)
+    if mpiutil.rank0:
+        print 'shape = %s, %d procs, %.1f MB local, %s: %.2f s' % (tuple(args.shape), mpiutil.size, local_mb, args.case, elapsed)
+        print 'peak memory growth: max %.1f MB, mean %.1f MB (%.2f of the local array)' % (max(growths), np.mean(growths), max(growths) / local_mb)
+        print 'released while moving by rank 0: %.1f MB' % (stats.get('released', 0) / 2.0**20)
+    del out
+
+
+parser = argparse.ArgumentParser(description='Measure the peak memory of redistributing a distributed array.')
+parser.add_argument('case', type=str, choices=['keep', 'release'], help='Whether the caller keeps a reference to the array.')
+parser.add_argument('--shape', type=int, nargs=3, default=[512, 256, 2016], help='Shape of the array.')
+parser.add_argument('--slab', type=float, default=64.0, help='Maximum size of a slab in MB.')
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""Benchmark the startup time of the pipeline tasks.
+
+Each task module (by default all modules of `tlpipe.timestream` and
+`tlpipe.plot`) is imported in a fresh interpreter, the import time is
+measured and the heavy dependencies (matplotlib, scipy, aipy, ...) loaded by
+the import are reported. A task module should only load its heavy
+dependencies when the task actually runs, so the pipeline starts quickly
+when it only needs a few of them.
+
+Usage:   python bench_startup.py [-h] [--modules M [M ...]] [--repeat N]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+
+# dependencies that should only be loaded by the tasks using them
+HEAVY = ('matplotlib', 'scipy', 'aipy', 'ephem', 'healpy', 'cora', 'tlpipe.map', 'tlpipe.plot')
+
+# imported in the fresh interpreter, prints the import time and the loaded
+# heavy modules, except the packages of the imported module itself
+_probe = """
+import sys, time, json
+st = time.time()
+import %s
+t = time.time() - st
+heavy = sorted(set([ h for h in %r for m in sys.modules if sys.modules[m] is not None and (m == h or m.startswith(h + '.')) and not %r.startswith(h + '.') ]))
+print json.dumps({'time': t, 'heavy': heavy})
+"""
+
+
+def task_modules():
+    """All modules of tlpipe.timestream and tlpipe.plot, found without importing them."""
+    top = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tlpipe')
+    modules = []
+    for pkg in ('timestream', 'plot'):
+        for fl in sorted(os.listdir(os.path.join(top, pkg))):
+            name, ext = os.path.splitext(fl)
+            if ext == '.py' and name != '__init__':
+                modules.append('tlpipe.%s.%s' % (pkg, name))
+
+    return modules
+
+
+def probe(module):
+    """Import `module` in a fresh interpreter, return the import time and the loaded heavy modules."""
+    out = subprocess.check_output([ sys.executable, '-c', _probe % (module, HEAVY, module) ])
+    res = json.loads(out.strip().split('\n')[-1])
+
+    return res['time'], res['heavy']
+
+
+def main(args):
+    modules = args.modules if args.modules else task_modules()
+
+    total = 0.0
+    nheavy = 0
+    # the pipeline manager is imported first, then the modules of the tasks
+    for module in [ 'tlpipe.pipeline.pipeline' ] + modules:
+        try:
+            res = [ probe(module) for ri in xrange(args.repeat) ]
+        except subprocess.CalledProcessError:
+            print '%-40s    failed' % module
+            continue
+        t = min([ r[0] for r in res ])
+        heavy = res[0][1]
+        total += t
+        nheavy += (len(heavy) > 0)
+        print '%-40s %8.3f s  %s' % (module, t, ', '.join(heavy))
+
+    print '%d modules, %.3f s in total, %d load heavy dependencies at import' % (len(modules) + 1, total, nheavy)
+
+
+parser = argparse.ArgumentParser(description='Benchmark the startup time of the pipeline tasks.')
+parser.add_argument('--modules', type=str, nargs='+', default=None, help='Task modules to import, default all of tlpipe.timestream and tlpipe.plot.')
+parser.add_argument('--repeat', type=int, default=3, help='Number of imports of each module, the minimum time is reported.')
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -63,7 +63,7 @@ setup(
     ext_modules = [ st_ext, sir_ext ],
     install_requires = requires,
     package_data = {},
-    scripts = ['scripts/tlpipe', 'scripts/h5info'],
+    scripts = ['scripts/tlpipe', 'scripts/h5info', 'scripts/h5index'],
     extras_require={
         'cython': ['cython'],
         'mpi': ['mpi4py>=1.3'],
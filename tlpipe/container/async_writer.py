@@ -0,0 +1,194 @@
+"""Write-behind output of data containers.
+
+Writing a container to files blocks a pipeline task until all data is on
+disk, so the next iteration of an iterative pipeline can not start reading
+before that. :class:`AsyncWriter` instead writes containers in a background
+thread while the pipeline moves on. A container that may still be used (and
+changed) by later tasks is snapshotted before it is queued, a container that
+no later task will get is taken over without copying its data. The queue of
+containers waiting to be written is bounded, so at most a given number of
+snapshots are held in memory.
+
+The background thread calls MPI by a duplicate of the communicator of the
+containers, so its collective operations never match those of the main
+thread. This needs an MPI library providing the `MPI_THREAD_MULTIPLE`
+thread support level, containers are written synchronously else. Parallel
+HDF5 is not thread safe and its collective writes may deadlock when they are
+done from a background thread, so containers are written in the 'staging'
+mode instead of the 'mpio' mode by the background thread.
+
+"""
+
+import sys
+import time
+import traceback
+import threading
+import Queue
+import logging
+from caput import mpiutil
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+# Set the module logger.
+logger = logging.getLogger(__name__)
+
+
+def threads_supported(comm):
+    """Whether a background thread can do MPI communications over `comm`."""
+    if MPI is None or comm is None:
+        return True
+
+    return MPI.Query_thread() == MPI.THREAD_MULTIPLE
+
+
+class AsyncWriter(object):
+    """Write data containers to files in a background thread.
+
+    Parameters
+    ----------
+    max_pending : integer, optional
+        Maximum number of containers waiting to be written, :meth:`write`
+        blocks until one of them has been written when it is reached.
+        Default 1.
+    comm : None or MPI.Comm, optional
+        MPI Communicator of the containers to write. Creating the writer is a
+        collective operation over it. Default None.
+
+    """
+
+    def __init__(self, max_pending=1, comm=None):
+
+        self.max_pending = max(1, int(max_pending))
+        self.comm = comm
+        self.threaded = threads_supported(comm)
+        if not self.threaded and mpiutil.rank0:
+            logger.warning('MPI does not support MPI_THREAD_MULTIPLE, output will be written synchronously')
+
+        self._write_comm = None
+        if self.threaded and comm is not None:
+            self._write_comm = comm.Dup()
+        self._queue = Queue.Queue(maxsize=self.max_pending)
+        self._thread = None
+        self._error = None
+
+    @property
+    def num_pending(self):
+        """Approximate number of containers waiting to be written."""
+        return self._queue.qsize()
+
+    def _run(self):
+        ### main loop of the background thread
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                # do not start more writes after a failure
+                if self._error is None:
+                    job()
+            except Exception:
+                self._error = sys.exc_info()
+            finally:
+                job = None
+                self._queue.task_done()
+
+    def _raise_error(self):
+        ### re-raise the error happened in the background thread
+        if self._error is not None:
+            exc_type, exc_value, exc_tb = self._error
+            self._error = None
+            raise exc_type, exc_value, exc_tb
+
+    def write(self, tod, outfiles, own=False, failed_continue=False, **kwargs):
+        """Write `tod` to `outfiles` in the background.
+
+        `tod` is redistributed along its first axis and its status checked
+        (if `check_status` is not False) before it is queued, just as
+        :meth:`~tlpipe.container.container.BasicTod.to_files` would do.
+
+        Parameters
+        ----------
+        tod : :class:`~tlpipe.container.container.BasicTod` object
+            The container to write.
+        outfiles : string or list of strings
+            File name or a list of file names that data will be saved into.
+        own : bool, optional
+            True if no one will use `tod` later, then the writer will share
+            data with it instead of snapshotting it. Default False.
+        failed_continue : bool, optional
+            If True, a failed write is only reported, else the error will be
+            raised by the next call of :meth:`write` or :meth:`close`.
+            Default False.
+        **kwargs
+            Other arguments of `tod.to_files`.
+
+        """
+
+        self._raise_error()
+
+        if tod.main_data_dist_axis != 0:
+            tod.redistribute(0)
+        if kwargs.pop('check_status', True):
+            tod.check_status()
+
+        if not self.threaded:
+            self._to_files(tod, outfiles, failed_continue, kwargs)
+            return
+
+        # no collective writes of parallel HDF5 from the background thread
+        if tod._get_write_mode(kwargs.get('write_mode', 'auto')) == 'mpio':
+            kwargs['write_mode'] = 'staging'
+
+        # snapshot tod, or share its data by read-only views if owned
+        copy_datasets = () if own else None
+        snapshot = tod.copy(copy_datasets=copy_datasets, comm=self._write_comm)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='AsyncWriter')
+            self._thread.daemon = True
+            self._thread.start()
+
+        # blocks if there are already max_pending containers waiting
+        self._queue.put(lambda: self._to_files(snapshot, outfiles, failed_continue, kwargs))
+
+    def _to_files(self, tod, outfiles, failed_continue, kwargs):
+        ### write `tod` to `outfiles`, report the error if `failed_continue`
+        start_time = time.time()
+        try:
+            tod.to_files(outfiles, check_status=False, **kwargs)
+        except Exception:
+            if failed_continue:
+                msg = 'Process %d writing output to files failed...' % tod.rank
+                logger.warning(msg)
+                traceback.print_exc(file=sys.stdout)
+                return
+            else:
+                raise
+        if tod.rank == 0:
+            logger.debug('Wrote %s in %.3f s' % (outfiles, time.time() - start_time))
+
+    def flush(self):
+        """Wait until all queued containers have been written."""
+        if self._thread is not None:
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Wait until all queued containers have been written and stop the writer.
+
+        This is a collective operation over `comm`.
+
+        """
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._write_comm is not None:
+            self._write_comm.Free()
+            self._write_comm = None
+        self._raise_error()
@@ -1,18 +1,36 @@
 """Basic time ordered data container."""
 
+import os
 import re
 import glob
+import time
 import pickle
 import posixpath
+import weakref
+import functools
 import itertools
 import warnings
+import logging
 from copy import deepcopy
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import h5py
 from caput import mpiarray
 from caput import memh5
 from caput import mpiutil
 from tlpipe.utils import progress
+from tlpipe.utils import telemetry
+import lazy
+import file_index
+import read_planner
+import packed_mask
+import redistribute as redist
+import work_stealing
+import time_window
+
+
+# Set the module logger.
+logger = logging.getLogger(__name__)
 
 
 def _to_slice_obj(lst):
@@ -29,6 +47,150 @@ def _to_slice_obj(lst):
             return lst
 
 
+def _mpio_available(comm):
+    ### whether files can be written collectively by `comm` with the mpio driver
+    return comm is not None and comm.size > 1 and h5py.get_config().mpi
+
+
+def _staging_file(outfile, rank):
+    ### name of the staging file of proc `rank` for `outfile`
+    return '%s.stage%d' % (outfile, rank)
+
+
+def _wait_for_file(filename, timeout=60.0, interval=0.5):
+    ### wait until `filename` is visible to this proc, it may take a while on
+    ### a networked file system after the file has been created by another proc
+    for i in xrange(int(timeout / interval)):
+        if os.path.isfile(filename):
+            return
+        time.sleep(interval)
+    if not os.path.isfile(filename):
+        raise RuntimeError('File %s does not exist' % filename)
+
+
+def _lazy_reader(ref, name, axis, start, stop, transform=None):
+    ### read a section of dataset `name` from the input files of the container
+    ### weakly referenced by `ref`, `transform` is applied to the read data
+    data = ref()._read_lazy_section(name, axis, start, stop)
+    return data if transform is None else transform(data)
+
+
+def _lazy_materializer(ref, name):
+    ### materialize the lazy dataset `name` of the container weakly referenced by `ref`
+    return ref()._materialize_a_dataset(name)
+
+
+def _section(arr, sel, copy_data=False):
+    ### section `sel` of `arr`, a copy of it if `copy_data`
+    if copy_data:
+        return arr[tuple(sel)].copy()
+    else:
+        return arr[tuple(sel)]
+
+
+def _index_blocks(linds, ginds, block_size, align=None):
+    ### split the consecutive local indices `linds` and the corresponding
+    ### global indices `ginds` into blocks of at most `block_size` (all if
+    ### not positive) indices, which do not cross multiples of `align` of the
+    ### local indices if it is not None, return the slices of local indices
+    ### and the arrays of global indices of the blocks
+    n = len(linds)
+    step = n if block_size <= 0 else block_size
+    bounds = []
+    s = 0
+    while s < n:
+        e = min(s + step, n)
+        if align is not None:
+            e = min(e, s + align - linds[s] % align)
+        bounds.append((s, e))
+        s = e
+
+    return [ slice(linds[s], linds[e-1]+1) for (s, e) in bounds ], [ np.array(ginds[s:e]) for (s, e) in bounds ]
+
+
+def _index_start(ind):
+    ### the first index of a single index or a slice of indices
+    return ind.start if isinstance(ind, slice) else ind
+
+
+def _operate_batch(func, kwargs, arrays, batch, copy_data, pool=None):
+    ### call `func` for each (sections, sel, args) in `batch` by the thread
+    ### `pool` if not None, then pack the operated sections back in order;
+    ### each call operates on its own sections, so no locking is needed
+    if pool is None:
+        for sections, sel, args in batch:
+            func(*args, **kwargs)
+    else:
+        pool.map(functools.partial(_call, func, kwargs), [ args for (sections, sel, args) in batch ])
+    if not copy_data:
+        for sections, sel, args in batch:
+            _pack_back(arrays, sections, sel)
+
+
+def _call(func, kwargs, args):
+    ### call `func` with `args` and `kwargs`, a task of the thread pool
+    return func(*args, **kwargs)
+
+
+def _pack_back(arrays, sections, sel):
+    ### write the operated `sections` of the packed masks in `arrays` back to
+    ### them, as indexing a packed mask returns a new unpacked array
+    for arr, sec in zip(arrays, sections):
+        if isinstance(arr, packed_mask.PackedMask):
+            arr[tuple(sel)] = sec
+
+
+def select_time_range(num_ts, start=0, stop=None):
+    """Select the files that contain time points from `start` to `stop`.
+
+    Parameters
+    ----------
+    num_ts : list of integers
+        Number of time points in each file.
+    start : integer, optional
+        Starting time point. Non-negative integer is relative to the first
+        time point of the first file, negative integer is relative to the last
+        time point of the last file. Default 0.
+    stop : None or integer, optional
+        Stopping time point. Non-negative integer is relative to the first
+        time point of the first file, negative integer is relative to the last
+        time point of the last file. Default None is to the end of the last
+        file.
+
+    Returns
+    -------
+    sf, ef : integer
+        Index of the first and the last (included) selected file.
+    new_start, new_stop : integer
+        `start` and `stop` relative to the first selected file.
+
+    """
+
+    nt = sum(num_ts) # total length of the first axis along different files
+
+    tmp_start = start if start >=0 else start + nt
+    if tmp_start >= 0 and tmp_start < nt:
+        start = tmp_start
+    else:
+        raise ValueError('Invalid start %d for nt = %d' % (start, nt))
+    stop = nt if stop is None else stop
+    tmp_stop = stop if stop >=0 else stop + nt
+    if tmp_stop >= 0 and tmp_stop <= nt:
+        stop = tmp_stop
+    else:
+        raise ValueError('Invalid stop %d for nt = %d' % (stop, nt))
+    if start > stop:
+        raise ValueError('Invalid start %d and stop %d for nt = %d' % (start, stop, nt))
+
+    cum_num_ts = np.cumsum(num_ts)
+    sf = np.searchsorted(cum_num_ts, start, side='right') # start file index
+    new_start = start if sf == 0 else start - cum_num_ts[sf-1] # start relative the selected first file
+    ef = np.searchsorted(cum_num_ts, stop, side='left') # stop file index, included
+    new_stop = stop if sf == 0 else stop - cum_num_ts[sf-1] # stop relative the selected first file
+
+    return sf, ef, new_start, new_stop
+
+
 def ensure_file_list(files):
     """Tries to interpret the input as a sequence of files
 
@@ -136,6 +298,15 @@ class BasicTod(memh5.MemDiskGroup):
 
     def __init__(self, files=None, mode='r', start=0, stop=None, dist_axis=0, use_hints=True, comm=None):
 
+        # lazy datasets backed by the input files, see enable_lazy_load
+        self._lazy_datasets = {}
+        self._lazy_cache = None
+        self._lazy_block_size = None
+        # bit-packed boolean datasets, see _pack_a_dataset
+        self._packed_datasets = {}
+        # containers sharing data of a dataset by read-only views, see copy
+        self._shared = {}
+
         super(BasicTod, self).__init__(data_group=None, distributed=True, comm=comm)
 
         self.nproc = 1 if self.comm is None else self.comm.size
@@ -144,31 +315,78 @@ class BasicTod(memh5.MemDiskGroup):
 
         # hints pattern to match hint class attributes defined above
         self.hints_pattern = re.compile(r"(^_[^_]+_$)|(^_[^_]\w*[^_]_$)")
+        # metadata of the input files from the file index
+        files_info = None
+        if files is not None:
+            files = ensure_file_list(files)
+            if len(files) > 0:
+                files_info = file_index.get_file_info(files, comm=self.comm)
         # read and set hints from the first file if use_hints is True
-        if files is not None and use_hints:
-            fl = ensure_file_list(files)[0]
-            with h5py.File(fl, 'r') as f:
-                if 'hints' in f.attrs.iterkeys():
-                    hints = pickle.loads(f.attrs['hints'])
-                    for key, val in hints.iteritems():
-                        setattr(self, key, val)
+        if files_info is not None and use_hints:
+            if files_info[0]['hints'] is not None:
+                hints = pickle.loads(str(files_info[0]['hints']))
+                for key, val in hints.iteritems():
+                    setattr(self, key, val)
 
         self.infiles_mode = mode
         # self.infiles will be a list of opened hdf5 file handlers
-        self.infiles, self.main_data_start, self.main_data_stop = self._select_files(files, self.main_data_name, start, stop)
+        self.infiles, self.main_data_start, self.main_data_stop = self._select_files(files, self.main_data_name, start, stop, files_info)
         self.num_infiles = len(self.infiles)
         self.main_data_dist_axis = check_axis(dist_axis, self.main_data_axes)
 
         self.main_data_select = [ slice(0, None, None) for i in self._main_data_axes_ ]
         self.subset_data_select = [ slice(0, None, None) for i in self._main_data_axes_ ]
 
+        # time window to take the rows it keeps on loading, and the absolute
+        # time index of the first time point, see time_window
+        self.time_window = None
+        self.time_window_offset = 0
+        # whether to read data by the chunk-aligned read planner, see read_planner
+        self.use_read_planner = False
+        self._node_comm = None
+        # maximum size in MB of a slab moved in each step of redistribute
+        self.redistribute_slab_size = 64
+        # statistics of each redistribute, a list of dicts
+        self.redistribute_stats = []
+        # statistics of all procs of the last dynamic data_operate
+        self.operate_stats = []
+
     def __del__(self):
         """Closes the opened file handlers."""
+        if self._lazy_cache is not None:
+            self._lazy_cache.close()
         for fh in self.infiles:
             fh.close()
 
-    def _select_files(self, files, dset_name, start=0, stop=None):
+    def __getitem__(self, key):
+        if isinstance(key, basestring) and key.strip('/') in self._lazy_datasets:
+            return self._lazy_datasets[key.strip('/')]
+        if isinstance(key, basestring) and key.strip('/') in self._packed_datasets:
+            return self._packed_datasets[key.strip('/')]
+        return super(BasicTod, self).__getitem__(key)
+
+    def __delitem__(self, key):
+        if isinstance(key, basestring) and key.strip('/') in self._lazy_datasets:
+            self._lazy_datasets.pop(key.strip('/')).discard()
+        elif isinstance(key, basestring) and key.strip('/') in self._packed_datasets:
+            del self._packed_datasets[key.strip('/')]
+        else:
+            super(BasicTod, self).__delitem__(key)
+
+    def __contains__(self, key):
+        if isinstance(key, basestring) and (key.strip('/') in self._lazy_datasets or key.strip('/') in self._packed_datasets):
+            return True
+        return super(BasicTod, self).__contains__(key)
+
+    def __iter__(self):
+        return iter(list(super(BasicTod, self).__iter__()) + self._lazy_datasets.keys() + self._packed_datasets.keys())
+
+    def __len__(self):
+        return super(BasicTod, self).__len__() + len(self._lazy_datasets) + len(self._packed_datasets)
+
+    def _select_files(self, files, dset_name, start=0, stop=None, files_info=None):
         ### select the needed files from `files` which contain time ordered data from `start` to `stop`
+        ### files_info: metadata of `files`, will be got from the file index if None
         assert dset_name in self.time_ordered_datasets.keys(), '%s is not a time ordered dataset' % dset_name
 
         if files is None:
@@ -178,42 +396,24 @@ class BasicTod(memh5.MemDiskGroup):
         if len(files) == 0:
             return [], 0, 0
 
-        num_ts = []
-        for fh in files:
-            with h5py.File(fh, 'r') as f:
-                num_ts.append(f[dset_name].shape[0])
+        if files_info is None:
+            files_info = file_index.get_file_info(files, comm=self.comm)
+        num_ts = file_index.num_time_points(files_info, dset_name)
 
-        nt = sum(num_ts) # total length of the first axis along different files
-
-        tmp_start = start if start >=0 else start + nt
-        if tmp_start >= 0 and tmp_start < nt:
-            start = tmp_start
-        else:
-            raise ValueError('Invalid start %d for nt = %d' % (start, nt))
-        stop = nt if stop is None else stop
-        tmp_stop = stop if stop >=0 else stop + nt
-        if tmp_stop >= 0 and tmp_stop <= nt:
-            stop = tmp_stop
-        else:
-            raise ValueError('Invalid stop %d for nt = %d' % (stop, nt))
-        if start > stop:
-            raise ValueError('Invalid start %d and stop %d for nt = %d' % (start, stop, nt))
-
-        cum_num_ts = np.cumsum(num_ts)
-        sf = np.searchsorted(cum_num_ts, start, side='right') # start file index
-        new_start = start if sf == 0 else start - cum_num_ts[sf-1] # start relative the selected first file
-        ef = np.searchsorted(cum_num_ts, stop, side='left') # stop file index, included
-        new_stop = stop if sf == 0 else stop - cum_num_ts[sf-1] # stop relative the selected first file
+        sf, ef, new_start, new_stop = select_time_range(num_ts, start, stop)
 
         # open all selected files
         files = [ h5py.File(fh, self.infiles_mode) for fh in files[sf:ef+1] ]
 
         return files, new_start, new_stop
 
-    def _gen_files_map(self, num_ts, start=0, stop=None):
+    def _gen_files_map(self, num_ts, start=0, stop=None, rank=None):
         ### generate files map, i.e., a list of (file_idx, start, stop)
         ### num_ts: a list of number of time points allocated to each file
         ### start, stop are all relative to the first file
+        ### rank: generate the files map of this proc, default self.rank
+
+        rank = self.rank if rank is None else rank
 
         nt = np.sum(num_ts) # total number of time points
         stop = nt if stop is None else stop
@@ -234,10 +434,10 @@ class BasicTod(memh5.MemDiskGroup):
         intervals = [ (intervals[i], intervals[i+1]) for i in xrange(len(intervals)-1) ]
         cum_num_lf_ind = np.cumsum([0] + (ef - sf + 1).tolist())
         # local intervals owned by this proc
-        lits = intervals[cum_num_lf_ind[self.rank]: cum_num_lf_ind[self.rank+1]]
+        lits = intervals[cum_num_lf_ind[rank]: cum_num_lf_ind[rank+1]]
         # infiles_map: a list of (file_idx, start, stop)
         files_map = []
-        for idx, fi in enumerate(range(sf[self.rank], ef[self.rank]+1)):
+        for idx, fi in enumerate(range(sf[rank], ef[rank]+1)):
             files_map.append((fi, lits[idx][0]-tmp_cum_num_ts[fi], lits[idx][1]-tmp_cum_num_ts[fi]))
 
         return files_map
@@ -428,11 +628,66 @@ class BasicTod(memh5.MemDiskGroup):
         # copy attrs of this dset
         memh5.copyattrs(dset.attrs, self[name].attrs)
 
+    def _read_section(self, dset, fsel, out, msel, di=None):
+        ### read dset[fsel] to out[msel], by the read planner if it is enabled,
+        ### in which case this must be called by all procs if `di` (the axis
+        ### along which fsel differs in procs) is not None
+
+        if packed_mask.is_packed(dset):
+            # a packed boolean dataset, unpack it
+            if np.prod(out[tuple(msel)].shape) > 0:
+                out[tuple(msel)] = packed_mask.read_packed(dset, fsel)
+        elif self.use_read_planner:
+            if di is None:
+                read_planner.read(dset, fsel, out, msel)
+            else:
+                read_planner.node_read(dset, fsel, di, out, msel, comm=self._get_node_comm())
+        elif np.prod(out[tuple(msel)].shape) > 0:
+            # only read in data if non-empty, may get error otherwise
+            fsel = [  ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in fsel ]
+            out[tuple(msel)] = dset[tuple(fsel)]
+
+        telemetry.count('bytes_read', out[tuple(msel)].nbytes)
+
+    def _read_time_sections(self, name, sections, fsel, ti, di=None):
+        ### read the sections [(fi, start, stop, st), ...] along the time axis
+        ### `ti` of dataset `name` in the input files to the local rows
+        ### [st, st + stop - start) of the distributed dataset, taking the rows
+        ### kept by self.time_window instead of reading them if it is set, this
+        ### must be called by all procs
+        out = self[name].local_data
+        msel = [ slice(0, None, None) ] * (ti + 1)
+
+        if self.time_window is not None:
+            lo = self.time_window_offset + self[name].local_offset[ti]
+            rows = self.time_window.rows(self, name, lo, lo + out.shape[ti])
+            for rst, ret, data in rows:
+                msel[ti] = slice(rst, ret)
+                out[tuple(msel)] = data
+            sections = time_window.uncovered(sections, [ (rst, ret) for (rst, ret, _) in rows ])
+
+        for fi, start, stop, st in sections:
+            fsel[ti] = slice(start, stop)
+            msel[ti] = slice(st, st + (stop - start))
+            self._read_section(self.infiles[fi][name], fsel, out, msel, di)
+
+    def _get_node_comm(self):
+        ### communicator of procs in the same node as this proc, created at the first call
+        if self._node_comm is None:
+            self._node_comm = read_planner.node_comm(self.comm)
+
+        return self._node_comm
+
     def _load_a_main_axes_ordered_dataset(self, name):
         ### load a main_axes_ordered_dataset from the first file if it is not time
         ### ordered, else from all files, distribute the data along
         ### self.main_data_dist_axis if data has this axis
 
+        if self._is_lazy_loadable(name):
+            # keep it backed by the input files
+            self._load_a_lazy_dataset(name)
+            return
+
         if name in self.main_time_ordered_datasets.keys():
             dset_shape, dset_type, infiles_map = self._get_input_info(name, self.main_data_start, self.main_data_stop)
             if len(infiles_map) == 0:
@@ -445,6 +700,13 @@ class BasicTod(memh5.MemDiskGroup):
             last_stop = mpiutil.bcast(last_stop, root=self.nproc-1, comm=self.comm) # stop from the last file
         else:
             dset_shape, dset_type = self.infiles[0][name].shape, self.infiles[0][name].dtype
+        packed = packed_mask.is_packed(self.infiles[0][name])
+        if packed:
+            # a packed boolean dataset, it will be unpacked on loading
+            pattrs = self.infiles[0][name].attrs
+            dset_shape = list(dset_shape)
+            dset_shape[int(pattrs[packed_mask.PACKED_AXIS_ATTR])] = int(pattrs[packed_mask.PACKED_LENGTH_ATTR])
+            dset_type = np.bool
 
         axes = list(self.main_axes_ordered_datasets[name])
         axes = axes + [None] * (len(dset_shape) - len(axes)) # complete the un-write axes
@@ -462,21 +724,18 @@ class BasicTod(memh5.MemDiskGroup):
             self.create_dataset(name, shape=shp, dtype=dset_type, distributed=True, distributed_axis=di)
             # copy attrs of this dset
             memh5.copyattrs(self.infiles[0][name].attrs, self[name].attrs)
+            if packed:
+                self._strip_packed_attrs(name)
 
             if 0 in axes:
                 if self.main_data_dist_axis == 0:
                     # load data from all files as a distributed dataset
+                    sections = []
                     st = 0
                     for fi, start, stop in infiles_map:
-                        et = st + (stop - start)
-                        fsel[ti] = slice(start, stop)
-                        msel[ti] = slice(st, et)
-                        st = et
-                        fh = self.infiles[fi]
-                        if np.prod(self[name].local_data[msel].shape) > 0:
-                            # only read in data if non-empty, may get error otherwise
-                            fsel = [  ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in fsel ]
-                            self[name].local_data[msel] = fh[name][tuple(fsel)]
+                        sections.append((fi, start, stop, st))
+                        st = st + (stop - start)
+                    self._read_time_sections(name, sections, fsel, ti)
 
                 else:
                     # load data from all files as a distributed dataset
@@ -484,28 +743,15 @@ class BasicTod(memh5.MemDiskGroup):
                     fsel[di] = linds
 
                     # load data from all files
+                    sections = []
                     st = 0
                     for fi, fh in enumerate(self.infiles):
                         num_ts = fh[name].shape[0]
-                        if self.num_infiles == 1:
-                            et = st + last_stop - first_start
-                            fsel[ti] = slice(first_start, last_stop)
-                        elif self.num_infiles > 1:
-                            if fi == 0:
-                                et = st + (num_ts - first_start)
-                                fsel[ti] = slice(first_start, None)
-                            elif fi == self.num_infiles-1:
-                                et = st + last_stop
-                                fsel[ti] = slice(0, last_stop)
-                            else:
-                                et = st + num_ts
-                                fsel[ti] = slice(0, None)
-
-                        msel[ti] = slice(st, et)
-                        st = et
-                        if np.prod(self[name].local_data[msel].shape) > 0:
-                            fsel = [  ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in fsel ]
-                            self[name].local_data[msel] = fh[name][tuple(fsel)]
+                        start = first_start if fi == 0 else 0
+                        stop = last_stop if fi == self.num_infiles-1 else num_ts
+                        sections.append((fi, start, stop, st))
+                        st = st + (stop - start)
+                    self._read_time_sections(name, sections, fsel, ti, di)
 
             else:
                 if self.main_data_dist_axis == 0:
@@ -514,9 +760,7 @@ class BasicTod(memh5.MemDiskGroup):
                     # load data from the first file as a distributed dataset
                     linds = mpiutil.mpilist(np.arange(dset_shape[di])[fsel[di]].tolist(), comm=self.comm)
                     fsel[di] = linds
-                    if np.prod(self[name].local_data.shape) > 0:
-                        fsel = [  ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in fsel ]
-                        self[name].local_data[:] = self.infiles[0][name][tuple(fsel)]
+                    self._read_section(self.infiles[0][name], fsel, self[name].local_data, msel, di)
 
         else:
             # load as a common dataset
@@ -524,6 +768,8 @@ class BasicTod(memh5.MemDiskGroup):
             self.create_dataset(name, shape=shp, dtype=dset_type)
             # copy attrs of this dset
             memh5.copyattrs(self.infiles[0][name].attrs, self[name].attrs)
+            if packed:
+                self._strip_packed_attrs(name)
 
             if 0 in axes:
                 # load data from all files
@@ -546,15 +792,11 @@ class BasicTod(memh5.MemDiskGroup):
 
                     msel[ti] = slice(st, et)
                     st = et
-                    if np.prod(self[name][msel].shape) > 0:
-                        fsel = [  ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in fsel ]
-                        self[name][msel] = fh[name][tuple(fsel)] # not a distributed dataset
+                    self._read_section(fh[name], fsel, self[name], msel) # not a distributed dataset
 
             else:
                 # load data from the first file
-                if np.prod(self[name][:].shape) > 0:
-                    fsel = [  ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in fsel ]
-                    self[name][:] = self.infiles[0][name][tuple(fsel)] # not a distributed dataset
+                self._read_section(self.infiles[0][name], fsel, self[name], msel) # not a distributed dataset
 
     def _load_a_time_ordered_dataset(self, name):
         ### load a time ordered dataset (except those also in main_axes_ordered_datasets) from all files
@@ -584,6 +826,7 @@ class BasicTod(memh5.MemDiskGroup):
                     # only read in data if non-empty, may get error otherwise
                     fsel = [  ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in fsel ]
                     self[name].local_data[msel] = fh[name][tuple(fsel)]
+                    telemetry.count('bytes_read', self[name].local_data[msel].nbytes)
         else:
             # load data as a common dataset
             # create a common dataset to hold the data to be load
@@ -614,6 +857,7 @@ class BasicTod(memh5.MemDiskGroup):
                 if np.prod(self[name][msel].shape) > 0:
                     fsel = [  ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in fsel ]
                     self[name][msel] = fh[name][tuple(fsel)] # not a distributed dataset
+                    telemetry.count('bytes_read', self[name][msel].nbytes)
 
     def _load_a_dataset(self, name):
         ### load a dataset (either a commmon or a main axis ordered or a time ordered)
@@ -719,6 +963,192 @@ class BasicTod(memh5.MemDiskGroup):
             self._load_a_dataset(dset_name)
 
 
+    def enable_lazy_load(self, cache_size=1024, block_size=None, scratch_dir=None):
+        """Keep the large main axes ordered datasets out of memory on load.
+
+        After calling this, datasets that have all the main data axes (e.g.,
+        the main data) will not be read into memory by the load methods, but
+        stay backed by the input files as :class:`~tlpipe.container.lazy.LazyDataset`.
+        Their local sections are divided into blocks along the distributed
+        axis, which are only read when they are accessed, and at most
+        `cache_size` MB of blocks are kept in memory, modified blocks are
+        spilled to a scratch file when they are evicted. Indexing a single
+        block and :meth:`data_operate` work block by block, any other operation
+        that needs the whole local array of such a dataset will read it into
+        memory first, see :meth:`materialize`.
+
+        This must be called before loading the data.
+
+        Parameters
+        ----------
+        cache_size : float, optional
+            Memory budget in MB for the blocks held in memory. Default 1024.
+        block_size : None or integer, optional
+            Number of points along the distributed axis in a block. If None,
+            it is chosen so that a block of the main data is about 1/16 of
+            `cache_size`. Default None.
+        scratch_dir : None or string, optional
+            Directory to create the scratch file of the spilled blocks. The
+            system default temporary directory will be used if None.
+            Default None.
+
+        """
+
+        if self._lazy_cache is not None:
+            self._lazy_cache.close()
+        self._lazy_cache = lazy.BlockCache(int(cache_size * 2**20), scratch_dir)
+        self._lazy_block_size = block_size
+
+    @property
+    def lazy_datasets(self):
+        """Names of datasets that are backed by the input files."""
+        return sorted(self._lazy_datasets.keys())
+
+    def materialize(self, names=None):
+        """Read lazy datasets into memory as ordinary datasets.
+
+        This does not involve any communication between processes.
+
+        Parameters
+        ----------
+        names : None, string or list of strings, optional
+            Names of the lazy datasets to read. All lazy datasets if None.
+            Names that are not lazy datasets are ignored. Default None.
+
+        """
+
+        if names is None:
+            names = self._lazy_datasets.keys()
+        elif isinstance(names, basestring):
+            names = [ names ]
+
+        for name in names:
+            if name.strip('/') in self._lazy_datasets:
+                self._materialize_a_dataset(name.strip('/'))
+
+    def _materialize_a_dataset(self, name):
+        ### replace the lazy dataset `name` by an in-memory dataset and return it
+        dset = self._lazy_datasets[name]
+        data = dset.to_mpi_array()
+        del self[name]
+        self.create_dataset(name, data=data, distributed=True, distributed_axis=dset.distributed_axis)
+        memh5.copyattrs(dset.attrs, self[name].attrs)
+
+        return self[name]
+
+    def _lazy_block_len(self, axis):
+        ### number of points along the main data axis `axis` in a lazy block
+        if self._lazy_block_size is not None:
+            return self._lazy_block_size
+
+        # a block of the main data is about 1/16 of the cache size
+        dset = self.infiles[0][self.main_data_name]
+        shp = [ self.main_data_stop - self.main_data_start ] + [ len(np.arange(ni)[si]) for (ni, si) in zip(dset.shape[1:], self.main_data_select[1:]) ]
+        row_bytes = dset.dtype.itemsize * np.prod(shp) / max(shp[axis], 1)
+
+        return max(1, int(self._lazy_cache.max_bytes / (16 * max(row_bytes, 1))))
+
+    def _is_lazy_loadable(self, name):
+        ### whether dataset `name` can be loaded as a lazy dataset
+        if self._lazy_cache is None or not name in self.main_axes_ordered_datasets.keys():
+            return False
+        axes = self.main_axes_ordered_datasets[name]
+        return sorted(axes) == range(len(self.main_data_axes)) and len(self.infiles[0][name].shape) == len(axes) and not packed_mask.is_packed(self.infiles[0][name])
+
+    def _load_a_lazy_dataset(self, name, src_name=None, dtype=None, transform=None):
+        ### create a lazy dataset `name` backed by the dataset `src_name`
+        ### (default `name`) in the input files, `transform` is applied to the
+        ### data read from files if not None, which gives data of type `dtype`
+
+        src_name = name if src_name is None else src_name
+        axes = list(self.main_axes_ordered_datasets[src_name])
+        dset = self.infiles[0][src_name]
+        dtype = dset.dtype if dtype is None else dtype
+        ti = axes.index(0) # index of time axis
+        di = axes.index(self.main_data_dist_axis) # index of dist axis
+        dset_shape = list(dset.shape)
+        dset_shape[ti] = self.main_data_stop - self.main_data_start
+        shp = tuple([ len(np.arange(ni)[self.main_data_select[a]]) for (ni, a) in zip(dset_shape, axes) ])
+
+        attrs = {}
+        if src_name == name:
+            memh5.copyattrs(dset.attrs, attrs)
+        ref = weakref.ref(self)
+        reader = functools.partial(_lazy_reader, ref, src_name, transform=transform)
+        materializer = functools.partial(_lazy_materializer, ref)
+        block_len = self._lazy_block_len(self.main_data_dist_axis)
+        self._lazy_datasets[name] = lazy.LazyDataset(name, shp, dtype, di, reader, self._lazy_cache, block_len, attrs, self.comm, materializer)
+        self.main_axes_ordered_datasets[name] = tuple(axes)
+
+    def _read_lazy_section(self, name, axis, start, stop):
+        ### read the section from `start` to `stop` along `axis` of the
+        ### selected data of dataset `name` from all input files
+
+        axes = list(self.main_axes_ordered_datasets[name])
+        ti = axes.index(0) # index of time axis
+        fsel = [ self.main_data_select[a] for a in axes ] # for data in file
+        if axis == ti:
+            t0, t1 = start, stop
+        else:
+            t0, t1 = 0, self.main_data_stop - self.main_data_start
+            fsel[axis] = np.arange(self.infiles[0][name].shape[axis])[fsel[axis]][start:stop].tolist()
+        fsel = [ ( _to_slice_obj(s) if isinstance(s, list) else s ) for s in fsel ]
+
+        # time points relative to the first file
+        t0, t1 = self.main_data_start + t0, self.main_data_start + t1
+        secs = []
+        st = 0
+        for fh in self.infiles:
+            et = st + fh[name].shape[ti]
+            if max(t0, st) < min(t1, et):
+                fsel[ti] = slice(max(t0, st) - st, min(t1, et) - st)
+                secs.append(fh[name][tuple(fsel)])
+            st = et
+
+        if len(secs) == 1:
+            return secs[0]
+        else:
+            return np.concatenate(secs, axis=ti)
+
+
+    @property
+    def packed_datasets(self):
+        """Names of datasets that are held bit-packed in memory."""
+        return sorted(self._packed_datasets.keys())
+
+    def _pack_a_dataset(self, name):
+        ### hold the distributed boolean dataset `name` bit-packed in memory,
+        ### it must have all the main data axes, e.g., vis_mask
+
+        name = name.strip('/')
+        if name in self._packed_datasets or name in self._lazy_datasets:
+            return
+        dset = self[name]
+        axes = self.main_axes_ordered_datasets.get(name, ())
+        if not (dset.dtype == np.bool and dset.distributed and sorted(axes) == range(len(self.main_data_axes)) and len(dset.shape) == len(axes)):
+            raise ValueError('Can not pack dataset %s, only a distributed boolean dataset having all main data axes can be packed' % name)
+
+        packed = packed_mask.PackedDataset.from_dataset(name, dset, self.comm)
+        del self[name]
+        self._packed_datasets[name] = packed
+
+    def _unpack_a_dataset(self, name):
+        ### replace the packed dataset `name` by an ordinary in-memory dataset
+        dset = self._packed_datasets.pop(name.strip('/'))
+        self.create_dataset(dset.name, data=dset.to_mpi_array(), distributed=True, distributed_axis=dset.distributed_axis)
+        memh5.copyattrs(dset.attrs, self[dset.name].attrs)
+
+    def _redistribute_packed(self, axis, stats=None):
+        ### redistribute packed datasets along the main data axis `axis`
+        for name, dset in self._packed_datasets.items():
+            self._packed_datasets[name] = dset.redistribute(list(self.main_axes_ordered_datasets[name]).index(axis), int(self.redistribute_slab_size * 2**20), stats)
+
+    def _strip_packed_attrs(self, name):
+        ### remove the packing attributes copied from a packed dataset in files
+        for key in (packed_mask.PACKED_AXIS_ATTR, packed_mask.PACKED_LENGTH_ATTR):
+            if key in self[name].attrs:
+                del self[name].attrs[key]
+
     def group_name_allowed(self, name):
         """No groups are exposed to the user. Returns ``False``."""
         return False
@@ -984,7 +1414,11 @@ class BasicTod(memh5.MemDiskGroup):
                 print '%s:' % attr_name, attr_val
             # list all top level datasets
             for dset_name, dset in self.iteritems():
-                if dset.distributed:
+                if dset_name in self._lazy_datasets:
+                    print '%s  shape = %s, dist_axis = %d, lazy' % (dset_name, dset.shape, dset.distributed_axis)
+                elif dset_name in self._packed_datasets:
+                    print '%s  shape = %s, dist_axis = %d, packed' % (dset_name, dset.shape, dset.distributed_axis)
+                elif dset.distributed:
                     print '%s  shape = %s, dist_axis = %d' % (dset_name, dset.shape, dset.distributed_axis)
                 else:
                     print '%s  shape = %s' % (dset_name, dset.shape)
@@ -1022,20 +1456,29 @@ class BasicTod(memh5.MemDiskGroup):
             # already the distributed axis, nothing to do
             return
         else:
+            stats = {'nbytes': 0, 'nslabs': 0, 'released': 0}
+            start_time = time.time()
+
+            # redistribute lazy datasets
+            self._redistribute_lazy(axis)
+            # redistribute packed datasets
+            self._redistribute_packed(axis, stats)
+
             # redistribute main data if it exists
-            try:
-                self.main_data.redistribute(axis)
-            except KeyError:
-                pass
+            if self.main_data_name in self.iterkeys() and not self.main_data_name in self._lazy_datasets:
+                self._redistribute_a_dataset(self.main_data_name, axis, stats)
             self.main_data_dist_axis = axis
 
             # redistribute other main_axes_ordered_datasets
             for name, val in self.main_axes_ordered_datasets.items():
-                if name in self.iterkeys() and name != self.main_data_name:
+                if name in self.iterkeys() and name != self.main_data_name and not name in self._lazy_datasets and not name in self._packed_datasets:
                     if axis in val:
-                        with warnings.catch_warnings():
-                            warnings.simplefilter('ignore')
-                            self.dataset_common_to_distributed(name, distributed_axis=val.index(axis))
+                        if self[name].distributed:
+                            self._redistribute_a_dataset(name, val.index(axis), stats)
+                        else:
+                            with warnings.catch_warnings():
+                                warnings.simplefilter('ignore')
+                                self.dataset_common_to_distributed(name, distributed_axis=val.index(axis))
                     else:
                         if self[name].distributed:
                             self.dataset_distributed_to_common(name)
@@ -1049,6 +1492,49 @@ class BasicTod(memh5.MemDiskGroup):
                         if self[name].distributed:
                             self.dataset_distributed_to_common(name)
 
+            # report the bytes moved and the time spent
+            telemetry.count('bytes_redistributed', stats['nbytes'])
+            nbytes = mpiutil.allreduce(stats['nbytes'], comm=self.comm)
+            elapsed = mpiutil.allreduce(time.time() - start_time, op=mpiutil.MAX, comm=self.comm)
+            released = mpiutil.allreduce(stats['released'], comm=self.comm)
+            self.redistribute_stats.append({'axis': self.main_data_axes[axis], 'nbytes': nbytes, 'nslabs': stats['nslabs'], 'released': released, 'time': elapsed})
+            if self.rank0:
+                logger.info('Redistribute %s along %s: %.1f MB moved in %.2f s, %.1f MB released while moving' % (self.main_data_name, self.main_data_axes[axis], nbytes / 2.0**20, elapsed, released / 2.0**20))
+
+    def _redistribute_a_dataset(self, name, axis, stats=None):
+        ### redistribute the distributed dataset `name` along its `axis` by
+        ### slabs of at most redistribute_slab_size MB
+
+        dset = self[name]
+        attrs = {}
+        memh5.copyattrs(dset.attrs, attrs)
+        # hand over the only reference to the old data, so its rows can be
+        # released as they are sent
+        data = [ dset.data ]
+        del dset
+        del self[name]
+        data = redist.redistribute(data, axis, int(self.redistribute_slab_size * 2**20), stats)
+        self.create_dataset(name, data=data, distributed=True, distributed_axis=axis)
+        memh5.copyattrs(attrs, self[name].attrs)
+
+    def _redistribute_lazy(self, axis):
+        ### redistribute lazy datasets along the main data axis `axis`, which
+        ### only rebuilds the proxies if no proc has modified or materialized
+        ### any of them, else all of them are materialized to be redistributed
+        ### as ordinary datasets
+
+        states = self.comm.allgather(sorted([ (name, dset.modified) for (name, dset) in self._lazy_datasets.iteritems() ]))
+        if all([ len(st) == 0 for st in states ]):
+            return
+
+        if all([ st == states[0] for st in states ]) and not any([ modified for (name, modified) in states[0] ]):
+            block_len = self._lazy_block_len(axis)
+            for name, dset in self._lazy_datasets.items():
+                di = list(self.main_axes_ordered_datasets[name]).index(axis)
+                self._lazy_datasets[name] = dset.redistribute(di, block_len)
+        else:
+            self.materialize()
+
     def check_status(self):
         """Check that data hold in this container is consistent.
 
@@ -1094,7 +1580,7 @@ class BasicTod(memh5.MemDiskGroup):
                 raise RuntimeError('Not all main_axes_ordered_datasets have an aligned %s axis' % self.main_data_axes[axis])
 
 
-    def _get_output_info(self, dset_name, num_outfiles):
+    def _get_output_info(self, dset_name, num_outfiles, rank=None):
         ### get data shape and type and infile_map of time ordered datasets
 
         dset_shape = self[dset_name].shape
@@ -1104,12 +1590,209 @@ class BasicTod(memh5.MemDiskGroup):
         # allocate nt to the given number of files
         num_ts, num_s, num_e = mpiutil.split_m(nt, num_outfiles)
 
-        outfiles_map = self._gen_files_map(num_ts, start=0, stop=None)
+        outfiles_map = self._gen_files_map(num_ts, start=0, stop=None, rank=rank)
 
         return dset_shape, dset_type, outfiles_map
 
+    def _get_write_mode(self, write_mode):
+        ### determine the actual write mode to use for `to_files`
+
+        if not write_mode in ('auto', 'mpio', 'staging', 'serial'):
+            raise ValueError('Unknown write mode %s' % write_mode)
+
+        if write_mode == 'auto':
+            if self.nproc == 1:
+                return 'serial'
+            elif _mpio_available(self.comm):
+                return 'mpio'
+            else:
+                return 'staging'
+        elif write_mode == 'mpio' and not _mpio_available(self.comm):
+            warnings.warn('h5py is not built with parallel HDF5 support, use staging write mode instead')
+            return 'staging' if self.nproc > 1 else 'serial'
+
+        return write_mode
+
+    def _output_file_header(self, f, fi, num_outfiles, exclude=[], write_hints=True, chunks=None, collective=False):
+        ### write hints, common attrs and common datasets to the `fi`-th output
+        ### file `f` of `num_outfiles`, and create time ordered datasets in it
+        ### if `collective`, `f` is opened by all procs with the mpio driver
+
+        chunks = {} if chunks is None else chunks
+
+        # write hints if required
+        if write_hints:
+            hint_keys = [ key for key in self.__class__.__dict__.keys() if re.match(self.hints_pattern, key) ]
+            hint_dict = { key: getattr(self, key) for key in hint_keys }
+            f.attrs['hints'] = pickle.dumps(hint_dict)
+
+        # write top level common attrs
+        for attrs_name, attrs_value in self.attrs.iteritems():
+            if attrs_name in exclude:
+                continue
+            if attrs_name not in self.time_ordered_attrs:
+                f.attrs[attrs_name] = self.attrs[attrs_name]
+
+        for dset_name, dset in self.iteritems():
+            if dset_name in exclude:
+                continue
+            # write top level common datasets
+            if dset_name not in self.time_ordered_datasets.keys():
+                if collective:
+                    # dataset creation is collective, but only one proc writes the data
+                    f.create_dataset(dset_name, dset.shape, dtype=dset.dtype)
+                    if self.rank0 and np.prod(dset.shape) > 0:
+                        f[dset_name][...] = dset[...]
+                else:
+                    f.create_dataset(dset_name, data=dset, shape=dset.shape, dtype=dset.dtype)
+            # initialize time ordered datasets, HDF5 fills them with 0 by default
+            else:
+                shape, dtype = self._output_shape_dtype(dset_name)
+                nt = shape[0]
+                lt, et, st = mpiutil.split_m(nt, num_outfiles)
+                lshape = (lt[fi],) + shape[1:]
+                dset_chunks = chunks.get(dset_name, None)
+                if dset_chunks is not None and dset_name in self._packed_datasets:
+                    dset_chunks = list(dset_chunks)
+                    dset_chunks[dset.pack_axis] = packed_mask.packed_length(dset_chunks[dset.pack_axis])
+                    dset_chunks = tuple(dset_chunks)
+                if dset_chunks is not None:
+                    f.create_dataset(dset_name, lshape, dtype=dtype, chunks=dset_chunks)
+                else:
+                    f.create_dataset(dset_name, lshape, dtype=dtype)
+
+            # copy attrs of this dset
+            memh5.copyattrs(dset.attrs, f[dset_name].attrs)
+            if dset_name in self._packed_datasets:
+                f[dset_name].attrs[packed_mask.PACKED_AXIS_ATTR] = dset.pack_axis
+                f[dset_name].attrs[packed_mask.PACKED_LENGTH_ATTR] = dset.shape[dset.pack_axis]
+
+    def _output_time_ordered_names(self, exclude=[]):
+        ### names of time ordered datasets that will be written to output files
+        return [ name for name in self.iterkeys() if name not in exclude and name in self.time_ordered_datasets.keys() ]
+
+    def _output_shape_dtype(self, dset_name):
+        ### shape and dtype of dataset `dset_name` as saved in files, which
+        ### are those of the packed data for a packed dataset
+        dset = self[dset_name]
+        if dset_name in self._packed_datasets:
+            return dset.packed_shape, dset.local_data.packed.dtype
+        else:
+            return dset.shape, dset.dtype
+
+    def _write_local_rows(self, out, dset_name, start, st, et):
+        ### write rows from `st` to `et` of the local data of dataset
+        ### `dset_name` to rows from `start` of the output dataset `out`, a
+        ### lazy dataset is written block by block without reading it
+        ### entirely, a packed dataset is written as the packed data
+
+        dset = self[dset_name]
+        if dset_name in self._packed_datasets:
+            out[start:start+et-st] = dset.local_data.packed[st:et]
+            telemetry.count('bytes_written', dset.local_data.packed[st:et].nbytes)
+        elif dset_name in self._lazy_datasets:
+            for bi in xrange(dset.num_blocks):
+                bs, be = dset.block_range(bi)
+                s, e = max(bs, st), min(be, et)
+                if s < e:
+                    out[start+s-st:start+e-st] = dset.block(bi)[s-bs:e-bs]
+                    telemetry.count('bytes_written', dset.block(bi)[s-bs:e-bs].nbytes)
+        else:
+            out[start:start+et-st] = dset.local_data[st:et]
+            telemetry.count('bytes_written', dset.local_data[st:et].nbytes)
+
+    def _write_mpio(self, outfiles, exclude=[], write_hints=True, libver='earliest', chunks=None):
+        ### write all data to `outfiles` with the mpio driver of parallel HDF5,
+        ### all procs open each file collectively and write their own local
+        ### sections of the time ordered datasets independently
+
+        num_outfiles = len(outfiles)
+        names = self._output_time_ordered_names(exclude)
+        # local sections of time ordered datasets held by this proc
+        # {fi: [(dset_name, start, stop, st, et), ...]}
+        sections = {}
+        for dset_name in names:
+            dset_shape, dset_type, outfiles_map = self._get_output_info(dset_name, num_outfiles)
+            st = 0
+            for fi, start, stop in outfiles_map:
+                et = st + (stop - start)
+                sections.setdefault(fi, []).append((dset_name, start, stop, st, et))
+                st = et
+
+        for fi, outfile in enumerate(outfiles):
+            with h5py.File(outfile, 'w', driver='mpio', comm=self.comm, libver=libver) as f:
+                self._output_file_header(f, fi, num_outfiles, exclude, write_hints, chunks, collective=True)
+                for dset_name, start, stop, st, et in sections.get(fi, []):
+                    if stop > start:
+                        self._write_local_rows(f[dset_name], dset_name, start, st, et)
+
+    def _write_staging(self, outfiles, owned, exclude=[], libver='earliest'):
+        ### each proc first writes its own local sections of the time ordered
+        ### datasets to its private staging files simultaneously, then the proc
+        ### that has created an output file merges the staged sections into it
+
+        num_outfiles = len(outfiles)
+        names = self._output_time_ordered_names(exclude)
+
+        # local sections of all procs, {(fi, ri): [(dset_name, start, stop, st, et), ...]}
+        sections = {}
+        for dset_name in names:
+            for ri in xrange(self.nproc):
+                dset_shape, dset_type, outfiles_map = self._get_output_info(dset_name, num_outfiles, rank=ri)
+                st = 0
+                for fi, start, stop in outfiles_map:
+                    et = st + (stop - start)
+                    if stop > start:
+                        sections.setdefault((fi, ri), []).append((dset_name, start, stop, st, et))
+                    st = et
+
+        # write local sections to staging files
+        for (fi, ri), secs in sections.iteritems():
+            if ri != self.rank:
+                continue
+            with h5py.File(_staging_file(outfiles[fi], ri), 'w', libver=libver) as sf:
+                for dset_name, start, stop, st, et in secs:
+                    shape, dtype = self._output_shape_dtype(dset_name)
+                    sf.create_dataset(dset_name, (et - st,) + shape[1:], dtype=dtype)
+                    self._write_local_rows(sf[dset_name], dset_name, 0, st, et)
 
-    def to_files(self, outfiles, exclude=[], check_status=True, write_hints=True, libver='earliest'):
+        mpiutil.barrier(comm=self.comm)
+
+        # merge staging files into the output files
+        for fi, outfile in owned:
+            with h5py.File(outfile, 'r+', libver=libver) as f:
+                for ri in xrange(self.nproc):
+                    if not (fi, ri) in sections:
+                        continue
+                    stage_file = _staging_file(outfile, ri)
+                    _wait_for_file(stage_file)
+                    with h5py.File(stage_file, 'r') as sf:
+                        for dset_name, start, stop, st, et in sections[(fi, ri)]:
+                            f[dset_name][start:stop] = sf[dset_name][:]
+                    os.remove(stage_file)
+
+    def _write_serial(self, outfiles, exclude=[], libver='earliest'):
+        ### procs write their own local sections of the time ordered datasets
+        ### to the output files in turn
+
+        num_outfiles = len(outfiles)
+        for dset_name in self._output_time_ordered_names(exclude):
+            dset_shape, dset_type, outfiles_map = self._get_output_info(dset_name, num_outfiles)
+
+            st = 0
+            # NOTE: if write simultaneously, will loss data with processes distributed in several nodes
+            for ri in xrange(self.nproc):
+                if ri == self.rank:
+                    for fi, start, stop in outfiles_map:
+
+                        et = st + (stop - start)
+                        _wait_for_file(outfiles[fi])
+                        with h5py.File(outfiles[fi], 'r+', libver=libver) as f:
+                            self._write_local_rows(f[dset_name], dset_name, start, st, et)
+                        st = et
+                mpiutil.barrier(comm=self.comm)
+
+    def to_files(self, outfiles, exclude=[], check_status=True, write_hints=True, libver='earliest', write_mode='auto', chunks=None):
         """Save the data hold in this container to files.
 
         Parameters
@@ -1131,6 +1814,19 @@ class BasicTod(memh5.MemDiskGroup):
             backwards compatibility, can be performance advantages. The 'earliest'
             option means that HDF5 will make a best effort to be backwards
             compatible. Default is 'earliest'.
+        write_mode : 'auto', 'mpio', 'staging' or 'serial', optional
+            How the distributed time ordered datasets are written. 'mpio' opens
+            each file collectively with the mpio driver of parallel HDF5 and all
+            procs write their local sections simultaneously; 'staging' lets all
+            procs write their local sections to private staging files
+            simultaneously, which are then merged into the output files by the
+            procs that created them; 'serial' lets procs write to the output
+            files in turn. 'auto' uses 'mpio' if h5py is built with parallel
+            HDF5, else 'staging' for more than one proc. Default 'auto'.
+        chunks : None or dict, optional
+            Chunk shape for the time ordered datasets in the saved files, keyed
+            by dataset name. Datasets not in it will be saved contiguous.
+            Default None.
 
         """
 
@@ -1145,68 +1841,56 @@ class BasicTod(memh5.MemDiskGroup):
         if check_status:
             self.check_status()
 
+        write_mode = self._get_write_mode(write_mode)
+
+        if write_mode == 'mpio':
+            self._write_mpio(outfiles, exclude, write_hints, libver, chunks)
+            mpiutil.barrier(comm=self.comm)
+            return
+
         # split output files among procs
-        for fi, outfile in mpiutil.mpilist(list(enumerate(outfiles)), method='rand', comm=self.comm):
+        owned = mpiutil.mpilist(list(enumerate(outfiles)), method='rand', comm=self.comm)
+        for fi, outfile in owned:
             # first write top level common attrs and datasets to file
             with h5py.File(outfile, 'w', libver=libver) as f:
-
-                # write hints if required
-                if write_hints:
-                    hint_keys = [ key for key in self.__class__.__dict__.keys() if re.match(self.hints_pattern, key) ]
-                    hint_dict = { key: getattr(self, key) for key in hint_keys }
-                    f.attrs['hints'] = pickle.dumps(hint_dict)
-
-                # write top level common attrs
-                for attrs_name, attrs_value in self.attrs.iteritems():
-                    if attrs_name in exclude:
-                        continue
-                    if attrs_name not in self.time_ordered_attrs:
-                        f.attrs[attrs_name] = self.attrs[attrs_name]
-
-                for dset_name, dset in self.iteritems():
-                    if dset_name in exclude:
-                        continue
-                    # write top level common datasets
-                    if dset_name not in self.time_ordered_datasets.keys():
-                        f.create_dataset(dset_name, data=dset, shape=dset.shape, dtype=dset.dtype)
-                    # initialize time ordered datasets
-                    else:
-                        nt = dset.shape[0]
-                        lt, et, st = mpiutil.split_m(nt, num_outfiles)
-                        lshape = (lt[fi],) + dset.shape[1:]
-                        f.create_dataset(dset_name, lshape, dtype=dset.dtype)
-                        f[dset_name][:] = np.array(0.0).astype(dset.dtype)
-
-                    # copy attrs of this dset
-                    memh5.copyattrs(dset.attrs, f[dset_name].attrs)
+                self._output_file_header(f, fi, num_outfiles, exclude, write_hints, chunks)
 
         mpiutil.barrier(comm=self.comm)
 
         # then write time ordered datasets
-        for dset_name, dset in self.iteritems():
-            if dset_name in exclude:
-                continue
-            if dset_name in self.time_ordered_datasets.keys():
-                dset_shape, dset_type, outfiles_map = self._get_output_info(dset_name, num_outfiles)
+        if write_mode == 'staging':
+            self._write_staging(outfiles, owned, exclude, libver)
+        else:
+            self._write_serial(outfiles, exclude, libver)
 
-                st = 0
-                # NOTE: if write simultaneously, will loss data with processes distributed in several nodes
-                for ri in xrange(self.nproc):
-                    if ri == self.rank:
-                        for fi, start, stop in outfiles_map:
+        mpiutil.barrier(comm=self.comm)
 
-                            et = st + (stop - start)
-                            with h5py.File(outfiles[fi], 'r+', libver=libver) as f:
-                                f[dset_name][start:stop] = self[dset_name].local_data[st:et]
-                            st = et
-                    mpiutil.barrier(comm=self.comm)
+    def copy(self, copy_datasets=None, comm=None):
+        """Return a copy of this container.
 
-                # mpiutil.barrier(comm=self.comm)
+        Parameters
+        ----------
+        copy_datasets : None or list of strings, optional
+            Names of datasets whose data will be copied. Other datasets of the
+            copy share data with this container by read-only views (so writing
+            to them raises an error) until :meth:`ensure_writable` is called
+            for them, which copies the data if it is still shared, i.e.,
+            copy-on-write. This container stays writable, so one that is
+            changed after the copy is made (e.g., the state a task keeps
+            through iterations) should call :meth:`ensure_writable` for the
+            datasets to change first, else the changes show in the copy.
+            Lazy datasets are always copied, and stay lazy in this container.
+            Default None to copy all datasets.
+        comm : None or MPI.Comm, optional
+            MPI Communicator the copy is distributed over, which must contain
+            the same processes in the same order as that of this container,
+            e.g., a duplicate of it. Default None to use that of this container.
 
-    def copy(self):
-        """Return a deep copy of this container."""
+        """
 
-        cont = self.__class__(dist_axis=self.main_data_dist_axis, comm=self.comm)
+        new_comm = comm
+        comm = self.comm if comm is None else comm
+        cont = self.__class__(dist_axis=self.main_data_dist_axis, comm=comm)
 
         # set hints
         hint_keys = [ key for key in self.__class__.__dict__.keys() if re.match(self.hints_pattern, key) ]
@@ -1219,14 +1903,117 @@ class BasicTod(memh5.MemDiskGroup):
 
         # copy datasets
         for dset_name, dset in self.iteritems():
-            cont.create_dataset(dset_name, data=dset.data.copy())
+            if dset_name in self._packed_datasets:
+                cont._packed_datasets[dset_name] = dset.copy(new_comm)
+                continue
+            share = None
+            if dset_name in self._lazy_datasets:
+                # read the local section, not to materialize it in this container
+                data = dset.to_mpi_array()
+            elif copy_datasets is None or dset_name in copy_datasets:
+                data = dset.data.copy()
+            else:
+                # share data by a read-only view, this container stays
+                # writable, see ensure_writable
+                data = dset.data.view()
+                data.flags.writeable = False
+                if self._is_shared(dset_name):
+                    share = self._shared[dset_name][0]
+                else:
+                    share = weakref.WeakSet([self])
+                    self._shared[dset_name] = (share, weakref.ref(dset.data))
+                share.add(cont)
+            if new_comm is not None and dset.distributed:
+                # re-wrap the local data to be distributed over the new comm
+                data = mpiarray.MPIArray.wrap(data.local_array, axis=data.axis, comm=new_comm)
+            cont.create_dataset(dset_name, data=data)
             memh5.copyattrs(dset.attrs, cont[dset_name].attrs)
+            if share is not None:
+                cont._shared[dset_name] = (share, weakref.ref(cont[dset_name].data))
 
         return cont
 
+    def total_nbytes(self):
+        """Total number of bytes of the data held in memory by all procs.
+
+        Lazy datasets are counted by the blocks held in memory, and packed
+        datasets by their packed data. This must be called by all procs.
+        """
+
+        nbytes = 0
+        for name in self.iterkeys():
+            if name in self._lazy_datasets:
+                continue
+            elif name in self._packed_datasets:
+                nbytes += self[name].local_data.packed.nbytes
+            elif self[name].distributed or self.rank0:
+                # a common dataset is counted only once
+                nbytes += self[name].local_data.nbytes
+        if self._lazy_cache is not None:
+            nbytes += self._lazy_cache.nbytes
+
+        return mpiutil.allreduce(nbytes, comm=self.comm) if self.comm is not None else nbytes
+
+    def _is_shared(self, name):
+        ### whether dataset `name` still shares data with another container by copy
+        if not name in self._shared:
+            return False
+        if name in self.iterkeys() and not (name in self._lazy_datasets or name in self._packed_datasets) and self[name].data is self._shared[name][1]():
+            return True
+        # the dataset has been replaced since
+        del self._shared[name]
+        return False
+
+    @property
+    def shared_datasets(self):
+        """Names of datasets that share data with another container until
+        :meth:`ensure_writable`, see :meth:`copy`."""
+        return sorted([ name for name in self._shared.keys() if self._is_shared(name) ])
+
+    def ensure_writable(self, names=None):
+        """Make datasets that share data with another container writable.
+
+        The data is copied if any other container still shares it, else the
+        datasets are just made writable again.
+
+        Parameters
+        ----------
+        names : None, string or list of strings, optional
+            Names of datasets to make writable. All datasets if None. Names
+            that do not share data are ignored. Default None.
+
+        """
 
+        if names is None:
+            names = self.shared_datasets
+        elif isinstance(names, basestring):
+            names = [ names ]
+
+        for name in names:
+            name = name.strip('/')
+            if not self._is_shared(name):
+                continue
+            share = self._shared.pop(name)[0]
+            share.discard(self)
+            dset = self[name]
+            if not any(cont._is_shared(name) and cont._shared[name][0] is share for cont in list(share)):
+                # the only holder left, no need to copy
+                try:
+                    dset.data.flags.writeable = True
+                    continue
+                except ValueError:
+                    # the base array is not writable
+                    pass
+            data = dset.data.copy()
+            attrs = {}
+            memh5.copyattrs(dset.attrs, attrs)
+            del dset
+            del self[name]
+            self.create_dataset(name, data=data)
+            memh5.copyattrs(attrs, self[name].attrs)
 
-    def data_operate(self, func, op_axis=None, axis_vals=0, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+
+    def data_operate(self, func, op_axis=None, axis_vals=0, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """A basic data operation interface.
 
         You can use this method to do some constrained operations to the main data
@@ -1238,7 +2025,9 @@ class BasicTod(memh5.MemDiskGroup):
         func : function object
             The opertation function object. It is of type func(array, self,
             \*\*kwargs) if `op_axis=None`, func(array, local_index, global_index,
-            axis_val, self, \*\*kwargs) else.
+            axis_val, self, \*\*kwargs) else. In block mode (see `block_size`),
+            `array` keeps the operated axes, and `local_index`, `global_index`
+            and `axis_val` are arrays for the indices of the block.
         op_axis : None, string or integer, tuple of string or interger, optional
             Axis along which `func` will opterate. If None, `func` will operate on
             the whole main dataset (but note: since the main data is distributed
@@ -1268,50 +2057,56 @@ class BasicTod(memh5.MemDiskGroup):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original dist axis if the
             dist axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, which saves the
+            per-call overhead for a `func` that is vectorized over the operated
+            axes. Blocks along the dist axis of a lazy main data are also split
+            at the boundaries of its lazy blocks. Default None.
+        num_threads : integer, optional
+            Number of threads to call `func` in parallel on different slices (or
+            blocks) if larger than 1, which speeds up a `func` spending most of
+            its time in numpy or scipy routines that release the GIL. `func`
+            must then be thread-safe, i.e., it may only change its own data
+            sections. Sections of a packed mask are unpacked for each call and
+            packed back in the order of the slices after the calls. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes. 'static' lets each
+            process operate on its local slices; 'dynamic' hands out slices on
+            demand, so processes that have finished their own slices steal
+            slices from others, which balances the load when the cost of
+            `func` varies a lot among slices. 'dynamic' works only with
+            `full_data`, slices along the dist axis are the units handed out,
+            `block_size` and `num_threads` are ignored, and `func` may run on a process
+            other than the one holding the slice, so it should only use its
+            arguments and the common datasets; the `local_index` passed to it
+            is that on the process holding the slice. A histogram of the busy
+            time fractions of all processes is logged and the per-process
+            statistics are kept in :attr:`operate_stats`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
 
+        names = self._operate_datasets()
+
         if op_axis is None:
-            if copy_data:
-                func(self.main_data.local_data.copy(), self, **kwargs)
-            else:
-                func(self.main_data.local_data, self, **kwargs)
+            for arrays in self._operate_sections(names, [], not copy_data):
+                if copy_data:
+                    arrays = [ arr.copy() for arr in arrays ]
+                sections = [ _section(arr, [], copy_data) if isinstance(arr, packed_mask.PackedMask) else arr for arr in arrays ]
+                func(*(sections + [self]), **kwargs)
+                _pack_back(arrays, sections, [])
+            return
         elif isinstance(op_axis, int) or isinstance(op_axis, basestring):
-            axis = check_axis(op_axis, self.main_data_axes)
-            data_sel = [ slice(0, None) ] * len(self.main_data_axes)
+            axes = [ check_axis(op_axis, self.main_data_axes) ]
+            axis_vals = [ axis_vals ]
             if full_data:
                 original_dist_axis = self.main_data_dist_axis
-                self.redistribute(axis)
-            if self.main_data.distributed:
-                lgind = self.main_data.data.enumerate(axis)
-            else:
-                lgind = enumerate(range(self.main_data.data.shape[axis]))
-            if show_progress:
-                pg = progress.Progress(len(lgind), step=progress_step)
-            cnt = 0
-            for lind, gind in lgind:
-                if show_progress and mpiutil.rank0:
-                    pg.show(cnt)
-                cnt += 1
-                data_sel[axis] = lind
-                if isinstance(axis_vals, memh5.MemDataset):
-                    # use the new dataset which may be different from axis_vals if it is redistributed
-                    axis_val = self[axis_vals.name].local_data[lind]
-                elif hasattr(axis_vals, '__iter__'):
-                    axis_val = axis_vals[lind]
-                else:
-                    axis_val = axis_vals
-                if copy_data:
-                    func(self.main_data.local_data[data_sel].copy(), lind, gind, axis_val, self, **kwargs)
-                else:
-                    func(self.main_data.local_data[data_sel], lind, gind, axis_val, self, **kwargs)
-            if full_data and keep_dist_axis:
-                self.redistribute(original_dist_axis)
+                self.redistribute(axes[0])
         elif isinstance(op_axis, tuple):
             axes = [ check_axis(axis, self.main_data_axes) for axis in op_axis ]
-            data_sel = [ slice(0, None) ] * len(self.main_data_axes)
             if full_data:
                 original_dist_axis = self.main_data_dist_axis
                 if not original_dist_axis in axes:
@@ -1320,38 +2115,218 @@ class BasicTod(memh5.MemDiskGroup):
                     # choose the longest axis in axes as the new dist axis
                     new_dist_axis = axes[np.argmax(axes_len)]
                     self.redistribute(new_dist_axis)
-            if self.main_data.distributed:
-                lgind = [ list(self.main_data.data.enumerate(axis)) for axis in axes ]
+        else:
+            raise ValueError('Invalid op_axis: %s', op_axis)
+
+        if schedule == 'dynamic':
+            if not full_data:
+                raise ValueError('Dynamic schedule works only with full_data')
+            if isinstance(op_axis, tuple):
+                self._dynamic_operate(func, names, axes, axis_vals, copy_data, kwargs)
             else:
-                lgind = [ list(enumerate(range(self.main_data.data.shape[axis]))) for axis in axes ]
-            linds = [ [ li for (li, gi) in lg ] for lg in lgind ]
-            ginds = [ [ gi for (li, gi) in lg ] for lg in lgind ]
-            lgind = zip(itertools.product(*linds), itertools.product(*ginds))
-            if show_progress:
-                pg = progress.Progress(len(lgind), step=progress_step)
-            cnt = 0
-            for lind, gind in lgind:
-                if show_progress and mpiutil.rank0:
-                    pg.show(cnt)
-                cnt += 1
-                axis_val = ()
-                for ai, axis in enumerate(axes):
-                    data_sel[axis] = lind[ai]
-                    if isinstance(axis_vals[ai], memh5.MemDataset):
-                        # use the new dataset which may be different from axis_vals if it is redistributed
-                        axis_val += (self[axis_vals[ai].name].local_data[lind[ai]],)
-                    elif hasattr(axis_vals[ai], '__iter__'):
-                        axis_val += (axis_vals[ai][lind[ai]],)
-                    else:
-                        axis_val += (axis_vals[ai],)
-                if copy_data:
-                    func(self.main_data.local_data[data_sel].copy(), lind, gind, axis_val, self, **kwargs)
-                else:
-                    func(self.main_data.local_data[data_sel], lind, gind, axis_val, self, **kwargs)
-            if full_data and keep_dist_axis:
+                self._dynamic_operate(func, names, axes[0], axis_vals[0], copy_data, kwargs)
+            if keep_dist_axis:
                 self.redistribute(original_dist_axis)
+            return
+        elif schedule != 'static':
+            raise ValueError('Unknown schedule %s' % schedule)
+
+        if self.main_data_name in self._lazy_datasets:
+            lgind = [ self.main_data.enumerate(axis) for axis in axes ]
+        elif self.main_data.distributed:
+            lgind = [ list(self.main_data.data.enumerate(axis)) for axis in axes ]
         else:
-            raise ValueError('Invalid op_axis: %s', op_axis)
+            lgind = [ list(enumerate(range(self.main_data.data.shape[axis]))) for axis in axes ]
+        linds = [ [ li for (li, gi) in lg ] for lg in lgind ]
+        ginds = [ [ gi for (li, gi) in lg ] for lg in lgind ]
+        if block_size is not None:
+            # split the consecutive local indices along each axis into blocks,
+            # a block along the dist axis of a lazy main data must be in a
+            # single lazy block, else its section would be a copy
+            aligns = [ (self.main_data.block_len if (self.main_data_name in self._lazy_datasets and axis == self.main_data_dist_axis) else None) for axis in axes ]
+            linds, ginds = zip(*[ _index_blocks(li, gi, block_size, al) for (li, gi, al) in zip(linds, ginds, aligns) ])
+        lgind = zip(itertools.product(*linds), itertools.product(*ginds))
+        if self.main_data_name in self._lazy_datasets and self.main_data_dist_axis in axes:
+            # loop the dist axis outermost to access the lazy blocks in sequence
+            pos = axes.index(self.main_data_dist_axis)
+            lgind.sort(key=lambda lg: _index_start(lg[0][pos]))
+
+        block_dset = self._operate_block_dataset(names, axes)
+        num_sections = 1 if block_dset is None else block_dset.num_blocks
+        if show_progress:
+            pg = progress.Progress(num_sections * len(lgind), step=progress_step)
+        cnt = 0
+        pool = ThreadPool(num_threads) if num_threads > 1 else None
+        # number of calls of func prepared at once for the thread pool
+        batch_size = 4 * num_threads
+        data_sel = [ slice(0, None) ] * len(self.main_data_axes)
+        try:
+            for arrays in self._operate_sections(names, axes, not copy_data):
+                batch = []
+                for lind, gind in lgind:
+                    if show_progress and mpiutil.rank0:
+                        pg.show(cnt)
+                    cnt += 1
+                    axis_val = ()
+                    for ai, axis in enumerate(axes):
+                        data_sel[axis] = lind[ai]
+                        if isinstance(axis_vals[ai], memh5.MemDataset):
+                            # use the new dataset which may be different from axis_vals if it is redistributed
+                            axis_val += (self[axis_vals[ai].name].local_data[lind[ai]],)
+                        elif hasattr(axis_vals[ai], '__iter__'):
+                            axis_val += (axis_vals[ai][lind[ai]],)
+                        else:
+                            axis_val += (axis_vals[ai],)
+                    sections = [ _section(arr, data_sel, copy_data) for arr in arrays ]
+                    if block_size is not None:
+                        lind = tuple([ np.arange(sl.start, sl.stop) for sl in lind ])
+                    if not isinstance(op_axis, tuple):
+                        lind, gind, axis_val = lind[0], gind[0], axis_val[0]
+                    batch.append((sections, list(data_sel), sections + [lind, gind, axis_val, self]))
+                    if len(batch) >= batch_size:
+                        _operate_batch(func, kwargs, arrays, batch, copy_data, pool)
+                        batch = []
+                _operate_batch(func, kwargs, arrays, batch, copy_data, pool)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if full_data and keep_dist_axis:
+            self.redistribute(original_dist_axis)
+
+    def _dynamic_operate(self, func, names, axes, axis_vals, copy_data, kwargs):
+        ### call `func` on the slices along `axes` of the datasets `names`,
+        ### whose slices along the dist axis (which is one of `axes`) are
+        ### handed out on demand among all procs, see work_stealing.operate;
+        ### the indices and axis values passed to func are tuples if `axes`
+        ### is a list, else single ones
+
+        single = not isinstance(axes, list)
+        axes = [ axes ] if single else axes
+        axis_vals = [ axis_vals ] if single else list(axis_vals)
+        dist_axis = self.main_data_dist_axis
+        di = axes.index(dist_axis)
+
+        # the operated datasets must be in memory
+        self.materialize([ name for name in names if name in self._lazy_datasets ])
+
+        # axis values of all slices along the dist axis, as a slice may be
+        # operated by any proc
+        for ai, vals in enumerate(axis_vals):
+            if isinstance(vals, memh5.MemDataset):
+                dset = self[vals.name]
+                vals = dset.local_data[:]
+                if ai == di and dset.distributed and self.comm is not None:
+                    vals = np.concatenate(self.comm.allgather(vals), axis=dset.distributed_axis)
+            elif ai == di and hasattr(vals, '__iter__') and self.comm is not None:
+                vals = np.concatenate(self.comm.allgather(np.asarray(vals)), axis=0)
+            axis_vals[ai] = vals
+        shape = self.main_data.local_data.shape
+        nlocal = [ shape[dist_axis] ] if self.comm is None else self.comm.allgather(shape[dist_axis])
+        offsets = np.cumsum([0] + nlocal)
+
+        # position of each of the other axes in a slice along the dist axis
+        # of each dataset
+        positions = []
+        for name in names:
+            order = list(self.main_axes_ordered_datasets[name])
+            pd = order.index(dist_axis)
+            positions.append([ (order.index(axis) if order.index(axis) < pd else order.index(axis) - 1) for axis in axes ])
+
+        def _call(owner, li, rows):
+            ### call func on all sections of the slice `li` of proc `owner`
+            gi = offsets[owner] + li
+            ranges = [ ([li] if ai == di else xrange(shape[axis])) for (ai, axis) in enumerate(axes) ]
+            for lind in itertools.product(*ranges):
+                gind = tuple([ (gi if ai == di else ind) for (ai, ind) in enumerate(lind) ])
+                axis_val = tuple([ (vals[gind[ai]] if hasattr(vals, '__iter__') else vals) for (ai, vals) in enumerate(axis_vals) ])
+                sections = []
+                for row, pos in zip(rows, positions):
+                    sel = [ slice(0, None) ] * row.ndim
+                    for ai, ind in enumerate(lind):
+                        if ai != di:
+                            sel[pos[ai]] = ind
+                    sections.append(row[tuple(sel)])
+                if single:
+                    lind, gind, axis_val = lind[0], gind[0], axis_val[0]
+                func(*(sections + [lind, gind, axis_val, self]), **kwargs)
+
+        # packed masks are operated on unpacked
+        local_arrays = [ self[name].local_data for name in names ]
+        arrays = [ arr.unpack() if isinstance(arr, packed_mask.PackedMask) else arr for arr in local_arrays ]
+        dist_axes = [ list(self.main_axes_ordered_datasets[name]).index(dist_axis) for name in names ]
+        stats = work_stealing.operate(arrays, dist_axes, _call, self.comm, copy_data)
+        if not copy_data:
+            sel = [ slice(0, None) ] * self.main_data.local_data.ndim
+            _pack_back(local_arrays, arrays, sel)
+
+        # report the balance of the load
+        all_stats = [ stats ] if self.comm is None else self.comm.allgather(stats)
+        self.operate_stats = all_stats
+        if self.rank0:
+            busy = [ st['busy'] for st in all_stats ]
+            wall = [ st['wall'] for st in all_stats ]
+            counts, edges = work_stealing.busy_histogram(busy, wall)
+            msg = 'Busy time fraction of %d procs (max wall time %.3f s, %d slices stolen):' % (len(all_stats), max(wall), sum([ st['stolen'] for st in all_stats ]))
+            for ci, cnt in enumerate(counts):
+                msg += '\n\t[%.1f, %.1f): %d' % (edges[ci], edges[ci+1], cnt)
+            logger.info(msg)
+
+    def _operate_datasets(self):
+        ### names of datasets whose local data are passed to `func` in data_operate
+        return [ self.main_data_name ]
+
+    def _operate_block_dataset(self, names, axes):
+        ### the lazy dataset in `names` whose blocks will be operated one by
+        ### one, i.e., when the dist axis is not one of the operating `axes`,
+        ### None if no such one
+        if self.main_data_dist_axis in axes:
+            return None
+        for name in names:
+            if name in self._lazy_datasets:
+                return self[name]
+
+        return None
+
+    def _operate_sections(self, names, axes, write=True):
+        ### generate sections of the local data of datasets `names` to be
+        ### operated, which are the whole local data, or the sections
+        ### corresponding to each block if there is a lazy dataset in `names`
+        ### and the dist axis is not one of the operating `axes`, the blocks
+        ### are marked modified if `write`
+
+        block_dset = self._operate_block_dataset(names, axes)
+        if block_dset is None:
+            yield [ self[name].local_data for name in names ]
+            return
+
+        for bi in xrange(block_dset.num_blocks):
+            bs, be = block_dset.block_range(bi)
+            arrays = []
+            pinned = []
+            packed = []
+            try:
+                for name in names:
+                    # get it in each loop as it may have been materialized
+                    dset = self[name]
+                    if name in self._lazy_datasets:
+                        # keep it in memory while it is being operated
+                        arrays.append(dset.block(bi, write))
+                        dset.pin(bi)
+                        pinned.append(dset)
+                    else:
+                        sel = [ slice(0, None) ] * len(dset.shape)
+                        sel[list(self.main_axes_ordered_datasets[name]).index(self.main_data_dist_axis)] = slice(bs, be)
+                        arrays.append(dset.local_data[tuple(sel)])
+                        if name in self._packed_datasets:
+                            packed.append((dset.local_data, sel, arrays[-1]))
+                yield arrays
+                # pack back the operated blocks of packed datasets
+                for mask, sel, arr in packed:
+                    mask[tuple(sel)] = arr
+            finally:
+                for dset in pinned:
+                    dset.unpin(bi)
 
     def all_data_operate(self, func, copy_data=False, **kwargs):
         """Operation to the whole main data.
@@ -1433,6 +2408,7 @@ class BasicTod(memh5.MemDiskGroup):
                 ldata = mpiutil.gather_array(other[name].local_data[sel], axis=di, root=ri, comm=self.comm)
                 if ri == mpiutil.rank:
                     self[name].local_data[:] = ldata
+                    telemetry.count('bytes_gathered', ldata.nbytes)
 
     def _copy_a_time_ordered_dataset(self, name, other):
         ### copy a time ordered dataset (except those also in main_axes_ordered_datasets) from `other` to self
@@ -0,0 +1,243 @@
+"""Persistent metadata index of HDF5 data files.
+
+Getting the metadata of the input files (e.g., the number of time points in
+each file) needs opening all of them, which may be slow for a large number of
+files on a networked file system. This module keeps the metadata of the data
+files in a directory in an index file, so it only needs to be read from the
+data files once. Each entry of the index records the size and the modification
+time of the data file, and it will be updated automatically if any of them
+changes.
+
+The index files are kept in an index directory (see :func:`set_index_dir`)
+instead of the data directories, which are often read-only or shared, one
+file for each data directory named by the hash of its path. The pipeline sets
+it to the directory given by its parameter `index_dir`. No index is used if
+there is no index directory.
+
+The index can be built beforehand by the command line tool `h5index`.
+
+"""
+
+import os
+import sys
+import json
+import pickle
+import hashlib
+import tempfile
+import h5py
+from caput import mpiutil
+
+
+INDEX_VERSION = 2
+
+# directory of the index files, see set_index_dir
+_index_dir = os.environ.get('TL_INDEX_DIR', None)
+
+
+def fingerprint(filename):
+    """Return the fingerprint, i.e., [size, mtime] of a file."""
+    st = os.stat(filename)
+    return [ st.st_size, st.st_mtime ]
+
+
+def probe_file(filename):
+    """Read the metadata of a HDF5 data file.
+
+    Parameters
+    ----------
+    filename : string
+        Name of the data file.
+
+    Returns
+    -------
+    info : dict
+        The metadata, which has keys 'fingerprint', 'shapes' and 'dtypes' (of
+        the top level datasets), 'inttime', 'sec1970' and 'last_sec1970' (time
+        of the first and last time points), and 'hints' (the pickled hints of
+        the data container). A value is None if it is not in the file.
+
+    """
+
+    info = {'fingerprint': fingerprint(filename)}
+    with h5py.File(filename, 'r') as f:
+        dsets = [ (name, dset) for (name, dset) in f.iteritems() if isinstance(dset, h5py.Dataset) ]
+        info['shapes'] = { name: list(dset.shape) for (name, dset) in dsets }
+        info['dtypes'] = { name: str(dset.dtype) for (name, dset) in dsets }
+        info['inttime'] = float(f.attrs['inttime']) if 'inttime' in f.attrs else None
+        info['hints'] = str(f.attrs['hints']) if 'hints' in f.attrs else None
+
+        info['sec1970'] = None
+        info['last_sec1970'] = None
+        if 'sec1970' in f and len(f['sec1970'].shape) == 1 and f['sec1970'].shape[0] > 0:
+            info['sec1970'] = float(f['sec1970'][0])
+            info['last_sec1970'] = float(f['sec1970'][-1])
+        elif 'sec1970' in f.attrs and info['inttime'] is not None and 'vis' in f:
+            info['sec1970'] = float(f.attrs['sec1970'])
+            info['last_sec1970'] = info['sec1970'] + (f['vis'].shape[0] - 1) * info['inttime']
+
+    return info
+
+
+def set_index_dir(index_dir):
+    """Set the directory to keep the index files in, None to use no index.
+
+    The default is given by the environment variable `TL_INDEX_DIR`.
+    """
+    global _index_dir
+    _index_dir = index_dir
+
+
+def get_index_dir():
+    """Return the directory of the index files, None if no index is used."""
+    return _index_dir
+
+
+def index_file(dirname):
+    """Return the name of the index file of data directory `dirname`, None if no index is used."""
+    if _index_dir is None:
+        return None
+    dirname = os.path.abspath(dirname)
+    return os.path.join(_index_dir, 'tlpipe_index_%s.json' % hashlib.md5(dirname).hexdigest())
+
+
+def load_index(dirname):
+    """Load the index of data directory `dirname`, return an empty one if not exist or invalid."""
+    filename = index_file(dirname)
+    if filename is None:
+        return {}
+    try:
+        with open(filename, 'r') as fl:
+            index = json.load(fl)
+    except (IOError, OSError, ValueError):
+        return {}
+
+    if not isinstance(index, dict) or index.get('version', None) != INDEX_VERSION:
+        return {}
+    if index.get('dirname', None) != os.path.abspath(dirname):
+        return {}
+
+    return index.get('files', {})
+
+
+def save_index(dirname, index):
+    """Save the index of data directory `dirname`, return True if success.
+
+    The index file is replaced atomically, so concurrent readers will never see
+    a partially written index.
+    """
+    filename = index_file(dirname)
+    if filename is None:
+        return False
+    try:
+        try:
+            os.makedirs(_index_dir)
+        except OSError:
+            if not os.path.isdir(_index_dir):
+                raise
+        fd, tmp_file = tempfile.mkstemp(prefix=os.path.basename(filename), dir=_index_dir)
+        with os.fdopen(fd, 'w') as fl:
+            json.dump({'version': INDEX_VERSION, 'dirname': os.path.abspath(dirname), 'files': index}, fl)
+        os.chmod(tmp_file, 0644)
+        os.rename(tmp_file, filename)
+    except (IOError, OSError):
+        # usually no write permission for the directory
+        return False
+
+    return True
+
+
+def update_index(files, force=False, save=True):
+    """Return the metadata of `files`, update the index if necessary.
+
+    Parameters
+    ----------
+    files : list of strings
+        Names of the data files.
+    force : bool, optional
+        If True, re-read the metadata of all files even if the index is up to
+        date. Default False.
+    save : bool, optional
+        If True, save the updated index to the index directory. Default True.
+
+    Returns
+    -------
+    files_info : list of dicts
+        Metadata of each file in `files`, see :func:`probe_file`.
+
+    """
+
+    files_info = []
+    indices = {} # index of each directory
+    updated = set() # directories whose index has been updated
+    for filename in files:
+        dirname, basename = os.path.split(os.path.abspath(filename))
+        if not dirname in indices:
+            indices[dirname] = load_index(dirname)
+        index = indices[dirname]
+
+        info = index.get(basename, None)
+        if force or info is None or info.get('fingerprint', None) != fingerprint(filename):
+            info = probe_file(filename)
+            index[basename] = info
+            updated.add(dirname)
+        files_info.append(info)
+
+    if save:
+        for dirname in updated:
+            save_index(dirname, indices[dirname])
+
+    return files_info
+
+
+def get_file_info(files, comm=None):
+    """Return the metadata of `files` on all processes.
+
+    The metadata is got from the index by the rank 0 process and broadcasted
+    to other processes in `comm`, so this must be called by all processes.
+
+    Parameters
+    ----------
+    files : list of strings
+        Names of the data files.
+    comm : None or MPI.Comm, optional
+        MPI Communicator. Default None to use mpiutil.world.
+
+    Returns
+    -------
+    files_info : list of dicts
+        Metadata of each file in `files`, see :func:`probe_file`.
+
+    """
+
+    comm = mpiutil.world if comm is None else comm
+    rank = 0 if comm is None else comm.rank
+
+    files_info = None
+    error = None
+    if rank == 0:
+        try:
+            files_info = update_index(files)
+        except Exception as e:
+            exc_info = sys.exc_info()
+            # other procs raise the same exception if it can be pickled
+            try:
+                error = pickle.loads(pickle.dumps(e))
+            except Exception:
+                error = RuntimeError('Failed to get the metadata of the input files: %s: %s' % (type(e).__name__, e))
+    # always broadcast the error, so other procs will not wait for the
+    # metadata if rank 0 fails
+    error = mpiutil.bcast(error, root=0, comm=comm)
+    if error is not None:
+        if rank == 0:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        raise error
+
+    return mpiutil.bcast(files_info, root=0, comm=comm)
+
+
+def num_time_points(files_info, dset_name):
+    """Return the number of time points of dataset `dset_name` in each file."""
+    try:
+        return [ info['shapes'][dset_name][0] for info in files_info ]
+    except KeyError:
+        raise KeyError('Dataset %s does not exist in all files' % dset_name)
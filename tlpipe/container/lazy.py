@@ -0,0 +1,625 @@
+"""Lazy, out-of-core backing of the distributed datasets of a data container.
+
+In the lazy mode of :class:`~tlpipe.container.container.BasicTod`, the main
+data (and the datasets that have the same axes as it, e.g., `vis_mask`) are
+not read into memory by `load_all`, but stay backed by the input HDF5 files
+through a :class:`LazyDataset` proxy. The local section of each process is
+divided into blocks along the distributed axis, which are read from files only
+when they are touched, and are held in a :class:`BlockCache` which has a budget
+on the total resident bytes. Blocks that have been modified are spilled to a
+scratch HDF5 file when they are evicted from the cache, so no modifications
+will be lost.
+
+"""
+
+import os
+import itertools
+import tempfile
+import collections
+import numpy as np
+import h5py
+from caput import mpiutil
+from caput import mpiarray
+from tlpipe.utils import telemetry
+
+
+# unique id for each lazy dataset
+_uid = itertools.count()
+
+
+class BlockCache(object):
+    """A least recently used cache of data blocks.
+
+    A block is regarded as modified once it has been got for writing or
+    marked dirty, which must be done by whoever writes into it.
+
+    Parameters
+    ----------
+    max_bytes : integer
+        Budget of the total bytes of blocks resident in memory. Blocks will be
+        evicted in the least recently used order when this is exceeded, but
+        the most recently used block and the pinned blocks are always kept.
+    scratch_dir : None or string, optional
+        Directory to create the scratch file to spill the modified blocks. The
+        default temporary directory will be used if None. Default None.
+
+    """
+
+    def __init__(self, max_bytes, scratch_dir=None):
+        self.max_bytes = max_bytes
+        self.scratch_dir = scratch_dir
+        self._blocks = collections.OrderedDict() # key: [array, dirty]
+        self._pinned = set() # keys of the blocks that can not be evicted
+        self._spilled = set() # keys of the spilled blocks
+        self._nbytes = 0
+        self._scratch_file = None
+
+    @property
+    def nbytes(self):
+        """Total bytes of blocks resident in memory."""
+        return self._nbytes
+
+    def get(self, key, load, write=False):
+        """Return the block `key`, call `load()` to load it if not cached.
+
+        The block is marked dirty if `write` is True.
+        """
+        try:
+            entry = self._blocks.pop(key)
+        except KeyError:
+            if key in self._spilled:
+                arr = self._read_spilled(key)
+            else:
+                arr = load()
+            entry = [arr, False]
+            self._nbytes += arr.nbytes
+        entry[1] = entry[1] or write
+        self._blocks[key] = entry # move to the most recently used position
+        self._evict()
+
+        return entry[0]
+
+    def mark_dirty(self, key):
+        """Mark the cached block `key` as modified."""
+        self._blocks[key][1] = True
+
+    def pin(self, key):
+        """Keep the block `key` in memory until it is unpinned."""
+        self._pinned.add(key)
+
+    def unpin(self, key):
+        """Allow the block `key` to be evicted."""
+        self._pinned.discard(key)
+
+    def is_modified(self, uid):
+        """Whether any block of the lazy dataset `uid` has been modified."""
+        for key in self._spilled:
+            if key[0] == uid:
+                return True
+        for key, (arr, dirty) in self._blocks.iteritems():
+            if key[0] == uid and dirty:
+                return True
+
+        return False
+
+    def discard(self, uid):
+        """Drop all blocks of the lazy dataset `uid`."""
+        for key in [ key for key in self._blocks.iterkeys() if key[0] == uid ]:
+            self._nbytes -= self._blocks.pop(key)[0].nbytes
+            self._pinned.discard(key)
+        spilled = [ key for key in self._spilled if key[0] == uid ]
+        if len(spilled) > 0:
+            with h5py.File(self._scratch_file, 'r+') as f:
+                for key in spilled:
+                    self._spilled.remove(key)
+                    del f[self._spill_name(key)]
+
+    def close(self):
+        """Drop all blocks and remove the scratch file."""
+        self._blocks.clear()
+        self._pinned.clear()
+        self._spilled.clear()
+        self._nbytes = 0
+        if self._scratch_file is not None:
+            if os.path.exists(self._scratch_file):
+                os.remove(self._scratch_file)
+            self._scratch_file = None
+
+    def _evict(self):
+        ### evict the least recently used blocks until within the budget
+        for key in list(self._blocks.iterkeys())[:-1]:
+            if self._nbytes <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            arr, dirty = self._blocks.pop(key)
+            self._nbytes -= arr.nbytes
+            if dirty:
+                self._spill(key, arr)
+
+    def _spill_name(self, key):
+        ### dataset name of the spilled block `key` in the scratch file
+        return '%d_%d' % key
+
+    def _spill(self, key, arr):
+        ### write a modified block to the scratch file
+        if self._scratch_file is None:
+            fd, self._scratch_file = tempfile.mkstemp(suffix='.hdf5', prefix='tlpipe_lazy_', dir=self.scratch_dir)
+            os.close(fd)
+            h5py.File(self._scratch_file, 'w').close()
+        with h5py.File(self._scratch_file, 'r+') as f:
+            name = self._spill_name(key)
+            if name in f:
+                del f[name]
+            f.create_dataset(name, data=arr)
+        self._spilled.add(key)
+
+    def _read_spilled(self, key):
+        ### read a spilled block back from the scratch file
+        with h5py.File(self._scratch_file, 'r') as f:
+            return f[self._spill_name(key)][...]
+
+
+class LazyDataset(object):
+    """A proxy of a distributed dataset backed by the input files.
+
+    This mimics the interface of :class:`caput.memh5.MemDatasetDistributed`
+    that is used by the data containers and tasks, but its local data will be
+    read in blocks along the distributed axis only when it is touched.
+
+    Parameters
+    ----------
+    name : string
+        Name of the dataset.
+    shape : tuple
+        The global shape of the dataset.
+    dtype : numpy dtype
+        Data type of the dataset.
+    distributed_axis : integer
+        Axis of the dataset along which it is distributed.
+    reader : callable
+        Function of type reader(axis, start, stop) that reads and returns the
+        section from `start` to `stop` along `axis` of the global dataset.
+    cache : :class:`BlockCache`
+        Cache to hold the blocks of this dataset.
+    block_len : integer
+        Length of a block along the distributed axis.
+    attrs : dict, optional
+        Attributes of the dataset.
+    comm : None or MPI.Comm, optional
+        MPI Communicator the dataset distributed over.
+    materializer : None or callable, optional
+        Function of type materializer(name) that replaces this lazy dataset by
+        an ordinary in-memory dataset in its container and returns the new
+        dataset. It is used for operations that need the whole local array.
+
+    """
+
+    def __init__(self, name, shape, dtype, distributed_axis, reader, cache, block_len, attrs=None, comm=None, materializer=None):
+        self._name = name
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+        self._distributed_axis = distributed_axis
+        self._reader = reader
+        self._cache = cache
+        self._block_len = max(1, int(block_len))
+        self.attrs = {} if attrs is None else dict(attrs)
+        self.comm = comm
+        self.materializer = materializer
+        self.uid = _uid.next()
+
+        n, s, e = mpiutil.split_local(self._shape[distributed_axis], comm=comm)
+        self._local_offset = tuple([ (s if ai == distributed_axis else 0) for ai in xrange(len(self._shape)) ])
+        self._local_shape = tuple([ (n if ai == distributed_axis else ni) for ai, ni in enumerate(self._shape) ])
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def global_shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def distributed(self):
+        return True
+
+    @property
+    def common(self):
+        return False
+
+    @property
+    def distributed_axis(self):
+        return self._distributed_axis
+
+    @property
+    def local_offset(self):
+        return self._local_offset
+
+    @property
+    def local_shape(self):
+        return self._local_shape
+
+    @property
+    def block_len(self):
+        """Length of a block along the distributed axis."""
+        return self._block_len
+
+    @property
+    def num_blocks(self):
+        """Number of blocks of the local section."""
+        nl = self._local_shape[self._distributed_axis]
+        return (nl + self._block_len - 1) / self._block_len
+
+    @property
+    def modified(self):
+        """Whether any block of this dataset has been modified."""
+        return self._cache.is_modified(self.uid)
+
+    def block_range(self, bi):
+        """Local start and stop along the distributed axis of block `bi`."""
+        nl = self._local_shape[self._distributed_axis]
+        return bi * self._block_len, min((bi + 1) * self._block_len, nl)
+
+    def block(self, bi, write=False):
+        """Return block `bi` of the local section.
+
+        The returned array is the cached block itself, so modifications to it
+        will be kept, as long as they are done before it is evicted from the
+        cache, i.e., before accessing too many other blocks, unless it is pinned.
+        Set `write` to True if it will be modified, else the modifications may
+        be lost.
+        """
+        def _load():
+            ls, le = self.block_range(bi)
+            offset = self._local_offset[self._distributed_axis]
+            arr = np.ascontiguousarray(self._reader(self._distributed_axis, offset+ls, offset+le), dtype=self._dtype)
+            telemetry.count('bytes_read', arr.nbytes)
+            return arr
+
+        return self._cache.get((self.uid, bi), _load, write)
+
+    def pin(self, bi):
+        """Keep block `bi` in memory until it is unpinned."""
+        self._cache.pin((self.uid, bi))
+
+    def unpin(self, bi):
+        """Allow block `bi` to be evicted from memory."""
+        self._cache.unpin((self.uid, bi))
+
+    def read_local(self, out=None):
+        """Read the whole local section into `out` (a new array if None)."""
+        if out is None:
+            out = np.empty(self._local_shape, dtype=self._dtype)
+        sel = [ slice(0, None) ] * len(self._shape)
+        for bi in xrange(self.num_blocks):
+            ls, le = self.block_range(bi)
+            sel[self._distributed_axis] = slice(ls, le)
+            out[tuple(sel)] = self.block(bi)
+
+        return out
+
+    def enumerate(self, axis):
+        """Same as :meth:`caput.mpiarray.MPIArray.enumerate`."""
+        if axis == self._distributed_axis:
+            return [ (li, li + self._local_offset[axis]) for li in xrange(self._local_shape[axis]) ]
+        else:
+            return [ (li, li) for li in xrange(self._shape[axis]) ]
+
+    def to_mpi_array(self):
+        """Read the local section into a new :class:`caput.mpiarray.MPIArray`.
+
+        This does not involve any communication between processes.
+        """
+        arr = mpiarray.MPIArray(self._shape, axis=self._distributed_axis, comm=self.comm, dtype=self._dtype)
+        self.read_local(arr.local_array)
+
+        return arr
+
+    def discard(self):
+        """Drop all cached blocks of this dataset."""
+        self._cache.discard(self.uid)
+
+    def redistribute(self, axis, block_len=None):
+        """Return a new proxy distributed along `axis`.
+
+        This is cheap as no data is moved, but it is only valid when no block
+        has been modified.
+        """
+        if self.modified:
+            raise RuntimeError('Can not redistribute the lazy dataset %s as it has been modified' % self._name)
+        self.discard()
+        block_len = self._block_len if block_len is None else block_len
+
+        return LazyDataset(self._name, self._shape, self._dtype, axis, self._reader, self._cache, block_len, self.attrs, self.comm, self.materializer)
+
+    def materialize(self):
+        """Replace this lazy dataset by an in-memory dataset and return it."""
+        if self.materializer is None:
+            raise RuntimeError('Can not materialize the lazy dataset %s' % self._name)
+        return self.materializer(self._name)
+
+    @property
+    def local_data(self):
+        return LazyArray(self)
+
+    @property
+    def data(self):
+        return self.materialize().data
+
+    def __getitem__(self, obj):
+        return self.local_data[obj]
+
+    def __setitem__(self, obj, val):
+        self.local_data[obj] = val
+
+    def __len__(self):
+        return self._shape[0]
+
+
+class LazyArray(object):
+    """Array like view of the local section of a :class:`LazyDataset`.
+
+    Indexing that falls in a single block along the distributed axis (e.g.,
+    an integer index or a slice inside the block) is served from the cached
+    block, so basic indexing returns a view just like a numpy array does. Other
+    indexing (e.g., a slice over several blocks or an integer or boolean array
+    along the distributed axis) reads or writes only the rows it selects along
+    the distributed axis, and getting returns a copy. Any other operation needs
+    the whole local array, so it will first materialize the lazy dataset, i.e.,
+    replace it by an ordinary in-memory dataset in its container.
+
+    Modifications must be done by item assignment (including augmented
+    assignment like ``a[i] += 1``), so the modified blocks are known; writing
+    into a view got by indexing does not mark its block as modified.
+
+    Parameters
+    ----------
+    dset : :class:`LazyDataset`
+        The lazy dataset.
+
+    """
+
+    # make numpy binary operations defer to this class
+    __array_priority__ = 10.0
+
+    def __init__(self, dset):
+        self._dset = dset
+
+    @property
+    def shape(self):
+        return self._dset.local_shape
+
+    @property
+    def dtype(self):
+        return self._dset.dtype
+
+    @property
+    def ndim(self):
+        return len(self._dset.local_shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self._dset.local_shape))
+
+    @property
+    def itemsize(self):
+        return self._dset.dtype.itemsize
+
+    @property
+    def nbytes(self):
+        return self.size * self.itemsize
+
+    def __len__(self):
+        return self._dset.local_shape[0]
+
+    def _full(self):
+        ### the whole local array
+        return self._dset.materialize().local_data
+
+    def _expand(self, obj):
+        ### expand `obj` to a tuple of an index for each axis, return None if
+        ### it has np.newaxis or is too long
+        if not isinstance(obj, tuple):
+            obj = (obj,)
+        ndim = self.ndim
+        eis = [ i for (i, o) in enumerate(obj) if o is Ellipsis ]
+        if len(eis) > 1 or any([ o is None for o in obj ]):
+            return None
+        if len(eis) == 1:
+            ei = eis[0]
+            obj = obj[:ei] + (slice(None),) * (ndim - len(obj) + 1) + obj[ei+1:]
+        if len(obj) > ndim:
+            return None
+
+        return obj + (slice(None),) * (ndim - len(obj))
+
+    def _block_index(self, obj):
+        ### convert `obj` to (block index, index in the block) if it only
+        ### touches a single block, else return None
+        obj = self._expand(obj)
+        if obj is None:
+            return None
+        # only basic indexing with integers and slices
+        for o in obj:
+            if not (isinstance(o, slice) or isinstance(o, (int, long, np.integer))):
+                return None
+
+        di = self._dset.distributed_axis
+        nl = self._dset.local_shape[di]
+        bl = self._dset.block_len
+        if nl == 0:
+            return None
+        o = obj[di]
+        if isinstance(o, slice):
+            start, stop, step = o.indices(nl)
+            if step != 1:
+                return None
+            if stop <= start:
+                bi = 0
+                new_o = slice(0, 0)
+            else:
+                bi = start / bl
+                if (stop - 1) / bl != bi:
+                    return None
+                new_o = slice(start - bi*bl, stop - bi*bl)
+        else:
+            o = int(o)
+            if o < 0:
+                o += nl
+            if o < 0 or o >= nl:
+                raise IndexError('index %d is out of bounds for axis %d with size %d' % (o, di, nl))
+            bi = o / bl
+            new_o = o - bi*bl
+
+        return bi, obj[:di] + (new_o,) + obj[di+1:]
+
+    def _rows_index(self, obj):
+        ### convert `obj` to (rows, pre, post): the sorted local rows along the
+        ### dist axis it touches, the basic index to take the touched part of
+        ### these rows, and the index to apply to that part to get the same
+        ### result as `obj`; return None if `obj` is not supported
+        obj = self._expand(obj)
+        if obj is None:
+            return None
+
+        di = self._dset.distributed_axis
+        nl = self._dset.local_shape[di]
+        pre, post = [], []
+        for ai, o in enumerate(obj):
+            if ai == di:
+                if isinstance(o, slice):
+                    rows = np.arange(nl)[o]
+                    if len(rows) > 0 and rows[0] > rows[-1]:
+                        rows, o = rows[::-1], slice(None, None, -1)
+                    else:
+                        o = slice(None)
+                else:
+                    o = np.asarray(o)
+                    if o.dtype == np.bool:
+                        if o.shape != (nl,):
+                            return None
+                        o = np.nonzero(o)[0]
+                    elif not issubclass(o.dtype.type, np.integer):
+                        return None
+                    o = np.where(o < 0, o + nl, o)
+                    if np.any(o < 0) or np.any(o >= nl):
+                        raise IndexError('index out of bounds for axis %d with size %d' % (di, nl))
+                    rows, inv = np.unique(o, return_inverse=True)
+                    o = inv.reshape(o.shape) if o.ndim > 0 else int(inv[0])
+                pre.append(slice(None))
+                post.append(o)
+            elif isinstance(o, slice):
+                # select it on reading, so only the touched part is held
+                pre.append(o)
+                post.append(slice(None))
+            elif isinstance(o, (int, long, np.integer)):
+                # keep the axis on reading to not change the kinds of indices
+                o = int(o) + (self.shape[ai] if o < 0 else 0)
+                pre.append(slice(o, o+1))
+                post.append(0)
+            else:
+                pre.append(slice(None))
+                post.append(o)
+
+        return rows, tuple(pre), tuple(post)
+
+    def _row_blocks(self, rows):
+        ### generate (block index, positions in `rows`, rows in the block) of
+        ### the blocks that hold the sorted local `rows`
+        bl = self._dset.block_len
+        bis = rows / bl
+        for bi in np.unique(bis):
+            st, et = np.searchsorted(bis, [bi, bi+1])
+            yield bi, slice(st, et), rows[st:et] - bi*bl
+
+    def _read_rows(self, rows, pre):
+        ### read the part `pre` of local `rows` along the dist axis
+        di = self._dset.distributed_axis
+        shape = [ len(xrange(*p.indices(n))) for (p, n) in zip(pre, self._dset.local_shape) ]
+        shape[di] = len(rows)
+        out = np.empty(shape, dtype=self.dtype)
+        sel = list(pre)
+        osel = [ slice(None) ] * len(shape)
+        for bi, pos, brows in self._row_blocks(rows):
+            sel[di], osel[di] = brows, pos
+            out[tuple(osel)] = self._dset.block(bi)[tuple(sel)]
+
+        return out
+
+    def _write_rows(self, rows, pre, data):
+        ### write `data` to the part `pre` of local `rows` along the dist axis
+        di = self._dset.distributed_axis
+        sel = list(pre)
+        dsel = [ slice(None) ] * data.ndim
+        for bi, pos, brows in self._row_blocks(rows):
+            sel[di], dsel[di] = brows, pos
+            self._dset.block(bi, write=True)[tuple(sel)] = data[tuple(dsel)]
+
+    def __getitem__(self, obj):
+        bsel = self._block_index(obj)
+        if bsel is not None:
+            bi, sel = bsel
+            return self._dset.block(bi)[sel]
+        rsel = self._rows_index(obj)
+        if rsel is None:
+            return self._full()[obj]
+        rows, pre, post = rsel
+        return self._read_rows(rows, pre)[post]
+
+    def __setitem__(self, obj, val):
+        bsel = self._block_index(obj)
+        if bsel is not None:
+            bi, sel = bsel
+            self._dset.block(bi, write=True)[sel] = val
+            return
+        rsel = self._rows_index(obj)
+        if rsel is None:
+            self._full()[obj] = val
+            return
+        rows, pre, post = rsel
+        data = self._read_rows(rows, pre)
+        data[post] = val
+        self._write_rows(rows, pre, data)
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self._full()
+        else:
+            return self._full().astype(dtype)
+
+    def __getattr__(self, name):
+        # delegate all other attributes (e.g., methods like sum, reshape) to the whole local array
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._full(), name)
+
+    def copy(self):
+        # read it without materializing the lazy dataset
+        return self._dset.read_local()
+
+
+def _delegate(op):
+    ### make a special method of LazyArray that operates on the whole local array
+    def _method(self, *args):
+        return getattr(self._full(), op)(*args)
+    _method.__name__ = op
+    return _method
+
+for _op in ('__add__', '__radd__', '__iadd__', '__sub__', '__rsub__', '__isub__',
+            '__mul__', '__rmul__', '__imul__', '__div__', '__rdiv__', '__idiv__',
+            '__truediv__', '__rtruediv__', '__itruediv__', '__floordiv__',
+            '__rfloordiv__', '__pow__', '__rpow__', '__mod__', '__and__',
+            '__rand__', '__iand__', '__or__', '__ror__', '__ior__', '__xor__',
+            '__rxor__', '__ixor__', '__lt__', '__le__', '__eq__', '__ne__',
+            '__gt__', '__ge__', '__neg__', '__pos__', '__abs__', '__invert__',
+            '__iter__', '__contains__', '__nonzero__'):
+    setattr(LazyArray, _op, _delegate(_op))
@@ -0,0 +1,444 @@
+"""Bit-packed boolean masks.
+
+A boolean numpy array costs one byte for each element, so a mask like
+`vis_mask` which has the same shape as the visibility data takes a noticeable
+part of the memory, of the all-to-all communication volume when it is
+redistributed and of the file size. Here a boolean mask is held packed by
+:func:`numpy.packbits` along one of its axes (other than the distributed axis)
+so that each element costs only one bit. :class:`PackedMask` has the same
+indexing semantics as the boolean array it holds, and :class:`PackedDataset`
+mimics the interface of :class:`caput.memh5.MemDatasetDistributed` for a
+packed distributed dataset of a data container.
+
+A packed dataset is saved to files as its packed `uint8` data, with the
+attributes :data:`PACKED_AXIS_ATTR` and :data:`PACKED_LENGTH_ATTR` giving the
+packed axis and its unpacked length, and it will be unpacked when it is read
+back by the data containers.
+
+"""
+
+import numpy as np
+from caput import mpiutil
+from caput import mpiarray
+from caput import memh5
+import read_planner
+import redistribute
+
+
+PACKED_AXIS_ATTR = 'packed_axis'
+PACKED_LENGTH_ATTR = 'packed_length'
+
+
+def packed_length(n):
+    """Length of `n` bits packed into bytes."""
+    return (n + 7) / 8
+
+
+def pack_axis(shape, dist_axis, exclude=()):
+    """The axis to pack along, i.e., the last axis that is neither
+    `dist_axis` nor in `exclude`, None if no such one."""
+    for ai in reversed(xrange(len(shape))):
+        if ai != dist_axis and not ai in exclude:
+            return ai
+
+    return None
+
+
+def pack(mask, axis):
+    """Pack the boolean array `mask` along `axis` into an `uint8` array."""
+    return np.packbits(np.asarray(mask, dtype=np.bool), axis=axis)
+
+
+def unpack(packed, axis, n):
+    """Unpack the `uint8` array `packed` along `axis` of unpacked length `n`."""
+    arr = np.unpackbits(packed, axis=axis).view(np.bool)
+    return arr[(slice(None),) * axis + (slice(0, n),)]
+
+
+def is_packed(dset):
+    """Whether the HDF5 dataset `dset` holds a packed boolean mask."""
+    return PACKED_AXIS_ATTR in dset.attrs and PACKED_LENGTH_ATTR in dset.attrs
+
+
+def read_packed(dset, sel):
+    """Read the selection `sel` of the unpacked mask of a packed HDF5 dataset.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        The packed dataset.
+    sel : list of slices or lists
+        Selection of the unpacked mask along each axis, a list must be
+        increasing.
+
+    """
+    axis = int(dset.attrs[PACKED_AXIS_ATTR])
+    n = int(dset.attrs[PACKED_LENGTH_ATTR])
+    inds = np.arange(n)[sel[axis]]
+
+    psel = list(sel)
+    if len(inds) == 0:
+        psel[axis] = slice(0, 0)
+        b0 = 0
+    else:
+        b0 = inds[0] / 8
+        psel[axis] = slice(b0, inds[-1] / 8 + 1)
+    # read the packed section by the read planner to support list selections
+    plan = read_planner.ReadPlan(dset.shape, psel, dset.chunks)
+    packed = plan.extract(plan.read(dset))
+
+    return np.take(np.unpackbits(packed, axis=axis).view(np.bool), inds - 8 * b0, axis=axis)
+
+
+class PackedMask(object):
+    """Array like boolean mask held bit-packed along one axis.
+
+    Basic indexing (integers, slices and Ellipsis) only unpacks the bytes it
+    touches, and returns a new boolean array, so changes to it do not affect
+    the mask; assign to an index of the mask instead, which packs the values
+    back. Any other operation works on the whole unpacked mask.
+
+    Parameters
+    ----------
+    packed : np.ndarray
+        The packed `uint8` array.
+    shape : tuple
+        Shape of the unpacked mask.
+    axis : integer
+        The axis along which the mask is packed.
+
+    """
+
+    # make numpy binary operations defer to this class
+    __array_priority__ = 10.0
+
+    def __init__(self, packed, shape, axis):
+        self._packed = packed
+        self._shape = tuple(shape)
+        self._axis = axis
+
+    @classmethod
+    def from_mask(cls, mask, axis):
+        """Pack the boolean array `mask` along `axis`."""
+        return cls(pack(mask, axis), np.shape(mask), axis)
+
+    @property
+    def packed(self):
+        """The packed `uint8` array."""
+        return self._packed
+
+    @property
+    def axis(self):
+        """The axis along which the mask is packed."""
+        return self._axis
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return np.dtype(np.bool)
+
+    @property
+    def ndim(self):
+        return len(self._shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self._shape))
+
+    @property
+    def itemsize(self):
+        return 1
+
+    @property
+    def nbytes(self):
+        """Number of bytes of the packed array."""
+        return self._packed.nbytes
+
+    def __len__(self):
+        return self._shape[0]
+
+    def unpack(self):
+        """Return the whole unpacked mask."""
+        return unpack(self._packed, self._axis, self._shape[self._axis])
+
+    def _section(self, obj):
+        ### convert basic index `obj` to (selection of the packed array,
+        ### selection in the unpacked section), None if it is not basic
+        if not isinstance(obj, tuple):
+            obj = (obj,)
+        ndim = self.ndim
+        for o in obj:
+            if not (o is Ellipsis or isinstance(o, slice) or isinstance(o, (int, long, np.integer))):
+                return None
+        if sum([ 1 for o in obj if o is Ellipsis ]) > 1:
+            return None
+        if Ellipsis in obj:
+            ei = obj.index(Ellipsis)
+            obj = obj[:ei] + (slice(None),) * (ndim - len(obj) + 1) + obj[ei+1:]
+        if len(obj) > ndim:
+            return None
+        obj = obj + (slice(None),) * (ndim - len(obj))
+
+        psel = []
+        usel = []
+        for ai, (o, ni) in enumerate(zip(obj, self._shape)):
+            if isinstance(o, slice):
+                start, stop, step = o.indices(ni)
+                if ai != self._axis:
+                    psel.append(o)
+                    usel.append(slice(None))
+                elif step < 0:
+                    return None
+                elif stop <= start:
+                    psel.append(slice(0, 0))
+                    usel.append(slice(0, 0))
+                else:
+                    last = start + ((stop - 1 - start) / step) * step
+                    b0 = start / 8
+                    psel.append(slice(b0, last / 8 + 1))
+                    usel.append(slice(start - 8*b0, last - 8*b0 + 1, step))
+            else:
+                o = int(o)
+                if o < 0:
+                    o += ni
+                if o < 0 or o >= ni:
+                    raise IndexError('index %d is out of bounds for axis %d with size %d' % (o, ai, ni))
+                if ai != self._axis:
+                    psel.append(slice(o, o+1))
+                    usel.append(0)
+                else:
+                    psel.append(slice(o/8, o/8 + 1))
+                    usel.append(o - 8*(o/8))
+
+        return tuple(psel), tuple(usel)
+
+    def __getitem__(self, obj):
+        sec = self._section(obj)
+        if sec is None:
+            return self.unpack()[obj]
+        psel, usel = sec
+        return np.unpackbits(self._packed[psel], axis=self._axis).view(np.bool)[usel]
+
+    def __setitem__(self, obj, val):
+        sec = self._section(obj)
+        if sec is None:
+            mask = self.unpack()
+            mask[obj] = val
+            self._packed[:] = pack(mask, self._axis)
+        else:
+            psel, usel = sec
+            block = np.unpackbits(self._packed[psel], axis=self._axis).view(np.bool)
+            block[usel] = val
+            self._packed[psel] = np.packbits(block, axis=self._axis)
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.unpack()
+        else:
+            return self.unpack().astype(dtype)
+
+    def __getattr__(self, name):
+        # delegate all other attributes (e.g., methods like any, sum) to the unpacked mask
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.unpack(), name)
+
+    def copy(self):
+        """Return a copy of the unpacked mask."""
+        return self.unpack().copy()
+
+    def __iand__(self, other):
+        self[...] = self.unpack() & other
+        return self
+
+    def __ior__(self, other):
+        self[...] = self.unpack() | other
+        return self
+
+    def __ixor__(self, other):
+        self[...] = self.unpack() ^ other
+        return self
+
+
+def _delegate(op):
+    ### make a special method of PackedMask that operates on the unpacked mask
+    def _method(self, *args):
+        return getattr(self.unpack(), op)(*args)
+    _method.__name__ = op
+    return _method
+
+for _op in ('__and__', '__rand__', '__or__', '__ror__', '__xor__', '__rxor__',
+            '__invert__', '__eq__', '__ne__', '__add__', '__radd__', '__mul__',
+            '__rmul__', '__iter__', '__contains__', '__nonzero__'):
+    setattr(PackedMask, _op, _delegate(_op))
+
+
+class PackedDataset(object):
+    """A distributed boolean dataset held bit-packed in memory.
+
+    This mimics the interface of :class:`caput.memh5.MemDatasetDistributed`
+    that is used by the data containers and tasks, with its local data a
+    :class:`PackedMask`.
+
+    Parameters
+    ----------
+    name : string
+        Name of the dataset.
+    mask : :class:`PackedMask`
+        The packed local section of the dataset.
+    shape : tuple
+        The global shape of the dataset.
+    distributed_axis : integer
+        Axis of the dataset along which it is distributed.
+    attrs : dict, optional
+        Attributes of the dataset.
+    comm : None or MPI.Comm, optional
+        MPI Communicator the dataset distributed over.
+
+    """
+
+    def __init__(self, name, mask, shape, distributed_axis, attrs=None, comm=None):
+        self._name = name
+        self._mask = mask
+        self._shape = tuple(shape)
+        self._distributed_axis = distributed_axis
+        self.attrs = {} if attrs is None else dict(attrs)
+        self.comm = comm
+
+        n, s, e = mpiutil.split_local(self._shape[distributed_axis], comm=comm)
+        self._local_offset = tuple([ (s if ai == distributed_axis else 0) for ai in xrange(len(self._shape)) ])
+        self._local_shape = tuple([ (n if ai == distributed_axis else ni) for ai, ni in enumerate(self._shape) ])
+
+    @classmethod
+    def from_dataset(cls, name, dset, comm=None):
+        """Pack the distributed boolean dataset `dset` along :func:`pack_axis`."""
+        di = dset.distributed_axis
+        axis = pack_axis(dset.shape, di)
+        if axis is None:
+            raise ValueError('Can not pack the 1-dimensional distributed dataset %s' % name)
+        attrs = {}
+        memh5.copyattrs(dset.attrs, attrs)
+
+        return cls(name, PackedMask.from_mask(dset.local_data, axis), dset.shape, di, attrs, comm)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def global_shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return np.dtype(np.bool)
+
+    @property
+    def distributed(self):
+        return True
+
+    @property
+    def common(self):
+        return False
+
+    @property
+    def distributed_axis(self):
+        return self._distributed_axis
+
+    @property
+    def local_offset(self):
+        return self._local_offset
+
+    @property
+    def local_shape(self):
+        return self._local_shape
+
+    @property
+    def pack_axis(self):
+        """The axis along which the dataset is packed."""
+        return self._mask.axis
+
+    @property
+    def packed_shape(self):
+        """The global shape of the packed dataset."""
+        shp = list(self._shape)
+        shp[self.pack_axis] = packed_length(shp[self.pack_axis])
+        return tuple(shp)
+
+    def to_mpi_array(self):
+        """Unpack the local section into a new :class:`caput.mpiarray.MPIArray`.
+
+        This does not involve any communication between processes.
+        """
+        arr = mpiarray.MPIArray(self._shape, axis=self._distributed_axis, comm=self.comm, dtype=np.bool)
+        arr.local_array[:] = self._mask.unpack()
+
+        return arr
+
+    def copy(self, comm=None):
+        """Return a copy of this dataset.
+
+        The copy is distributed over `comm` if it is not None, which must
+        contain the same processes in the same order as the communicator of
+        this dataset.
+
+        """
+        mask = PackedMask(self._mask.packed.copy(), self._mask.shape, self._mask.axis)
+        comm = self.comm if comm is None else comm
+        return PackedDataset(self._name, mask, self._shape, self._distributed_axis, self.attrs, comm)
+
+    def redistribute(self, axis, max_bytes=None, stats=None):
+        """Return a new packed dataset distributed along `axis`.
+
+        Only the packed data is communicated, by slabs of at most `max_bytes`,
+        see :func:`~tlpipe.container.redistribute.redistribute` (also for
+        `stats`). If the dataset is packed along `axis`, it will first be
+        re-packed along another axis locally.
+        """
+        if axis == self._distributed_axis:
+            return self
+
+        mask = self._mask
+        if mask.axis == axis:
+            pa = pack_axis(self._shape, axis, exclude=(self._distributed_axis,))
+            if pa is None:
+                # no other axis to pack along, redistribute the unpacked data
+                arr = redistribute.redistribute([ self.to_mpi_array() ], axis, max_bytes, stats)
+                mask = PackedMask.from_mask(arr.local_array, pack_axis(self._shape, axis))
+                return PackedDataset(self._name, mask, self._shape, axis, self.attrs, self.comm)
+            mask = PackedMask.from_mask(mask.unpack(), pa)
+
+        pshape = list(self._shape)
+        pshape[mask.axis] = packed_length(pshape[mask.axis])
+        parr = mpiarray.MPIArray(tuple(pshape), axis=self._distributed_axis, comm=self.comm, dtype=np.uint8)
+        parr.local_array[:] = mask.packed
+        parr = redistribute.redistribute([ parr ], axis, max_bytes, stats)
+
+        dset = PackedDataset(self._name, None, self._shape, axis, self.attrs, self.comm)
+        dset._mask = PackedMask(parr.local_array, dset.local_shape, mask.axis)
+
+        return dset
+
+    @property
+    def local_data(self):
+        return self._mask
+
+    @property
+    def data(self):
+        return self.to_mpi_array()
+
+    def __getitem__(self, obj):
+        return self.local_data[obj]
+
+    def __setitem__(self, obj, val):
+        self.local_data[obj] = val
+
+    def __len__(self):
+        return self._shape[0]
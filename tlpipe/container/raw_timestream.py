@@ -16,6 +16,12 @@ import timestream_common
 import timestream
 from caput import mpiarray
 from caput import memh5
+import redistribute as redist
+
+
+# maximum size in bytes of a block of data separated at a time by
+# RawTimestream.separate_pol_and_bl
+_SEPARATE_BLOCK_SIZE = 64 * 2**20
 
 
 class RawTimestream(timestream_common.TimestreamCommon):
@@ -293,70 +299,91 @@ class RawTimestream(timestream_common.TimestreamCommon):
         xy_pairs = [ (xchans[i], ychans[j]) for i in xrange(nfeed) for j in xrange(i, nfeed) ]
         yx_pairs = [ (ychans[i], xchans[j]) for i in xrange(nfeed) for j in xrange(i, nfeed) ]
 
-        blorder = [ tuple(bl) for bl in self['blorder'] ]
-        conj_blorder = [ tuple(bl[::-1]) for bl in self['blorder'] ]
+        # index of the first occurrence of each channel pair and of its
+        # conjugate in blorder
+        bl_inds = {}
+        conj_inds = {}
+        for bi, (ch1, ch2) in enumerate(self['blorder'][:].tolist()):
+            bl_inds.setdefault((ch1, ch2), bi)
+            conj_inds.setdefault((ch2, ch1), bi)
 
         def _get_ind(chp):
-            try:
-                return False, blorder.index(chp)
-            except ValueError:
-                return True, conj_blorder.index(chp)
-        # xx
-        xx_list = [ _get_ind(chp) for chp in xx_pairs ]
-        xx_inds = [ ind for (cj, ind) in xx_list ]
-        xx_conj = [ cj for (cj, ind) in xx_list ]
-        # yy
-        yy_list = [ _get_ind(chp) for chp in yy_pairs ]
-        yy_inds = [ ind for (cj, ind) in yy_list ]
-        yy_conj = [ cj for (cj, ind) in yy_list ]
-        # xy
-        xy_list = [ _get_ind(chp) for chp in xy_pairs ]
-        xy_inds = [ ind for (cj, ind) in xy_list ]
-        xy_conj = [ cj for (cj, ind) in xy_list ]
-        # yx
-        yx_list = [ _get_ind(chp) for chp in yx_pairs ]
-        yx_inds = [ ind for (cj, ind) in yx_list ]
-        yx_conj = [ cj for (cj, ind) in yx_list ]
+            if chp in bl_inds:
+                return False, bl_inds[chp]
+            elif chp in conj_inds:
+                return True, conj_inds[chp]
+            else:
+                raise ValueError('Channel pair %s is not in blorder' % (chp,))
+
+        # indices in blorder and whether to conjugate for xx, yy, xy, yx
+        pol_inds = []
+        pol_conj = []
+        for pairs in (xx_pairs, yy_pairs, xy_pairs, yx_pairs):
+            lst = [ _get_ind((int(ch1), int(ch2))) for (ch1, ch2) in pairs ]
+            pol_inds.append(np.array([ ind for (cj, ind) in lst ], dtype=np.int))
+            pol_conj.append(np.array([ cj for (cj, ind) in lst ], dtype=np.bool))
+        nbl = len(xx_pairs)
+
+        def _separate(name, conj):
+            # separate the local data of dataset `name` block by block along
+            # the first axis, so no temporary array is larger than a block;
+            # if destroy_self and its local array owns its memory, the dataset
+            # is deleted first and the blocks are taken from the end, so the
+            # rows of the raw data are released as they are separated
+            dset = self[name]
+            owner = None
+            if destroy_self and not name in self._lazy_datasets and not name in self._packed_datasets:
+                owner = redist._owner(dset.data)
+            # hold the raw data in a list, so the list is its only reference
+            # if it is to be released
+            src = [ dset.local_data if owner is None else owner ]
+            release = owner is not None
+            del dset, owner
+            if release:
+                self.delete_a_dataset(name)
+
+            data = np.empty(src[0].shape[:2] + (4, nbl), dtype=src[0].dtype)
+            step = max(1, _SEPARATE_BLOCK_SIZE / max(1, data[:1].nbytes))
+            for et in xrange(data.shape[0], 0, -step):
+                st = max(et - step, 0)
+                for pi in xrange(4):
+                    data[st:et, :, pi] = src[0][st:et, :, pol_inds[pi]]
+                    if conj and pol_conj[pi].any():
+                        data[st:et, :, pi, pol_conj[pi]] = data[st:et, :, pi, pol_conj[pi]].conj()
+                if release:
+                    try:
+                        src[0].resize((st,) + src[0].shape[1:], refcheck=True)
+                    except ValueError:
+                        # other references to it are alive
+                        release = False
+            del src
+
+            if destroy_self and name in self.iterkeys():
+                self.delete_a_dataset(name)
+
+            return data
 
+        # copy attrs from rt
+        vis_attrs = {}
+        memh5.copyattrs(self.main_data.attrs, vis_attrs)
         # create a MPIArray to hold the pol and bl separated vis
-        rvis = self.main_data.local_data
-        shp = rvis.shape[:2] + (4, len(xx_inds))
-        vis = np.empty(shp, dtype=rvis.dtype)
-        vis[:, :, 0] = np.where(xx_conj, rvis[:, :, xx_inds].conj(), rvis[:, :, xx_inds]) # xx
-        vis[:, :, 1] = np.where(yy_conj, rvis[:, :, yy_inds].conj(), rvis[:, :, yy_inds]) # yy
-        vis[:, :, 2] = np.where(xy_conj, rvis[:, :, xy_inds].conj(), rvis[:, :, xy_inds]) # xy
-        vis[:, :, 3] = np.where(yx_conj, rvis[:, :, yx_inds].conj(), rvis[:, :, yx_inds]) # yx
-
+        vis = _separate(self.main_data_name, True)
         vis = mpiarray.MPIArray.wrap(vis, axis=self.main_data_dist_axis, comm=self.comm)
 
         # create main data
         ts.create_main_data(vis)
-        # copy attrs from rt
-        memh5.copyattrs(self.main_data.attrs, ts.main_data.attrs)
+        memh5.copyattrs(vis_attrs, ts.main_data.attrs)
         # create attrs of this dataset
         ts.main_data.attrs['dimname'] = 'Time, Frequency, Polarization, Baseline'
 
-        if destroy_self:
-            self.delete_a_dataset('vis')
-
         # create a MPIArray to hold the pol and bl separated vis_mask
-        rvis_mask = self['vis_mask'].local_data
-        shp = rvis_mask.shape[:2] + (4, len(xx_inds))
-        vis_mask = np.empty(shp, dtype=rvis_mask.dtype)
-        vis_mask[:, :, 0] = rvis_mask[:, :, xx_inds] # xx
-        vis_mask[:, :, 1] = rvis_mask[:, :, yy_inds] # yy
-        vis_mask[:, :, 2] = rvis_mask[:, :, xy_inds] # xy
-        vis_mask[:, :, 3] = rvis_mask[:, :, yx_inds] # yx
-
+        vis_mask = _separate('vis_mask', False)
         vis_mask = mpiarray.MPIArray.wrap(vis_mask, axis=self.main_data_dist_axis, comm=self.comm)
 
         # create vis_mask
         axis_order = ts.main_axes_ordered_datasets[ts.main_data_name]
         ts.create_main_axis_ordered_dataset(axis_order, 'vis_mask', vis_mask, axis_order)
 
-        if destroy_self:
-            self.delete_a_dataset('vis_mask')
-
         # create other datasets needed
         # pol ordered dataset
         p = self.pol_dict
@@ -0,0 +1,290 @@
+"""Chunk-aligned, coalesced reading of data selections from HDF5 datasets.
+
+Reading a fancy selection (e.g., a list of frequencies or baselines) of a HDF5
+dataset directly issues many small scattered reads which take no account of
+the on-disk chunk layout, and when the data is distributed along a non-time
+axis, the same chunks may be read and decompressed by many processes. The
+read planner here converts a selection to a few large hyperslab reads by
+merging the selected indices along each axis into contiguous runs aligned to
+the chunk boundaries, and optionally lets only one process in each node read
+the union of the selections of all processes in that node and hand out the
+pieces to them with an MPI scatter.
+
+"""
+
+import itertools
+import numpy as np
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+# maximum size in bytes of a chunk of the union of the selections of all
+# processes in a node read and scattered at a time by node_read
+MAX_SCATTER_BYTES = 64 * 2**20
+
+
+def _to_index(pos, n):
+    ### convert the position array `pos` along an axis of length `n` to a
+    ### slice object if possible, None if it selects the whole axis
+    if len(pos) == n and (n == 0 or (pos[0] == 0 and np.all(np.diff(pos) == 1))):
+        return None
+    elif len(pos) == 0:
+        return slice(0, 0)
+    elif len(pos) == 1:
+        return slice(pos[0], pos[0]+1)
+    else:
+        d = np.diff(pos)
+        if d[0] > 0 and np.all(d == d[0]):
+            return slice(pos[0], pos[-1]+d[0], d[0])
+        else:
+            return pos
+
+
+def coalesce(inds):
+    """Merge increasing indices into a list of contiguous runs [(start, stop), ...]."""
+    inds = np.asarray(inds, dtype=np.int64)
+    if len(inds) == 0:
+        return []
+    breaks = (np.where(np.diff(inds) != 1)[0] + 1).tolist()
+    return [ (int(inds[s]), int(inds[e-1]) + 1) for (s, e) in zip([0] + breaks, breaks + [len(inds)]) ]
+
+
+def align_runs(runs, chunk_len, n):
+    """Expand runs to the chunk boundaries, and merge the overlapping ones.
+
+    Parameters
+    ----------
+    runs : list of (start, stop)
+        Increasing contiguous runs along an axis.
+    chunk_len : None or integer
+        Chunk length along this axis, runs are only merged if None.
+    n : integer
+        Length of this axis.
+
+    """
+    aligned = []
+    for s, e in runs:
+        if chunk_len:
+            s = (s / chunk_len) * chunk_len
+            e = min(((e + chunk_len - 1) / chunk_len) * chunk_len, n)
+        if len(aligned) > 0 and s <= aligned[-1][1]:
+            aligned[-1] = (aligned[-1][0], max(aligned[-1][1], e))
+        else:
+            aligned.append((s, e))
+
+    return aligned
+
+
+class ReadPlan(object):
+    """Plan to read a selection of a HDF5 dataset with a few hyperslab reads.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the dataset.
+    sel : list of slices or lists
+        Selection along each axis of the dataset, a list must be increasing.
+    chunks : None or tuple, optional
+        Chunk shape of the dataset, None if it is contiguous. Default None.
+    max_reads : integer, optional
+        Maximum number of hyperslab reads. If more are needed, the runs along
+        the axes that have the most runs will be merged to a single span
+        until within it. Default 1024.
+
+    """
+
+    def __init__(self, shape, sel, chunks=None, max_reads=1024):
+        self.shape = tuple(shape)
+        self.indices = [ np.arange(n)[s] for (n, s) in zip(shape, sel) ]
+
+        runs = []
+        for ai, (n, inds) in enumerate(zip(self.shape, self.indices)):
+            chunk_len = None if chunks is None else chunks[ai]
+            runs.append(align_runs(coalesce(inds), chunk_len, n))
+        # limit the number of reads
+        while np.prod([ len(r) for r in runs ]) > max_reads:
+            ai = np.argmax([ len(r) for r in runs ])
+            runs[ai] = [ (runs[ai][0][0], runs[ai][-1][1]) ]
+        self.runs = runs
+        # offset of each run in the read buffer
+        self.offsets = [ np.cumsum([0] + [ e - s for (s, e) in r ]) for r in runs ]
+
+    @property
+    def buffer_shape(self):
+        """Shape of the buffer to hold the read data."""
+        return tuple([ int(off[-1]) for off in self.offsets ])
+
+    @property
+    def selected_shape(self):
+        """Shape of the selected data."""
+        return tuple([ len(inds) for inds in self.indices ])
+
+    @property
+    def num_reads(self):
+        """Number of hyperslab reads."""
+        return int(np.prod([ len(r) for r in self.runs ]))
+
+    def positions(self, axis, inds=None):
+        """Positions in the read buffer along `axis` of the indices `inds`
+        (default all selected indices)."""
+        inds = self.indices[axis] if inds is None else np.asarray(inds, dtype=np.int64)
+        starts = np.array([ s for (s, e) in self.runs[axis] ], dtype=np.int64)
+        ri = np.searchsorted(starts, inds, side='right') - 1
+
+        return self.offsets[axis][ri] + inds - starts[ri]
+
+    def read(self, dset):
+        """Read the planned hyperslabs of `dset` into a new buffer."""
+        buf = np.empty(self.buffer_shape, dtype=dset.dtype)
+        if buf.size == 0:
+            return buf
+
+        for rs in itertools.product(*[ list(enumerate(r)) for r in self.runs ]):
+            src = tuple([ slice(s, e) for (ri, (s, e)) in rs ])
+            dst = tuple([ slice(off[ri], off[ri] + e - s) for ((ri, (s, e)), off) in zip(rs, self.offsets) ])
+            dset.read_direct(buf, src, dst)
+
+        return buf
+
+    def extract(self, buf, inds=None, axis=None):
+        """Extract the selected data from the read buffer `buf`.
+
+        If `inds` is not None, only these indices (must be a subset of the
+        selected indices) are extracted along `axis`.
+        """
+        out = buf
+        for ai in xrange(len(self.shape)):
+            pos = self.positions(ai, inds if ai == axis else None)
+            idx = _to_index(pos, out.shape[ai])
+            if idx is not None:
+                out = out[(slice(None),) * ai + (idx,)]
+
+        return out
+
+
+def node_comm(comm):
+    """Split `comm` to communicators of processes in the same node."""
+    if comm is None or MPI is None:
+        return None
+
+    try:
+        return comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.rank)
+    except (AttributeError, NotImplementedError):
+        # no MPI-3 support, split by the processor name
+        names = comm.allgather(MPI.Get_processor_name())
+        return comm.Split(sorted(set(names)).index(names[comm.rank]), comm.rank)
+
+
+def read(dset, sel, out, out_sel, max_reads=1024):
+    """Read `dset[sel]` to `out[out_sel]` by the read planner."""
+    plan = ReadPlan(dset.shape, sel, dset.chunks, max_reads)
+    if np.prod(plan.selected_shape) > 0:
+        out[tuple(out_sel)] = plan.extract(plan.read(dset))
+
+
+def _chunk_lens(lengths, axis, itemsize, max_bytes):
+    ### lengths along each axis of the chunks to divide an array of `lengths`
+    ### into, so a chunk has at most `max_bytes` (or a whole line along
+    ### `axis`, which is never divided)
+    chunk_lens = list(lengths)
+    nbytes = itemsize * lengths[axis]
+    for ai in reversed(xrange(len(lengths))):
+        if ai == axis:
+            continue
+        if nbytes * lengths[ai] <= max_bytes:
+            nbytes *= lengths[ai]
+        else:
+            chunk_lens[ai] = max(1, max_bytes / max(1, nbytes))
+            nbytes *= chunk_lens[ai]
+            max_bytes = 0 # axes before it are divided to length 1
+
+    return chunk_lens
+
+
+def node_read(dset, sel, axis, out, out_sel, comm=None, max_reads=1024, max_bytes=None):
+    """Read `dset[sel]` to `out[out_sel]` for all processes in a node.
+
+    The rank 0 process in `comm` reads the union of the selections of all
+    processes in `comm`, and scatters the pieces to them. The union is read
+    and scattered in chunks of at most `max_bytes` along the axes other than
+    `axis`, so the rank 0 process only holds a chunk and its send buffer at a
+    time, and the counts of a scatter can not overflow. This must be called
+    by all processes in `comm`, with `sel` the same in all processes except
+    along `axis`.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        The dataset to read from.
+    sel : list of slices or lists
+        Selection of `dset` along each axis, a list must be increasing.
+    axis : integer
+        The axis along which `sel` differs in processes.
+    out : np.ndarray
+        Array to hold the read data.
+    out_sel : list
+        Selection of `out` to hold the read data.
+    comm : None or MPI.Comm, optional
+        Communicator of processes in a node, see :func:`node_comm`. Default
+        None to let each process reads its own selection.
+    max_reads : integer, optional
+        Maximum number of hyperslab reads, see :class:`ReadPlan`.
+    max_bytes : None or integer, optional
+        Maximum size in bytes of a chunk of the union. Default None to use
+        :data:`MAX_SCATTER_BYTES`.
+
+    """
+
+    if comm is None or comm.size == 1:
+        read(dset, sel, out, out_sel, max_reads)
+        return
+
+    max_bytes = MAX_SCATTER_BYTES if max_bytes is None else max_bytes
+    inds = [ np.arange(n)[s] for (n, s) in zip(dset.shape, sel) ]
+    local_shape = tuple([ len(i) for i in inds ])
+    all_inds = comm.gather(inds[axis], root=0)
+    chunk_lens = None
+    if comm.rank == 0:
+        uinds = np.unique(np.concatenate(all_inds))
+        lengths = list(local_shape)
+        lengths[axis] = len(uinds)
+        chunk_lens = _chunk_lens(lengths, axis, dset.dtype.itemsize, max_bytes)
+    chunk_lens = comm.bcast(chunk_lens, root=0)
+
+    # receive into a view of out if possible
+    is_view = all([ isinstance(s, slice) for s in out_sel ])
+    if is_view:
+        target = out[tuple(out_sel)]
+    else:
+        target = np.empty(local_shape, dtype=dset.dtype)
+
+    # chunks along all axes except `axis`, the same in all procs
+    ranges = [ ([ (0, n) ] if ai == axis else [ (c, min(c + cl, n)) for c in xrange(0, n, cl) ]) for (ai, (n, cl)) in enumerate(zip(local_shape, chunk_lens)) ]
+    for box in itertools.product(*ranges):
+        send = None
+        if comm.rank == 0:
+            csel = [ (uinds if ai == axis else inds[ai][s:e]) for (ai, (s, e)) in enumerate(box) ]
+            plan = ReadPlan(dset.shape, csel, dset.chunks, max_reads)
+            buf = plan.read(dset)
+            shapes = [ tuple([ (len(ri) if ai == axis else e - s) for (ai, (s, e)) in enumerate(box) ]) for ri in all_inds ]
+            counts = [ int(np.prod(shp)) * dset.dtype.itemsize for shp in shapes ]
+            displs = np.cumsum([0] + counts[:-1]).tolist()
+            sendbuf = np.empty(sum(counts), dtype=np.uint8)
+            for ri, shp, cnt, dp in zip(all_inds, shapes, counts, displs):
+                if cnt > 0:
+                    sendbuf[dp:dp+cnt].view(dset.dtype).reshape(shp)[...] = plan.extract(buf, ri, axis)
+            # release the chunk before scattering it
+            del buf
+            send = [sendbuf, counts, displs, MPI.BYTE]
+
+        bsel = tuple([ slice(s, e) for (s, e) in box ])
+        recvbuf = np.empty(target[bsel].shape, dtype=dset.dtype)
+        comm.Scatterv(send, [recvbuf.reshape(-1).view(np.uint8), MPI.BYTE], root=0)
+        target[bsel] = recvbuf
+        del send, recvbuf
+
+    if not is_view:
+        out[tuple(out_sel)] = target
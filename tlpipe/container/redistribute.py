@@ -0,0 +1,234 @@
+"""Memory bounded redistribution of distributed arrays.
+
+:meth:`caput.mpiarray.MPIArray.redistribute` moves the whole local array in a
+single all-to-all, which needs send and receive buffers as large as the array
+itself and may exceed the message size limit of MPI for large arrays. Here the
+local array is moved in slabs, each of which is at most of a given size. The
+slabs are exchanged by non-blocking all-to-all (when supported by the MPI
+library), so the communication of one slab is overlapped with the packing of
+the next one and the placing of the previous one, and the send and receive
+buffers are reused for all slabs.
+
+The slabs are cut along the first axis unless it is the new distributed axis,
+and are sent from the end of the local array. If the caller hands over the
+only reference to the array (see :func:`redistribute`), the local array is
+shrunk after each slab is packed, so the memory of the sent rows is returned
+while the new array is being filled, and the peak memory of a process is
+about the size of its local array plus the slab buffers, instead of twice the
+size of its local array.
+
+"""
+
+import numpy as np
+from caput import mpiutil
+from caput import mpiarray
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+# default maximum size of a slab in bytes
+DEFAULT_SLAB_BYTES = 64 * 2**20
+
+
+def _owner(arr):
+    ### the array that owns the memory of `arr` if `arr` covers all of it,
+    ### else None
+    owner = arr if arr.base is None else arr.base
+    if not isinstance(owner, np.ndarray) or not owner.flags.owndata or not owner.flags.c_contiguous:
+        return None
+    if owner.shape != arr.shape or owner.ctypes.data != arr.ctypes.data:
+        return None
+
+    return owner
+
+
+def redistribute(arr, axis, max_bytes=None, stats=None):
+    """Redistribute the distributed array `arr` along `axis` by slabs.
+
+    Parameters
+    ----------
+    arr : :class:`caput.mpiarray.MPIArray` or list
+        The distributed array, or a list holding the only reference to it,
+        which will be emptied. In the latter case the rows of the local array
+        are released as they are sent if possible, i.e., if it is C
+        contiguous, owns its memory and no other reference to it is alive,
+        and the slabs are cut along its first axis.
+    axis : integer
+        The axis to redistribute along.
+    max_bytes : None or integer, optional
+        Maximum size in bytes of a slab sent by a process in each step. Use
+        :data:`DEFAULT_SLAB_BYTES` if None. Default None.
+    stats : None or dict, optional
+        If not None, the number of bytes sent to other processes, the number
+        of slabs and the number of bytes released before the end of the
+        redistribution by this process will be added to its keys 'nbytes',
+        'nslabs' and 'released'.
+
+    Returns
+    -------
+    out : :class:`caput.mpiarray.MPIArray`
+        A new array distributed along `axis`.
+
+    """
+
+    release = isinstance(arr, list)
+    if release:
+        arr = arr.pop()
+
+    comm = arr.comm
+    old_axis = arr.axis
+    if axis == old_axis:
+        return arr
+    if comm is None or comm.size == 1 or MPI is None or arr.dtype.hasobject:
+        return arr.redistribute(axis)
+
+    max_bytes = DEFAULT_SLAB_BYTES if max_bytes is None else int(max_bytes)
+    shape = tuple(arr.global_shape)
+    dtype = arr.dtype
+    nproc = comm.size
+    rank = comm.rank
+
+    out = mpiarray.MPIArray(shape, axis=axis, comm=comm, dtype=dtype)
+    dst = out.view(np.ndarray)
+
+    # local sections of all procs along the old and the new distributed axis
+    on, os, oe = mpiutil.split_all(shape[old_axis], comm=comm)
+    nn, ns, ne = mpiutil.split_all(shape[axis], comm=comm)
+
+    # the axis to cut slabs along, and the length and the global offset of
+    # the local array of each proc along it
+    sa = 0 if axis != 0 else old_axis
+    lens = on if sa == old_axis else [ shape[sa] ] * nproc
+    offs = os if sa == old_axis else [ 0 ] * nproc
+
+    def _row_bytes(q, r):
+        ### bytes of a row along `sa` of the local array of proc `q` to send
+        ### to proc `r`
+        lshape = list(shape)
+        lshape[old_axis] = on[q]
+        lshape[axis] = nn[r]
+        lshape[sa] = 1
+        return dtype.itemsize * int(np.prod(lshape))
+
+    # rows in a slab, the same for all procs
+    slab_len = max(1, max_bytes / max(1, max([ sum([ _row_bytes(q, r) for r in xrange(nproc) ]) for q in xrange(nproc) ])))
+    nslabs = (max(lens) + slab_len - 1) / slab_len
+
+    def _rows(k, q):
+        ### rows along `sa` of the local array of proc `q` in the `k`-th slab,
+        ### slabs are taken from the end
+        return max(lens[q] - (k + 1) * slab_len, 0), max(lens[q] - k * slab_len, 0)
+
+    # hold the source in a list, so the list is its only reference if it is
+    # to be released
+    src = [ arr.view(np.ndarray) ]
+    if release and sa == 0:
+        owner = _owner(arr)
+        if owner is not None:
+            del arr
+            src = [ owner ]
+            del owner
+        else:
+            release = False
+    else:
+        release = False
+
+    def _pack(k, buf):
+        ### pack the `k`-th slab to send into `buf`
+        r0, r1 = _rows(k, rank)
+        sel = [ slice(None) ] * len(shape)
+        sel[sa] = slice(r0, r1)
+        counts, displs = [], []
+        offset = 0
+        for q in xrange(nproc):
+            sel[axis] = slice(ns[q], ne[q])
+            piece = src[0][tuple(sel)]
+            buf[offset:offset+piece.nbytes].view(dtype).reshape(piece.shape)[:] = piece
+            counts.append(piece.nbytes)
+            displs.append(offset)
+            offset += piece.nbytes
+
+        return [ buf, counts, displs, MPI.BYTE ]
+
+    def _shrink(k):
+        ### release the rows of the local array from the `k`-th slab on,
+        ### return the number of bytes released
+        r0, r1 = _rows(k, rank)
+        if r1 == r0:
+            return 0
+        nbytes = src[0].nbytes
+        try:
+            src[0].resize((r0,) + src[0].shape[1:], refcheck=True)
+        except ValueError:
+            # other references to it are alive
+            return None
+
+        return nbytes - src[0].nbytes
+
+    def _recv_spec(k, buf):
+        ### receive spec of the `k`-th slab into `buf`
+        counts = [ (r1 - r0) * _row_bytes(q, rank) for (q, (r0, r1)) in enumerate([ _rows(k, q) for q in xrange(nproc) ]) ]
+        displs = np.cumsum([0] + counts[:-1]).tolist()
+
+        return [ buf, counts, displs, MPI.BYTE ]
+
+    def _place(k, spec):
+        ### place the received `k`-th slab to the output array
+        buf, counts, displs = spec[:3]
+        sel = [ slice(None) ] * len(shape)
+        for q in xrange(nproc):
+            r0, r1 = _rows(k, q)
+            if r1 > r0:
+                sel[sa] = slice(offs[q] + r0, offs[q] + r1)
+                if sa != old_axis:
+                    sel[old_axis] = slice(os[q], oe[q])
+                piece = dst[tuple(sel)]
+                piece[:] = buf[displs[q]:displs[q]+counts[q]].view(dtype).reshape(piece.shape)
+
+    # buffers of two slabs, one is in flight while the other is being processed
+    send_bytes = min(slab_len, lens[rank]) * sum([ _row_bytes(rank, r) for r in xrange(nproc) ])
+    recv_bytes = sum([ min(slab_len, lens[q]) * _row_bytes(q, rank) for q in xrange(nproc) ])
+    bufs = [ (np.empty(send_bytes, dtype=np.uint8), np.empty(recv_bytes, dtype=np.uint8)) for i in xrange(2) ]
+
+    nonblocking = hasattr(comm, 'Ialltoallv')
+    pending = None # (slab index, request, receive spec)
+    for k in xrange(nslabs):
+        sbuf, rbuf = bufs[k % 2]
+        send = _pack(k, sbuf)
+        if release:
+            released = _shrink(k)
+            if released is None:
+                release = False
+            elif stats is not None:
+                stats['released'] = stats.get('released', 0) + released
+        recv = _recv_spec(k, rbuf)
+        req = None
+        if nonblocking:
+            try:
+                req = comm.Ialltoallv(send, recv)
+            except NotImplementedError:
+                nonblocking = False
+        if req is None:
+            comm.Alltoallv(send, recv)
+        if stats is not None:
+            stats['nbytes'] = stats.get('nbytes', 0) + sum(send[1]) - send[1][rank]
+            stats['nslabs'] = stats.get('nslabs', 0) + 1
+
+        # place the previous slab while this one is in flight
+        if pending is not None:
+            pk, preq, pspec = pending
+            if preq is not None:
+                preq.Wait()
+            _place(pk, pspec)
+        pending = (k, req, recv)
+
+    if pending is not None:
+        pk, preq, pspec = pending
+        if preq is not None:
+            preq.Wait()
+        _place(pk, pspec)
+
+    return out
@@ -0,0 +1,54 @@
+"""Unit tests for the write-behind output."""
+
+import threading
+import pytest
+from tlpipe.container import async_writer
+
+
+class _Tod(object):
+    # records the writes instead of writing files
+    main_data_dist_axis = 0
+    rank = 0
+
+    def __init__(self, write_mode):
+        self._write_mode = write_mode
+        self.writes = []
+
+    def check_status(self):
+        pass
+
+    def copy(self, copy_datasets=None, comm=None):
+        return self
+
+    def _get_write_mode(self, write_mode):
+        return self._write_mode if write_mode == 'auto' else write_mode
+
+    def to_files(self, outfiles, check_status=True, **kwargs):
+        if kwargs.get('write_mode') == 'fail':
+            raise IOError('can not write %s' % outfiles)
+        self.writes.append((outfiles, kwargs.get('write_mode'), threading.current_thread().name))
+
+
+def test_background_write():
+    writer = async_writer.AsyncWriter()
+    tod = _Tod('staging')
+    writer.write(tod, 'a.hdf5', write_mode='auto')
+    writer.write(tod, 'b.hdf5', write_mode='serial')
+    writer.close()
+    assert tod.writes == [ ('a.hdf5', 'auto', 'AsyncWriter'), ('b.hdf5', 'serial', 'AsyncWriter') ]
+
+
+@pytest.mark.parametrize('write_mode', [ 'auto', 'mpio' ])
+def test_no_mpio_in_background(write_mode):
+    writer = async_writer.AsyncWriter()
+    tod = _Tod('mpio')
+    writer.write(tod, 'a.hdf5', write_mode=write_mode)
+    writer.close()
+    assert tod.writes == [ ('a.hdf5', 'staging', 'AsyncWriter') ]
+
+
+def test_error_raised_by_close():
+    writer = async_writer.AsyncWriter()
+    writer.write(_Tod('serial'), 'a.hdf5', write_mode='fail')
+    with pytest.raises(IOError):
+        writer.close()
@@ -0,0 +1,96 @@
+"""Unit tests for the copy-on-write copy of containers."""
+
+import numpy as np
+import pytest
+from caput import mpiarray
+from tlpipe.container.container import BasicTod
+
+
+class _Tod(BasicTod):
+    _main_data_name_ = 'vis'
+    _main_data_axes_ = ('time', 'frequency')
+    _main_axes_ordered_datasets_ = {'vis': (0, 1), 'vis_mask': (0, 1)}
+    _time_ordered_datasets_ = {'vis': (0,), 'vis_mask': (0,)}
+
+
+def _tod():
+    tod = _Tod()
+    vis = np.arange(24, dtype=np.float64).reshape(6, 4)
+    tod.create_dataset('vis', data=mpiarray.MPIArray.wrap(vis, axis=0, comm=tod.comm))
+    tod.create_dataset('vis_mask', data=mpiarray.MPIArray.wrap(np.zeros((6, 4), dtype=bool), axis=0, comm=tod.comm))
+    tod.create_dataset('freq', data=np.arange(4, dtype=np.float64))
+    return tod
+
+
+def test_copy_shares_read_only():
+    tod = _tod()
+    cp = tod.copy(copy_datasets=['vis_mask'])
+    assert cp.shared_datasets == ['freq', 'vis']
+    assert tod.shared_datasets == ['freq', 'vis']
+    # only the copy is read-only
+    with pytest.raises(ValueError):
+        cp['vis'].local_data[:] = 0
+    tod['vis'].local_data[:] *= 1
+    # copied datasets are writable and private
+    cp['vis_mask'].local_data[:] = True
+    assert not tod['vis_mask'].local_data.any()
+
+
+def test_source_write_does_not_show_in_copy():
+    tod = _tod()
+    cp = tod.copy(copy_datasets=[])
+    tod.ensure_writable('vis')
+    tod['vis'].local_data[:] *= 2
+    assert np.all(cp['vis'].local_data == np.arange(24).reshape(6, 4))
+    assert tod.shared_datasets == ['freq', 'vis_mask']
+    # the copy is the only holder of vis now
+    cp.ensure_writable()
+    assert cp.shared_datasets == []
+    cp['vis'].local_data[:] = -1
+    assert np.all(tod['vis'].local_data == 2 * np.arange(24).reshape(6, 4))
+
+
+def test_copy_write_does_not_show_in_source():
+    tod = _tod()
+    cp = tod.copy(copy_datasets=[])
+    cp2 = tod.copy(copy_datasets=[])
+    cp.ensure_writable('vis')
+    cp['vis'].local_data[:] = 0
+    assert np.all(tod['vis'].local_data == np.arange(24).reshape(6, 4))
+    assert np.all(cp2['vis'].local_data == np.arange(24).reshape(6, 4))
+    # still shared by tod and cp2
+    assert 'vis' in tod.shared_datasets
+    assert 'vis' in cp2.shared_datasets
+
+
+def test_dropped_copy_releases_share():
+    tod = _tod()
+    cp = tod.copy(copy_datasets=[])
+    del cp
+    data = tod['vis'].local_data
+    tod.ensure_writable()
+    # no other holder, so no copy is made
+    assert np.may_share_memory(data, tod['vis'].local_data)
+    tod['vis'].local_data[:] = 1
+
+
+def test_stateful_producer_copy_consumer():
+    # a producer keeps the container it emits and changes it each iteration,
+    # e.g. Accum, a consumer copies its input with copy_datasets=['vis_mask']
+    tod = _tod()
+    outputs = []
+    for it in xrange(3):
+        tod.ensure_writable(['vis', 'vis_mask'])
+        tod['vis'].local_data[:] += 1
+        tod['vis_mask'].local_data[:] = (it % 2 == 1)
+        cp = tod.copy(copy_datasets=['vis_mask'])
+        cp.ensure_writable('freq')
+        cp['freq'].local_data[:] *= -1
+        outputs.append(cp)
+    base = np.arange(24).reshape(6, 4)
+    for it, cp in enumerate(outputs):
+        assert np.all(cp['vis'].local_data == base + it + 1)
+        assert np.all(cp['vis_mask'].local_data == (it % 2 == 1))
+        assert np.all(cp['freq'].local_data == -np.arange(4))
+    assert np.all(tod['vis'].local_data == base + 3)
+    assert np.all(tod['freq'].local_data == np.arange(4))
@@ -0,0 +1,197 @@
+"""Unit tests for the block mode and the threads of data_operate.
+
+The tests run in a single process, or by several processes with e.g.::
+
+    $ mpirun -np 2 python -m pytest test_data_operate.py
+
+"""
+
+import itertools
+import numpy as np
+import pytest
+from caput import mpiutil
+from caput import mpiarray
+from tlpipe.container import lazy
+from tlpipe.container.timestream import Timestream
+
+
+shape = (6, 3, 4, 5) # time, frequency, polarization, baseline
+
+
+def _global():
+    rs = np.random.RandomState(0)
+    vis = (rs.normal(size=shape) + 1.0J * rs.normal(size=shape)).astype(np.complex64)
+    vis_mask = rs.rand(*shape) > 0.8
+    return vis, vis_mask
+
+
+def _local(data, axis):
+    arr = mpiarray.MPIArray(data.shape, axis=axis, comm=mpiutil.world, dtype=data.dtype)
+    sel = [ slice(None) ] * data.ndim
+    sel[axis] = slice(arr.local_offset[axis], arr.local_offset[axis] + arr.shape[axis])
+    arr.local_array[:] = data[tuple(sel)]
+    return arr
+
+
+def _ts(dist_axis, packed=False, lazy_block_len=None):
+    vis, vis_mask = _global()
+    ts = Timestream(dist_axis=dist_axis, comm=mpiutil.world)
+    if lazy_block_len is None:
+        ts.create_dataset('vis', data=_local(vis, dist_axis))
+    else:
+        def reader(axis, start, stop):
+            sel = [ slice(None) ] * vis.ndim
+            sel[axis] = slice(start, stop)
+            return vis[tuple(sel)].copy()
+        cache = lazy.BlockCache(2**30)
+        ts._lazy_datasets['vis'] = lazy.LazyDataset('vis', shape, vis.dtype, dist_axis, reader, cache, lazy_block_len, comm=mpiutil.world)
+    ts.create_dataset('vis_mask', data=_local(vis_mask, dist_axis))
+    jul_date = 2458000.0 + 0.01 * np.arange(shape[0])
+    ts.create_dataset('jul_date', data=(_local(jul_date, 0) if dist_axis == 0 else jul_date))
+    freq = 700.0 + np.arange(shape[1])
+    ts.create_dataset('freq', data=(_local(freq, 0) if dist_axis == 1 else freq))
+    ts.create_dataset('pol', data=np.array([ ts.pol_dict[p] for p in ('xx', 'yy', 'xy', 'yx') ]), dtype='i4')
+    ts['pol'].attrs['pol_type'] = 'linear'
+    blorder = np.array([ [1, 1], [1, 2], [2, 2], [1, 3], [2, 3] ])
+    ts.create_dataset('blorder', data=(_local(blorder, 0) if dist_axis == 3 else blorder))
+    if packed:
+        ts.pack_mask()
+    return ts
+
+
+def _result(ts):
+    ### the global vis and vis_mask of ts
+    ts.redistribute(0)
+    if 'vis' in ts.lazy_datasets:
+        vis = ts['vis'].read_local()
+    else:
+        vis = np.asarray(ts.local_vis)
+    mask = ts['vis_mask'].local_data
+    mask = mask.unpack() if ts.mask_packed else np.asarray(mask)
+    if mpiutil.world is not None:
+        vis = np.concatenate(mpiutil.world.allgather(vis), axis=0)
+        mask = np.concatenate(mpiutil.world.allgather(mask), axis=0)
+    return vis, mask
+
+
+def _slice_op(vis, vis_mask, li, gi, axis_val, ts):
+    ### change a slice depending only on its global indices and axis values
+    gis = gi if isinstance(gi, tuple) else (gi,)
+    vals = axis_val if isinstance(axis_val, tuple) else (axis_val,)
+    value = sum([ (g + 1) * 10**k for k, g in enumerate(gis) ]) + sum([ float(np.sum(v)) for v in vals ])
+    vis[:] = vis * (1.0 + value) + vis_mask
+    vis_mask[:] = vis_mask ^ (np.abs(vis) > 1.5 * (1.0 + value))
+
+
+def _block_op(axes, single):
+    ### call _slice_op on each slice of a block, the positions of the
+    ### operated `axes` in the block being their axis numbers
+    def op(vis, vis_mask, li, gi, axis_val, ts):
+        lis, gis, vals = ((li,), (gi,), (axis_val,)) if single else (li, gi, axis_val)
+        assert vis.shape == vis_mask.shape
+        for ai, axis in enumerate(axes):
+            assert len(lis[ai]) == len(gis[ai]) == vis.shape[axis]
+        for inds in itertools.product(*[ range(len(g)) for g in gis ]):
+            sel = [ slice(None) ] * vis.ndim
+            for ai, axis in enumerate(axes):
+                sel[axis] = inds[ai]
+            val = tuple([ (v[k] if hasattr(v, '__iter__') else v) for v, k in zip(vals, inds) ])
+            gind = tuple([ g[k] for g, k in zip(gis, inds) ])
+            lind = tuple([ l[k] for l, k in zip(lis, inds) ])
+            if single:
+                lind, gind, val = lind[0], gind[0], val[0]
+            _slice_op(vis[tuple(sel)], vis_mask[tuple(sel)], lind, gind, val, ts)
+    return op
+
+
+# (operate method, operated axes)
+operates = [ ('time_data_operate', (0,)),
+             ('bl_data_operate', (3,)),
+             ('time_and_bl_data_operate', (0, 3)),
+             ('freq_and_bl_data_operate', (1, 3)),
+             ('time_pol_and_bl_data_operate', (0, 2, 3)) ]
+
+
+@pytest.mark.parametrize('dist_axis', [ 0, 3 ])
+@pytest.mark.parametrize('method, axes', operates)
+@pytest.mark.parametrize('full_data', [ False, True ])
+@pytest.mark.parametrize('block_size', [ 1, 2, 0 ])
+def test_block_as_slices(dist_axis, method, axes, full_data, block_size):
+    single = len(axes) == 1
+    ts = _ts(dist_axis)
+    getattr(ts, method)(_slice_op, full_data=full_data)
+    expected = _result(ts)
+
+    ts = _ts(dist_axis)
+    getattr(ts, method)(_block_op(axes, single), full_data=full_data, block_size=block_size)
+    result = _result(ts)
+
+    assert np.array_equal(result[0], expected[0])
+    assert np.array_equal(result[1], expected[1])
+
+
+@pytest.mark.parametrize('method, axes', operates)
+@pytest.mark.parametrize('block_size', [ 2, 0 ])
+def test_block_packed_mask(method, axes, block_size):
+    single = len(axes) == 1
+    ts = _ts(0)
+    getattr(ts, method)(_slice_op)
+    expected = _result(ts)
+
+    ts = _ts(0, packed=True)
+    getattr(ts, method)(_block_op(axes, single), block_size=block_size)
+    assert ts.mask_packed
+    result = _result(ts)
+
+    assert np.array_equal(result[0], expected[0])
+    assert np.array_equal(result[1], expected[1])
+
+
+@pytest.mark.parametrize('method, axes', operates)
+@pytest.mark.parametrize('block_size', [ 1, 2, 3, 0 ])
+def test_block_lazy(method, axes, block_size):
+    single = len(axes) == 1
+    ts = _ts(0)
+    getattr(ts, method)(_slice_op)
+    expected = _result(ts)
+
+    # lazy blocks of 2 time points
+    ts = _ts(0, lazy_block_len=2)
+    getattr(ts, method)(_block_op(axes, single), block_size=block_size)
+    # still lazy
+    assert 'vis' in ts.lazy_datasets
+    result = _result(ts)
+
+    assert np.array_equal(result[0], expected[0])
+    assert np.array_equal(result[1], expected[1])
+
+
+def test_block_copy_data():
+    ts = _ts(0)
+    ts.time_and_bl_data_operate(_block_op((0, 3), False), copy_data=True, block_size=2)
+    vis, vis_mask = _global()
+    result = _result(ts)
+
+    assert np.array_equal(result[0], vis)
+    assert np.array_equal(result[1], vis_mask)
+
+
+@pytest.mark.parametrize('method, axes', operates)
+@pytest.mark.parametrize('block_size', [ None, 2 ])
+@pytest.mark.parametrize('packed, lazy_block_len', [ (False, None), (True, None), (False, 2) ])
+def test_threads(method, axes, block_size, packed, lazy_block_len):
+    op = _slice_op if block_size is None else _block_op(axes, len(axes) == 1)
+    ts = _ts(0, packed, lazy_block_len)
+    getattr(ts, method)(op, block_size=block_size)
+    expected = _result(ts)
+    # the mask has been changed
+    assert not np.array_equal(expected[1], _global()[1])
+
+    ts = _ts(0, packed, lazy_block_len)
+    getattr(ts, method)(op, block_size=block_size, num_threads=3)
+    # packed back
+    assert ts.mask_packed == packed
+    result = _result(ts)
+
+    assert np.array_equal(result[0], expected[0])
+    assert np.array_equal(result[1], expected[1])
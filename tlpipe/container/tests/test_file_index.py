@@ -0,0 +1,72 @@
+"""Unit tests for the metadata index of data files."""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import h5py
+import pytest
+from tlpipe.container import file_index
+
+try:
+    from mpi4py import MPI
+    # each proc indexes its own files when run by several procs
+    comm = MPI.COMM_SELF
+except ImportError:
+    comm = None
+
+
+@pytest.fixture
+def data_dir():
+    dirname = tempfile.mkdtemp()
+    index_dir = file_index.get_index_dir()
+    file_index.set_index_dir(os.path.join(dirname, 'index'))
+    yield dirname
+    file_index.set_index_dir(index_dir)
+    shutil.rmtree(dirname)
+
+
+def _data_file(dirname, name, nt):
+    filename = os.path.join(dirname, name)
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset('vis', data=np.zeros((nt, 2), dtype=np.complex64))
+        f.create_dataset('sec1970', data=1.0e9 + np.arange(nt, dtype=np.float64))
+        f.attrs['inttime'] = 1.0
+    return filename
+
+
+def test_index_not_in_data_dir(data_dir):
+    files = [ _data_file(data_dir, 'a.hdf5', 3), _data_file(data_dir, 'b.hdf5', 5) ]
+    files_info = file_index.get_file_info(files, comm=comm)
+    assert file_index.num_time_points(files_info, 'vis') == [3, 5]
+    assert files_info[1]['last_sec1970'] == 1.0e9 + 4
+    # the index is saved in the index directory only
+    assert sorted(os.listdir(data_dir)) == ['a.hdf5', 'b.hdf5', 'index']
+    assert os.path.exists(file_index.index_file(data_dir))
+    assert sorted(file_index.load_index(data_dir).keys()) == ['a.hdf5', 'b.hdf5']
+
+
+def test_index_updated(data_dir):
+    filename = _data_file(data_dir, 'a.hdf5', 3)
+    file_index.get_file_info([filename], comm=comm)
+    os.remove(filename)
+    _data_file(data_dir, 'a.hdf5', 7)
+    os.utime(filename, (0, 0))
+    assert file_index.num_time_points(file_index.get_file_info([filename], comm=comm), 'vis') == [7]
+
+
+def test_no_index_dir(data_dir):
+    filename = _data_file(data_dir, 'a.hdf5', 3)
+    file_index.set_index_dir(None)
+    assert file_index.num_time_points(file_index.get_file_info([filename], comm=comm), 'vis') == [3]
+    assert os.listdir(data_dir) == ['a.hdf5']
+
+
+def test_error_raised(data_dir):
+    with pytest.raises((IOError, OSError)):
+        file_index.get_file_info([os.path.join(data_dir, 'none.hdf5')], comm=comm)
+    filename = os.path.join(data_dir, 'bad.hdf5')
+    with open(filename, 'w') as fl:
+        fl.write('not a HDF5 file')
+    with pytest.raises(Exception):
+        file_index.get_file_info([filename], comm=comm)
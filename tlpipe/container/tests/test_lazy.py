@@ -0,0 +1,105 @@
+"""Unit tests for the lazy datasets."""
+
+import numpy as np
+from tlpipe.container import lazy
+from tlpipe.container.container import BasicTod
+
+try:
+    from mpi4py import MPI
+    # each proc holds the whole dataset when run by several procs
+    comm = MPI.COMM_SELF
+except ImportError:
+    comm = None
+
+
+def _lazy(data, axis, block_len, max_bytes=2**30, reads=None):
+    ### a lazy dataset backed by the array `data`
+
+    def reader(ax, start, stop):
+        if reads is not None:
+            reads.append((start, stop))
+        sel = [ slice(None) ] * data.ndim
+        sel[ax] = slice(start, stop)
+        return data[tuple(sel)].copy()
+
+    cache = lazy.BlockCache(max_bytes)
+    return lazy.LazyDataset('vis', data.shape, data.dtype, axis, reader, cache, block_len, comm=comm)
+
+
+def test_indexing():
+    data = np.arange(10*4*3, dtype=np.float64).reshape(10, 4, 3)
+    for axis in (0, 1):
+        dset = _lazy(data, axis, 3)
+        for obj in [ 2, (slice(1, 9), 1), (slice(None, None, -2), Ellipsis, 0),
+                     [7, 1, 1], (slice(None), [3, 0]), np.arange(10) % 3 == 0,
+                     (Ellipsis, [2, 0]), ([1, 5], slice(None), [0, 2]), (slice(None), 2, [0, 1]) ]:
+            assert np.array_equal(dset[obj], data[obj])
+
+
+def test_fancy_index_reads_selected_blocks():
+    data = np.arange(12*5, dtype=np.float32).reshape(12, 5)
+    reads = []
+    dset = _lazy(data, 0, 2, reads=reads)
+    assert np.array_equal(dset[[1, 9, 0]], data[[1, 9, 0]])
+    assert sorted(reads) == [ (0, 2), (8, 10) ]
+
+
+def test_setitem():
+    data = np.arange(10*4, dtype=np.float64).reshape(10, 4)
+    expect = data.copy()
+    dset = _lazy(data, 0, 3)
+    for obj, val in [ ((slice(2, 8), 1), -1.0), ([9, 0], 5.0), (np.arange(10) > 6, 2.0) ]:
+        dset[obj] = val
+        expect[obj] = val
+    dset[1:7, 2] *= 3
+    expect[1:7, 2] *= 3
+    assert np.array_equal(dset.read_local(), expect)
+
+
+def test_modified():
+    data = np.zeros((8, 3), dtype=np.int32)
+    dset = _lazy(data, 0, 2, max_bytes=2*3*4)
+    # reading does not modify
+    dset[0:8].sum()
+    dset[[1, 5]]
+    assert not dset.modified
+    # writing to the blocks, some of which are spilled on eviction
+    dset[[0, 7]] = 1
+    dset[3] = 2
+    assert dset.modified
+    expect = data.copy()
+    expect[[0, 7]] = 1
+    expect[3] = 2
+    assert np.array_equal(dset.read_local(), expect)
+    dset._cache.close()
+
+
+def test_copy_does_not_materialize():
+    data = np.arange(6*2, dtype=np.float64).reshape(6, 2)
+    # no materializer is set, so materializing would raise
+    dset = _lazy(data, 0, 4)
+    assert np.array_equal(dset.local_data.copy(), data)
+
+
+class _Tod(BasicTod):
+    _main_data_name_ = 'vis'
+    _main_data_axes_ = ('time', 'frequency')
+    _main_axes_ordered_datasets_ = {'vis': (0, 1)}
+    _time_ordered_datasets_ = {'vis': (0,)}
+
+
+def test_container_copy_keeps_source_lazy():
+    data = np.arange(6*2, dtype=np.float64).reshape(6, 2)
+    tod = _Tod(comm=comm)
+    # no materializer is set, so materializing would raise
+    tod._lazy_datasets['vis'] = _lazy(data, 0, 4)
+    tod.create_dataset('freq', data=np.arange(2, dtype=np.float64))
+    for copy_datasets in (None, []):
+        cp = tod.copy(copy_datasets=copy_datasets)
+        assert 'vis' in tod._lazy_datasets
+        assert not 'vis' in cp._lazy_datasets
+        assert np.array_equal(cp['vis'].local_data, data)
+        # the copy is private
+        cp.ensure_writable()
+        cp['vis'].local_data[:] = 0
+        assert np.array_equal(tod['vis'].read_local(), data)
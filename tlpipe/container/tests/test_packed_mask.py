@@ -0,0 +1,160 @@
+"""Unit tests for the bit-packed boolean masks.
+
+The tests of redistribution need several MPI processes, run them by, e.g.,
+``mpirun -np 3 python -m pytest test_packed_mask.py``.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import h5py
+import pytest
+from caput import mpiutil
+from caput import mpiarray
+from tlpipe.container import packed_mask
+from tlpipe.container.packed_mask import PackedMask, PackedDataset
+
+comm = mpiutil.world
+
+need_mpi = pytest.mark.skipif(comm is None or comm.size == 1, reason='needs several MPI processes')
+
+
+def _mask(shape, seed=0):
+    return np.random.RandomState(seed).rand(*shape) > 0.7
+
+
+def test_pack_unpack():
+    # lengths that are not multiples of 8 along the packed axis
+    mask = _mask((5, 13, 3))
+    for axis in range(3):
+        packed = packed_mask.pack(mask, axis)
+        assert packed.dtype == np.uint8
+        assert packed.shape[axis] == packed_mask.packed_length(mask.shape[axis])
+        assert np.array_equal(packed_mask.unpack(packed, axis, mask.shape[axis]), mask)
+
+
+def test_pack_axis():
+    assert packed_mask.pack_axis((4, 5, 6), 0) == 2
+    assert packed_mask.pack_axis((4, 5, 6), 2) == 1
+    assert packed_mask.pack_axis((4, 5, 6), 2, exclude=(1,)) == 0
+    assert packed_mask.pack_axis((4,), 0) is None
+
+
+@pytest.mark.parametrize('obj', [ 3, -1, (2, 5), (slice(None), 7), (slice(1, 4), slice(2, 12, 3)),
+                                  (Ellipsis, 0), (slice(None), slice(None, None, -1)), ([0, 2], slice(None)),
+                                  (slice(None), slice(9, 3)), Ellipsis ])
+def test_getitem(obj):
+    mask = _mask((6, 13, 2))
+    pm = PackedMask.from_mask(mask, 1)
+    assert np.array_equal(pm[obj], mask[obj])
+    # indexing returns a new array
+    sec = pm[obj]
+    if isinstance(sec, np.ndarray):
+        sec[...] = True
+        assert np.array_equal(pm.unpack(), mask)
+
+
+@pytest.mark.parametrize('obj', [ 3, (2, 5), (slice(None), 7), (slice(1, 4), slice(2, 12, 3)),
+                                  (Ellipsis, 0), ([0, 2], slice(None)), Ellipsis ])
+def test_setitem(obj):
+    mask = _mask((6, 13, 2))
+    pm = PackedMask.from_mask(mask, 1)
+    val = np.logical_not(mask[obj])
+    pm[obj] = val
+    mask[obj] = val
+    assert np.array_equal(pm.unpack(), mask)
+
+
+def test_array_ops():
+    mask = _mask((6, 13))
+    other = _mask((6, 13), seed=1)
+    pm = PackedMask.from_mask(mask, 1)
+    assert pm.shape == (6, 13) and pm.dtype == np.bool and pm.nbytes == 6 * 2
+    assert np.array_equal(np.asarray(pm), mask)
+    assert np.array_equal(pm & other, mask & other)
+    assert np.array_equal(other | pm, other | mask)
+    assert np.array_equal(~pm, ~mask)
+    assert pm.sum() == mask.sum() and pm.any() == mask.any()
+    assert np.array_equal(np.where(pm, 1, 0), np.where(mask, 1, 0))
+
+    pm |= other
+    assert isinstance(pm, PackedMask)
+    assert np.array_equal(pm.unpack(), mask | other)
+    pm &= mask
+    assert np.array_equal(pm.unpack(), mask)
+
+
+def test_read_packed():
+    mask = _mask((9, 21, 4))
+    dirname = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(dirname, 'mask.hdf5')
+        with h5py.File(filename, 'w') as f:
+            dset = f.create_dataset('vis_mask', data=packed_mask.pack(mask, 1), chunks=(3, 1, 4))
+            dset.attrs[packed_mask.PACKED_AXIS_ATTR] = 1
+            dset.attrs[packed_mask.PACKED_LENGTH_ATTR] = 21
+        with h5py.File(filename, 'r') as f:
+            dset = f['vis_mask']
+            assert packed_mask.is_packed(dset)
+            for sel in [ [ slice(None), slice(None), slice(None) ],
+                         [ slice(2, 7), slice(5, 18), slice(1, 3) ],
+                         [ [0, 4, 8], [1, 9, 10, 20], slice(None) ],
+                         [ slice(None), slice(3, 3), slice(None) ] ]:
+                expected = mask[tuple(sel[:1])][:, sel[1]][:, :, sel[2]]
+                assert np.array_equal(packed_mask.read_packed(dset, sel), expected)
+    finally:
+        shutil.rmtree(dirname)
+
+
+def _dataset(mask, axis):
+    n, s, e = mpiutil.split_local(mask.shape[axis], comm=comm)
+    sel = [ slice(None) ] * mask.ndim
+    sel[axis] = slice(s, e)
+    arr = mpiarray.MPIArray(mask.shape, axis=axis, comm=comm, dtype=np.bool)
+    arr.local_array[:] = mask[tuple(sel)]
+    pm = PackedMask.from_mask(arr.local_array, packed_mask.pack_axis(mask.shape, axis))
+    return PackedDataset('vis_mask', pm, mask.shape, axis, {'unit': 'none'}, comm)
+
+
+def _check(dset, mask):
+    sel = [ slice(None) ] * mask.ndim
+    axis = dset.distributed_axis
+    sel[axis] = slice(dset.local_offset[axis], dset.local_offset[axis] + dset.local_shape[axis])
+    assert dset.local_data.shape == dset.local_shape
+    assert np.array_equal(dset.local_data.unpack(), mask[tuple(sel)])
+    assert np.array_equal(dset.to_mpi_array().local_array, mask[tuple(sel)])
+
+
+def test_dataset_copy():
+    mask = _mask((10, 12, 3))
+    dset = _dataset(mask, 0)
+    _check(dset, mask)
+    cp = dset.copy()
+    cp.local_data[...] = True
+    _check(dset, mask)
+    assert cp.attrs == dset.attrs and cp.packed_shape == (10, 12, 1)
+
+
+@need_mpi
+@pytest.mark.parametrize('old_axis, axis', [ (0, 1), (0, 2), (1, 0), (2, 1) ])
+def test_dataset_redistribute(old_axis, axis):
+    mask = _mask((10, 12, 3))
+    dset = _dataset(mask, old_axis)
+    for max_bytes in (1, None):
+        out = dset.redistribute(axis, max_bytes)
+        assert out.distributed_axis == axis
+        assert out.pack_axis != axis
+        _check(out, mask)
+        # and back
+        _check(out.redistribute(old_axis, max_bytes), mask)
+
+
+@need_mpi
+def test_dataset_redistribute_2d():
+    # no other axis to pack along
+    mask = _mask((10, 12))
+    dset = _dataset(mask, 0)
+    out = dset.redistribute(1)
+    _check(out, mask)
+    _check(out.redistribute(0), mask)
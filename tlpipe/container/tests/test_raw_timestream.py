@@ -0,0 +1,124 @@
+"""Unit tests for separating the polarization and baseline of the raw timestream.
+
+The tests run in a single process, or by several processes with e.g.::
+
+    $ mpirun -np 2 python -m pytest test_raw_timestream.py
+
+"""
+
+import numpy as np
+import pytest
+from caput import mpiutil
+from caput import mpiarray
+from tlpipe.container import raw_timestream
+from tlpipe.container.raw_timestream import RawTimestream
+
+
+feedno = [ 2, 5, 9 ]
+channo = [ [1, 2], [3, 4], [5, 6] ] # x and y channels of each feed
+# all channel pairs, some only in the conjugated order, and some in both
+# orders, in which case the first non-conjugated one should be taken
+blorder = [ [1, 1], [2, 1], [1, 3], [4, 1], [1, 5], [6, 1],
+            [2, 2], [3, 2], [2, 4], [5, 2], [6, 2],
+            [3, 3], [3, 4], [3, 5], [6, 3],
+            [4, 4], [5, 4], [4, 6],
+            [5, 5], [5, 6], [6, 5],
+            [6, 6], [1, 2], [2, 3], [4, 6] ]
+shape = (7, 3, len(blorder)) # time, frequency, baseline
+
+
+def _global():
+    rs = np.random.RandomState(0)
+    vis = (rs.normal(size=shape) + 1.0J * rs.normal(size=shape)).astype(np.complex64)
+    vis_mask = rs.rand(*shape) > 0.7
+    return vis, vis_mask
+
+
+def _local(data, axis):
+    arr = mpiarray.MPIArray(data.shape, axis=axis, comm=mpiutil.world, dtype=data.dtype)
+    sel = [ slice(None) ] * data.ndim
+    sel[axis] = slice(arr.local_offset[axis], arr.local_offset[axis] + arr.shape[axis])
+    arr.local_array[:] = data[tuple(sel)]
+    return arr
+
+
+def _rt(dist_axis):
+    vis, vis_mask = _global()
+    rt = RawTimestream(dist_axis=dist_axis, comm=mpiutil.world)
+    rt.create_dataset('vis', data=_local(vis, dist_axis))
+    rt.create_dataset('vis_mask', data=_local(vis_mask, dist_axis))
+    rt['vis'].attrs['dimname'] = 'Time, Frequency, Baseline'
+    bl = np.array(blorder)
+    rt.create_dataset('blorder', data=(_local(bl, 0) if dist_axis == 2 else bl))
+    rt.create_dataset('feedno', data=np.array(feedno))
+    rt.create_dataset('channo', data=np.array(channo))
+    return rt
+
+
+def _old_separate(vis, conj):
+    ### the separated data by the former blorder.index lookups
+    xchans = [ ch[0] for ch in channo ]
+    ychans = [ ch[1] for ch in channo ]
+    nfeed = len(feedno)
+    bls = [ tuple(bl) for bl in blorder ]
+    conj_bls = [ tuple(bl[::-1]) for bl in blorder ]
+
+    def _get_ind(chp):
+        try:
+            return False, bls.index(chp)
+        except ValueError:
+            return True, conj_bls.index(chp)
+
+    out = []
+    for c1, c2 in [ (xchans, xchans), (ychans, ychans), (xchans, ychans), (ychans, xchans) ]:
+        lst = [ _get_ind((c1[i], c2[j])) for i in xrange(nfeed) for j in xrange(i, nfeed) ]
+        inds = [ ind for (cj, ind) in lst ]
+        cjs = [ cj for (cj, ind) in lst ]
+        out.append(np.where(cjs, vis[:, :, inds].conj(), vis[:, :, inds]) if conj else vis[:, :, inds])
+
+    return np.array(out).transpose(1, 2, 0, 3)
+
+
+def _result(ts):
+    ### the global vis and vis_mask of ts
+    ts.redistribute(0)
+    vis = np.asarray(ts.local_vis)
+    mask = np.asarray(ts.local_vis_mask)
+    if mpiutil.world is not None:
+        vis = np.concatenate(mpiutil.world.allgather(vis), axis=0)
+        mask = np.concatenate(mpiutil.world.allgather(mask), axis=0)
+    return vis, mask
+
+
+@pytest.mark.parametrize('dist_axis', [ 0, 2 ])
+@pytest.mark.parametrize('destroy_self', [ False, True ])
+@pytest.mark.parametrize('block_size', [ 1, 2**30 ])
+def test_separate_as_index(monkeypatch, dist_axis, destroy_self, block_size):
+    # block_size 1 separates a time point at a time
+    monkeypatch.setattr(raw_timestream, '_SEPARATE_BLOCK_SIZE', block_size)
+    vis, vis_mask = _global()
+    rt = _rt(dist_axis)
+    ts = rt.separate_pol_and_bl(destroy_self=destroy_self)
+
+    assert ts['blorder'][:].tolist() == [ [2, 2], [2, 5], [2, 9], [5, 5], [5, 9], [9, 9] ]
+    assert ts.vis.attrs['dimname'] == 'Time, Frequency, Polarization, Baseline'
+    result = _result(ts)
+    assert np.array_equal(result[0], _old_separate(vis, True))
+    assert np.array_equal(result[1], _old_separate(vis_mask, False))
+    # some pairs are conjugated
+    assert not np.array_equal(result[0], _old_separate(vis, False))
+    if destroy_self:
+        assert 'vis' not in rt and 'vis_mask' not in rt
+
+
+def test_separate_reference_alive(monkeypatch):
+    # the raw data can not be released while a reference to it is alive
+    monkeypatch.setattr(raw_timestream, '_SEPARATE_BLOCK_SIZE', 1)
+    vis, vis_mask = _global()
+    rt = _rt(0)
+    raw = rt['vis'].local_data
+    expected = raw.copy()
+    ts = rt.separate_pol_and_bl(destroy_self=True)
+
+    assert np.array_equal(raw, expected)
+    assert np.array_equal(_result(ts)[0], _old_separate(vis, True))
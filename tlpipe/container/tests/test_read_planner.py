@@ -0,0 +1,81 @@
+"""Unit tests for the read planner.
+
+The tests of reading for all processes in a node need several MPI processes,
+run them by, e.g., ``mpirun -np 3 python -m pytest test_read_planner.py``.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import h5py
+import pytest
+from tlpipe.container import read_planner
+
+try:
+    from mpi4py import MPI
+    comm = MPI.COMM_WORLD
+except ImportError:
+    comm = None
+
+need_mpi = pytest.mark.skipif(comm is None or comm.size == 1, reason='needs several MPI processes')
+
+
+@pytest.fixture
+def h5_dset():
+    dirname = tempfile.mkdtemp() if comm is None or comm.rank == 0 else None
+    if comm is not None:
+        dirname = comm.bcast(dirname, root=0)
+    filename = os.path.join(dirname, 'data.hdf5')
+    data = (np.arange(20*12*5) + 1j * np.arange(20*12*5)[::-1]).reshape(20, 12, 5).astype(np.complex64)
+    if comm is None or comm.rank == 0:
+        with h5py.File(filename, 'w') as f:
+            f.create_dataset('vis', data=data, chunks=(4, 3, 5))
+    if comm is not None:
+        comm.barrier()
+    with h5py.File(filename, 'r') as f:
+        yield f['vis'], data
+    if comm is not None:
+        comm.barrier()
+    if comm is None or comm.rank == 0:
+        shutil.rmtree(dirname)
+
+
+def test_coalesce_and_align():
+    assert read_planner.coalesce([1, 2, 3, 7, 8, 10]) == [ (1, 4), (7, 9), (10, 11) ]
+    assert read_planner.align_runs([ (1, 4), (7, 9), (10, 11) ], 4, 11) == [ (0, 11) ]
+    assert read_planner.align_runs([ (1, 2), (9, 10) ], 4, 11) == [ (0, 4), (8, 11) ]
+
+
+def test_read(h5_dset):
+    dset, data = h5_dset
+    for sel in [ [ slice(2, 17), [0, 1, 5, 11], slice(None) ],
+                 [ [3, 4, 9], slice(1, 12, 2), [0, 4] ] ]:
+        plan = read_planner.ReadPlan(dset.shape, sel, dset.chunks, max_reads=4)
+        assert plan.num_reads <= 4
+        out = np.zeros((25, 12, 5), dtype=data.dtype)
+        read_planner.read(dset, sel, out, [ slice(5, 5 + len(np.arange(20)[sel[0]])), slice(0, plan.selected_shape[1]), slice(0, plan.selected_shape[2]) ])
+        expect = data[np.ix_(*[ np.arange(n)[s] for (n, s) in zip(data.shape, sel) ])]
+        assert np.array_equal(out[5:5+expect.shape[0], :expect.shape[1], :expect.shape[2]], expect)
+
+
+def test_chunk_lens():
+    # a line along axis 1 has 12 * 8 bytes
+    assert read_planner._chunk_lens([20, 12, 5], 1, 8, 20*12*5*8) == [20, 12, 5]
+    assert read_planner._chunk_lens([20, 12, 5], 1, 8, 3*12*5*8) == [3, 12, 5]
+    assert read_planner._chunk_lens([20, 12, 5], 1, 8, 2*12*8) == [1, 12, 2]
+    assert read_planner._chunk_lens([20, 12, 5], 1, 8, 1) == [1, 12, 1]
+
+
+@need_mpi
+def test_node_read(h5_dset):
+    dset, data = h5_dset
+    # baselines distributed among procs, some overlap
+    bls = [ bi for bi in xrange(12) if bi % comm.size == comm.rank or bi == 6 ]
+    sel = [ slice(1, 19), bls, slice(None) ]
+    expect = data[1:19][:, bls]
+    for max_bytes in (None, 1, 3*12*5*8):
+        out = np.zeros((20, len(bls), 5), dtype=data.dtype)
+        read_planner.node_read(dset, sel, 1, out, [ slice(2, 20) ], comm=comm, max_bytes=max_bytes)
+        assert np.array_equal(out[2:], expect)
+        assert np.all(out[:2] == 0)
@@ -0,0 +1,66 @@
+"""Unit tests for the memory bounded redistribution.
+
+They need several MPI processes, run them by, e.g.,
+``mpirun -np 3 python -m pytest test_redistribute.py``.
+"""
+
+import numpy as np
+import pytest
+from caput import mpiutil
+from caput import mpiarray
+from tlpipe.container import redistribute
+
+comm = mpiutil.world
+
+pytestmark = pytest.mark.skipif(comm is None or comm.size == 1, reason='needs several MPI processes')
+
+
+def _global(shape):
+    return (np.arange(np.prod(shape)) + 1j).reshape(shape).astype(np.complex64)
+
+
+def _dist(data, axis):
+    arr = mpiarray.MPIArray(data.shape, axis=axis, comm=comm, dtype=data.dtype)
+    sel = [ slice(None) ] * data.ndim
+    sel[axis] = slice(arr.local_offset[axis], arr.local_offset[axis] + arr.shape[axis])
+    arr.local_array[:] = data[tuple(sel)]
+    return arr
+
+
+def _check(out, data, axis):
+    assert out.axis == axis
+    sel = [ slice(None) ] * data.ndim
+    sel[axis] = slice(out.local_offset[axis], out.local_offset[axis] + out.shape[axis])
+    assert np.array_equal(out.local_array, data[tuple(sel)])
+
+
+@pytest.mark.parametrize('old_axis, axis', [ (0, 1), (0, 2), (1, 0), (2, 1), (1, 2) ])
+def test_redistribute(old_axis, axis):
+    data = _global((7, 5, 4))
+    for max_bytes in (1, 3*5*4*8, None):
+        stats = {}
+        out = redistribute.redistribute(_dist(data, old_axis), axis, max_bytes, stats)
+        _check(out, data, axis)
+        assert stats['nslabs'] >= 1
+        assert stats.get('released', 0) == 0
+
+
+@pytest.mark.parametrize('old_axis, axis', [ (0, 2), (1, 2), (2, 0) ])
+def test_release(old_axis, axis):
+    data = _global((8, 6, 5))
+    stats = {}
+    out = redistribute.redistribute([ _dist(data, old_axis) ], axis, 5*8, stats)
+    _check(out, data, axis)
+    # the slabs are cut along the first axis, unless it is the new axis
+    assert (stats.get('released', 0) > 0) == (axis != 0)
+
+
+def test_no_release_if_referenced():
+    data = _global((8, 6, 5))
+    arr = _dist(data, 0)
+    view = arr[1:]
+    stats = {}
+    out = redistribute.redistribute([ arr ], 1, 6*8, stats)
+    _check(out, data, 1)
+    assert stats.get('released', 0) == 0
+    assert np.array_equal(view, _dist(data, 0)[1:])
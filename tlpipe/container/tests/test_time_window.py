@@ -0,0 +1,64 @@
+"""Unit tests for the sliding time window."""
+
+import numpy as np
+import pytest
+from caput import mpiutil
+from tlpipe.container.time_window import uncovered, TimeWindow
+
+
+def _rows(sections):
+    ### {local row: (file, row in file)} read by sections
+    rows = {}
+    for fi, start, stop, st in sections:
+        for ri in range(start, stop):
+            assert not st + ri - start in rows
+            rows[st + ri - start] = (fi, ri)
+    return rows
+
+
+@pytest.mark.parametrize('covered', [ [], [ (0, 30) ], [ (5, 8) ], [ (0, 12) ], [ (8, 15), (20, 22) ],
+                                      [ (20, 22), (8, 15) ], [ (3, 4), (3, 6), (25, 40) ], [ (12, 12) ] ])
+def test_uncovered(covered):
+    # rows [2, 12) of file 0 and [0, 15) of file 1 to local rows [0, 25)
+    sections = [ (0, 2, 12, 0), (1, 0, 15, 10) ]
+    result = uncovered(sections, covered)
+
+    expected = dict((lr, v) for lr, v in _rows(sections).items() if not any(lo <= lr < hi for lo, hi in covered))
+    assert _rows(result) == expected
+    # no empty sections
+    assert all(start < stop for fi, start, stop, st in result)
+
+
+def test_uncovered_random():
+    rs = np.random.RandomState(0)
+    for i in range(50):
+        sections = []
+        st = 0
+        for fi in range(rs.randint(1, 4)):
+            start = rs.randint(0, 10)
+            stop = start + rs.randint(1, 10)
+            sections.append((fi, start, stop, st))
+            st += stop - start
+        covered = [ tuple(sorted(rs.randint(0, st + 2, 2))) for j in range(rs.randint(0, 4)) ]
+        result = uncovered(sections, covered)
+        expected = dict((lr, v) for lr, v in _rows(sections).items() if not any(lo <= lr < hi for lo, hi in covered))
+        assert _rows(result) == expected
+
+
+@pytest.mark.parametrize('failed_rank', [ None, 0, mpiutil.size - 1 ])
+def test_wait_agrees_on_failure(failed_rank):
+    # the prefetch thread of `failed_rank` has read only some rows
+    tw = TimeWindow()
+    tw._comm = mpiutil.world if mpiutil.world is not None else False
+    tw._fetched = [ ('vis', 10, 12, np.ones((2, 3))) ]
+    if mpiutil.rank == failed_rank:
+        tw._error = IOError('read failed')
+    tw.wait()
+    if failed_rank is None:
+        assert [ a for a, b, _, _ in tw._segments['vis'] ] == [ 10 ]
+    else:
+        # dropped by all procs
+        assert tw._segments == {}
+    assert tw._error is None
+    # nothing to wait for any more
+    tw.wait()
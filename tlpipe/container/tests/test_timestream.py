@@ -0,0 +1,127 @@
+"""Unit tests for the conversion between linear and Stokes polarizations.
+
+The tests run in a single process, or by several processes with e.g.::
+
+    $ mpirun -np 2 python -m pytest test_timestream.py
+
+"""
+
+import warnings
+import numpy as np
+import pytest
+from caput import mpiutil
+from caput import mpiarray
+from tlpipe.container import timestream
+from tlpipe.container.timestream import Timestream
+
+
+shape = (6, 3, 4, 5) # time, frequency, polarization, baseline
+
+
+def _global():
+    rs = np.random.RandomState(0)
+    vis = (rs.normal(size=shape) + 1.0J * rs.normal(size=shape)).astype(np.complex64)
+    vis_mask = rs.rand(*shape) > 0.8
+    return vis, vis_mask
+
+
+def _local(data, axis):
+    arr = mpiarray.MPIArray(data.shape, axis=axis, comm=mpiutil.world, dtype=data.dtype)
+    sel = [ slice(None) ] * data.ndim
+    sel[axis] = slice(arr.local_offset[axis], arr.local_offset[axis] + arr.shape[axis])
+    arr.local_array[:] = data[tuple(sel)]
+    return arr
+
+
+def _check(ts, data):
+    axis = ts.main_data_dist_axis
+    sel = [ slice(None) ] * data.ndim
+    sel[axis] = slice(ts.vis.local_offset[axis], ts.vis.local_offset[axis] + ts.vis.local_shape[axis])
+    return ts.vis.local_data, data[tuple(sel)]
+
+
+def _ts(pols, pol_type, dist_axis):
+    vis, vis_mask = _global()
+    ts = Timestream(dist_axis=dist_axis, comm=mpiutil.world)
+    ts.create_dataset('vis', data=_local(vis, dist_axis))
+    ts.create_dataset('vis_mask', data=_local(vis_mask, dist_axis))
+    ts.create_dataset('pol', data=np.array([ ts.pol_dict[p] for p in pols ]), dtype='i4')
+    ts['pol'].attrs['pol_type'] = pol_type
+    return ts, vis, vis_mask
+
+
+def _pol(ts):
+    ### the global pol, which is distributed if the data is along polarization
+    pol = ts['pol']
+    if pol.distributed:
+        return np.concatenate(mpiutil.world.allgather(pol.local_data)).tolist()
+    return pol[:].tolist()
+
+
+def _local_mask(ts, mask):
+    axis = ts.main_data_dist_axis
+    sel = [ slice(None) ] * mask.ndim
+    sel[axis] = slice(ts['vis_mask'].local_offset[axis], ts['vis_mask'].local_offset[axis] + ts['vis_mask'].local_shape[axis])
+    return np.asarray(ts['vis_mask'].local_data), mask[tuple(sel)]
+
+
+@pytest.mark.parametrize('dist_axis', [ 0, 2 ])
+def test_lin2stokes(dist_axis, monkeypatch):
+    # convert by blocks of two time points
+    monkeypatch.setattr(timestream, '_MIX_BLOCK_SIZE', 2 * np.prod(shape[1:]) * 8)
+    # the linear polarizations in a different order
+    ts, vis, vis_mask = _ts(('yy', 'xx', 'yx', 'xy'), 'linear', dist_axis)
+    yy, xx, yx, xy = [ vis[:, :, pi] for pi in range(4) ]
+    expected = np.empty_like(vis)
+    expected[:, :, 0] = 0.5 * (xx + yy)
+    expected[:, :, 1] = 0.5 * (xx - yy)
+    expected[:, :, 2] = 0.5 * (xy + yx)
+    expected[:, :, 3] = -0.5J * (xy - yx)
+    mask = np.empty_like(vis_mask)
+    mask[:, :, 0] = mask[:, :, 1] = vis_mask[:, :, 0] | vis_mask[:, :, 1]
+    mask[:, :, 2] = mask[:, :, 3] = vis_mask[:, :, 2] | vis_mask[:, :, 3]
+
+    ts.lin2stokes()
+
+    assert ts.main_data_dist_axis == dist_axis
+    assert ts['pol'].attrs['pol_type'] == 'stokes'
+    assert _pol(ts) == [ ts.pol_dict[p] for p in ('I', 'Q', 'U', 'V') ]
+    local, exp = _check(ts, expected)
+    assert np.allclose(local, exp, atol=1.0e-6)
+    local, exp = _local_mask(ts, mask)
+    assert np.array_equal(local, exp)
+
+
+@pytest.mark.parametrize('dist_axis', [ 0, 2 ])
+def test_round_trip(dist_axis):
+    ts, vis, vis_mask = _ts(('xx', 'yy', 'xy', 'yx'), 'linear', dist_axis)
+    ts.lin2stokes()
+    ts.stokes2lin()
+
+    assert ts['pol'].attrs['pol_type'] == 'linear'
+    assert _pol(ts) == [ ts.pol_dict[p] for p in ('xx', 'yy', 'xy', 'yx') ]
+    local, exp = _check(ts, vis)
+    assert np.allclose(local, exp, atol=1.0e-6)
+    # masked points are never unmasked
+    local, exp = _local_mask(ts, vis_mask)
+    assert np.all(local[exp])
+
+
+def test_keep_dist_axis():
+    ts, vis, vis_mask = _ts(('xx', 'yy', 'xy', 'yx'), 'linear', 2)
+    ts.lin2stokes(keep_dist_axis=False)
+    assert ts.main_data_dist_axis == 0
+
+
+def test_already_converted():
+    ts, vis, vis_mask = _ts(('I', 'Q', 'U', 'V'), 'stokes', 0)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        ts.lin2stokes()
+    assert len(w) == 1
+    local, exp = _check(ts, vis)
+    assert np.array_equal(local, exp)
+
+    ts, vis, vis_mask = _ts(('xx', 'yy'), 'linear', 0)
+    with pytest.raises(RuntimeError):
+        ts.lin2stokes()
@@ -0,0 +1,66 @@
+"""Unit tests for the dynamic scheduling by work stealing.
+
+The tests of stealing need several MPI processes, run them by, e.g.,
+``mpirun -np 3 python -m pytest test_work_stealing.py``.
+"""
+
+import time
+import numpy as np
+import pytest
+from caput import mpiutil
+from tlpipe.container import work_stealing
+
+comm = mpiutil.world
+
+mpi = pytest.mark.skipif(comm is None or comm.size == 1, reason='needs several MPI processes')
+
+
+def _local(nlocal, order='C', rank=None):
+    if rank is None:
+        rank = 0 if comm is None else comm.rank
+    arr = np.zeros((3, nlocal, 4), dtype=np.float64, order=order)
+    arr[:] = (100 * rank + np.arange(nlocal))[np.newaxis, :, np.newaxis]
+    mask = np.zeros((nlocal, 4), dtype=bool)
+    return [ arr, mask ]
+
+
+def _double(owner, li, sections):
+    arr, mask = sections
+    assert arr.shape == (3, 4) and mask.shape == (4,)
+    assert np.all(arr == 100 * owner + li)
+    if owner == 0:
+        # slices of proc 0 are slow, so they are stolen by others
+        time.sleep(0.02)
+    arr *= 2
+    mask[:] = True
+
+
+def test_single_proc():
+    arrays = _local(5, rank=0)
+    stats = work_stealing.operate(arrays, [1, 0], _double, comm=None)
+    assert stats['slices'] == 5 and stats['stolen'] == 0
+    assert np.all(arrays[0] == 2 * np.arange(5)[np.newaxis, :, np.newaxis])
+    assert arrays[1].all()
+
+
+@mpi
+@pytest.mark.parametrize('order', [ 'C', 'F' ])
+def test_operate(order):
+    nlocal = 10 if comm.rank == 0 else 2
+    arrays = _local(nlocal, order)
+    expect = 2 * arrays[0]
+    stats = work_stealing.operate(arrays, [1, 0], _double, comm=comm)
+    all_stats = comm.allgather(stats)
+    assert sum([ st['slices'] for st in all_stats ]) == 10 + 2 * (comm.size - 1)
+    assert sum([ st['stolen'] for st in all_stats ]) > 0
+    assert np.all(arrays[0] == expect)
+    assert arrays[1].all()
+
+
+@mpi
+def test_operate_copy_data():
+    arrays = _local(3)
+    bufs = [ arr.copy() for arr in arrays ]
+    work_stealing.operate(arrays, [1, 0], _double, comm=comm, copy_data=True)
+    assert np.all(arrays[0] == bufs[0])
+    assert not arrays[1].any()
@@ -0,0 +1,326 @@
+"""Sliding time window of iteratively loaded data.
+
+:class:`~tlpipe.timestream.dispatch.Dispatch` loads the data of consecutive
+iterations in time windows that overlap by ``2*extra_inttime`` time points.
+:class:`TimeWindow` keeps a copy of the overlapping rows of the distributed
+time ordered datasets of one window, so that the next window takes them from
+memory instead of reading them from the files again. If the data is
+distributed along the time axis, the kept rows are sent to the processes that
+hold them in the next window. It can also read the rows of the next window in
+a background thread while the current window is being processed.
+
+Rows are indexed by their absolute time index in the input files, i.e., the
+`start` the data container was created with plus the time index in it.
+
+"""
+
+import threading
+import logging
+import numpy as np
+import h5py
+from caput import mpiutil
+from tlpipe.utils import telemetry
+import file_index
+import read_planner
+import packed_mask
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+# Set the module logger.
+logger = logging.getLogger(__name__)
+
+
+# maximum size in bytes of a message sending kept rows to another process
+MAX_MESSAGE_BYTES = 64 * 2**20
+# maximum size in bytes of a single read of the prefetch thread, it holds
+# the lock of h5py while reading
+MAX_READ_BYTES = 16 * 2**20
+
+
+def uncovered(sections, covered):
+    """Return the parts of `sections` not in the `covered` local rows.
+
+    Parameters
+    ----------
+    sections : list of tuples
+        Sections ``(fi, start, stop, st)`` to read rows [start, stop) of
+        file `fi` to the local rows [st, st + stop - start).
+    covered : list of tuples
+        Ranges ``(lo, hi)`` of local rows that need not be read.
+
+    """
+    result = []
+    for fi, start, stop, st in sections:
+        parts = [ (st, st + (stop - start)) ]
+        for lo, hi in covered:
+            parts = [ p for (a, b) in parts for p in ((a, min(b, lo)), (max(a, hi), b)) if p[0] < p[1] ]
+        result.extend([ (fi, start + (a - st), start + (b - st), a) for (a, b) in parts ])
+
+    return result
+
+
+def _full_shape(dset):
+    ### shape of the data of dset in a file, unpacked if it is a packed mask
+    shape = list(dset.shape)
+    if packed_mask.is_packed(dset):
+        shape[int(dset.attrs[packed_mask.PACKED_AXIS_ATTR])] = int(dset.attrs[packed_mask.PACKED_LENGTH_ATTR])
+
+    return shape
+
+
+class TimeWindow(object):
+    """Rows of a time window kept or prefetched for the next time window.
+
+    A data container uses it on loading if its attribute `time_window` is set
+    to it, and `time_window_offset` to the absolute time index of its first
+    row.
+
+    """
+
+    def __init__(self):
+
+        self._key = None
+        # {name: [(start, stop, data, prefetched), ...]}
+        self._segments = {}
+        self._thread = None
+        self._fetched = []
+        self._error = None
+        # communicator of the procs prefetching, None if not prefetching
+        self._comm = None
+
+    @staticmethod
+    def usable(tod):
+        """Whether rows of `tod` can be kept, i.e., all time points are selected."""
+        return tod.main_data_select[0] == slice(0, None, None)
+
+    @staticmethod
+    def _tod_key(tod):
+        ### kept rows only fit a container with the same selection and distribution
+        return (repr(tod.main_data_select), tod.main_data_dist_axis, tod.nproc)
+
+    @staticmethod
+    def dataset_names(tod):
+        """Names of the datasets of `tod` whose rows can be kept."""
+        names = []
+        for name, axes in tod.main_time_ordered_datasets.items():
+            if name in tod.iterkeys() and not name in tod.lazy_datasets and name in tod.infiles[0]:
+                if axes[0] == 0 and tod.main_data_dist_axis in axes:
+                    names.append(name)
+
+        return sorted(names)
+
+    def keep(self, tod, keep_start):
+        """Keep a copy of the rows from the absolute time index `keep_start` on.
+
+        This must be called just after `tod` has been loaded, before its data
+        are changed, and by all processes in the communicator of `tod`.
+
+        """
+        self.clear()
+        if not self.usable(tod):
+            return
+
+        self._key = self._tod_key(tod)
+        for name in self.dataset_names(tod):
+            dset = tod[name]
+            first = tod.time_window_offset + dset.local_offset[0]
+            lo = max(first, keep_start)
+            hi = first + dset.local_shape[0]
+            if lo < hi:
+                self._segments[name] = [ (lo, hi, dset.local_data[lo-first:hi-first].copy(), False) ]
+
+    def prefetch(self, tod, files, start, stop, read_start):
+        """Read in a background thread the rows of the next time window.
+
+        The next window [start, stop) will be loaded with the same data
+        selection and distribution as `tod`, the rows this process will hold
+        in it are read except those before `read_start`, which are expected
+        to be kept. This must be called by all processes in the communicator
+        of `tod`.
+
+        Parameters
+        ----------
+        tod : :class:`~tlpipe.container.container.BasicTod`
+            The data container of the current window.
+        files : list of strings
+            The input files, `start` and `stop` are relative to the first of
+            them.
+        start, stop : integer
+            Absolute time index range of the next window.
+        read_start : integer
+            Absolute time index to read from.
+
+        """
+        if self._comm is not None or not self.usable(tod):
+            return
+
+        num_ts = file_index.num_time_points(file_index.get_file_info(files, comm=tod.comm), tod.main_data_name)
+        offsets = np.cumsum([0] + num_ts)
+
+        if tod.main_data_dist_axis == 0:
+            _, sts, ets = mpiutil.split_all(stop - start, comm=tod.comm)
+            lo, hi = start + sts[tod.rank], start + ets[tod.rank]
+        else:
+            lo, hi = start, stop
+        lo = max(lo, read_start)
+
+        # all selections are made here, the thread only reads files
+        jobs = []
+        for name in self.dataset_names(tod):
+            dset = tod[name]
+            axes = list(tod.main_axes_ordered_datasets[name])
+            shape = _full_shape(tod.infiles[0][name])
+            axes = axes + [None] * (len(shape) - len(axes))
+            fsel = [ ( tod.main_data_select[a] if a is not None else slice(0, None, None) ) for a in axes ]
+            if tod.main_data_dist_axis != 0:
+                di = axes.index(tod.main_data_dist_axis)
+                fsel[di] = mpiutil.mpilist(np.arange(shape[di])[fsel[di]].tolist(), comm=tod.comm)
+            for fi in xrange(len(files)):
+                a, b = max(lo, offsets[fi]), min(hi, offsets[fi+1])
+                if a < b:
+                    jobs.append((files[fi], name, fsel, a, b, a - offsets[fi], tuple(dset.local_shape[1:]), dset.dtype))
+
+        # even procs with no rows to read agree on the prefetched rows in wait
+        self._comm = tod.comm if tod.comm is not None else False
+        if len(jobs) > 0:
+            self._thread = threading.Thread(target=self._run, args=(jobs,), name='TimeWindowPrefetch')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self, jobs):
+        ### read the prefetch jobs, in the background thread
+        fhs = {}
+        try:
+            for filename, name, fsel, a, b, fstart, tail, dtype in jobs:
+                if not filename in fhs:
+                    fhs[filename] = h5py.File(filename, 'r')
+                dset = fhs[filename][name]
+                data = np.empty((b - a,) + tail, dtype=dtype)
+                row_bytes = max(1, data[:1].nbytes)
+                step = max(1, MAX_READ_BYTES / row_bytes)
+                for c in xrange(0, b - a, step):
+                    c1 = min(c + step, b - a)
+                    sel = [ slice(fstart + c, fstart + c1) ] + list(fsel[1:])
+                    msel = [ slice(c, c1) ]
+                    if packed_mask.is_packed(dset):
+                        data[tuple(msel)] = packed_mask.read_packed(dset, sel)
+                    else:
+                        read_planner.read(dset, sel, data, msel)
+                self._fetched.append((name, a, b, data))
+        except Exception as e:
+            self._error = e
+        finally:
+            for fh in fhs.values():
+                fh.close()
+
+    def wait(self):
+        """Wait until the prefetch thread, if any, has read all its rows.
+
+        The prefetched rows are dropped by all processes if the prefetch has
+        failed on any of them, so that all processes read the same rows from
+        the files on loading, which may be collective. This must be called by
+        all processes that called :meth:`prefetch`.
+        """
+        if self._comm is None:
+            return
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        failed = self._error is not None
+        if self._comm is not False:
+            failed = mpiutil.allreduce(int(failed), op=mpiutil.MAX, comm=self._comm) > 0
+        self._comm = None
+        if failed:
+            # rows not prefetched are just read on loading
+            if self._error is not None:
+                logger.warning('Prefetching the next time window failed: %s' % self._error)
+            else:
+                logger.warning('Prefetching the next time window failed on another process')
+            self._error = None
+            self._fetched = []
+        for name, a, b, data in self._fetched:
+            self._segments.setdefault(name, []).append((a, b, data, True))
+        self._fetched = []
+
+    def clear(self):
+        """Drop all kept and prefetched rows."""
+        self.wait()
+        self._key = None
+        self._segments = {}
+
+    def rows(self, tod, name, lo, hi):
+        """Take the kept rows in [lo, hi) of dataset `name` of `tod`.
+
+        Rows of the dataset are dropped from the window once taken. This
+        must be called by all processes in the communicator of `tod`, as the
+        kept rows are exchanged between them if `tod` is distributed along
+        the time axis.
+
+        Returns
+        -------
+        rows : list of tuples
+            Rows ``(start, stop, data)`` relative to `lo`.
+
+        """
+        self.wait()
+        segs = self._segments.pop(name, [])
+        if self._key != self._tod_key(tod):
+            return []
+
+        for a, b, data, prefetched in segs:
+            if prefetched:
+                telemetry.count('bytes_read', data.nbytes)
+        segs = [ (a, b, data) for a, b, data, _ in segs ]
+
+        if tod.main_data_dist_axis == 0 and tod.comm is not None and tod.nproc > 1:
+            segs = self._exchange(segs, lo, hi, tuple(tod[name].local_shape[1:]), tod[name].dtype, tod.comm)
+
+        result = []
+        for a, b, data in segs:
+            a1, b1 = max(a, lo), min(b, hi)
+            if a1 < b1:
+                result.append((a1 - lo, b1 - lo, data[a1-a:b1-a]))
+
+        return result
+
+    @staticmethod
+    def _exchange(segs, lo, hi, tail, dtype, comm):
+        ### send the kept rows to the procs that want them, and return the
+        ### kept rows in [lo, hi) of this proc
+        held = comm.allgather([ (a, b) for a, b, _ in segs ])
+        wanted = comm.allgather((lo, hi))
+        row_bytes = max(1, np.dtype(dtype).itemsize * int(np.prod(tail)))
+        step = max(1, MAX_MESSAGE_BYTES / row_bytes)
+
+        result = []
+        requests = []
+        buffers = [] # keep send buffers alive until sent
+        # every proc goes through all pairs in the same order, so the
+        # messages between two procs are received in the order they are sent
+        for src in xrange(comm.size):
+            for si, (a, b) in enumerate(held[src]):
+                for dst in xrange(comm.size):
+                    a1, b1 = max(a, wanted[dst][0]), min(b, wanted[dst][1])
+                    if a1 >= b1 or not comm.rank in (src, dst):
+                        continue
+                    if src == dst:
+                        result.append((a1, b1, segs[si][2][a1-a:b1-a]))
+                        continue
+                    for c in xrange(a1, b1, step):
+                        c1 = min(c + step, b1)
+                        if comm.rank == src:
+                            buf = np.ascontiguousarray(segs[si][2][c-a:c1-a])
+                            buffers.append(buf)
+                            requests.append(comm.Isend([ buf, MPI.BYTE ], dest=dst))
+                        else:
+                            buf = np.empty((c1 - c,) + tail, dtype=dtype)
+                            requests.append(comm.Irecv([ buf, MPI.BYTE ], source=src))
+                            result.append((c, c1, buf))
+        MPI.Request.Waitall(requests)
+
+        return result
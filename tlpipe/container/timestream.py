@@ -10,13 +10,18 @@ Inheritance diagram
 """
 
 import itertools
+import warnings
 import numpy as np
 import container
 import timestream_common
-from caput import mpiarray
 from caput import memh5
 
 
+# maximum size in bytes of a block of data converted at a time between
+# linear and Stokes polarizations
+_MIX_BLOCK_SIZE = 64 * 2**20
+
+
 class Timestream(timestream_common.TimestreamCommon):
     """Container class for the timestream data.
 
@@ -209,100 +214,124 @@ class Timestream(timestream_common.TimestreamCommon):
         self.create_main_axis_ordered_dataset('polarization', name, data, axis_order, recreate, copy_attrs, check_align)
 
 
-    def lin2stokes(self):
-        """Convert the linear polarized data to Stokes polarization."""
+    def _mix_pol(self, in_pols, matrix, out_pols, pol_type, keep_dist_axis):
+        ### replace the polarizations `in_pols` of the main data by `out_pols`
+        ### = `matrix` * `in_pols`, in place block by block along the first
+        ### axis, an output is masked if any of the inputs it mixes is masked
+
+        # redistribute to 0 axis if polarization is the distributed axis
+        original_dist_axis = self.main_data_dist_axis
+        if 'polarization' == self.main_data_axes[self.main_data_dist_axis]:
+            self.redistribute(0)
+
+        names = [ self.main_data_name, 'vis_mask' ]
+        self.materialize(names)
+        self.unpack_mask()
+        self.ensure_writable(names)
+
+        pol = self.pol[:].tolist()
+        inds = [ pol.index(ip) for ip in in_pols ]
+        vis = self.main_data.local_data
+        vis_mask = self['vis_mask'].local_data if 'vis_mask' in self.iterkeys() else None
+        matrix = np.asarray(matrix).astype(vis.dtype)
+        mixes = [ np.nonzero(row)[0].tolist() for row in matrix ]
+
+        # the inputs of a block are copied, so the scratch is just a block
+        step = max(1, _MIX_BLOCK_SIZE / max(1, vis[:1].nbytes))
+        for st in xrange(0, vis.shape[0], step):
+            et = min(st + step, vis.shape[0])
+            blk = vis[st:et][:, :, inds]
+            for oi, js in enumerate(mixes):
+                out = vis[st:et, :, oi]
+                np.multiply(blk[:, :, js[0]], matrix[oi, js[0]], out=out)
+                for j in js[1:]:
+                    out += matrix[oi, j] * blk[:, :, j]
+            del blk
+
+            if vis_mask is not None:
+                blk = vis_mask[st:et][:, :, inds]
+                for oi, js in enumerate(mixes):
+                    np.any(blk[:, :, js], axis=2, out=vis_mask[st:et, :, oi])
+                del blk
+
+        del self['pol']
+        self.create_dataset('pol', data=np.array(out_pols), dtype='i4')
+        self['pol'].attrs['pol_type'] = pol_type
+
+        if keep_dist_axis:
+            # redistribute self to original axis
+            self.redistribute(original_dist_axis)
+
+    def lin2stokes(self, keep_dist_axis=True):
+        """Convert the linear polarized data to Stokes polarization.
+
+        The data is converted in place, and a Stokes parameter is masked if
+        any of the two linear polarizations it is made of is masked.
+
+        Parameters
+        ----------
+        keep_dist_axis : bool, optional
+            Whether to redistribute main data to the original dist axis if it
+            was the polarization axis. Default True.
+
+        """
         try:
             pol = self.pol
         except KeyError:
             raise RuntimeError('Polarization of the data is unknown, can not convert')
 
         if pol.attrs['pol_type'] == 'stokes' and pol.shape[0] == 4:
-            warning.warn('Data is already Stokes polarization, no need to convert')
+            warnings.warn('Data is already Stokes polarization, no need to convert')
             return
 
         if pol.attrs['pol_type'] == 'linear' and pol.shape[0] == 4:
-
-            # redistribute to 0 axis if polarization is the distributed axis
-            original_dist_axis = self.main_data_dist_axis
-            if 'polarization' == self.main_data_axes[self.main_data_dist_axis]:
-                self.redistribute(0)
-
-            pol = pol[:].tolist()
             p = self.pol_dict
-
-            # create a new MPIArray to hold the new data
-            md = mpiarray.MPIArray(self.main_data.shape, axis=self.main_data_dist_axis, comm=self.comm, dtype=self.main_data.dtype)
-            # convert to Stokes I, Q, U, V
-            md.local_array[:, :, 0] = 0.5 * (self.main_data.local_data[:, :, pol.index(p['xx'])] + self.main_data.local_data[:, :, pol.index(p['yy'])]) # I
-            md.local_array[:, :, 1] = 0.5 * (self.main_data.local_data[:, :, pol.index(p['xx'])] - self.main_data.local_data[:, :, pol.index(p['yy'])]) # Q
-            md.local_array[:, :, 2] = 0.5 * (self.main_data.local_data[:, :, pol.index(p['xy'])] + self.main_data.local_data[:, :, pol.index(p['yx'])]) # U
-            md.local_array[:, :, 3] = -0.5J * (self.main_data.local_data[:, :, pol.index(p['xy'])] - self.main_data.local_data[:, :, pol.index(p['yx'])]) # V
-
-            attr_dict = {} # temporarily save attrs of this dataset
-            memh5.copyattrs(self.main_data.attrs, attr_dict)
-            del self[self.main_data_name]
-            # create main data
-            self.create_dataset(self.main_data_name, shape=md.shape, dtype=md.dtype, data=md, distributed=True, distributed_axis=self.main_data_dist_axis)
-            memh5.copyattrs(attr_dict, self.main_data.attrs)
-
-            del self['pol']
-            self.create_dataset('pol', data=np.array([p['I'], p['Q'], p['U'], p['V']]), dtype='i4')
-            self['pol'].attrs['pol_type'] = 'stokes'
-
-            # redistribute self to original axis
-            self.redistribute(original_dist_axis)
+            # I = (xx + yy) / 2, Q = (xx - yy) / 2, U = (xy + yx) / 2, V = -i (xy - yx) / 2
+            matrix = [ [ 0.5, 0.5, 0, 0 ],
+                       [ 0.5, -0.5, 0, 0 ],
+                       [ 0, 0, 0.5, 0.5 ],
+                       [ 0, 0, -0.5J, 0.5J ] ]
+            self._mix_pol([p['xx'], p['yy'], p['xy'], p['yx']], matrix, [p['I'], p['Q'], p['U'], p['V']], 'stokes', keep_dist_axis)
 
         else:
             raise RuntimeError('Can not convert to Stokes polarization')
 
-    def stokes2lin(self):
-        """Convert the Stokes polarized data to linear polarization."""
+    def stokes2lin(self, keep_dist_axis=True):
+        """Convert the Stokes polarized data to linear polarization.
+
+        The data is converted in place, and a linear polarization is masked
+        if any of the two Stokes parameters it is made of is masked.
+
+        Parameters
+        ----------
+        keep_dist_axis : bool, optional
+            Whether to redistribute main data to the original dist axis if it
+            was the polarization axis. Default True.
+
+        """
         try:
             pol = self.pol
         except KeyError:
             raise RuntimeError('Polarization of the data is unknown, can not convert')
 
         if pol.attrs['pol_type'] == 'linear' and pol.shape[0] == 4:
-            warning.warn('Data is already linear polarization, no need to convert')
+            warnings.warn('Data is already linear polarization, no need to convert')
             return
 
         if pol.attrs['pol_type'] == 'stokes' and pol.shape[0] == 4:
-
-            # redistribute to 0 axis if polarization is the distributed axis
-            original_dist_axis = self.main_data_dist_axis
-            if 'polarization' == self.main_data_axes[self.main_data_dist_axis]:
-                self.redistribute(0)
-
-            pol = pol[:].tolist()
             p = self.pol_dict
-
-            # create a new MPIArray to hold the new data
-            md = mpiarray.MPIArray(self.main_data.shape, axis=self.main_data_dist_axis, comm=self.comm, dtype=self.main_data.dtype)
-            # convert to linear xx, yy, xy, yx
-            md.local_array[:, :, 0] = self.main_data.local_data[:, :, pol.index(p['I'])] + self.main_data.local_data[:, :, pol.index(p['Q'])] # xx
-            md.local_array[:, :, 1] = self.main_data.local_data[:, :, pol.index(p['I'])] - self.main_data.local_data[:, :, pol.index(p['Q'])] # yy
-            md.local_array[:, :, 2] = self.main_data.local_data[:, :, pol.index(p['U'])] + 1.0J * self.main_data.local_data[:, :, pol.index(p['V'])] # xy
-            md.local_array[:, :, 3] = self.main_data.local_data[:, :, pol.index(p['U'])] - 1.0J * self.main_data.local_data[:, :, pol.index(p['V'])] # yx
-
-            attr_dict = {} # temporarily save attrs of this dataset
-            memh5.copyattrs(self.main_data.attrs, attr_dict)
-            del self[self.main_data_name]
-            # create main data
-            self.create_dataset(self.main_data_name, shape=md.shape, dtype=md.dtype, data=md, distributed=True, distributed_axis=self.main_data_dist_axis)
-            memh5.copyattrs(attr_dict, self.main_data.attrs)
-
-            del self['pol']
-            self.create_dataset('pol', data=np.array([p['xx'], p['yy'], p['xy'], p['yx']]), dtype='i4')
-            self['pol'].attrs['pol_type'] = 'linear'
-
-            # redistribute self to original axis
-            self.redistribute(original_dist_axis)
+            # xx = I + Q, yy = I - Q, xy = U + iV, yx = U - iV
+            matrix = [ [ 1, 1, 0, 0 ],
+                       [ 1, -1, 0, 0 ],
+                       [ 0, 0, 1, 1.0J ],
+                       [ 0, 0, 1, -1.0J ] ]
+            self._mix_pol([p['I'], p['Q'], p['U'], p['V']], matrix, [p['xx'], p['yy'], p['xy'], p['yx']], 'linear', keep_dist_axis)
 
         else:
             raise RuntimeError('Can not convert to linear polarization')
 
 
-    def pol_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def pol_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the polarization axis.
 
         Parameters
@@ -327,14 +356,26 @@ class Timestream(timestream_common.TimestreamCommon):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis='polarization', axis_vals=self.pol, full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis='polarization', axis_vals=self.pol, full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
 
-    def time_and_pol_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def time_and_pol_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the time and polarization axis.
 
         Parameters
@@ -360,13 +401,25 @@ class Timestream(timestream_common.TimestreamCommon):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('time', 'polarization'), axis_vals=(self.time, self.pol), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis=('time', 'polarization'), axis_vals=(self.time, self.pol), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def freq_and_pol_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def freq_and_pol_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the frequency and polarization axis.
 
         Parameters
@@ -392,13 +445,25 @@ class Timestream(timestream_common.TimestreamCommon):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('frequency', 'polarization'), axis_vals=(self.freq, self.pol), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis=('frequency', 'polarization'), axis_vals=(self.freq, self.pol), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def pol_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def pol_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the polarization and baseline axis.
 
         Parameters
@@ -424,13 +489,25 @@ class Timestream(timestream_common.TimestreamCommon):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('polarization', 'baseline'), axis_vals=(self.pol, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis=('polarization', 'baseline'), axis_vals=(self.pol, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def time_freq_and_pol_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def time_freq_and_pol_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the time, frequency and polarization axis.
 
         Parameters
@@ -457,13 +534,25 @@ class Timestream(timestream_common.TimestreamCommon):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('time', 'frequency', 'polarization'), axis_vals=(self.time, self.freq, self.pol), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis=('time', 'frequency', 'polarization'), axis_vals=(self.time, self.freq, self.pol), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def time_freq_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def time_freq_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the time, frequency and baseline axis.
 
         Parameters
@@ -490,13 +579,25 @@ class Timestream(timestream_common.TimestreamCommon):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('time', 'frequency', 'baseline'), axis_vals=(self.time, self.freq, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis=('time', 'frequency', 'baseline'), axis_vals=(self.time, self.freq, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def time_pol_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def time_pol_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the time, polarization and baseline axis.
 
         Parameters
@@ -523,13 +624,25 @@ class Timestream(timestream_common.TimestreamCommon):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('time', 'polarization', 'baseline'), axis_vals=(self.time, self.pol, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis=('time', 'polarization', 'baseline'), axis_vals=(self.time, self.pol, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def freq_pol_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def freq_pol_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the frequency, polarization and baseline axis.
 
         Parameters
@@ -556,8 +669,20 @@ class Timestream(timestream_common.TimestreamCommon):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('frequency', 'polarization', 'baseline'), axis_vals=(self.freq, self.pol, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
\ No newline at end of file
+        self.data_operate(func, op_axis=('frequency', 'polarization', 'baseline'), axis_vals=(self.freq, self.pol, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
\ No newline at end of file
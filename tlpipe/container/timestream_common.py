@@ -9,23 +9,22 @@ Inheritance diagram
 
 """
 
-import os
-import time
 import re
 import pickle
-import itertools
 import numpy as np
 import h5py
-import ephem
-from datetime import datetime, timedelta
+from datetime import datetime
 import container
 from caput import mpiutil
 from caput import mpiarray
 from caput import memh5
-from tlpipe.core import tl_array
 from tlpipe.core import constants as const
 from tlpipe.utils import date_util
-from tlpipe.utils import progress
+
+
+def _invalid_mask(vis):
+    ### mask of invalid values in `vis`
+    return np.where(np.isfinite(vis), False, True)
 
 
 class TimestreamCommon(container.BasicTod):
@@ -232,7 +231,10 @@ class TimestreamCommon(container.BasicTod):
         super(TimestreamCommon, self).load_all()
 
         # create some new necessary datasets if they do not already exist in file
-        if 'vis_mask' not in self.iterkeys():
+        if 'vis_mask' not in self.iterkeys() and self.main_data_name in self.lazy_datasets:
+            # create the mask array as a lazy dataset derived from vis
+            self._load_a_lazy_dataset('vis_mask', self.main_data_name, np.bool, _invalid_mask)
+        elif 'vis_mask' not in self.iterkeys():
             # create the mask array
             vis_mask = np.where(np.isfinite(self.local_vis), False, True)
             vis_mask = mpiarray.MPIArray.wrap(vis_mask, axis=self.main_data_dist_axis)
@@ -266,20 +268,13 @@ class TimestreamCommon(container.BasicTod):
         if 'sec1970' not in self.iterkeys():
             # generate sec1970
             int_time = self.infiles[0].attrs['inttime']
-            sec1970s = []
-            nts = []
-            for fh in self.infiles:
-                sec1970s.append(fh.attrs['sec1970'])
-                nts.append(fh[self.main_data_name].shape[0])
-            sec1970 = np.zeros(sum(nts), dtype=np.float64) # precision float32 is not enough
-            cum_nts = np.cumsum([0] + nts)
-            for idx, (nt, sec) in enumerate(zip(nts, sec1970s)):
-                sec1970[cum_nts[idx]:cum_nts[idx+1]] = np.array([ sec + i*int_time for i in xrange(nt)], dtype=np.float64) # precision float32 is not enough
+            sec1970 = np.concatenate([ fh.attrs['sec1970'] + int_time * np.arange(fh[self.main_data_name].shape[0], dtype=np.float64) for fh in self.infiles ]) # precision float32 is not enough
             # select the corresponding section
             sec1970 = sec1970[self.main_data_start:self.main_data_stop][self.main_data_select[0]]
 
             # if time is just the distributed axis, load sec1970 distributed
-            if 'time' == self.main_data_axes[self.main_data_dist_axis]:
+            time_dist = ('time' == self.main_data_axes[self.main_data_dist_axis])
+            if time_dist:
                 sec1970 = mpiarray.MPIArray.from_numpy_array(sec1970)
             self.create_main_time_ordered_dataset('sec1970', data=sec1970)
             # create attrs of this dset
@@ -293,49 +288,41 @@ class TimestreamCommon(container.BasicTod):
             else:
                 self['sec1970'].attrs["continuous"] = True
 
-            # generate julian date from sec1970 by getting python date/time
-            # and converting to julian date with util.get_juldate
-            jul_date = np.array([ date_util.get_juldate(datetime.utcfromtimestamp(s), tzone='UTC+00h') for s in sec1970 ], dtype=np.float64) # precision float32 is not enough
-            if 'time' == self.main_data_axes[self.main_data_dist_axis]:
+            # az, alt of the antenna pointing, in radians
+            if self.is_dish:
+                # antpointing = rt['antpointing'][-1, :, :] # degree
+                # pointingtime = rt['pointingtime'][-1, :, :] # degree
+                az, alt = 0.0, np.pi/2
+            elif self.is_cylinder:
+                az, alt = np.pi/2, np.pi/2
+            else:
+                raise RuntimeError('Unknown antenna type %s' % self.attrs['telescope'])
+
+            # derive julian date, local hour and the pointing from sec1970
+            if time_dist:
+                # each process derives only its local section
+                jul_date, local_hour, az_alt, ra_dec = self._derive_time_datasets(sec1970.local_array, az, alt)
+            else:
+                # derive once and broadcast to all processes
+                derived = None
+                if self.comm is None or self.comm.rank == 0:
+                    derived = self._derive_time_datasets(sec1970, az, alt)
+                jul_date, local_hour, az_alt, ra_dec = mpiutil.bcast(derived, root=0, comm=self.comm)
+
+            if time_dist:
                 jul_date = mpiarray.MPIArray.wrap(jul_date, axis=0)
             # if time is just the distributed axis, load jul_date distributed
             self.create_main_time_ordered_dataset('jul_date', data=jul_date)
             # create attrs of this dset
             self['jul_date'].attrs["unit"] = 'day'
 
-            # generate local time in hour from 0 to 24.0
-            def _hour(t):
-                return t.hour + t.minute/60.0 + t.second/3600.0 + t.microsecond/3.6e8
-            local_hour = np.array([ _hour((datetime.utcfromtimestamp(s) + timedelta(hours=8)).time()) for s in sec1970 ], dtype=np.float64)
-            if 'time' == self.main_data_axes[self.main_data_dist_axis]:
+            if time_dist:
                 local_hour = mpiarray.MPIArray.wrap(local_hour, axis=0)
             # if time is just the distributed axis, load local_hour distributed
             self.create_main_time_ordered_dataset('local_hour', data=local_hour)
             # create attrs of this dset
             self['local_hour'].attrs["unit"] = 'hour'
 
-            # generate az, alt
-            az_alt = np.zeros((self['sec1970'].local_data.shape[0], 2), dtype=np.float32) # radians
-            if self.is_dish:
-                # antpointing = rt['antpointing'][-1, :, :] # degree
-                # pointingtime = rt['pointingtime'][-1, :, :] # degree
-                az_alt[:, 0] = 0.0 # az
-                az_alt[:, 1] = np.pi/2 # alt
-            elif self.is_cylinder:
-                az_alt[:, 0] = np.pi/2 # az
-                az_alt[:, 1] = np.pi/2 # alt
-            else:
-                raise RuntimeError('Unknown antenna type %s' % self.attrs['telescope'])
-
-            # generate ra, dec of the antenna pointing
-            aa = self.array
-            ra_dec = np.zeros_like(az_alt) # radians
-            for ti in xrange(az_alt.shape[0]):
-                az, alt = az_alt[ti]
-                az, alt = ephem.degrees(az), ephem.degrees(alt)
-                aa.set_jultime(self['jul_date'].local_data[ti])
-                ra_dec[ti] = aa.radec_of(az, alt) # in radians, a point in the sky above the observer
-
             if self.main_data_dist_axis == 0:
                 az_alt = mpiarray.MPIArray.wrap(az_alt, axis=0)
                 ra_dec = mpiarray.MPIArray.wrap(ra_dec, axis=0)
@@ -382,6 +369,29 @@ class TimestreamCommon(container.BasicTod):
                     self['ra_dec'].attrs['same_dec'] = False
 
 
+    def _derive_time_datasets(self, sec1970, az, alt):
+        ### julian date, local hour, az_alt and ra_dec of the time points
+        ### `sec1970` for the antenna pointing `az`, `alt` (radians), by the
+        ### vectorized expressions in date_util, ra_dec agrees with that of
+        ### ephem's radec_of to better than 1 arcmin
+        try:
+            lon = np.radians(float(self.attrs['sitelon']))
+            lat = np.radians(float(self.attrs['sitelat']))
+        except KeyError:
+            raise KeyError('Attribute sitelon or sitelat does not exist, try to load it first')
+
+        jul_date = date_util.sec1970_to_juldate(sec1970) # precision float32 is not enough
+        # local time in hour from 0 to 24.0
+        local_hour = date_util.sec1970_to_hour(sec1970, tzone='UTC+08h')
+        az_alt = np.zeros((len(sec1970), 2), dtype=np.float32) # radians
+        az_alt[:, 0] = az
+        az_alt[:, 1] = alt
+        ra_dec = np.zeros_like(az_alt) # radians
+        ra_dec[:, 0], ra_dec[:, 1] = date_util.azalt_to_radec(az, alt, sec1970, lat, lon)
+
+        return jul_date, local_hour, az_alt, ra_dec
+
+
     @property
     def vis(self):
         """Return the main data for convenient use."""
@@ -405,6 +415,26 @@ class TimestreamCommon(container.BasicTod):
         """A convenience for vis_mask.local_data."""
         return self.vis_mask.local_data
 
+    @property
+    def mask_packed(self):
+        """Whether `vis_mask` is held bit-packed in memory."""
+        return 'vis_mask' in self.packed_datasets
+
+    def pack_mask(self):
+        """Hold `vis_mask` bit-packed in memory, which costs 1 bit per element.
+
+        A packed `vis_mask` is also saved packed to files, see
+        :mod:`~tlpipe.container.packed_mask`. Nothing is done if `vis_mask`
+        does not exist or is a lazy dataset.
+        """
+        if 'vis_mask' in self.iterkeys() and not 'vis_mask' in self.lazy_datasets:
+            self._pack_a_dataset('vis_mask')
+
+    def unpack_mask(self):
+        """Hold `vis_mask` as an ordinary boolean dataset if it is packed."""
+        if self.mask_packed:
+            self._unpack_a_dataset('vis_mask')
+
     def apply_mask(self, fill_val=complex(np.nan, np.nan)):
         """Applying `vis_mask` to `vis` with the `fill_val`.
 
@@ -412,7 +442,11 @@ class TimestreamCommon(container.BasicTod):
         values corresponding to True of `vis_mask` will be replaced by `fill_val`
         and lost. Usually you may prefer to use :meth:`masked_vis` instead.
         """
-        self.vis[:] = np.where(self.vis_mask[:], fill_val, self.vis[:])
+        vis = self.local_vis
+        vis_mask = self.local_vis_mask
+        # row by row to avoid full size temporaries
+        for ti in xrange(vis.shape[0]):
+            vis[ti][vis_mask[ti]] = fill_val
 
     @property
     def masked_vis(self):
@@ -425,6 +459,8 @@ class TimestreamCommon(container.BasicTod):
         """
 
         outer_self = self
+        # the whole vis is needed
+        self.materialize(self.main_data_name)
 
         class _masked_vis(outer_self.vis.__class__):
             """This will be a subclass of ether :class:`caput.memh5.MemDatasetCommon`
@@ -519,6 +555,9 @@ class TimestreamCommon(container.BasicTod):
     @property
     def array(self):
         """Return either a dish array or a cylinder array instance."""
+        # tl_array imports aipy and cora, so only import it when needed
+        from tlpipe.core import tl_array
+
         try:
             lon = self.attrs['sitelon'] # degree
             lat = self.attrs['sitelat'] # degree
@@ -783,7 +822,7 @@ class TimestreamCommon(container.BasicTod):
         if num != 0 and num != 1:
             raise RuntimeError('Not all feed_ordered_datasets have an aligned feed axis')
 
-    def to_files(self, outfiles, exclude=[], check_status=True, write_hints=True, libver='earliest', chunk_vis=True, chunk_shape=None, chunk_size=64):
+    def to_files(self, outfiles, exclude=[], check_status=True, write_hints=True, libver='earliest', chunk_vis=True, chunk_shape=None, chunk_size=64, write_mode='auto'):
         """Save the data hold in this container to files.
 
         Parameters
@@ -814,21 +853,14 @@ class TimestreamCommon(container.BasicTod):
         chunk_size : integer
             If `chunk_shape` is None, then dataset 'vis' and 'vis_mask' will be
             chunked to be approximately this size in unit KB.
+        write_mode : 'auto', 'mpio', 'staging' or 'serial', optional
+            How the distributed datasets are written, see
+            :meth:`container.BasicTod.to_files`. Default 'auto'.
 
         """
 
-        outfiles = container.ensure_file_list(outfiles)
-        num_outfiles = len(outfiles)
-
-        # first redistribute main_time_ordered_datasets to the first axis
-        if self.main_data_dist_axis != 0:
-            self.redistribute(0)
-
-        # check data is consistent before save
-        if check_status:
-            self.check_status()
-
         # get the appropriate chunk for vis
+        chunks = None
         if chunk_vis:
             if not chunk_shape is None:
                 chunk_shape = tuple(chunk_shape)
@@ -848,77 +880,12 @@ class TimestreamCommon(container.BasicTod):
                     chunk_shape = (tc, num_freq, 1)
                 else:
                     chunk_shape = (tc, num_freq, num_pol, 1)
+            chunks = {'vis': chunk_shape, 'vis_mask': chunk_shape}
+
+        super(TimestreamCommon, self).to_files(outfiles, exclude, check_status, write_hints, libver, write_mode=write_mode, chunks=chunks)
 
-        # split output files among procs
-        for fi, outfile in mpiutil.mpilist(list(enumerate(outfiles)), method='rand', comm=self.comm):
-            # first write top level common attrs and datasets to file
-            with h5py.File(outfile, 'w', libver=libver) as f:
-
-                # write hints if required
-                if write_hints:
-                    hint_keys = [ key for key in self.__class__.__dict__.keys() if re.match(self.hints_pattern, key) ]
-                    hint_dict = { key: getattr(self, key) for key in hint_keys }
-                    f.attrs['hints'] = pickle.dumps(hint_dict)
-
-                # write top level common attrs
-                for attrs_name, attrs_value in self.attrs.iteritems():
-                    if attrs_name in exclude:
-                        continue
-                    if attrs_name not in self.time_ordered_attrs:
-                        f.attrs[attrs_name] = self.attrs[attrs_name]
-
-
-                for dset_name, dset in self.iteritems():
-                    if dset_name in exclude:
-                        continue
-                    # write top level common datasets
-                    if dset_name not in self.time_ordered_datasets.keys():
-                        f.create_dataset(dset_name, data=dset, shape=dset.shape, dtype=dset.dtype)
-                    # initialize time ordered datasets
-                    else:
-                        nt = dset.shape[0]
-                        lt, et, st = mpiutil.split_m(nt, num_outfiles)
-                        lshape = (lt[fi],) + dset.shape[1:]
-                        if chunk_vis and dset_name in ('vis', 'vis_mask'):
-                            f.create_dataset(dset_name, lshape, dtype=dset.dtype, chunks=chunk_shape)
-                        else:
-                            f.create_dataset(dset_name, lshape, dtype=dset.dtype)
-
-                    # copy attrs of this dset
-                    memh5.copyattrs(dset.attrs, f[dset_name].attrs)
-
-        mpiutil.barrier(comm=self.comm)
-
-        # then write time ordered datasets
-        for dset_name, dset in self.iteritems():
-            if dset_name in exclude:
-                continue
-            if dset_name in self.time_ordered_datasets.keys():
-                dset_shape, dset_type, outfiles_map = self._get_output_info(dset_name, num_outfiles)
-
-                st = 0
-                # NOTE: if write simultaneously, will loss data with processes distributed in several nodes
-                for ri in xrange(self.nproc):
-                    if ri == self.rank:
-                        for fi, start, stop in outfiles_map:
-
-                            et = st + (stop - start)
-                            for i in range(120):
-                                if os.path.isfile(outfiles[fi]):
-                                    break
-                                else:
-                                    time.sleep(0.5)
-                            else:
-                                raise RuntimeError('File %s does not exist' % outfiles[fi])
-                            with h5py.File(outfiles[fi], 'r+', libver=libver) as f:
-                                f[dset_name][start:stop] = self[dset_name].local_data[st:et]
-                            st = et
-                    mpiutil.barrier(comm=self.comm)
-
-                # mpiutil.barrier(comm=self.comm)
-
-
-    def data_operate(self, func, op_axis=None, axis_vals=0, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+
+    def data_operate(self, func, op_axis=None, axis_vals=0, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """An overload data operation interface.
 
         This overloads the method in its super class :class:`container.BasicTod`
@@ -964,90 +931,28 @@ class TimestreamCommon(container.BasicTod):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original dist axis if the
             dist axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
 
-        if op_axis is None:
-            if copy_data:
-                func(self.local_vis.copy(), self.local_vis_mask.copy(), self, **kwargs)
-            else:
-                func(self.local_vis, self.local_vis_mask, self, **kwargs)
-        elif isinstance(op_axis, int) or isinstance(op_axis, basestring):
-            axis = container.check_axis(op_axis, self.main_data_axes)
-            data_sel = [ slice(0, None) ] * len(self.main_data_axes)
-            if full_data:
-                original_dist_axis = self.main_data_dist_axis
-                self.redistribute(axis)
-            if self.main_data.distributed:
-                lgind = list(self.main_data.data.enumerate(axis))
-            else:
-                lgind = list(enumerate(range(self.main_data.data.shape[axis])))
-            if show_progress:
-                pg = progress.Progress(len(lgind), step=progress_step)
-            cnt = 0
-            for lind, gind in lgind:
-                if show_progress and mpiutil.rank0:
-                    pg.show(cnt)
-                cnt += 1
-                data_sel[axis] = lind
-                if isinstance(axis_vals, memh5.MemDataset):
-                    # use the new dataset which may be different from axis_vals if it is redistributed
-                    axis_val = self[axis_vals.name].local_data[lind]
-                elif hasattr(axis_vals, '__iter__'):
-                    axis_val = axis_vals[lind]
-                else:
-                    axis_val = axis_vals
-                if copy_data:
-                    func(self.local_vis[data_sel].copy(), self.local_vis_mask[data_sel].copy(), lind, gind, axis_val, self, **kwargs)
-                else:
-                    func(self.local_vis[data_sel], self.local_vis_mask[data_sel], lind, gind, axis_val, self, **kwargs)
-            if full_data and keep_dist_axis:
-                self.redistribute(original_dist_axis)
-        elif isinstance(op_axis, tuple):
-            axes = [ container.check_axis(axis, self.main_data_axes) for axis in op_axis ]
-            data_sel = [ slice(0, None) ] * len(self.main_data_axes)
-            if full_data:
-                original_dist_axis = self.main_data_dist_axis
-                if not original_dist_axis in axes:
-                    shape = self.main_data.shape
-                    axes_len = [ shape[axis] for axis in axes ]
-                    # choose the longest axis in axes as the new dist axis
-                    new_dist_axis = axes[np.argmax(axes_len)]
-                    self.redistribute(new_dist_axis)
-            if self.main_data.distributed:
-                lgind = [ list(self.main_data.data.enumerate(axis)) for axis in axes ]
-            else:
-                lgind = [ list(enumerate(range(self.main_data.data.shape[axis]))) for axis in axes ]
-            linds = [ [ li for (li, gi) in lg ] for lg in lgind ]
-            ginds = [ [ gi for (li, gi) in lg ] for lg in lgind ]
-            lgind = zip(itertools.product(*linds), itertools.product(*ginds))
-            if show_progress:
-                pg = progress.Progress(len(lgind), step=progress_step)
-            cnt = 0
-            for lind, gind in lgind:
-                if show_progress and mpiutil.rank0:
-                    pg.show(cnt)
-                cnt += 1
-                axis_val = ()
-                for ai, axis in enumerate(axes):
-                    data_sel[axis] = lind[ai]
-                    if isinstance(axis_vals[ai], memh5.MemDataset):
-                        # use the new dataset which may be different from axis_vals if it is redistributed
-                        axis_val += (self[axis_vals[ai].name].local_data[lind[ai]],)
-                    elif hasattr(axis_vals[ai], '__iter__'):
-                        axis_val += (axis_vals[ai][lind[ai]],)
-                    else:
-                        axis_val += (axis_vals[ai],)
-                if copy_data:
-                    func(self.local_vis[data_sel].copy(), self.local_vis_mask[data_sel].copy(), lind, gind, axis_val, self, **kwargs)
-                else:
-                    func(self.local_vis[data_sel], self.local_vis_mask[data_sel], lind, gind, axis_val, self, **kwargs)
-            if full_data and keep_dist_axis:
-                self.redistribute(original_dist_axis)
-        else:
-            raise ValueError('Invalid op_axis: %s', op_axis)
+        super(TimestreamCommon, self).data_operate(func, op_axis, axis_vals, full_data, copy_data, show_progress, progress_step, keep_dist_axis, block_size, num_threads, schedule, **kwargs)
+
+    def _operate_datasets(self):
+        ### names of datasets whose local data are passed to `func` in data_operate
+        return [ self.main_data_name, 'vis_mask' ]
 
     def all_data_operate(self, func, copy_data=False, **kwargs):
         """Operation to the whole `vis` and `vis_mask`.
@@ -1071,7 +976,7 @@ class TimestreamCommon(container.BasicTod):
         """
         self.data_operate(func, op_axis=None, axis_vals=0, full_data=False, copy_data=copy_data, keep_dist_axis=False, **kwargs)
 
-    def time_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def time_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the time axis.
 
         Parameters
@@ -1096,13 +1001,25 @@ class TimestreamCommon(container.BasicTod):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis='time', axis_vals=self.time, full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis='time', axis_vals=self.time, full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def freq_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def freq_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the frequency axis.
 
         Parameters
@@ -1127,13 +1044,25 @@ class TimestreamCommon(container.BasicTod):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis='frequency', axis_vals=self.freq, full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis='frequency', axis_vals=self.freq, full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the baseline axis.
 
         Parameters
@@ -1158,13 +1087,25 @@ class TimestreamCommon(container.BasicTod):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis='baseline', axis_vals=self.bl, full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis='baseline', axis_vals=self.bl, full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def time_and_freq_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def time_and_freq_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the time and frequency axis.
 
         Parameters
@@ -1190,13 +1131,25 @@ class TimestreamCommon(container.BasicTod):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('time', 'frequency'), axis_vals=(self.time, self.freq), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis=('time', 'frequency'), axis_vals=(self.time, self.freq), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def time_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def time_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the time and baseline axis.
 
         Parameters
@@ -1222,13 +1175,25 @@ class TimestreamCommon(container.BasicTod):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('time', 'baseline'), axis_vals=(self.time, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis=('time', 'baseline'), axis_vals=(self.time, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
-    def freq_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, **kwargs):
+    def freq_and_bl_data_operate(self, func, full_data=False, copy_data=False, show_progress=False, progress_step=None, keep_dist_axis=False, block_size=None, num_threads=1, schedule='static', **kwargs):
         """Data operation along the frequency and baseline axis.
 
         Parameters
@@ -1254,11 +1219,23 @@ class TimestreamCommon(container.BasicTod):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original axis if the dist
             axis has changed during the operation. Default False.
+        block_size : None or integer, optional
+            If not None, `func` will be called on blocks of at most this number
+            of consecutive local indices along each operated axis (0 for all
+            local indices at once) instead of on each slice, see
+            :meth:`data_operate`. Default None.
+        num_threads : integer, optional
+            Number of threads to call a thread-safe `func` in parallel, see
+            :meth:`data_operate`. Default 1.
+        schedule : 'static' or 'dynamic', optional
+            How slices are distributed among processes, 'dynamic' hands out
+            slices on demand to balance the load and needs `full_data`, see
+            :meth:`data_operate`. Default 'static'.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
-        self.data_operate(func, op_axis=('frequency', 'baseline'), axis_vals=(self.freq, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, **kwargs)
+        self.data_operate(func, op_axis=('frequency', 'baseline'), axis_vals=(self.freq, self.bl), full_data=full_data, copy_data=copy_data, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=keep_dist_axis, block_size=block_size, num_threads=num_threads, schedule=schedule, **kwargs)
 
 
     def _copy_a_common_dataset(self, name, other):
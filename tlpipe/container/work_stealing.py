@@ -0,0 +1,221 @@
+"""Dynamic scheduling of operations on slices of distributed arrays.
+
+With a static distribution, each process operates on the slices of its own
+local array, so a process that happens to hold slices that are expensive to
+operate on (e.g., baselines that need many RFI flagging iterations) makes all
+others wait for it. Here the slices along an axis are instead handed out on
+demand: each process keeps a counter of its next slice in an MPI window, and
+claims slices by atomically incrementing the counter, first from its own
+counter, then, when its own slices are exhausted, from those of the other
+processes, i.e., it steals work from them. The data of a stolen slice is got
+from the owner by one-sided communication, operated on by the thief, and put
+back to the owner.
+
+The local arrays are exposed in MPI windows as they are, a slice along the
+operated axis is described by a strided MPI datatype, so no extra copy is
+needed unless a local array is not C-contiguous (or not writable). All
+accesses are done in passive target epochs opened by a lock-all of each
+window, remote ones are completed by flushes, and the owner synchronizes the
+public and private copies of its window (`MPI_Win_sync`) around its local
+accesses, so this needs an MPI library supporting MPI-3 one-sided
+communications but works with the separate memory model as well.
+
+"""
+
+import time
+import numpy as np
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+
+def _claim(win, owner):
+    ### atomically claim the next slice of proc `owner` by window `win`
+    one = np.ones(1, dtype=np.int64)
+    res = np.zeros(1, dtype=np.int64)
+    win.Lock(owner, MPI.LOCK_SHARED)
+    win.Fetch_and_op(one, res, owner, 0, MPI.SUM)
+    win.Unlock(owner)
+
+    return int(res[0])
+
+
+def _window(buf, comm):
+    ### expose the memory of `buf` as bytes in an MPI window
+    mem = buf.reshape(-1).view(np.uint8)
+    if mem.size == 0:
+        # a window of a process can not be empty in some implementations
+        mem = np.zeros(1, dtype=np.uint8)
+
+    return MPI.Win.Create(mem, disp_unit=1, comm=comm)
+
+
+def _row_type(shape, axis, itemsize):
+    ### MPI datatype of a slice along `axis` of a C-contiguous array of
+    ### `shape`, and the bytes between the starts of two adjacent slices
+    inner = itemsize * int(np.prod(shape[axis+1:]))
+    outer = int(np.prod(shape[:axis]))
+    dtype = MPI.BYTE.Create_vector(outer, inner, shape[axis] * inner)
+    dtype.Commit()
+
+    return dtype, inner
+
+
+def operate(arrays, axes, call, comm=None, copy_data=False):
+    """Call `call` on all slices of the distributed `arrays` with work stealing.
+
+    This is a collective operation over `comm`.
+
+    Parameters
+    ----------
+    arrays : list of np.ndarray
+        The local arrays of this process, they must have the same length along
+        their operated axis, which is the distributed axis.
+    axes : list of integers
+        The operated axis of each array in `arrays`.
+    call : function object
+        It is called as call(owner, local_index, sections) for each slice,
+        where `owner` is the rank of the process holding the slice,
+        `local_index` is the index of the slice in the local arrays of
+        `owner`, and `sections` are the slices of `arrays`, which may be
+        changed in place by `call`.
+    comm : None or MPI.Comm, optional
+        MPI Communicator the arrays are distributed over. Default None.
+    copy_data : bool, optional
+        If True, changes to `sections` will not be written back to `arrays`.
+        Default False.
+
+    Returns
+    -------
+    stats : dict
+        Statistics of this process, with keys 'busy' (seconds spent in
+        `call`), 'wall' (seconds spent in this function), 'slices' (number
+        of slices operated on) and 'stolen' (number of them that are stolen
+        from other processes).
+
+    """
+
+    start_time = time.time()
+    stats = {'busy': 0.0, 'slices': 0, 'stolen': 0}
+
+    def _call(owner, li, sections):
+        ### call `call` and accumulate the busy time
+        t0 = time.time()
+        call(owner, li, sections)
+        stats['busy'] += time.time() - t0
+        stats['slices'] += 1
+
+    if comm is None or comm.size == 1 or MPI is None:
+        rank = 0 if comm is None else comm.rank
+        for li in xrange(arrays[0].shape[axes[0]]):
+            sections = [ np.take(arr, li, axis=axis) if copy_data else _slice(arr, axis, li) for (arr, axis) in zip(arrays, axes) ]
+            _call(rank, li, sections)
+        stats['wall'] = time.time() - start_time
+        return stats
+
+    rank = comm.rank
+    nproc = comm.size
+    nlocal = comm.allgather(arrays[0].shape[axes[0]])
+
+    # the local arrays are exposed as they are if possible, else their copies
+    bufs = [ (arr if isinstance(arr, np.ndarray) and arr.flags.c_contiguous and arr.flags.writeable else np.ascontiguousarray(arr)) for arr in arrays ]
+    row_shapes = [ buf.shape[:axis] + buf.shape[axis+1:] for (buf, axis) in zip(bufs, axes) ]
+    # the slices of a proc are described by the shapes of its local arrays
+    all_shapes = [ comm.allgather(buf.shape) for buf in bufs ]
+    wins = [ _window(buf, comm) for buf in bufs ]
+
+    # counter of the next slice to be claimed of each proc
+    counter = np.zeros(1, dtype=np.int64)
+    cwin = MPI.Win.Create(counter, disp_unit=counter.itemsize, comm=comm)
+    comm.Barrier()
+
+    for win in wins:
+        win.Lock_all(MPI.MODE_NOCHECK)
+    try:
+        # own slices first, then steal from the next procs in turn
+        for owner in [ (rank + i) % nproc for i in xrange(nproc) ]:
+            if owner != rank:
+                types = [ _row_type(shapes[owner], axis, buf.itemsize) for (shapes, axis, buf) in zip(all_shapes, axes, bufs) ]
+            while True:
+                li = _claim(cwin, owner)
+                if li >= nlocal[owner]:
+                    break
+                if owner == rank:
+                    # see the slices put by others before
+                    for win in wins:
+                        win.Sync()
+                    sections = [ np.take(buf, li, axis=axis) if copy_data else _slice(buf, axis, li) for (buf, axis) in zip(bufs, axes) ]
+                    _call(owner, li, sections)
+                    for win in wins:
+                        win.Sync()
+                    continue
+
+                # get the slice from its owner
+                sections = [ np.empty(shp, dtype=buf.dtype) for (buf, shp) in zip(bufs, row_shapes) ]
+                for win, sec, (dtype, nb) in zip(wins, sections, types):
+                    win.Get([sec.reshape(-1).view(np.uint8), MPI.BYTE], owner, target=(li * nb, 1, dtype))
+                    win.Flush(owner)
+                _call(owner, li, sections)
+                stats['stolen'] += 1
+                # and put the operated slice back
+                if not copy_data:
+                    for win, sec, (dtype, nb) in zip(wins, sections, types):
+                        win.Put([np.ascontiguousarray(sec).reshape(-1).view(np.uint8), MPI.BYTE], owner, target=(li * nb, 1, dtype))
+                        win.Flush(owner)
+            if owner != rank:
+                for dtype, nb in types:
+                    dtype.Free()
+
+        # wait until all slices have been put back
+        comm.Barrier()
+        for win in wins:
+            win.Sync()
+    finally:
+        for win in wins:
+            win.Unlock_all()
+        cwin.Free()
+        for win in wins:
+            win.Free()
+
+    if not copy_data:
+        for arr, buf in zip(arrays, bufs):
+            if not buf is arr:
+                arr[...] = buf
+
+    stats['wall'] = time.time() - start_time
+
+    return stats
+
+
+def _slice(arr, axis, ind):
+    ### a view of the slice `ind` along `axis` of `arr`
+    sel = [ slice(0, None) ] * len(arr.shape)
+    sel[axis] = ind
+
+    return arr[tuple(sel)]
+
+
+def busy_histogram(busy, wall, bins=10):
+    """Histogram of the fractions of busy time of all processes.
+
+    Parameters
+    ----------
+    busy, wall : list of floats
+        Busy time and wall time of each process.
+    bins : integer, optional
+        Number of bins in [0, 1]. Default 10.
+
+    Returns
+    -------
+    counts : np.ndarray
+        Number of processes in each bin.
+    edges : np.ndarray
+        Edges of the bins.
+
+    """
+
+    frac = np.array([ (b / w if w > 0 else 1.0) for (b, w) in zip(busy, wall) ])
+
+    return np.histogram(np.clip(frac, 0.0, 1.0), bins=bins, range=(0.0, 1.0))
@@ -10,19 +10,20 @@ Constants
 
 """
 
-from scipy import constants as const
+# values are those of scipy.constants, defined here so that importing this
+# module does not import scipy
 
 
 doc = ""
 
 doc += "  c: Speed of light in :math:`m/s`;\n"
-c = const.c
+c = 299792458.0
 
 doc += "  sday: One sidereal day in :math:`s`;\n"
 sday = 86164.0905
 
 doc += "  k_B: Boltzmann constant in :math:`m^2 \\cdot kg \\cdot s^{-2} \\cdot \\text{K}^{-1}`;\n"
-k_B = const.k
+k_B = 1.38064852e-23
 
 doc += "  yr_s: a year in :math:`s`;\n"
 yr_s = 31556926.
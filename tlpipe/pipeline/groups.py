@@ -0,0 +1,95 @@
+"""Run a pipeline by groups of processes.
+
+Iterations of an iterable pipeline (e.g., one sidereal day of data in each
+iteration) are often independent of each other, but running each of them on
+all processes scales poorly when the number of processes is large. Instead,
+the processes can be split into groups which run the pipeline concurrently,
+each group running a subset of the iterations, and the results of all groups
+are merged by the reduction tasks (e.g.,
+:class:`~tlpipe.timestream.accumulate.Accum`) at the end. Non-iterable tasks
+(e.g., those processing the merged results) are only run by the first group.
+
+Tasks are unaware of the groups, they use the default communicator
+:data:`caput.mpiutil.world` (or the communicators of their data containers)
+as usual, which is replaced by the communicator of the group during the
+running of the pipeline by :func:`set_world`.
+
+"""
+
+import inspect
+from caput import mpiutil
+
+
+def split(ngroups, comm=None):
+    """Split the processes in `comm` into `ngroups` groups of consecutive ranks.
+
+    Parameters
+    ----------
+    ngroups : integer
+        Number of groups, it must divide the number of processes.
+    comm : None or MPI.Comm, optional
+        MPI Communicator to split. Default None to use mpiutil.world.
+
+    Returns
+    -------
+    group : integer
+        The group this process belongs to.
+    group_comm : MPI.Comm
+        Communicator of the processes in this group.
+    merge_comm : MPI.Comm
+        Communicator of the processes having the same rank in all groups,
+        whose rank is the group number.
+
+    """
+
+    comm = mpiutil.world if comm is None else comm
+    if comm is None:
+        raise ValueError('Can not split processes into %d groups without MPI' % ngroups)
+    if ngroups < 1 or comm.size % ngroups != 0:
+        raise ValueError('Can not split %d processes into %d groups of equal size' % (comm.size, ngroups))
+
+    gsize = comm.size / ngroups
+    group = comm.rank / gsize
+    group_comm = comm.Split(group, comm.rank)
+    merge_comm = comm.Split(comm.rank % gsize, comm.rank)
+
+    return group, group_comm, merge_comm
+
+
+def set_world(comm):
+    """Make `comm` the default communicator of :mod:`caput.mpiutil`.
+
+    This replaces the module attributes `world`, `rank`, `size` and `rank0`
+    and the default `comm` arguments of the functions of
+    :mod:`caput.mpiutil`.
+
+    Parameters
+    ----------
+    comm : MPI.Comm
+        The new default communicator.
+
+    Returns
+    -------
+    old_comm : MPI.Comm
+        The previous default communicator, call this function with it to
+        restore.
+
+    """
+
+    old_comm = mpiutil.world
+    if old_comm is None or comm is None:
+        raise ValueError('Can not replace the default communicator without MPI')
+
+    # default arguments are bound when the functions are defined
+    for name, func in inspect.getmembers(mpiutil, inspect.isfunction):
+        if func.__defaults__ is not None:
+            func.__defaults__ = tuple([ (comm if d is old_comm else d) for d in func.__defaults__ ])
+
+    mpiutil.world = comm
+    if hasattr(mpiutil, '_comm'):
+        mpiutil._comm = comm
+    mpiutil.rank = comm.rank
+    mpiutil.size = comm.size
+    mpiutil.rank0 = (comm.rank == 0)
+
+    return old_comm
@@ -0,0 +1,115 @@
+"""Journal of checkpoints of a pipeline for resuming it after a crash.
+
+When the pipeline is quiescent, i.e., all tasks have been set up and no data
+product is waiting in the input queues of any task, every output of the
+iterations finished so far has been written, so the state of the pipeline at
+that point is a consistent checkpoint. The state of each task returned by its
+:meth:`~tlpipe.pipeline.pipeline.TaskBase.checkpoint` method (e.g., the
+iterations it has run, or the file holding the accumulated data) is then
+appended as a line to a JSON Lines journal file, which is flushed to disk
+before the pipeline continues.
+
+When the pipeline is resumed, the last complete checkpoint in the journal is
+read and handed to the
+:meth:`~tlpipe.pipeline.pipeline.TaskBase.restore_checkpoint` method of each
+task after its `setup()`, so iterations finished before the crash are
+skipped. An incomplete last line left by the crash is cut off before new
+checkpoints are appended to the journal.
+
+"""
+
+import os
+import json
+import time
+import numpy as np
+from caput import mpiutil
+
+
+def _default(obj):
+    ### convert numpy scalars and arrays for json
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+class Journal(object):
+    """An append-only journal of checkpoints of a pipeline.
+
+    Parameters
+    ----------
+    filename : string
+        The JSON Lines file of the journal.
+    comm : None or MPI.Comm, optional
+        MPI Communicator. Default None to use mpiutil.world.
+
+    """
+
+    def __init__(self, filename, comm=None):
+        self.filename = filename
+        self.comm = mpiutil.world if comm is None else comm
+        self.rank0 = (self.comm is None or self.comm.rank == 0)
+        self.seq = 0
+        # whether an incomplete last line has been cut off
+        self._truncated = False
+
+    def _truncate(self):
+        ### cut off the journal after its last complete line
+        if not os.path.isfile(self.filename):
+            return
+
+        with open(self.filename, 'r+') as f:
+            good = 0
+            for line in iter(f.readline, ''):
+                if not line.endswith('\n'):
+                    break
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+                good = f.tell()
+            f.truncate(good)
+
+    def last(self):
+        """Return the task states of the last complete checkpoint, None if no checkpoint."""
+
+        states = None
+        if self.rank0 and os.path.isfile(self.filename):
+            with open(self.filename, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # an incomplete line written when crashed
+                        continue
+                    self.seq = entry['seq']
+                    states = entry['tasks']
+
+        states, self.seq = mpiutil.bcast((states, self.seq), root=0, comm=self.comm)
+
+        return states
+
+    def write(self, states):
+        """Append a checkpoint of the task states `states` and flush it to disk."""
+
+        self.seq += 1
+        if self.rank0:
+            if not self._truncated:
+                self._truncate()
+                self._truncated = True
+            entry = {'seq': self.seq, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'tasks': states}
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(entry, default=_default) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+        mpiutil.barrier(comm=self.comm)
+
+    def clear(self):
+        """Remove the journal file."""
+
+        if self.rank0 and os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+        mpiutil.barrier(comm=self.comm)
@@ -155,7 +155,10 @@ individual task.  Here is an example of a pipeline configuration:
 ... ce_in = ge_out
 ... '''
 
-Here the `pipe_tasks` is a list to hold a list of tasks to be executed.  Other
+Here the `pipe_tasks` is a list to hold a list of tasks to be executed.  A task
+can also be given by the full import path of its class as a string, e.g.,
+'tlpipe.timestream.dispatch.Dispatch', in which case its module (and the heavy
+dependencies it imports) is only loaded when the pipeline sets up the task.  Other
 parameters with the specified prefix are the input parameters for the corresponding
 tasks, they include three keys that all taks will have:
 
@@ -331,7 +334,8 @@ Several subclasses of :class:`TaskBase` provide advanced functionality for tasks
 that conform to the most common patterns. This functionality includes: optionally
 reading inputs from disk, instead of receiving them from the pipeline;
 optionally writing outputs to disk automatically; and caching the results of a
-large computation to disk in an intelligent manner (not yet implemented).
+large computation to disk in an intelligent manner (see
+:mod:`~tlpipe.pipeline.result_cache`).
 
 Base classes providing this functionality are :class:`OneAndOne` for (at most)
 one input and one output.  There are limited to a single input ('in' key) and
@@ -356,6 +360,7 @@ See the documentation for these base classes for more details.
 
 import sys
 import inspect
+import importlib
 import Queue
 import collections
 import logging
@@ -369,6 +374,14 @@ import datetime
 from caput import mpiutil
 from tlpipe.kiyopy import parse_ini
 from tlpipe.utils.path_util import input_path, output_path
+from tlpipe.utils import telemetry
+from tlpipe.container import file_index
+from tlpipe.pipeline.result_cache import ResultCache, file_fingerprint
+from tlpipe.pipeline import groups
+from tlpipe.pipeline import scheduler
+from tlpipe.pipeline import planner
+from tlpipe.pipeline.journal import Journal
+from tlpipe.pipeline.product_queue import ProductQueue
 
 
 
@@ -441,16 +454,31 @@ class Manager(object):
                     'outdir': 'output/', # output directory of pipeline data, default is current-dir/output/
                     'timing': False, # log the running time
                     'flush': False, # flush stdout buffer after each task, may slower the running
+                    'cache_dir': None, # directory to cache outputs of cacheable tasks, None to disable caching
+                    'cache_size': 100.0, # GB, max total size of the cache, least recently used outputs will be removed
+                    'index_dir': 'index/', # directory of the metadata index of input files, relative to outdir, None to keep no index
+                    'ngroups': 1, # split processes into this number of groups, each runs a subset of iterations of iterable tasks
+                    'concurrent_branches': False, # run independent branches of tasks concurrently by partitioned processes
+                    'telemetry_file': None, # JSON Lines file to append the performance records of each stage of tasks to, None to disable
+                    'run_id': None, # identifier of this run in the performance records, None to use the start time
+                    'checkpoint': False, # journal checkpoints of the pipeline so it can be resumed after a crash
+                    'journal_file': 'journal.jsonl', # file of the checkpoint journal, relative to outdir
+                    'queue_size': None, # MB, max total size of the products waiting in each input queue of a task, None for unbounded
+                    'queue_policy': 'block', # 'block' to stop running the producers of a full queue, 'spill' to save the products in it not taken out next to scratch files
+                    'scratch_dir': 'scratch/', # directory of the scratch files of the spilled products, relative to outdir
+                    'spill_cache_size': None, # MB, reload spilled products lazily with at most this size of large datasets in memory, None to reload entirely
                   }
 
     prefix = 'pipe_'
 
 
-    def __init__(self, pipefile=None, feedback=2):
+    def __init__(self, pipefile=None, feedback=2, resume=False):
 
         # Read in the parameters.
         self.params, self.task_params = parse_ini.parse(pipefile, self.params_init, prefix=self.prefix, return_undeclared=True, feedback=feedback)
         self.tasks = self.params['tasks']
+        # resume from the last checkpoint in the journal
+        self.resume = resume
 
         # timing the running
         if self.params['timing']:
@@ -461,6 +489,10 @@ class Manager(object):
         # set environment var
         os.environ['TL_OUTPUT'] = self.params['outdir'] + '/'
 
+        # keep the metadata index of input files in the output directory
+        if self.params['index_dir'] is not None:
+            file_index.set_index_dir(input_path(self.params['index_dir']))
+
         # copy pipefile to outdir if required
         if self.params['copy']:
             base_name = path.basename(pipefile)
@@ -482,6 +514,13 @@ class Manager(object):
 
             mpiutil.barrier()
 
+        self.group = 0
+        self.ngroups = self.params['ngroups']
+        self.merge_comm = None
+        self.cache = None
+        self.telemetry = None
+        self.journal = None
+
 
     @classmethod
     def show_params(cls):
@@ -513,31 +552,116 @@ class Manager(object):
         # Flush output or not
         flush = self.params['flush']
 
+        # record the performance of tasks
+        if self.params['telemetry_file'] is not None:
+            telemetry_file = output_path(self.params['telemetry_file'], mkdir=True)
+            self.telemetry = telemetry.Recorder(telemetry_file, self.params['run_id'])
+            telemetry.enable()
+
+        # split processes into groups, each runs the pipeline by its own
+        # communicator
+        world = None
+        if self.ngroups > 1:
+            try:
+                self.group, group_comm, self.merge_comm = groups.split(self.ngroups)
+            except ValueError as e:
+                raise PipelineConfigError(str(e))
+            world = groups.set_world(group_comm)
+            if mpiutil.rank0:
+                logger.info('Run the pipeline by group %d of %d with %d processes' % (self.group, self.ngroups, mpiutil.size))
+
+        # partition processes to run independent branches of tasks
+        # concurrently, each only sets up the tasks of its branches
+        branch_world = None
+        my_tasks = range(len(self.tasks))
+        # products handed over to other branches, key: [ (dest, tag) ], and
+        # from other branches, [ (producer index, key, source, tag, nends) ]
+        handoff_sends = {}
+        handoff_recvs = []
+        if self.params['concurrent_branches'] and mpiutil.size > 1:
+            task_keys = [ self._task_keys(task_spec) for task_spec in self.tasks ]
+            branches = scheduler.branches(task_keys)
+            if len(branches) > 1:
+                my_branches, branch_comm = scheduler.split(len(branches))
+                branch_world = groups.set_world(branch_comm)
+                my_tasks = sorted(sum([ branches[bi] for bi in my_branches ], []))
+                if mpiutil.rank0:
+                    logger.info('Run branches %s of %d with %d processes' % (my_branches, len(branches), mpiutil.size))
+
+                roots = [ scheduler.branch_root(bi, len(branches), branch_world.size) for bi in range(len(branches)) ]
+                seen = set()
+                for tag, (key, pb, cb, nends) in enumerate(scheduler.handoffs(task_keys, branches)):
+                    # branches run by the same processes share the products
+                    if roots[pb] == roots[cb] or (key, pb, roots[cb]) in seen:
+                        continue
+                    seen.add((key, pb, roots[cb]))
+                    if pb in my_branches:
+                        handoff_sends.setdefault(key, []).append((roots[cb], tag))
+                    if cb in my_branches:
+                        pi = min([ ti for ti in branches[pb] if key in task_keys[ti][2] ])
+                        handoff_recvs.append((pi, key, roots[pb], tag, nends))
+
+        # result cache of tasks
+        if self.params['cache_dir'] is not None:
+            self.cache = ResultCache(input_path(self.params['cache_dir']), self.params['cache_size'])
+
+        # journal of checkpoints, each group or branch of processes has its own
+        resume_states = None
+        if self.params['checkpoint'] or self.resume:
+            root, ext = path.splitext(self.params['journal_file'])
+            if self.ngroups > 1:
+                root += '_group%d' % self.group
+            if branch_world is not None:
+                root += '_branch%s' % '-'.join([ str(bi) for bi in my_branches ])
+            self.journal = Journal(output_path(root + ext, mkdir=True))
+            if self.resume:
+                resume_states = self.journal.last()
+                if mpiutil.rank0:
+                    if resume_states is None:
+                        logger.info('No checkpoint in %s, run the pipeline from the start' % self.journal.filename)
+                    else:
+                        logger.info('Resume the pipeline from checkpoint %d in %s' % (self.journal.seq, self.journal.filename))
+            else:
+                self.journal.clear()
+
         # Initialize all tasks.
         pipeline_tasks = []
         for ii, task_spec in enumerate(self.tasks):
+            if not ii in my_tasks:
+                continue
 
-            # task_spec is either the TaskBase object, or a tuple, with the first
-            # element being the TaskBase object and the second element being the
-            # new prefix to use
-            if isinstance(task_spec, tuple) :
-                task =  task_spec[0]
-                task.prefix = task_spec[1]
-            else :
-                task = task_spec
-
+            # task_spec is either the TaskBase object (or the import path of
+            # it), or a tuple, with the first element being the TaskBase object
+            # and the second element being the new prefix to use
             try:
+                if isinstance(task_spec, tuple) :
+                    task =  _task_class(task_spec[0])
+                    task.prefix = task_spec[1]
+                else :
+                    task = _task_class(task_spec)
+
                 task = self._setup_task(task)
             except PipelineConfigError as e:
                 # msg = "Setting up task %d caused an error - " % ii
-                msg = "Setting up task %d: %s.%s caused an error - " % (ii, task.__module__, task.__name__)
+                msg = "Setting up task %d: %s caused an error - " % (ii, _task_name(task_spec))
                 msg += str(e)
                 new_e = PipelineConfigError(msg)
                 # This preserves the traceback.
                 raise new_e.__class__, new_e, sys.exc_info()[2]
-            pipeline_tasks.append(task)
+            task._journal_key = '%d_%s' % (ii, task.prefix)
+            if self.params['queue_size'] is not None:
+                task._pipeline_bound_queues(int(self.params['queue_size'] * 2**20), self.params['queue_policy'], output_path(self.params['scratch_dir'], relative=False), self.params['spill_cache_size'])
+            if resume_states is not None:
+                task._resume_state = resume_states.get(task._journal_key, None)
+            pipeline_tasks.append((ii, task))
             if mpiutil.rank0:
                 logger.debug("Added %s to task list." % task.__class__.__name__)
+        # products of other branches are received in place of their producers
+        for pi, key, source, tag, nends in handoff_recvs:
+            pipeline_tasks.append((pi, _Handoff(key, source, tag, nends, branch_world)))
+        pipeline_tasks = [ it[1] for it in sorted(pipeline_tasks, key=lambda it: it[0]) ]
+        all_tasks = list(pipeline_tasks)
+        progress = self._progress(all_tasks)
 
         # flush if requires
         if flush:
@@ -545,11 +669,28 @@ class Manager(object):
             sys.stderr.flush()
 
         # Run the pipeline.
+        unblock = False # run producers of full queues to avoid deadlock
+        handoff_reqs = []
         while pipeline_tasks:
+            ran = False
+            blocked = False
+            # journal a checkpoint when some progress has been made and the
+            # pipeline is quiescent
+            if self.journal is not None and self._quiescent(all_tasks):
+                new_progress = self._progress(all_tasks)
+                if new_progress != progress:
+                    self._checkpoint(all_tasks)
+                    progress = new_progress
+
             for task in list(pipeline_tasks):  # Copy list so we can alter it.
+                # Do not produce more into full queues until they are drained.
+                if not unblock and self._blocked(task, pipeline_tasks):
+                    blocked = True
+                    continue
                 # These lines control the flow of the pipeline.
                 try:
                     out = task._pipeline_next()
+                    ran = True
                 except _PipelineMissingData:
                     if pipeline_tasks.index(task) == 0:
                         msg = ("%s missing input data and is at beginning of"
@@ -561,12 +702,17 @@ class Manager(object):
                     break
                 except _PipelineFinished:
                     pipeline_tasks.remove(task)
+                    # end of the products handed over to other branches
+                    for key in task._out_keys:
+                        for dest, tag in handoff_sends.get(key, []):
+                            handoff_reqs.append(scheduler.send_product(None, None, dest, tag, branch_world))
                     continue
                 # Now pass the output data products to any task that needs them.
                 out_keys = task._out_keys
                 if out is None:     # This iteration supplied no output.
                     continue
                 elif len(out_keys) == 0:    # Output not handled by pipeline.
+                    out = None
                     continue
                 elif len(out_keys) == 1:
                     out = (out,)
@@ -579,14 +725,157 @@ class Manager(object):
                 msg = msg % (task.__class__.__name__, keys)
                 if mpiutil.rank0:
                     logger.debug(msg)
+                # hand over to other branches before any task may change them
+                for key, product in zip(out_keys, out):
+                    for dest, tag in handoff_sends.get(key, []):
+                        filename = path.join(output_path(self.params['scratch_dir'], relative=False), 'handoff_%d_%d.hdf5' % (tag, len(handoff_reqs)))
+                        handoff_reqs.append(scheduler.send_product(product, filename, dest, tag, branch_world))
                 for receiving_task in pipeline_tasks:
                     receiving_task._pipeline_inspect_queue_product(out_keys, out)
+                # the products are now only held by the queues of the
+                # receiving tasks, and freed once all of them taken out
+                out = None
 
                 # flush if requires
                 if flush:
                     sys.stdout.flush()
                     sys.stderr.flush()
 
+            # if all runnable tasks are waiting for the blocked ones, let them
+            # run once
+            unblock = blocked and not ran
+
+        # the handed over products must have been received
+        for req in handoff_reqs:
+            if req is not None:
+                req.wait()
+
+        # restore the default communicator
+        if branch_world is not None:
+            groups.set_world(branch_world)
+            mpiutil.barrier()
+        if world is not None:
+            groups.set_world(world)
+            mpiutil.barrier()
+
+        if self.telemetry is not None:
+            telemetry.disable()
+
+
+    def _blocked(self, task, tasks):
+        """Whether `task` would produce into a full input queue of `tasks`."""
+
+        if task._pipeline_state != 'next' or len(task._out_keys) == 0:
+            return False
+
+        for receiving_task in tasks:
+            if receiving_task._in is None:
+                continue
+            for in_key, in_ in zip(receiving_task._in_keys, receiving_task._in):
+                if in_key in task._out_keys and isinstance(in_, ProductQueue) and in_.full():
+                    return True
+
+        return False
+
+    def _quiescent(self, tasks):
+        """Whether all tasks have been set up and no product is waiting in their queues."""
+
+        for task in tasks:
+            if task._pipeline_state == 'setup':
+                return False
+            if task._in is not None:
+                for in_ in task._in:
+                    if not in_.empty():
+                        return False
+
+        return True
+
+    def _progress(self, tasks):
+        """The stages and iterations run by all tasks."""
+
+        return [ (task._pipeline_state, getattr(task, '_iter_cnt', None)) for task in tasks ]
+
+    def _checkpoint(self, tasks):
+        """Journal the states of all tasks."""
+
+        states = {}
+        for task in tasks:
+            state = task.checkpoint()
+            if state is not None:
+                states[task._journal_key] = state
+        self.journal.write(states)
+
+        if mpiutil.rank0:
+            logger.debug('Checkpoint %d written to %s' % (self.journal.seq, self.journal.filename))
+
+    def plan(self, nproc=None, mem_per_proc=None, max_nproc=None):
+        """Plan the resources to run the pipeline without running it.
+
+        The shapes of the data products are propagated through the tasks
+        from the metadata of the input files only, see
+        :mod:`~tlpipe.pipeline.planner`. A report of the expected peak memory
+        per process, the total volume of I/O and redistribution, and the
+        recommended distributed axis of the input data and number of
+        processes is printed.
+
+        Parameters
+        ----------
+        nproc : None or integer, optional
+            Number of processes to plan for. Default None to use the number of
+            processes running this.
+        mem_per_proc : None or float, optional
+            Memory available to each process in GB, used to recommend the
+            number of processes. Default None.
+        max_nproc : None or integer, optional
+            Max number of processes to recommend. Default None for 8 times
+            `nproc`.
+
+        Returns
+        -------
+        plan : :class:`~tlpipe.pipeline.planner.Plan`
+
+        """
+
+        nproc = mpiutil.size if nproc is None else nproc
+        mem_bytes = None if mem_per_proc is None else int(mem_per_proc * 2**30)
+
+        tasks = []
+        for task_spec in self.tasks:
+            if isinstance(task_spec, tuple) :
+                task =  _task_class(task_spec[0])
+                task.prefix = task_spec[1]
+            else :
+                task = _task_class(task_spec)
+            tasks.append(task(self.task_params, feedback=0))
+
+        plan, best_axis, plans_by_axis, fit_nproc = planner.recommend(tasks, nproc, mem_bytes, max_nproc)
+
+        if mpiutil.rank0:
+            print plan.report()
+            print
+            for axis, pl in plans_by_axis.items():
+                print 'Input data distributed along %s: peak %s per process, %s redistributed' % (axis, planner.format_bytes(pl.peak_bytes), planner.format_bytes(pl.redistribute_bytes))
+            if best_axis is not None:
+                print 'Recommended dist_axis of the input data: %s' % best_axis
+            if mem_bytes is not None:
+                if fit_nproc is None:
+                    print 'No number of processes up to %d fits in %s per process' % (8 * nproc if max_nproc is None else max_nproc, planner.format_bytes(mem_bytes))
+                else:
+                    print 'Recommended number of processes for %s per process: %d' % (planner.format_bytes(mem_bytes), fit_nproc)
+
+        return plan
+
+    def _task_keys(self, task_spec):
+        """Read the 'requires', 'in' and 'out' keys of a task spec."""
+
+        if isinstance(task_spec, tuple):
+            task, prefix = task_spec
+        else:
+            task = _task_class(task_spec)
+            prefix = task.prefix
+        params = parse_ini.parse(self.task_params, {'requires': None, 'in': None, 'out': None}, prefix=prefix, feedback=0)
+
+        return format_list(params['requires']), format_list(params['in']), format_list(params['out'])
 
     def _setup_task(self, task):
         """Set up a pipeline task from the spec given in the tasks list."""
@@ -595,6 +884,10 @@ class Manager(object):
             logger.info('Initializing task: ' + str(task))
 
         task = task(self.task_params)
+        task.result_cache = self.cache
+        task.telemetry = self.telemetry
+        if self.ngroups > 1:
+            task.set_group(self.group, self.ngroups, self.merge_comm)
 
         return task
 
@@ -672,6 +965,24 @@ class TaskBase(object):
 
     prefix = 'tb_'
 
+    # the :class:`~tlpipe.pipeline.result_cache.ResultCache` of the pipeline,
+    # set by the Manager, None if caching is disabled
+    result_cache = None
+
+    # the :class:`~tlpipe.utils.telemetry.Recorder` of the pipeline, set by
+    # the Manager, None if telemetry is disabled
+    telemetry = None
+
+    # the state to restore after `setup()` when the pipeline is resumed, set
+    # by the Manager
+    _resume_state = None
+
+    # the group of processes running this task and the number of groups, see
+    # set_group
+    group = 0
+    ngroups = 1
+    merge_comm = None
+
 
     # Overridable Attributes
     # -----------------------
@@ -766,6 +1077,82 @@ class TaskBase(object):
 
         pass
 
+    def merge_groups(self):
+        """Override to merge the results of all groups of processes.
+
+        When the pipeline runs by groups of processes (see the `ngroups`
+        parameter of :class:`Manager`), this is called on all processes after
+        the task finishes iterating `next()` and before `finish()`. A task
+        that reduces the results of the iterations (e.g., accumulates them)
+        should merge its results of all groups here by `merge_comm`.
+
+        """
+
+        pass
+
+    def checkpoint(self):
+        """Override to return the state of this task for resuming it.
+
+        When checkpointing is enabled (see the `checkpoint` parameter of
+        :class:`Manager`), this is called on all processes whenever the
+        pipeline is quiescent, i.e., no data product is waiting to be
+        processed, and the returned state is journaled. It must ensure that
+        all outputs produced so far have been written, and return a JSON
+        serializable object that :meth:`restore_checkpoint` can restore the
+        task from, or None if there is nothing to restore.
+
+        """
+
+        return None
+
+    def restore_checkpoint(self, state):
+        """Override to restore this task from `state` returned by :meth:`checkpoint`.
+
+        This is called after `setup()` when the pipeline is resumed.
+
+        """
+
+        pass
+
+    def plan(self, stage, *inputs):
+        """Override to propagate the shapes of data products through this task.
+
+        This is called by :meth:`Manager.plan` to plan the resources of the
+        pipeline without running it, see :mod:`~tlpipe.pipeline.planner`.
+        `inputs` are the :class:`~tlpipe.pipeline.planner.ProductShape` of
+        the products received by `next()` (None if unknown). It should record
+        the resources used in one iteration in `stage`, a
+        :class:`~tlpipe.pipeline.planner.Stage`, and return the shape of the
+        output, None if there is no output or it is unknown.
+
+        """
+
+        return None
+
+    def plan_iterations(self):
+        """Override to return the number of iterations of the pipeline if this task determines it."""
+
+        return None
+
+    def set_group(self, group, ngroups, merge_comm):
+        """Set the group of processes running this task.
+
+        Parameters
+        ----------
+        group : integer
+            The group of this process.
+        ngroups : integer
+            Number of groups.
+        merge_comm : MPI.Comm
+            Communicator of the processes having the same rank in all groups,
+            whose rank is the group number.
+
+        """
+
+        self.group = group
+        self.ngroups = ngroups
+        self.merge_comm = merge_comm
+
     @property
     def embarrassingly_parallelizable(self):
         """Override to return `True` if `next()` is trivially parallelizeable.
@@ -779,7 +1166,9 @@ class TaskBase(object):
         Otherwise `next()` must be parallelized internally if at all. `setup()`
         and `finish()` must always be parallelized internally.
 
-        Usage of this has not implemented.
+        Iterable :class:`OneAndOne` tasks are embarrassingly parallelizable
+        over iterations, which are shared out to groups of processes when the
+        `ngroups` parameter of :class:`Manager` is larger than 1.
 
         """
 
@@ -789,7 +1178,11 @@ class TaskBase(object):
     def cacheable(self):
         """Override to return `True` if caching results is implemented.
 
-        No caching infrastructure has yet been implemented.
+        Outputs of a cacheable task are saved to the result cache of the
+        pipeline if it is enabled (by the `cache_dir` parameter of
+        :class:`Manager`), and loaded from it instead of being computed again
+        when all inputs, parameters and code of the task are unchanged. See
+        :class:`OneAndOne` for the methods a cacheable task should implement.
 
         """
 
@@ -862,6 +1255,11 @@ class TaskBase(object):
         self._in = [Queue.Queue() for i in xrange(n_in)]
         self._out_keys = out
 
+    def _pipeline_bound_queues(self, max_bytes, policy='block', scratch_dir=None, lazy_cache_size=None):
+        """Replace the input queues by :class:`~tlpipe.pipeline.product_queue.ProductQueue` of capacity `max_bytes`."""
+
+        self._in = [ ProductQueue(max_bytes, policy, scratch_dir, lazy_cache_size) for in_ in self._in ]
+
     def _pipeline_advance_state(self):
         """Advance this pipeline task to the next stage.
 
@@ -891,6 +1289,8 @@ class TaskBase(object):
                     msg = "Task finished %s iterating `next()` but input queue \'%s\' isn't empty." % (self.__class__.__name__, in_key)
                     if mpiutil.rank0:
                         warnings.warn(msg)
+                if isinstance(in_, ProductQueue):
+                    in_.close()
 
             self._in = None
             self._pipeline_state = "finish"
@@ -919,7 +1319,17 @@ class TaskBase(object):
                 msg = "Task %s calling 'setup()'." % self.__class__.__name__
                 if mpiutil.rank0:
                     logger.debug(msg)
+                if self.telemetry is not None:
+                    tstart = self.telemetry.start()
                 out = self.setup(*tuple(self._requires))
+                if self.telemetry is not None:
+                    self.telemetry.record(self, 'setup', tstart)
+                if self._resume_state is not None:
+                    msg = "Task %s calling 'restore_checkpoint()'." % self.__class__.__name__
+                    if mpiutil.rank0:
+                        logger.debug(msg)
+                    self.restore_checkpoint(self._resume_state)
+                    self._resume_state = None
                 self._pipeline_advance_state()
                 return out
         elif self._pipeline_state == "next":
@@ -938,21 +1348,35 @@ class TaskBase(object):
                         logger.debug(msg)
                     if self.params['timing']:
                         stime = datetime.datetime.now()
+                    if self.telemetry is not None:
+                        tstart = self.telemetry.start()
+                        iteration = getattr(self, 'iteration', None)
                     out = self.next(*args)
                     if self.params['timing']:
                         etime = datetime.datetime.now()
                         if mpiutil.rank0:
                             msg = 'Executing time of %s.next(): %s [ %s - %s ]' % (self.__class__.__name__, etime - stime, stime, etime)
                             logger.info(msg)
+                    if self.telemetry is not None:
+                        self.telemetry.record(self, 'next', tstart, iteration)
                     return out
                 except PipelineStopIteration:
                     # Finished iterating `next()`.
                     self._pipeline_advance_state()
         elif self._pipeline_state == "finish":
+            if self.telemetry is not None:
+                tstart = self.telemetry.start()
+            if self.ngroups > 1:
+                msg = "Task %s calling 'merge_groups()'." % self.__class__.__name__
+                if mpiutil.rank0:
+                    logger.debug(msg)
+                self.merge_groups()
             msg = "Task %s calling 'finish()'." % self.__class__.__name__
             if mpiutil.rank0:
                 logger.debug(msg)
             out = self.finish()
+            if self.telemetry is not None:
+                self.telemetry.record(self, 'finish', tstart)
             self._pipeline_advance_state()
             return out
         elif self._pipeline_state == "raise":
@@ -1050,6 +1474,43 @@ class _DryRun(object):
     pass
 
 
+class _Handoff(object):
+    """Stand-in of the tasks of another branch producing the product `key`,
+    which receives the product handed over by them, see
+    :func:`~tlpipe.pipeline.scheduler.send_product`."""
+
+    def __init__(self, key, source, tag, nends, comm):
+        self.key = key
+        self.source = source
+        self.tag = tag
+        self.nends = nends
+        self.comm = comm
+
+        self._in = None
+        self._out_keys = [ key ]
+        self._pipeline_state = 'next'
+        self._journal_key = 'handoff_%d' % tag
+
+    def _pipeline_next(self):
+        received, product = scheduler.recv_product(self.source, self.tag, self.comm)
+        if received and product is None:
+            # all producers have finished
+            self.nends -= 1
+            if self.nends == 0:
+                raise _PipelineFinished()
+
+        return product
+
+    def _pipeline_advance_state(self):
+        pass
+
+    def _pipeline_inspect_queue_product(self, keys, products):
+        pass
+
+    def checkpoint(self):
+        return None
+
+
 class OneAndOne(TaskBase):
     """Base class for tasks that have (at most) one input and one output.
 
@@ -1074,10 +1535,17 @@ class OneAndOne(TaskBase):
                     'iter_num': None, # number of iterations
                     'dry_run_time': 0, # dry run for this number of times
                     'process_timing': False, # timing the executing of process()
+                    'cache': True, # use the result cache of the pipeline if this task is cacheable
                   }
 
     prefix = 'ob_'
 
+    # parameters that do not affect the output, so they are not part of the
+    # cache key
+    cache_exclude_params = ('requires', 'in', 'out', 'keep_last_in', 'timing', 'copy', 'input_files', 'output_files', 'dry_run_time', 'process_timing', 'cache')
+
+    _input_fingerprint = None
+
 
     def __init__(self, parameter_file_or_dict=None, feedback=2):
 
@@ -1124,6 +1592,27 @@ class OneAndOne(TaskBase):
         self.output_files = output_path(format_list(self.params['output_files']), mkdir=False)
 
 
+    @property
+    def embarrassingly_parallelizable(self):
+        return self.iterable
+
+    def set_group(self, group, ngroups, merge_comm):
+        """Set the group of processes running this task.
+
+        An iterable task will only run every `ngroups`-th iteration starting
+        from the `group`-th one, and a non-iterable task will only run by the
+        first group.
+
+        """
+
+        super(OneAndOne, self).set_group(group, ngroups, merge_comm)
+
+        if self.iterable:
+            self.iter_start += group * self.iter_step
+            self.iter_step *= ngroups
+            if self.iter_num is not None:
+                self.iter_num = max(0, (self.iter_num - group + ngroups - 1) / ngroups)
+
     @property
     def iteration(self):
         """Current iteration when `iterable` is *True*, None else."""
@@ -1132,6 +1621,73 @@ class OneAndOne(TaskBase):
         else:
             return None
 
+    def checkpoint(self):
+        """Return the iterations run by an iterable task."""
+
+        if self.iterable:
+            return {'iter_cnt': self._iter_cnt, 'iter_stop': self._iter_stop}
+        else:
+            return None
+
+    def restore_checkpoint(self, state):
+        """Skip the iterations run before the checkpoint."""
+
+        if self.iterable:
+            self._iter_cnt = state['iter_cnt']
+            self._iter_stop = state['iter_stop']
+            if mpiutil.rank0:
+                logger.info('%s resumes from iteration %s' % (self.__class__.__name__, self.iteration))
+
+    def plan_iterations(self):
+        """Number of iterations of an iterable task if given by `iter_num`."""
+
+        if self.iterable:
+            return self.iter_num
+        else:
+            return None
+
+    def plan(self, stage, input=None):
+        """Plan reading the input, processing it and writing the output."""
+
+        if input is None:
+            if self._no_input or len(self.input_files) == 0:
+                return None
+            input = self.plan_read(stage)
+            if input is None:
+                stage.note('unknown shape of the input files')
+                return None
+        elif self.params['copy']:
+            input = input.copy()
+            stage.hold(input.local_nbytes(stage.nproc))
+
+        output = self.plan_process(stage, input)
+
+        if output is not None and len(self.output_files) != 0:
+            stage.write(output)
+
+        return output
+
+    def plan_read(self, stage):
+        """Override to return the shape of the input read from files.
+
+        Only the metadata of the files should be read, and the reading should
+        be recorded by `stage.read`. Return None if the shape is unknown.
+
+        """
+
+        return None
+
+    def plan_process(self, stage, input):
+        """Override to declare how `process` transforms the shape of `input`.
+
+        The default is that `process` works in place without changing the
+        shape. A new output should be returned if `process` creates one, and
+        the memory of its arrays recorded by `stage.hold`.
+
+        """
+
+        return input
+
     def restart_iteration(self):
         """Re-start the iteration.
 
@@ -1175,6 +1731,16 @@ class OneAndOne(TaskBase):
         if isinstance(input, _DryRun):
             input = None
 
+        # a non-iterable task runs only by the first group of processes, which
+        # holds the results merged from all groups, see set_group
+        if not self.iterable and self.group != 0:
+            self._iter_cnt += 1
+            return None
+
+        # fingerprint of the input before it is copied
+        if self.result_cache is not None and input is not None:
+            self._input_fingerprint = self.result_cache.get_fingerprint(input)
+
         if input:
             if self.params['copy']:
                 input = self.copy_input(input)
@@ -1188,6 +1754,45 @@ class OneAndOne(TaskBase):
     def read_process_write(self, input):
         """Reads input, executes any processing and writes output."""
 
+        key = self._cache_key(input)
+        use_cache = key is not None and self.cacheable and self.params['cache']
+
+        if use_cache and self.result_cache.contains(key):
+            if mpiutil.rank0:
+                msg = "%s loading output from cache %s" % (self.__class__.__name__, self.result_cache.entry(key))
+                logger.info(msg)
+            output = self.read_output(self.result_cache.files(key))
+        else:
+            output = self._read_process(input)
+            if use_cache and output is not None:
+                self.result_cache.store(key, lambda files: self.write_cache(output, files), info=self.history)
+
+        if key is not None and output is not None:
+            self.result_cache.set_fingerprint(output, key)
+
+        # Write output if needed.
+        if output is not None and len(self.output_files) != 0:
+            if mpiutil.rank0:
+                msg = "%s writing data to files:" % self.__class__.__name__
+
+                # make output dirs
+                for output_file in self.output_files:
+                    msg += '\n\t%s' % output_file
+                    output_dir = path.dirname(output_file)
+                    if not path.exists(output_dir):
+                        os.makedirs(output_dir)
+
+                logger.info(msg)
+
+            mpiutil.barrier()
+
+            self.write_output(output)
+
+        return output
+
+    def _read_process(self, input):
+        """Reads input if needed and executes any processing."""
+
         # Read input if needed.
         if input is None and not self._no_input:
             if self.input_files is None or len(self.input_files) == 0:
@@ -1230,25 +1835,32 @@ class OneAndOne(TaskBase):
                         msg = 'Executing time of %s.process(): %s [ %s - %s ]' % (self.__class__.__name__, etime - stime, stime, etime)
                         logger.info(msg)
 
-        # Write output if needed.
-        if output is not None and len(self.output_files) != 0:
-            if mpiutil.rank0:
-                msg = "%s writing data to files:" % self.__class__.__name__
+        return output
 
-                # make output dirs
-                for output_file in self.output_files:
-                    msg += '\n\t%s' % output_file
-                    output_dir = path.dirname(output_file)
-                    if not path.exists(output_dir):
-                        os.makedirs(output_dir)
+    def _cache_input_files(self):
+        """Input files of the current iteration, used for result caching."""
 
-                logger.info(msg)
+        return self.input_files
 
-            mpiutil.barrier()
+    def _cache_key(self, input):
+        """Cache key of the output of the current iteration, None if caching
+        is disabled or the fingerprint of `input` is unknown."""
 
-            self.write_output(output)
+        if self.result_cache is None:
+            return None
 
-        return output
+        if self._no_input:
+            fingerprints = []
+        elif input is None:
+            # read from files
+            files = self._cache_input_files()
+            if files is None or len(files) == 0:
+                return None
+            fingerprints = [ file_fingerprint(infile) for infile in files ]
+        else:
+            fingerprints = [ self._input_fingerprint ]
+
+        return self.result_cache.key(self, fingerprints, self.cache_exclude_params)
 
     def read_input(self):
         """Override to implement reading inputs from disk."""
@@ -1275,6 +1887,16 @@ class OneAndOne(TaskBase):
 
         raise NotImplementedError()
 
+    def write_cache(self, output, filenames):
+        """Override to implement writing outputs to the files `filenames`
+        that :meth:`read_output` can read back.
+
+        Used for result caching.
+
+        """
+
+        raise NotImplementedError()
+
     def process(self, input):
         """Override this method with your data processing task.
         """
@@ -1341,19 +1963,37 @@ def format_list(val):
 
 def _import_class(class_path):
     """Import class dynamically from a string."""
-    path_split = class_path.split('.')
-    module_path = '.'.join(path_split[:-1])
-    class_name = path_split[-1]
+    module_path, _, class_name = class_path.rpartition('.')
     if module_path:
-        m = __import__(module_path)
-        for comp in path_split[1:]:
-            m = getattr(m, comp)
-        task_cls = m
+        # only the module of the class is imported, not its whole package
+        try:
+            m = importlib.import_module(module_path)
+        except ImportError as e:
+            raise PipelineConfigError('Can not import task %s: %s' % (class_path, e))
+        try:
+            task_cls = getattr(m, class_name)
+        except AttributeError:
+            raise PipelineConfigError('No task %s in module %s' % (class_name, module_path))
     else:
         task_cls = globals()[class_name]
     return task_cls
 
 
+def _task_name(task_spec):
+    """Full name of the task class in `task_spec`, without importing it."""
+    task = task_spec[0] if isinstance(task_spec, tuple) else task_spec
+    if isinstance(task, basestring):
+        return task
+    return '%s.%s' % (task.__module__, task.__name__)
+
+
+def _task_class(task):
+    """Return the task class of `task`, which may be its import path."""
+    if isinstance(task, basestring):
+        return _import_class(task)
+    return task
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -0,0 +1,425 @@
+"""Plan the resources needed to run a pipeline without running it.
+
+Before submitting a pipeline to a batch queue, it is useful to know how much
+memory each process will need, how much data will be read, written and moved
+between processes by redistribution, and how many processes and which
+distributed axis fit the available memory. Instead of loading the data, a
+planning run propagates the shapes of the data products through the tasks:
+the tasks reading files build a :class:`ProductShape` from the metadata of
+the input files only (see :mod:`~tlpipe.container.file_index`), and each task
+declares how it transforms the shape of its input (e.g., rebinning the
+frequency channels or separating the polarizations and baselines) in its
+:meth:`~tlpipe.pipeline.pipeline.TaskBase.plan` method, recording the
+resources it uses in a :class:`Stage`.
+
+The planned sizes are estimates: datasets are assumed to be evenly
+distributed, and the temporary arrays used internally by a task are not
+counted unless the task declares them.
+
+"""
+
+import numpy as np
+
+
+class ProductShape(object):
+    """Shape of a data container, without its data.
+
+    Parameters
+    ----------
+    kind : string
+        Name of the container class, e.g., 'RawTimestream' or 'Timestream'.
+    axes : tuple of strings
+        Names of the axes of the main data.
+    lengths : dict
+        Length of each axis in `axes`.
+    dist_axis : integer, optional
+        Index of the distributed axis in `axes`. Default 0.
+    main_data_name : string, optional
+        Name of the main data. Default 'vis'.
+
+    """
+
+    def __init__(self, kind, axes, lengths, dist_axis=0, main_data_name='vis'):
+        self.kind = kind
+        self.main_data_name = main_data_name
+        self.axes = tuple(axes)
+        self.lengths = dict(lengths)
+        self.dist_axis = dist_axis
+        # {name: (dims, itemsize)}, each of dims is an axis name in axes or a
+        # fixed length
+        self.datasets = {}
+        # attributes needed to plan the tasks, e.g., 'inttime'
+        self.attrs = {}
+
+    def copy(self):
+        """Return a copy of this shape."""
+        shape = ProductShape(self.kind, self.axes, self.lengths, self.dist_axis, self.main_data_name)
+        shape.datasets = dict(self.datasets)
+        shape.attrs = dict(self.attrs)
+        return shape
+
+    def axis_index(self, axis):
+        """Index of `axis` given by its name or index."""
+        if isinstance(axis, basestring):
+            return self.axes.index(axis)
+        return axis % len(self.axes)
+
+    @property
+    def dist_axis_name(self):
+        """Name of the distributed axis."""
+        return self.axes[self.dist_axis]
+
+    def add_dataset(self, name, dims, itemsize):
+        """Add (or replace) dataset `name` of shape `dims`."""
+        self.datasets[name] = (tuple(dims), itemsize)
+
+    def remove_dataset(self, name):
+        """Remove dataset `name` if it exists."""
+        self.datasets.pop(name, None)
+
+    def resize(self, axis, length):
+        """Set the length of `axis`, which changes all datasets along it."""
+        self.lengths[self.axes[self.axis_index(axis)]] = length
+
+    def dataset_shape(self, name):
+        """Shape of dataset `name`."""
+        dims, itemsize = self.datasets[name]
+        return tuple([ self.lengths[d] if isinstance(d, basestring) else d for d in dims ])
+
+    def dataset_nbytes(self, name):
+        """Total size in bytes of dataset `name`."""
+        # itemsize may be fractional, e.g., 1/8 for a bit-packed mask
+        return int(np.prod(self.dataset_shape(name)) * self.datasets[name][1])
+
+    @property
+    def main_nbytes(self):
+        """Total size in bytes of the main data."""
+        return self.dataset_nbytes(self.main_data_name)
+
+    @property
+    def nbytes(self):
+        """Total size in bytes of all datasets."""
+        return sum([ self.dataset_nbytes(name) for name in self.datasets ])
+
+    def distributed(self, name):
+        """Whether dataset `name` is distributed among processes."""
+        return self.dist_axis_name in self.datasets[name][0]
+
+    def local_nbytes(self, nproc, names=None):
+        """Size in bytes held by the process holding the most data of `nproc` processes.
+
+        Only datasets in `names` are counted if it is not None.
+        """
+        dist_len = self.lengths[self.dist_axis_name]
+        # the first processes get one more point along the distributed axis
+        local_len = (dist_len + nproc - 1) / nproc
+        nbytes = 0
+        for name in (self.datasets if names is None else names):
+            if self.distributed(name):
+                nbytes += self.dataset_nbytes(name) / max(dist_len, 1) * local_len
+            else:
+                nbytes += self.dataset_nbytes(name)
+
+        return nbytes
+
+    def redistribute(self, axis, nproc):
+        """Redistribute along `axis`, return the total bytes moved between processes."""
+
+        axis = self.axis_index(axis)
+        if axis == self.dist_axis or nproc == 1:
+            self.dist_axis = axis
+            return 0
+
+        old, new = self.dist_axis_name, self.axes[axis]
+        moved = 0
+        for name, (dims, itemsize) in self.datasets.items():
+            if old in dims and new in dims:
+                # all-to-all exchange, each process keeps 1/nproc of its data
+                moved += self.dataset_nbytes(name) * (nproc - 1) / nproc
+            elif old in dims:
+                # gathered to all processes
+                moved += self.dataset_nbytes(name) * (nproc - 1)
+        self.dist_axis = axis
+
+        return moved
+
+    def __str__(self):
+        lens = ', '.join([ '%s=%d' % (ax, self.lengths[ax]) for ax in self.axes ])
+        return '%s(%s; dist %s)' % (self.kind, lens, self.dist_axis_name)
+
+
+class Stage(object):
+    """Resources used by a task in one iteration, recorded by its `plan` method.
+
+    Parameters
+    ----------
+    name : string
+        Name of the task.
+    nproc : integer
+        Number of processes.
+    dist_axis : None, integer or string, optional
+        If not None, data read from files by the task is distributed along
+        this axis instead of the one given by its parameters. Default None.
+
+    """
+
+    def __init__(self, name, nproc, dist_axis=None):
+        self.name = name
+        self.nproc = nproc
+        self.dist_axis = dist_axis
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.redistribute_bytes = 0
+        self.peak_bytes = 0 # per process
+        self.output = None
+        self.output_str = '-'
+        self.notes = []
+        self._held = 0
+
+    def hold(self, nbytes):
+        """Hold `nbytes` more bytes of memory on each process."""
+        self._held += nbytes
+        self.peak_bytes = max(self.peak_bytes, self._held)
+
+    def release(self, nbytes):
+        """Release `nbytes` bytes of memory on each process."""
+        self._held = max(0, self._held - nbytes)
+
+    def read(self, shape):
+        """Read `shape` from files into memory."""
+        self.read_bytes += shape.nbytes
+        self.hold(shape.local_nbytes(self.nproc))
+        self._check_dist(shape)
+
+    def write(self, shape):
+        """Write `shape` to files."""
+        self.write_bytes += shape.nbytes
+
+    def redistribute(self, shape, axis, slab_size=None):
+        """Redistribute `shape` along `axis`.
+
+        Parameters
+        ----------
+        shape : :class:`ProductShape`
+            The data redistributed.
+        axis : integer or string
+            The new distributed axis.
+        slab_size : None or integer, optional
+            Max bytes moved in each step of the redistribution, which is the
+            extra memory it needs. Default None for a whole dataset.
+
+        """
+
+        local = shape.local_nbytes(self.nproc)
+        moved = shape.redistribute(axis, self.nproc)
+        if moved > 0:
+            self.redistribute_bytes += moved
+            # a redistribution needs a buffer of the size moved in one step
+            extra = local if slab_size is None else min(local, slab_size)
+            self.hold(extra)
+            self.release(extra)
+            self._check_dist(shape)
+
+    def note(self, msg):
+        """Add a note to the report."""
+        if not msg in self.notes:
+            self.notes.append(msg)
+
+    def _check_dist(self, shape):
+        ### note idle processes
+        dist_len = shape.lengths[shape.dist_axis_name]
+        if dist_len < self.nproc:
+            self.note('only %d of %d processes hold data distributed along %s' % (dist_len, self.nproc, shape.dist_axis_name))
+
+
+class Plan(object):
+    """The planned resources of a pipeline for a number of processes.
+
+    Parameters
+    ----------
+    nproc : integer
+        Number of processes.
+    niter : integer
+        Number of iterations of the iterable tasks.
+    stages : list of (:class:`Stage`, integer, integer)
+        Each task's stage, the number of times it runs, and the bytes held
+        per process by the other data products alive while it runs.
+
+    """
+
+    def __init__(self, nproc, niter, stages):
+        self.nproc = nproc
+        self.niter = niter
+        self.stages = stages
+
+    @property
+    def peak_bytes(self):
+        """Expected peak memory per process."""
+        return max([ st.peak_bytes + live for (st, nrun, live) in self.stages ] or [0])
+
+    @property
+    def read_bytes(self):
+        """Total bytes read from files."""
+        return sum([ st.read_bytes * nrun for (st, nrun, live) in self.stages ])
+
+    @property
+    def write_bytes(self):
+        """Total bytes written to files."""
+        return sum([ st.write_bytes * nrun for (st, nrun, live) in self.stages ])
+
+    @property
+    def redistribute_bytes(self):
+        """Total bytes moved between processes by redistribution."""
+        return sum([ st.redistribute_bytes * nrun for (st, nrun, live) in self.stages ])
+
+    def report(self):
+        """Return the plan as a printable table."""
+
+        lines = [ 'Plan for %d processes, %d iterations:' % (self.nproc, self.niter) ]
+        fmt = '  %-24s %5s %10s %10s %10s %10s  %s'
+        lines.append(fmt % ('task', 'runs', 'peak/proc', 'read', 'write', 'redist', 'output'))
+        for st, nrun, live in self.stages:
+            lines.append(fmt % (st.name, nrun, format_bytes(st.peak_bytes + live), format_bytes(st.read_bytes * nrun), format_bytes(st.write_bytes * nrun), format_bytes(st.redistribute_bytes * nrun), st.output_str))
+            for msg in st.notes:
+                lines.append('    note: %s' % msg)
+        lines.append(fmt % ('total', '', format_bytes(self.peak_bytes), format_bytes(self.read_bytes), format_bytes(self.write_bytes), format_bytes(self.redistribute_bytes), ''))
+
+        return '\n'.join(lines)
+
+
+def format_bytes(nbytes):
+    """Format `nbytes` in a human readable unit."""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(nbytes) < 1024.0:
+            return '%.1f%s' % (nbytes, unit)
+        nbytes /= 1024.0
+    return '%.1fTB' % nbytes
+
+
+def plan_tasks(tasks, nproc, dist_axis=None):
+    """Plan running `tasks` by `nproc` processes.
+
+    Parameters
+    ----------
+    tasks : list of :class:`~tlpipe.pipeline.pipeline.TaskBase`
+        The initialized tasks, in the order of the pipeline.
+    nproc : integer
+        Number of processes.
+    dist_axis : None, integer or string, optional
+        If not None, override the distributed axis of the data read from
+        files. Default None.
+
+    Returns
+    -------
+    plan : :class:`Plan`
+
+    """
+
+    # number of iterations, given by the first iterable task that knows it
+    niter = 1
+    for task in tasks:
+        n = task.plan_iterations()
+        if n is not None:
+            niter = n
+            break
+
+    # the last task consuming each product
+    last_use = {}
+    for ti, task in enumerate(tasks):
+        for key in task._requires_keys + task._in_keys:
+            last_use[key] = ti
+
+    products = {} # {key: ProductShape}
+    runs = {} # {key: number of times produced}
+    stages = []
+    for ti, task in enumerate(tasks):
+        stage = Stage('%s(%s)' % (task.__class__.__name__, task.prefix), nproc, dist_axis)
+        inputs = [ products.get(key, None) for key in task._in_keys ]
+        # the inputs are already in memory
+        for shape in set(inputs) - {None}:
+            stage.hold(shape.local_nbytes(nproc))
+        output = task.plan(stage, *inputs)
+        stage.output = output
+        # the shape may be changed in place by later tasks
+        stage.output_str = str(output) if output is not None else '-'
+
+        # an iterable task runs every iteration, others run once for each input
+        if getattr(task, 'iterable', False):
+            nrun = niter
+        else:
+            nrun = max([ runs.get(key, 1) for key in task._in_keys ] or [1])
+
+        # memory of the other products alive, counted once even if held by
+        # several keys
+        alive = {}
+        for key, shape in products.items():
+            if shape is not None and last_use.get(key, -1) >= ti and not shape in inputs:
+                alive[id(shape)] = shape.local_nbytes(nproc)
+        stages.append((stage, nrun, sum(alive.values())))
+
+        for key in task._out_keys:
+            products[key] = output
+            runs[key] = nrun
+
+    return Plan(nproc, niter, stages)
+
+
+def recommend(tasks, nproc, mem_per_proc=None, max_nproc=None):
+    """Recommend the distributed axis and the number of processes.
+
+    Parameters
+    ----------
+    tasks : list of :class:`~tlpipe.pipeline.pipeline.TaskBase`
+        The initialized tasks, in the order of the pipeline.
+    nproc : integer
+        Number of processes planned.
+    mem_per_proc : None or integer, optional
+        Memory available to each process in bytes. Default None for
+        unlimited.
+    max_nproc : None or integer, optional
+        Max number of processes to consider. Default None for 8 times
+        `nproc`.
+
+    Returns
+    -------
+    plan : :class:`Plan`
+        The plan with the current parameters.
+    best_axis : string or None
+        The distributed axis of the data read from files that moves the least
+        data by redistribution, None if no task reads data.
+    plans_by_axis : dict
+        The plan for each distributed axis.
+    fit_nproc : integer or None
+        The least number of processes (a power of 2) whose peak memory per
+        process fits in `mem_per_proc`, None if none fits or `mem_per_proc`
+        is None.
+
+    """
+
+    plan = plan_tasks(tasks, nproc)
+
+    # the axes of the first product read from files
+    axes = ()
+    for st, nrun, live in plan.stages:
+        if st.read_bytes > 0 and st.output is not None:
+            axes = st.output.axes
+            break
+
+    plans_by_axis = {}
+    for axis in axes:
+        plans_by_axis[axis] = plan_tasks(tasks, nproc, dist_axis=axis)
+    best_axis = None
+    if plans_by_axis:
+        best_axis = min(axes, key=lambda ax: (plans_by_axis[ax].redistribute_bytes, plans_by_axis[ax].peak_bytes))
+
+    fit_nproc = None
+    if mem_per_proc is not None:
+        max_nproc = 8 * nproc if max_nproc is None else max_nproc
+        n = 1
+        while n <= max_nproc:
+            if plan_tasks(tasks, n, dist_axis=best_axis).peak_bytes <= mem_per_proc:
+                fit_nproc = n
+                break
+            n *= 2
+
+    return plan, best_axis, plans_by_axis, fit_nproc
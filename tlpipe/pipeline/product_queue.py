@@ -0,0 +1,229 @@
+"""Bounded queues of the data products passed between pipeline tasks.
+
+A :class:`ProductQueue` holds the products waiting to be processed by a task,
+like the :class:`Queue.Queue` it replaces, but keeps track of the total size
+of the products in it. When the size exceeds the capacity of the queue, it
+either reports itself full, so the :class:`~tlpipe.pipeline.pipeline.Manager`
+stops running the tasks producing into it until it is drained ('block'
+policy), or writes products to scratch HDF5 files and reloads them when they
+are taken out ('spill' policy). As the :class:`~tlpipe.pipeline.pipeline.Manager`
+runs each task at most once between two puts into its queue, the oldest
+product, which will be taken out next, is never spilled, and the others are
+spilled from the newest, which will be taken out the last.
+
+The size of a product is given by its `total_nbytes()` method if it has one
+(e.g., a :class:`~tlpipe.container.container.BasicTod`), else by its `nbytes`
+attribute, and 0 if neither exists. Only products that can be saved by
+`to_files()` and re-constructed from the saved files (i.e., the containers)
+can be spilled. Note that spilling a product only frees its memory if it is
+not referenced by anything else, e.g., the queue of another task, in which
+case the product itself instead of the reloaded one is taken out. A reloaded
+product gets back the hints and other states of the container not saved to
+the files, e.g., the mode of its input files.
+
+All methods must be called by all processes of the communicator.
+
+"""
+
+import os
+import shutil
+import re
+import tempfile
+import weakref
+import collections
+import logging
+from caput import mpiutil
+
+
+# Set the module logger.
+logger = logging.getLogger(__name__)
+
+
+def product_nbytes(product):
+    """Total size in bytes of `product`."""
+
+    if hasattr(product, 'total_nbytes'):
+        return product.total_nbytes()
+    else:
+        return getattr(product, 'nbytes', 0)
+
+
+def spillable(product):
+    """Whether `product` can be spilled to files."""
+
+    return hasattr(product, 'to_files') and hasattr(product, 'load_all')
+
+
+# states of a container not saved to files, restored when it is reloaded
+STATE_ATTRS = ('infiles_mode', 'use_read_planner', 'redistribute_slab_size')
+
+
+def product_state(product):
+    """States of `product` not saved by its `to_files()`."""
+
+    keys = [ key for key in STATE_ATTRS if hasattr(product, key) ]
+    # hints may be changed after the container is constructed
+    if hasattr(product, 'hints_pattern'):
+        keys += [ key for key in product.__class__.__dict__.keys() if re.match(product.hints_pattern, key) ]
+
+    return dict((key, getattr(product, key)) for key in keys)
+
+
+class _Spilled(object):
+    """A product saved in a scratch file."""
+
+    def __init__(self, product, filename):
+        self.cls = product.__class__
+        self.filename = filename
+        # to_files may redistribute the product, so record its axis first
+        self.dist_axis = product.main_data_dist_axis
+        self.comm = product.comm
+        self.state = product_state(product)
+        # the product is still alive if referenced by anything else
+        self.ref = weakref.ref(product)
+
+
+class ProductQueue(object):
+    """A FIFO queue of data products with a capacity in bytes.
+
+    Parameters
+    ----------
+    max_bytes : None or integer, optional
+        Capacity of the queue in bytes, None for unbounded. Default None.
+    policy : 'block' or 'spill', optional
+        What to do when the capacity is exceeded. Default 'block'.
+    scratch_dir : None or string, optional
+        Directory to create the scratch files of the spilled products in. The
+        system default temporary directory will be used if None.
+        Default None.
+    lazy_cache_size : None or float, optional
+        If not None, spilled products are reloaded lazily with at most this
+        many MB of their large datasets held in memory, see
+        :meth:`~tlpipe.container.container.BasicTod.enable_lazy_load`.
+        Default None to reload them entirely.
+    comm : None or MPI.Comm, optional
+        MPI Communicator. Default None to use mpiutil.world.
+
+    """
+
+    def __init__(self, max_bytes=None, policy='block', scratch_dir=None, lazy_cache_size=None, comm=None):
+        if not policy in ('block', 'spill'):
+            raise ValueError('Unknown queue policy %s, must be block or spill' % policy)
+
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.scratch_dir = scratch_dir
+        self.lazy_cache_size = lazy_cache_size
+        self.comm = mpiutil.world if comm is None else comm
+        self.rank0 = (self.comm is None or self.comm.rank == 0)
+
+        # [(product or _Spilled, nbytes), ...], the size of a spilled product
+        # is 0 as it is not in memory
+        self._items = collections.deque()
+        self._nbytes = 0
+        self._tmpdir = None
+        self._nspilled = 0
+
+    @property
+    def nbytes(self):
+        """Total size in bytes of the products held in memory."""
+        return self._nbytes
+
+    def qsize(self):
+        """Number of products in the queue."""
+        return len(self._items)
+
+    def empty(self):
+        """Whether the queue is empty."""
+        return len(self._items) == 0
+
+    def full(self):
+        """Whether the queue holds products exceeding its capacity.
+
+        A queue with the 'spill' policy is never full.
+        """
+
+        if self.max_bytes is None or self.policy != 'block':
+            return False
+
+        return self._nbytes > self.max_bytes
+
+    def put(self, product):
+        """Put `product` into the queue."""
+
+        nbytes = product_nbytes(product) if self.max_bytes is not None else 0
+        self._items.append((product, nbytes))
+        self._nbytes += nbytes
+
+        if self.policy == 'spill' and self.max_bytes is not None:
+            # keep the oldest product, which will be taken out next, and
+            # spill the others from the newest until within the capacity
+            for ii in reversed(xrange(1, len(self._items))):
+                if self._nbytes <= self.max_bytes:
+                    break
+                item, nbytes = self._items[ii]
+                if isinstance(item, _Spilled) or not spillable(item):
+                    continue
+                self._items[ii] = (self._spill(item), 0)
+                self._nbytes -= nbytes
+
+    def get(self):
+        """Remove and return the oldest product in the queue."""
+
+        item, nbytes = self._items.popleft()
+        self._nbytes -= nbytes
+        if isinstance(item, _Spilled):
+            item = self._reload(item)
+
+        return item
+
+    def close(self):
+        """Remove the scratch files of products never taken out."""
+
+        if self._tmpdir is not None:
+            self._items.clear()
+            self._nbytes = 0
+            if self.rank0:
+                shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def _spill(self, product):
+        ### save `product` to a scratch file
+
+        if self._tmpdir is None:
+            tmpdir = None
+            if self.rank0:
+                if self.scratch_dir is not None and not os.path.isdir(self.scratch_dir):
+                    os.makedirs(self.scratch_dir)
+                tmpdir = tempfile.mkdtemp(prefix='tlpipe_queue_', dir=self.scratch_dir)
+            self._tmpdir = mpiutil.bcast(tmpdir, root=0, comm=self.comm)
+
+        filename = os.path.join(self._tmpdir, 'product_%d.hdf5' % self._nspilled)
+        self._nspilled += 1
+        spilled = _Spilled(product, filename)
+        product.to_files(filename, check_status=False)
+        if self.rank0:
+            logger.debug('Spilled %s to %s' % (product.__class__.__name__, filename))
+
+        return spilled
+
+    def _reload(self, spilled):
+        ### re-construct the product saved in a scratch file
+
+        # take the product itself if it is still held by all procs
+        product = spilled.ref()
+        alive = mpiutil.allreduce(int(product is not None), op=mpiutil.MIN, comm=self.comm)
+        if not alive:
+            product = spilled.cls(spilled.filename, mode='r', start=0, stop=None, dist_axis=spilled.dist_axis, use_hints=True, comm=spilled.comm)
+            if self.lazy_cache_size is not None:
+                product.enable_lazy_load(self.lazy_cache_size)
+            product.load_all()
+            for key, val in spilled.state.iteritems():
+                setattr(product, key, val)
+
+        # the file is opened by all procs, so it can be removed now
+        mpiutil.barrier(comm=self.comm)
+        if self.rank0:
+            os.remove(spilled.filename)
+
+        return product
@@ -0,0 +1,298 @@
+"""Content-addressed cache of the outputs of pipeline tasks.
+
+Each output of a cacheable task is stored in a directory named by its cache
+key, which is a hash of the class of the task, the parameters of the task
+that affect the output, the code version (the version of tlpipe, all source
+files of the tlpipe package and the modules of the base classes of the task
+outside it) and the fingerprints of the inputs
+of the task. The fingerprint of an input read from files is given by the
+names, sizes and modification times of the files, and that of an input
+product of another task is the cache key of that product, so a key changes
+whenever anything upstream changes. When a pipeline is re-run, a task whose
+key is found in the cache loads its output from the cache instead of
+computing it.
+
+The total size of the cache is bounded, the least recently used entries are
+removed when it is exceeded.
+
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import inspect
+import weakref
+import logging
+import numpy as np
+from caput import mpiutil
+import tlpipe
+
+
+# Set the module logger.
+logger = logging.getLogger(__name__)
+
+
+def file_fingerprint(filename):
+    """Return the fingerprint, i.e., (name, size, mtime) of a file, None if not exist."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+
+    return (os.path.abspath(filename), st.st_size, st.st_mtime)
+
+
+def _update(md5, val):
+    ### update the hash `md5` by the value `val` of a parameter
+    if isinstance(val, np.ndarray):
+        md5.update('ndarray%s%s' % (val.dtype.str, val.shape))
+        md5.update(np.ascontiguousarray(val).tostring())
+    elif isinstance(val, dict):
+        md5.update('dict%d' % len(val))
+        for k in sorted(val.keys()):
+            _update(md5, k)
+            _update(md5, val[k])
+    elif isinstance(val, (list, tuple)):
+        md5.update('%s%d' % (type(val).__name__, len(val)))
+        for v in val:
+            _update(md5, v)
+    else:
+        md5.update(repr(val))
+
+
+# suffixes of the source files hashed as the code version
+SOURCE_SUFFIXES = ('.py', '.pyx', '.pxd', '.c', '.h')
+
+# hashes of the source trees, they do not change while running
+_tree_hashes = {}
+
+
+def _update_file(md5, filename):
+    ### update the hash `md5` by the content of the file `filename`
+    with open(filename, 'rb') as f:
+        md5.update(f.read())
+
+
+def _tree_hash(root):
+    ### hash of all source files under the directory `root`
+    md5 = hashlib.md5()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for fn in sorted(filenames):
+            if fn.endswith(SOURCE_SUFFIXES):
+                filename = os.path.join(dirpath, fn)
+                md5.update(os.path.relpath(filename, root))
+                _update_file(md5, filename)
+
+    return md5.hexdigest()
+
+
+def _source_hash(cls):
+    ### hash of the source code `cls` may depend on, i.e., all source files of
+    ### the tlpipe package (as a task may use any module of it) and those of
+    ### the modules of its base classes outside tlpipe
+    root = os.path.dirname(os.path.abspath(tlpipe.__file__))
+    if not root in _tree_hashes:
+        _tree_hashes[root] = _tree_hash(root)
+
+    md5 = hashlib.md5()
+    md5.update(_tree_hashes[root])
+    for c in inspect.getmro(cls):
+        if c is object:
+            continue
+        try:
+            filename = inspect.getsourcefile(c)
+        except TypeError:
+            # a built-in class
+            filename = None
+        if filename is None or not os.path.isfile(filename):
+            # source not available, e.g., an extension class
+            md5.update('%s.%s' % (c.__module__, c.__name__))
+        elif not os.path.abspath(filename).startswith(root + os.sep):
+            _update_file(md5, filename)
+
+    return md5.hexdigest()
+
+
+class ResultCache(object):
+    """A directory of cached task outputs.
+
+    All methods that access the cache directory are collective operations
+    over `comm`, only its rank 0 process touches the file system.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The cache directory, it will be created if not exist.
+    max_size : float, optional
+        Maximum total size of the cache in GB. Default 100.
+    comm : None or MPI.Comm, optional
+        MPI Communicator. Default None to use mpiutil.world.
+
+    """
+
+    def __init__(self, cache_dir, max_size=100.0, comm=None):
+
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size = max_size
+        self.comm = mpiutil.world if comm is None else comm
+        self.rank0 = (self.comm is None or self.comm.rank == 0)
+
+        # cache keys of the products passed between tasks
+        self._fingerprints = weakref.WeakKeyDictionary()
+        self._source_hashes = {}
+
+        if self.rank0 and not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                pass
+        mpiutil.barrier(comm=self.comm)
+
+    def set_fingerprint(self, product, key):
+        """Record `key` as the fingerprint of the data `product`."""
+        try:
+            self._fingerprints[product] = key
+        except TypeError:
+            # can not be weakly referenced, e.g., a tuple
+            pass
+
+    def get_fingerprint(self, product):
+        """Return the fingerprint of the data `product`, None if unknown."""
+        try:
+            return self._fingerprints.get(product, None)
+        except TypeError:
+            return None
+
+    def key(self, task, input_fingerprints, exclude_params=()):
+        """Return the cache key of the output of `task`.
+
+        Parameters
+        ----------
+        task : :class:`~tlpipe.pipeline.pipeline.TaskBase` object
+            The task.
+        input_fingerprints : list
+            Fingerprints of the inputs of the task, the key is None if any of
+            them is None, i.e., unknown.
+        exclude_params : list of strings, optional
+            Names of parameters of `task` that do not affect its output.
+
+        Returns
+        -------
+        key : string or None
+
+        """
+
+        if any([ fp is None for fp in input_fingerprints ]):
+            return None
+
+        # only the key computed by rank 0 is used
+        if not self.rank0:
+            return mpiutil.bcast(None, root=0, comm=self.comm)
+
+        cls = task.__class__
+        if not cls in self._source_hashes:
+            self._source_hashes[cls] = _source_hash(cls)
+
+        md5 = hashlib.md5()
+        md5.update('%s.%s' % (cls.__module__, cls.__name__))
+        md5.update(tlpipe.__version__)
+        md5.update(self._source_hashes[cls])
+        params = dict([ (k, v) for (k, v) in task.params.items() if not k in exclude_params ])
+        _update(md5, params)
+        _update(md5, list(input_fingerprints))
+        _update(md5, getattr(task, 'iteration', None))
+
+        return mpiutil.bcast(md5.hexdigest(), root=0, comm=self.comm)
+
+    def entry(self, key):
+        """The directory of the cache entry `key`."""
+        return os.path.join(self.cache_dir, key)
+
+    def files(self, key, num=1):
+        """Names of the `num` files in the cache entry `key`."""
+        return [ os.path.join(self.entry(key), 'output_%d.hdf5' % i) for i in xrange(num) ]
+
+    def contains(self, key):
+        """Whether the cache entry `key` exists, its access time will be updated if so."""
+        found = False
+        if self.rank0:
+            entry = self.entry(key)
+            found = os.path.isdir(entry)
+            if found:
+                # mark as recently used for eviction
+                os.utime(entry, None)
+
+        return mpiutil.bcast(found, root=0, comm=self.comm)
+
+    def store(self, key, write, num=1, info=''):
+        """Store an output as the cache entry `key`.
+
+        Parameters
+        ----------
+        key : string
+            The cache key.
+        write : function object
+            Called as write(filenames) to write the output to the list of
+            file names `filenames`, collectively over all processes.
+        num : integer, optional
+            Number of files to write. Default 1.
+        info : string, optional
+            Description of the output, saved in the entry for reference.
+
+        """
+
+        # write to a temporary entry, so an incomplete entry is never seen
+        tmp_key = key + '.tmp'
+        if self.rank0:
+            tmp_entry = self.entry(tmp_key)
+            if os.path.isdir(tmp_entry):
+                shutil.rmtree(tmp_entry)
+            os.makedirs(tmp_entry)
+            with open(os.path.join(tmp_entry, 'info.txt'), 'w') as fl:
+                fl.write(info)
+        mpiutil.barrier(comm=self.comm)
+
+        write(self.files(tmp_key, num))
+
+        mpiutil.barrier(comm=self.comm)
+        if self.rank0:
+            entry = self.entry(key)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            os.rename(self.entry(tmp_key), entry)
+            self.evict(keep=key)
+        mpiutil.barrier(comm=self.comm)
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the cache size is
+        within `max_size`, the entry `keep` is never removed.
+
+        This is only done by the rank 0 process.
+
+        """
+
+        if not self.rank0:
+            return
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(entry) or name.endswith('.tmp'):
+                continue
+            size = 0
+            for dirpath, dirnames, filenames in os.walk(entry):
+                size += sum([ os.path.getsize(os.path.join(dirpath, fn)) for fn in filenames ])
+            entries.append((os.path.getmtime(entry), name, size))
+
+        total = sum([ e[2] for e in entries ])
+        max_bytes = self.max_size * 2**30
+        for mtime, name, size in sorted(entries):
+            if total <= max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+            logger.info('Removed cache entry %s (last used %s) of %.2f GB' % (name, time.ctime(mtime), size / 2.0**30))
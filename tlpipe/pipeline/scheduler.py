@@ -0,0 +1,331 @@
+"""Run independent branches of a pipeline concurrently.
+
+The tasks of a pipeline are linked by the keys of the data products they
+exchange, i.e., the `requires`, `in` and `out` keys of the tasks. Tasks that
+are not linked by any key, directly or through other tasks, form independent
+branches of the pipeline, e.g., two chains of tasks processing different
+input files. Instead of running them one after another on all processes, the
+processes can be partitioned into groups which run the branches concurrently,
+each by its own communicator.
+
+A data product is distributed over the processes that produced it, so a
+task consuming it is in the same branch as its producer, except when several
+tasks consume the same product (a fan-out): the first of them stays in the
+branch of the producer, and the others start their own branches (together
+with their downstream tasks), which get the product handed over, see
+:func:`handoffs`. A handed over product is written to a file by the processes
+of the producer and read by those of the consumer with their own
+distribution, so it must be a data container that can be written by
+`to_files` and read back by its class, or a small picklable object that is
+sent in a message. Dependencies through files (e.g., a task reading the
+output files of another task) are not seen by the scheduler, link such tasks
+by keys if they should not run concurrently.
+
+"""
+
+import os
+import importlib
+from caput import mpiutil
+
+
+def task_graph(keys):
+    """Find the upstream tasks of each task.
+
+    Parameters
+    ----------
+    keys : list of tuples
+        The (`requires`, `in`, `out`) keys of each task, each is a list of
+        keys.
+
+    Returns
+    -------
+    upstreams : list of sets
+        Indices of the tasks producing the data products consumed by each
+        task.
+
+    """
+
+    producers = {}
+    for ti, (requires, in_, out) in enumerate(keys):
+        for key in out:
+            producers.setdefault(key, set()).add(ti)
+
+    upstreams = []
+    for ti, (requires, in_, out) in enumerate(keys):
+        ups = set()
+        for key in list(requires) + list(in_):
+            ups.update(producers.get(key, set()))
+        ups.discard(ti)
+        upstreams.append(ups)
+
+    return upstreams
+
+
+def _consumers(keys):
+    ### indices of the tasks consuming each key, in the order of the tasks
+    consumers = {}
+    for ti, (requires, in_, out) in enumerate(keys):
+        for key in list(requires) + list(in_):
+            if not ti in consumers.setdefault(key, []):
+                consumers[key].append(ti)
+
+    return consumers
+
+
+def branches(keys):
+    """Split tasks into independent branches.
+
+    Tasks are linked by the data products they exchange, except that only the
+    first consumer of a product consumed by several tasks is linked to its
+    producer, see :func:`handoffs`.
+
+    Parameters
+    ----------
+    keys : list of tuples
+        The (`requires`, `in`, `out`) keys of each task, each is a list of
+        keys.
+
+    Returns
+    -------
+    branches : list of lists
+        Indices of the tasks in each branch, in the order of the tasks. The
+        branches are ordered by their first task.
+
+    """
+
+    # union-find of tasks linked by data products
+    parent = range(len(keys))
+
+    def find(ti):
+        while parent[ti] != ti:
+            parent[ti] = parent[parent[ti]]
+            ti = parent[ti]
+        return ti
+
+    producers = {}
+    for ti, (requires, in_, out) in enumerate(keys):
+        for key in out:
+            producers.setdefault(key, set()).add(ti)
+
+    for key, consumers in _consumers(keys).items():
+        # other consumers of a fan-out get the product handed over
+        for ui in producers.get(key, set()):
+            ti = consumers[0] if consumers[0] != ui or len(consumers) == 1 else consumers[1]
+            ri, ru = find(ti), find(ui)
+            if ri != ru:
+                parent[max(ri, ru)] = min(ri, ru)
+
+    brs = {}
+    for ti in range(len(keys)):
+        brs.setdefault(find(ti), []).append(ti)
+
+    return [ brs[root] for root in sorted(brs.keys()) ]
+
+
+def handoffs(keys, brs):
+    """Find the data products that are consumed in other branches than their producers.
+
+    Parameters
+    ----------
+    keys : list of tuples
+        The (`requires`, `in`, `out`) keys of each task, each is a list of
+        keys.
+    brs : list of lists
+        The branches returned by :func:`branches`.
+
+    Returns
+    -------
+    handoffs : list of tuples
+        (key, producer branch, consumer branch, number of producer tasks) of
+        each product to be handed over from a branch to another, ordered by
+        the key and the branches.
+
+    """
+
+    branch_of = {}
+    for bi, br in enumerate(brs):
+        for ti in br:
+            branch_of[ti] = bi
+
+    producers = {}
+    for ti, (requires, in_, out) in enumerate(keys):
+        for key in out:
+            producers.setdefault(key, []).append(ti)
+
+    hos = set()
+    for key, consumers in _consumers(keys).items():
+        for pb in set([ branch_of[ui] for ui in producers.get(key, []) ]):
+            nproducers = len([ ui for ui in producers[key] if branch_of[ui] == pb ])
+            for ti in consumers:
+                if branch_of[ti] != pb:
+                    hos.add((key, pb, branch_of[ti], nproducers))
+
+    return sorted(hos)
+
+
+def branch_root(bi, nbranches, size):
+    """Rank of the first process of those running branch `bi`, see :func:`split`.
+
+    Parameters
+    ----------
+    bi : integer
+        Index of the branch.
+    nbranches : integer
+        Number of branches.
+    size : integer
+        Number of processes in the communicator that is split.
+
+    """
+
+    if size <= nbranches:
+        return bi % size
+
+    quot, rem = divmod(size, nbranches)
+    if bi < rem:
+        return bi * (quot + 1)
+    else:
+        return rem * (quot + 1) + (bi - rem) * quot
+
+
+def split(nbranches, comm=None):
+    """Partition the processes in `comm` to run `nbranches` branches.
+
+    The processes are divided into groups of consecutive ranks of as equal
+    size as possible, one for each branch. If there are more branches than
+    processes, each process runs several branches one after another.
+
+    Parameters
+    ----------
+    nbranches : integer
+        Number of branches.
+    comm : None or MPI.Comm, optional
+        MPI Communicator to split. Default None to use mpiutil.world.
+
+    Returns
+    -------
+    my_branches : list
+        Indices of the branches run by this process.
+    branch_comm : MPI.Comm
+        Communicator of the processes running the same branches as this one.
+
+    """
+
+    comm = mpiutil.world if comm is None else comm
+    if comm is None:
+        raise ValueError('Can not run %d branches concurrently without MPI' % nbranches)
+    if nbranches < 1:
+        raise ValueError('Invalid number of branches %d' % nbranches)
+
+    if comm.size <= nbranches:
+        color = comm.rank
+        my_branches = range(color, nbranches, comm.size)
+    else:
+        # the first branches get one more process
+        quot, rem = divmod(comm.size, nbranches)
+        if comm.rank < rem * (quot + 1):
+            color = comm.rank / (quot + 1)
+        else:
+            color = rem + (comm.rank - rem * (quot + 1)) / quot
+        my_branches = [ color ]
+
+    branch_comm = comm.Split(color, comm.rank)
+
+    return my_branches, branch_comm
+
+
+def send_product(product, filename, dest, tag, comm):
+    """Hand over a data product to the processes of another branch.
+
+    This is a collective operation over the communicator of the processes
+    holding `product`, i.e., :data:`caput.mpiutil.world`. A data container
+    is written to `filename`, and a message of it (or of a picklable
+    `product` itself) is sent to the process `dest` by `comm`.
+
+    Parameters
+    ----------
+    product : object
+        The data product, None to send the end of the products.
+    filename : string
+        File to write a data container to.
+    dest : integer
+        Rank in `comm` of the first process of the receiving branch.
+    tag : integer
+        Tag of the message.
+    comm : MPI.Comm
+        The communicator the branches are split from.
+
+    Returns
+    -------
+    request : None or MPI.Request
+        Request of the message sent by the rank 0 process of the branch, to
+        be waited for before `comm` is freed.
+
+    """
+
+    if hasattr(product, 'to_files'):
+        if mpiutil.rank0:
+            dirname = os.path.dirname(filename)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+        mpiutil.barrier()
+        dist_axis = product.main_data_dist_axis
+        product.to_files(filename)
+        cls = product.__class__
+        msg = ('file', (cls.__module__, cls.__name__), filename, dist_axis)
+    elif product is None:
+        msg = ('end',)
+    else:
+        msg = ('object', product)
+
+    if mpiutil.rank0:
+        return comm.isend(msg, dest=dest, tag=tag)
+    return None
+
+
+def recv_product(source, tag, comm):
+    """Receive a data product handed over by :func:`send_product`.
+
+    This is a collective operation over the communicator of the processes of
+    the receiving branch, i.e., :data:`caput.mpiutil.world`, which will hold
+    the product. The handed over file is removed after read.
+
+    Parameters
+    ----------
+    source : integer
+        Rank in `comm` of the first process of the sending branch.
+    tag : integer
+        Tag of the message.
+    comm : MPI.Comm
+        The communicator the branches are split from.
+
+    Returns
+    -------
+    received : bool
+        False if no product has been sent yet, the product and the end of the
+        products are received only if True.
+    product : object
+        The data product, None for the end of the products.
+
+    """
+
+    msg = None
+    if mpiutil.rank0 and comm.Iprobe(source=source, tag=tag):
+        msg = comm.recv(source=source, tag=tag)
+    msg = mpiutil.bcast(msg, root=0)
+
+    if msg is None:
+        return False, None
+    elif msg[0] == 'end':
+        return True, None
+    elif msg[0] == 'object':
+        return True, msg[1]
+
+    _, (module, name), filename, dist_axis = msg
+    cls = getattr(importlib.import_module(module), name)
+    product = cls(filename, mode='r', start=0, stop=None, dist_axis=dist_axis, use_hints=True, comm=mpiutil.world)
+    product.load_all()
+    mpiutil.barrier()
+    if mpiutil.rank0:
+        os.remove(filename)
+
+    return True, product
@@ -0,0 +1,59 @@
+"""Unit tests for running a pipeline by groups of processes."""
+
+from tlpipe.pipeline.pipeline import OneAndOne, PipelineStopIteration
+
+
+class _Count(OneAndOne):
+    """Records the inputs it processes."""
+
+    prefix = 'ct_'
+
+    def __init__(self, parameter_file_or_dict=None, feedback=0):
+        super(_Count, self).__init__(parameter_file_or_dict, feedback)
+        self.inputs = []
+
+    def process(self, input):
+        self.inputs.append(input)
+        return input
+
+
+def _run(task, inputs):
+    outputs = []
+    for input in inputs:
+        try:
+            outputs.append(task.next(input))
+        except PipelineStopIteration:
+            break
+    return outputs
+
+
+def test_non_iterable_first_group_only():
+    for group in range(3):
+        task = _Count({ 'ct_in': 'data' })
+        task.set_group(group, 3, None)
+        outputs = _run(task, [ 'merged', 'more' ])
+        if group == 0:
+            assert task.inputs == [ 'merged' ]
+            assert outputs == [ 'merged' ]
+        else:
+            assert task.inputs == []
+            assert outputs == [ None ]
+
+
+def test_iterable_split():
+    done = []
+    for group in range(3):
+        task = _Count({ 'ct_in': 'data', 'ct_iterable': True, 'ct_iter_num': 7 })
+        task.set_group(group, 3, None)
+        iterations = []
+        for input in [ 'day%d' % i for i in range(7) ]:
+            iteration = task.iteration
+            try:
+                task.next(input)
+            except PipelineStopIteration:
+                break
+            iterations.append(iteration)
+        # every group runs its share of the iterations
+        assert iterations == range(group, 7, 3)
+        done += iterations
+    assert sorted(done) == range(7)
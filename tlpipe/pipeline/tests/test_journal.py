@@ -0,0 +1,46 @@
+"""Unit tests for the checkpoint journal."""
+
+import os
+from caput import mpiutil
+from tlpipe.pipeline.journal import Journal
+
+
+def test_write_last(tmpdir):
+    # the journal is written by rank 0 for all procs
+    filename = mpiutil.bcast(str(tmpdir.join('journal.jsonl')))
+    journal = Journal(filename)
+    assert journal.last() is None
+
+    journal.write({'0_ts_': {'iteration': 1}})
+    journal.write({'0_ts_': {'iteration': 2}})
+
+    journal = Journal(filename)
+    assert journal.last() == {'0_ts_': {'iteration': 2}}
+    assert journal.seq == 2
+
+
+def test_truncated_line(tmpdir):
+    # the journal is written by rank 0 for all procs
+    filename = mpiutil.bcast(str(tmpdir.join('journal.jsonl')))
+    journal = Journal(filename)
+    journal.write({'0_ts_': {'iteration': 1}})
+    size = os.path.getsize(filename)
+    # an incomplete line written when crashed
+    if mpiutil.rank0:
+        with open(filename, 'a') as f:
+            f.write('{"seq": 2, "tasks": {"0_ts_"')
+    mpiutil.barrier()
+
+    journal = Journal(filename)
+    assert journal.last() == {'0_ts_': {'iteration': 1}}
+
+    # the incomplete line is cut off before the next checkpoint
+    journal.write({'0_ts_': {'iteration': 2}})
+    with open(filename, 'r') as f:
+        lines = f.readlines()
+    assert len(lines) == 2
+    assert os.path.getsize(filename) > size
+
+    journal = Journal(filename)
+    assert journal.last() == {'0_ts_': {'iteration': 2}}
+    assert journal.seq == 2
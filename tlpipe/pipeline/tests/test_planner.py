@@ -0,0 +1,161 @@
+"""Unit tests for the resource planner."""
+
+import pytest
+from tlpipe.pipeline import planner
+from tlpipe.pipeline.planner import ProductShape, Stage
+from tlpipe.pipeline.pipeline import OneAndOne
+
+
+def _shape(dist_axis=0):
+    shape = ProductShape('Timestream', ('time', 'frequency', 'polarization', 'baseline'),
+                         {'time': 100, 'frequency': 64, 'polarization': 4, 'baseline': 30}, dist_axis)
+    shape.add_dataset('vis', ('time', 'frequency', 'polarization', 'baseline'), 8)
+    # bit-packed
+    shape.add_dataset('vis_mask', ('time', 'frequency', 'polarization', 'baseline'), 1.0/8)
+    shape.add_dataset('freq', ('frequency',), 8)
+    return shape
+
+
+def test_product_shape():
+    shape = _shape()
+    assert shape.main_nbytes == 100*64*4*30*8
+    assert shape.dataset_nbytes('vis_mask') == 100*64*4*30/8
+    assert shape.nbytes == shape.main_nbytes + shape.dataset_nbytes('vis_mask') + 64*8
+    assert shape.distributed('vis') and not shape.distributed('freq')
+    # the first processes hold one more time point
+    assert shape.local_nbytes(3, [ 'vis' ]) == 34*64*4*30*8
+    assert shape.local_nbytes(3, [ 'freq' ]) == 64*8
+
+    cp = shape.copy()
+    cp.resize('frequency', 32)
+    cp.remove_dataset('freq')
+    assert shape.dataset_shape('vis') == (100, 64, 4, 30)
+    assert cp.dataset_shape('vis') == (100, 32, 4, 30)
+    assert 'freq' in shape.datasets and not 'freq' in cp.datasets
+
+
+def test_redistribute():
+    shape = _shape()
+    assert shape.redistribute('time', 4) == 0
+    # all-to-all exchange of the datasets along both axes
+    moved = shape.redistribute('baseline', 4)
+    assert moved == (shape.main_nbytes + shape.dataset_nbytes('vis_mask')) * 3 / 4
+    assert shape.dist_axis_name == 'baseline'
+    # a single process moves nothing
+    assert shape.redistribute(0, 1) == 0
+    assert shape.dist_axis_name == 'time'
+
+
+def test_stage():
+    shape = _shape()
+    stage = Stage('task', 4)
+    stage.read(shape)
+    assert stage.read_bytes == shape.nbytes
+    local = shape.local_nbytes(4)
+    assert stage.peak_bytes == local
+
+    # redistributing by slabs only needs a buffer of the slab size
+    stage.redistribute(shape, 'baseline', slab_size=1000)
+    assert stage.peak_bytes == local + 1000
+    assert stage.redistribute_bytes > 0
+    # or a buffer of the local data
+    local_bl = shape.local_nbytes(4)
+    stage.redistribute(shape, 'time')
+    assert stage.peak_bytes == local + max(1000, local_bl)
+
+    stage.write(shape)
+    assert stage.write_bytes == shape.nbytes
+
+    # idle processes
+    stage = Stage('task', 64)
+    stage.read(_shape(2))
+    assert len(stage.notes) == 1
+
+
+class _Read(OneAndOne):
+    """Reads the data of _shape."""
+
+    params_init = {
+                    'dist_axis': 0,
+                  }
+
+    prefix = 'rd_'
+
+    def plan_read(self, stage):
+        dist_axis = self.params['dist_axis'] if stage.dist_axis is None else stage.dist_axis
+        shape = _shape()
+        shape.dist_axis = shape.axis_index(dist_axis)
+        stage.read(shape)
+        return shape
+
+
+class _Rebin(OneAndOne):
+    """Halves the frequency channels of the data distributed along baseline."""
+
+    prefix = 'rb_'
+
+    def plan_process(self, stage, input):
+        stage.redistribute(input, 'baseline')
+        output = input.copy()
+        output.resize('frequency', input.lengths['frequency'] / 2)
+        stage.hold(output.local_nbytes(stage.nproc))
+        return output
+
+
+@pytest.fixture
+def outdir(tmpdir, monkeypatch):
+    monkeypatch.setenv('TL_OUTPUT', str(tmpdir) + '/')
+
+
+def _tasks(dist_axis=0):
+    params = {
+               'rd_input_files': [ 'data.hdf5' ],
+               'rd_out': 'raw',
+               'rd_iterable': True,
+               'rd_iter_num': 5,
+               'rd_dist_axis': dist_axis,
+               'rb_in': 'raw',
+               'rb_out': 'rebinned',
+               'rb_iterable': True,
+               'rb_iter_num': 5,
+               'rb_output_files': [ 'rebinned.hdf5' ],
+             }
+    return [ _Read(params, feedback=0), _Rebin(params, feedback=0) ]
+
+
+def test_plan_tasks(outdir):
+    tasks = _tasks()
+    plan = planner.plan_tasks(tasks, 4)
+    assert plan.niter == 5
+    (read, nread, read_live), (rebin, nrebin, rebin_live) = plan.stages
+    assert nread == nrebin == 5
+    assert read_live == rebin_live == 0
+
+    shape = _shape()
+    assert plan.read_bytes == 5 * shape.nbytes
+    shape.resize('frequency', 32)
+    assert plan.write_bytes == 5 * shape.nbytes
+    assert plan.redistribute_bytes > 0
+    assert plan.peak_bytes == rebin.peak_bytes
+    assert rebin.output.lengths['frequency'] == 32
+    assert 'total' in plan.report()
+
+
+def test_recommend(outdir):
+    plan, best_axis, plans_by_axis, fit_nproc = planner.recommend(_tasks(), 4, mem_per_proc=None)
+    # reading the data distributed along baseline needs no redistribution
+    assert best_axis == 'baseline'
+    assert plans_by_axis['baseline'].redistribute_bytes == 0
+    assert plans_by_axis['time'].redistribute_bytes == plan.redistribute_bytes
+    assert fit_nproc is None
+
+    peak = planner.plan_tasks(_tasks(), 8, dist_axis='baseline').peak_bytes
+    plan, best_axis, plans_by_axis, fit_nproc = planner.recommend(_tasks(), 4, mem_per_proc=peak)
+    assert fit_nproc is not None and fit_nproc <= 8
+    assert planner.plan_tasks(_tasks(), fit_nproc, dist_axis='baseline').peak_bytes <= peak
+
+
+def test_format_bytes():
+    assert planner.format_bytes(100) == '100.0B'
+    assert planner.format_bytes(3 * 2**20) == '3.0MB'
+    assert planner.format_bytes(2**42) == '4.0TB'
@@ -0,0 +1,130 @@
+"""Unit tests for the bounded queues of data products.
+
+The tests run in a single process, or by several processes with e.g.::
+
+    $ mpirun -np 2 python -m pytest test_product_queue.py
+
+"""
+
+import os
+import numpy as np
+import h5py
+from caput import mpiutil
+from tlpipe.pipeline.product_queue import ProductQueue
+
+
+class _Product(object):
+    """A minimal container that can be spilled to files, of 100 bytes."""
+
+    def __init__(self, files=None, mode='r', start=0, stop=None, dist_axis=0, use_hints=True, comm=None):
+        self.infiles_mode = mode
+        self.main_data_dist_axis = dist_axis
+        self.comm = comm
+        self.data = np.zeros(100, dtype=np.uint8)
+        if files is not None:
+            with h5py.File(files, 'r') as f:
+                self.data = f['data'][:]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def to_files(self, filename, check_status=True):
+        if mpiutil.rank0:
+            with h5py.File(filename, 'w') as f:
+                f['data'] = self.data
+        mpiutil.barrier(comm=self.comm)
+
+    def load_all(self):
+        pass
+
+
+def _products(n):
+    products = []
+    for i in range(n):
+        product = _Product(mode='r+', dist_axis=1, comm=mpiutil.world)
+        product.data[:] = i
+        products.append(product)
+    return products
+
+
+def test_block():
+    queue = ProductQueue(250, 'block')
+    a, b, c = _products(3)
+    queue.put(a)
+    queue.put(b)
+    assert not queue.full()
+    queue.put(c)
+    assert queue.full()
+    assert queue.nbytes == 300
+
+    assert queue.get() is a
+    assert not queue.full()
+    assert queue.get() is b
+    assert queue.get() is c
+    assert queue.empty() and queue.nbytes == 0
+
+
+def test_unbounded():
+    queue = ProductQueue(None, 'block')
+    for product in _products(3):
+        queue.put(product)
+    assert not queue.full()
+    assert queue.nbytes == 0
+
+
+def test_spill_keeps_next(tmpdir):
+    queue = ProductQueue(50, 'spill', scratch_dir=mpiutil.bcast(str(tmpdir)))
+    # larger than the capacity, but taken out next, so not spilled
+    a, = _products(1)
+    queue.put(a)
+    assert queue._tmpdir is None
+    assert queue.nbytes == 100
+    assert queue.get() is a
+    queue.close()
+
+
+def test_spill(tmpdir):
+    scratch_dir = mpiutil.bcast(str(tmpdir))
+    queue = ProductQueue(250, 'spill', scratch_dir=scratch_dir)
+    products = _products(4)
+    for product in products:
+        queue.put(product)
+    assert not queue.full()
+    # the newest products are spilled first
+    assert queue.nbytes == 200
+    assert [ nbytes for item, nbytes in queue._items ] == [ 100, 100, 0, 0 ]
+
+    # drop the references, so the spilled products are reloaded
+    a, b = products[:2]
+    del products, product
+    assert queue.get() is a
+    assert queue.get() is b
+    for val in (2, 3):
+        product = queue.get()
+        assert isinstance(product, _Product)
+        assert (product.data == val).all()
+        # states not saved to the files
+        assert product.infiles_mode == 'r+'
+        assert product.main_data_dist_axis == 1
+    assert queue.empty() and queue.nbytes == 0
+    mpiutil.barrier()
+    assert os.listdir(queue._tmpdir) == []
+    mpiutil.barrier()
+
+    queue.close()
+    mpiutil.barrier()
+    assert os.listdir(scratch_dir) == []
+
+
+def test_spill_alive(tmpdir):
+    queue = ProductQueue(150, 'spill', scratch_dir=mpiutil.bcast(str(tmpdir)))
+    a, b = _products(2)
+    queue.put(a)
+    queue.put(b)
+    assert queue.nbytes == 100
+    # b is still referenced here, so it is taken out instead of reloading
+    b.data[:] = 7
+    assert queue.get() is a
+    assert queue.get() is b
+    queue.close()
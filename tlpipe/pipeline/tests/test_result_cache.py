@@ -0,0 +1,146 @@
+"""Unit tests for the result cache of pipeline tasks."""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import pytest
+from caput import mpiutil
+from tlpipe.pipeline import result_cache
+from tlpipe.pipeline.pipeline import OneAndOne
+
+
+class _Data(object):
+    # a product that can be weakly referenced
+    def __init__(self, val):
+        self.val = val
+
+
+class _Double(OneAndOne):
+    """Doubles the input, counting the calls of process."""
+
+    params_init = {
+                    'factor': 2,
+                  }
+
+    prefix = 'db_'
+
+    cacheable = True
+
+    def __init__(self, parameter_file_or_dict=None, feedback=0):
+        super(_Double, self).__init__(parameter_file_or_dict, feedback)
+        self.calls = 0
+
+    def process(self, input):
+        self.calls += 1
+        return _Data(self.params['factor'] * input.val)
+
+    def write_cache(self, output, filenames):
+        np.save(open(filenames[0], 'wb'), output.val)
+
+    def read_output(self, filenames):
+        return _Data(np.load(open(filenames[0], 'rb')))
+
+
+@pytest.fixture
+def cache_dir():
+    # the cache is shared by all procs
+    dirname = mpiutil.bcast(tempfile.mkdtemp() if mpiutil.rank0 else None)
+    yield dirname
+    mpiutil.barrier()
+    if mpiutil.rank0:
+        shutil.rmtree(dirname)
+
+
+def _task(rc, **params):
+    task = _Double(dict([ ('db_' + k, v) for (k, v) in params.items() ]))
+    task.result_cache = rc
+    return task
+
+
+def _run(task, input):
+    cache = task.result_cache
+    task._input_fingerprint = cache.get_fingerprint(input)
+    return task.read_process_write(input)
+
+
+def test_key_stable(cache_dir):
+    cache1 = result_cache.ResultCache(cache_dir)
+    cache2 = result_cache.ResultCache(cache_dir)
+    key1 = cache1.key(_task(cache1), ['in'])
+    assert key1 == cache1.key(_task(cache1), ['in'])
+    assert key1 == cache2.key(_task(cache2), ['in'])
+    # parameters that do not affect the output
+    exclude = _Double.cache_exclude_params
+    key2 = cache1.key(_task(cache1), ['in'], exclude)
+    assert key2 == cache1.key(_task(cache1, copy=True, process_timing=True), ['in'], exclude)
+
+
+def test_key_invalidated(cache_dir):
+    cache = result_cache.ResultCache(cache_dir)
+    key = cache.key(_task(cache), ['in'])
+    assert key != cache.key(_task(cache, factor=3), ['in'])
+    assert key != cache.key(_task(cache), ['other'])
+    assert cache.key(_task(cache), ['in', None]) is None
+
+
+def test_source_hash(cache_dir):
+    # a source tree of each proc
+    root = os.path.join(cache_dir, 'pkg%d' % mpiutil.rank)
+    os.makedirs(os.path.join(root, 'sub'))
+    for fn in [ 'a.py', 'sub/b.pyx', 'sub/c.txt' ]:
+        with open(os.path.join(root, fn), 'w') as f:
+            f.write('x = 1\n')
+    h = result_cache._tree_hash(root)
+    assert h == result_cache._tree_hash(root)
+    # changes to other files are ignored
+    with open(os.path.join(root, 'sub/c.txt'), 'w') as f:
+        f.write('x = 2\n')
+    assert h == result_cache._tree_hash(root)
+    # any change to a source file in the tree
+    with open(os.path.join(root, 'sub/b.pyx'), 'w') as f:
+        f.write('x = 2\n')
+    assert h != result_cache._tree_hash(root)
+
+    # a task depends on the whole tlpipe tree
+    cls_hash = result_cache._source_hash(_Double)
+    assert cls_hash == result_cache._source_hash(_Double)
+    result_cache._tree_hashes[result_cache._tree_hashes.keys()[0]] = h
+    try:
+        assert cls_hash != result_cache._source_hash(_Double)
+    finally:
+        result_cache._tree_hashes.clear()
+    assert cls_hash == result_cache._source_hash(_Double)
+
+
+def test_miss_then_hit(cache_dir):
+    cache = result_cache.ResultCache(cache_dir)
+    input = _Data(np.arange(4))
+    cache.set_fingerprint(input, 'in')
+
+    # miss: computed and stored
+    task = _task(cache)
+    out = _run(task, input)
+    assert task.calls == 1
+    assert np.all(out.val == 2 * np.arange(4))
+    key = cache.key(task, ['in'], task.cache_exclude_params)
+    assert cache.contains(key)
+    assert os.path.exists(cache.files(key)[0])
+    assert cache.get_fingerprint(out) == key
+
+    # hit: loaded from the cache by a new task
+    task = _task(cache)
+    out = _run(task, input)
+    assert task.calls == 0
+    assert np.all(out.val == 2 * np.arange(4))
+
+    # miss again when a parameter changes
+    task = _task(cache, factor=3)
+    out = _run(task, input)
+    assert task.calls == 1
+    assert np.all(out.val == 3 * np.arange(4))
+
+    # not cached at all if the task opts out
+    task = _task(cache, cache=False, factor=4)
+    _run(task, input)
+    assert not cache.contains(cache.key(task, ['in'], task.cache_exclude_params))
@@ -0,0 +1,151 @@
+"""Unit tests for running independent branches of a pipeline concurrently.
+
+The tests of handing over products need several MPI processes, run them by,
+e.g., ``mpirun -np 3 python -m pytest test_scheduler.py``.
+"""
+
+import pytest
+from caput import mpiutil
+from tlpipe.pipeline import scheduler
+
+comm = mpiutil.world
+
+mpi = pytest.mark.skipif(comm is None or comm.size == 1, reason='needs several MPI processes')
+
+
+def _keys(*tasks):
+    # (in, out) of each task to (requires, in, out)
+    return [ ([], in_, out) for (in_, out) in tasks ]
+
+
+def test_independent_chains():
+    keys = _keys(([], ['a']), (['a'], ['a2']), ([], ['b']), (['b'], []))
+    brs = scheduler.branches(keys)
+    assert brs == [ [0, 1], [2, 3] ]
+    assert scheduler.handoffs(keys, brs) == []
+
+
+def test_fan_out_split():
+    # reader -> x -> (cal -> cal_out -> plot), (flag -> map)
+    keys = _keys(([], ['x']), (['x'], ['cal_out']), (['cal_out'], []), (['x'], ['flagged']), (['flagged'], []))
+    brs = scheduler.branches(keys)
+    assert brs == [ [0, 1, 2], [3, 4] ]
+    assert scheduler.handoffs(keys, brs) == [ ('x', 0, 1, 1) ]
+
+    # three consumers of the same product
+    keys = _keys(([], ['x']), (['x'], []), (['x'], []), (['x'], []))
+    brs = scheduler.branches(keys)
+    assert brs == [ [0, 1], [2], [3] ]
+    assert scheduler.handoffs(keys, brs) == [ ('x', 0, 1, 1), ('x', 0, 2, 1) ]
+
+
+def test_fan_out_joined():
+    # the consumers of x are linked by another product, so not split
+    keys = _keys(([], ['x']), (['x'], ['y']), (['x', 'y'], []))
+    brs = scheduler.branches(keys)
+    assert brs == [ [0, 1, 2] ]
+    assert scheduler.handoffs(keys, brs) == []
+
+
+def test_branch_root():
+    for size in range(1, 9):
+        for nbranches in range(1, 6):
+            colors = []
+            for rank in range(size):
+                if size <= nbranches:
+                    colors.append(rank)
+                else:
+                    quot, rem = divmod(size, nbranches)
+                    colors.append(rank / (quot + 1) if rank < rem * (quot + 1) else rem + (rank - rem * (quot + 1)) / quot)
+            for bi in range(nbranches):
+                root = scheduler.branch_root(bi, nbranches, size)
+                color = bi % size if size <= nbranches else bi
+                assert root == colors.index(color)
+
+
+@mpi
+def test_send_recv_object():
+    my_branches, branch_comm = scheduler.split(2, comm)
+    roots = [ scheduler.branch_root(bi, 2, comm.size) for bi in range(2) ]
+    old_world = mpiutil.world
+    try:
+        from tlpipe.pipeline import groups
+        groups.set_world(branch_comm)
+        if 0 in my_branches:
+            reqs = [ scheduler.send_product({'day': i}, None, roots[1], 7, comm) for i in range(3) ]
+            reqs.append(scheduler.send_product(None, None, roots[1], 7, comm))
+            for req in reqs:
+                if req is not None:
+                    req.wait()
+        else:
+            products = []
+            while True:
+                received, product = scheduler.recv_product(roots[0], 7, comm)
+                if not received:
+                    continue
+                if product is None:
+                    break
+                products.append(product)
+            assert products == [ {'day': i} for i in range(3) ]
+    finally:
+        groups.set_world(old_world)
+        branch_comm.Free()
+
+
+class _Days(object):
+    # tasks of the test pipeline, defined lazily as pipeline is only
+    # imported by the tests of it
+    received = {}
+
+    @classmethod
+    def tasks(cls):
+        from tlpipe.pipeline.pipeline import OneAndOne
+
+        class Produce(OneAndOne):
+            params_init = { 'ndays': 3 }
+            prefix = 'pd_'
+            def process(self):
+                return { 'day': self.iteration, 'nproc': mpiutil.size }
+
+        class Consume(OneAndOne):
+            prefix = 'cs_'
+            def process(self, input):
+                cls.received.setdefault(self.prefix, []).append((input['day'], mpiutil.size))
+                input['day'] = None # changes do not show in other branches
+                return None
+
+        return Produce, Consume
+
+
+@mpi
+def test_fan_out_pipeline(tmpdir):
+    from tlpipe.pipeline.pipeline import Manager
+
+    Produce, Consume = _Days.tasks()
+    outdir = comm.bcast(str(tmpdir), root=0)
+    params = {
+               'pipe_tasks': [ Produce, (Consume, 'c1_'), (Consume, 'c2_') ],
+               'pipe_outdir': outdir,
+               'pipe_copy': False,
+               'pipe_concurrent_branches': True,
+               'pipe_logging': 'warning',
+               'pd_out': 'x',
+               'pd_iterable': True,
+               'pd_iter_num': 3,
+               'c1_in': 'x',
+               'c1_iterable': True,
+               'c2_in': 'x',
+               'c2_iterable': True,
+             }
+    _Days.received.clear()
+    world = mpiutil.world
+    Manager(params, feedback=0).run()
+    assert mpiutil.world is world
+
+    # each consumer is run by its own branch and gets all products
+    received = comm.allgather(_Days.received)
+    roots = [ scheduler.branch_root(bi, 2, comm.size) for bi in range(2) ] + [ comm.size ]
+    for bi, prefix in enumerate([ 'c1_', 'c2_' ]):
+        ranks = [ rank for (rank, rec) in enumerate(received) if prefix in rec ]
+        assert ranks == range(roots[bi], roots[bi+1])
+        assert received[roots[bi]][prefix] == [ (day, len(ranks)) for day in range(3) ]
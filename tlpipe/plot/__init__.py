@@ -1,3 +0,0 @@
-import matplotlib
-matplotlib.rcParams.update({'figure.max_open_warning': 0})
-matplotlib.use('Agg')
\ No newline at end of file
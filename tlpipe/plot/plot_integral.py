@@ -14,9 +14,7 @@ from tlpipe.timestream import timestream_task
 from tlpipe.container.raw_timestream import RawTimestream
 from tlpipe.container.timestream import Timestream
 from tlpipe.utils.path_util import output_path
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import MaxNLocator, AutoMinorLocator
+from tlpipe.utils.plot_util import setup_matplotlib
 
 
 class Plot(timestream_task.TimestreamTask):
@@ -44,6 +42,8 @@ class Plot(timestream_task.TimestreamTask):
 
     prefix = 'pit_'
 
+    process_dist_axis = 'baseline'
+
     def process(self, ts):
 
         ts.redistribute('baseline')
@@ -62,6 +62,10 @@ class Plot(timestream_task.TimestreamTask):
 
     def plot(self, vis, vis_mask, li, gi, bl, ts, **kwargs):
         """Function that does the actual plot work."""
+        setup_matplotlib()
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+        from matplotlib.ticker import MaxNLocator, AutoMinorLocator
 
         integral = self.params['integral']
         bl_incl = self.params['bl_incl']
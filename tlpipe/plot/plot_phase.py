@@ -10,14 +10,11 @@ Inheritance diagram
 
 from datetime import datetime, timedelta
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline
 from tlpipe.timestream import timestream_task
 from tlpipe.container.raw_timestream import RawTimestream
 from tlpipe.container.timestream import Timestream
 from tlpipe.utils.path_util import output_path
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import MaxNLocator, AutoMinorLocator
+from tlpipe.utils.plot_util import setup_matplotlib
 
 
 class Plot(timestream_task.TimestreamTask):
@@ -50,6 +47,8 @@ class Plot(timestream_task.TimestreamTask):
 
     prefix = 'pph_'
 
+    process_dist_axis = 'baseline'
+
     def process(self, ts):
 
         ts.redistribute('baseline')
@@ -68,6 +67,11 @@ class Plot(timestream_task.TimestreamTask):
 
     def plot(self, vis, vis_mask, li, gi, bl, ts, **kwargs):
         """Function that does the actual plot work."""
+        from scipy.interpolate import InterpolatedUnivariateSpline
+        setup_matplotlib()
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+        from matplotlib.ticker import MaxNLocator, AutoMinorLocator
 
         bl_incl = self.params['bl_incl']
         bl_excl = self.params['bl_excl']
@@ -11,15 +11,12 @@ Inheritance diagram
 # import pytz
 from datetime import datetime, timedelta
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline
 from tlpipe.timestream import timestream_task
 from tlpipe.container.raw_timestream import RawTimestream
 from tlpipe.container.timestream import Timestream
 from tlpipe.utils.path_util import output_path
 from tlpipe.utils import hist_eq
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import MaxNLocator, AutoMinorLocator
+from tlpipe.utils.plot_util import setup_matplotlib
 
 # tz = pytz.timezone('Asia/Shanghai')
 
@@ -56,6 +53,8 @@ class Plot(timestream_task.TimestreamTask):
 
     prefix = 'pwf_'
 
+    process_dist_axis = 'baseline'
+
     def process(self, ts):
 
         ts.redistribute('baseline')
@@ -74,6 +73,11 @@ class Plot(timestream_task.TimestreamTask):
 
     def plot(self, vis, vis_mask, li, gi, bl, ts, **kwargs):
         """Function that does the actual plot work."""
+        from scipy.interpolate import InterpolatedUnivariateSpline
+        setup_matplotlib()
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+        from matplotlib.ticker import MaxNLocator, AutoMinorLocator
 
         bl_incl = self.params['bl_incl']
         bl_excl = self.params['bl_excl']
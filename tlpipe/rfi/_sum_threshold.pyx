@@ -1,6 +1,8 @@
 import numpy as np
 cimport numpy as np
-from cython cimport boundscheck, wraparound
+from cython cimport boundscheck, wraparound, cdivision
+from cython.parallel cimport prange, threadid
+from libc.math cimport fabs
 
 
 @boundscheck(False)
@@ -102,4 +104,172 @@ def vthreshold(float[:, :] vis, np.ndarray[np.uint8_t, cast=True, ndim=2] vis_ma
             top += 1
             bottom += 1
 
-    vis_mask[:] = tmp_mask
\ No newline at end of file
+    vis_mask[:] = tmp_mask
+
+
+@boundscheck(False)
+@wraparound(False)
+cdef void _threshold_len1(float[:, :] vis, unsigned char[:, :] vis_mask, float threshold) nogil:
+    cdef int x, y
+    cdef int height = vis.shape[0], width = vis.shape[1]
+
+    for y in range(height):
+        for x in range(width):
+            if vis_mask[y, x] == 0 and fabs(vis[y, x]) > threshold:
+                vis_mask[y, x] = 1
+
+
+@boundscheck(False)
+@wraparound(False)
+@cdivision(True)
+cdef void _hthreshold(float[:, :] vis, unsigned char[:, :] vis_mask, unsigned char[:, ::1] tmp_mask, int length, float threshold) nogil:
+    cdef int x, y, k
+    cdef int cnt, left, right
+    cdef float sm
+    cdef int height = vis.shape[0], width = vis.shape[1]
+
+    for y in range(height):
+        for x in range(width):
+            tmp_mask[y, x] = vis_mask[y, x]
+
+    for y in range(height):
+
+        # if all have been masked, continue
+        for x in range(width):
+            if vis_mask[y, x] == 0:
+                break
+        else:
+            continue
+
+        sm = 0.0
+        cnt = 0
+        left = 0
+        right = 0
+        for right in range(length-1):
+            if vis_mask[y, right] == 0:
+                sm += vis[y, right]
+                cnt += 1
+
+        while(right < width):
+            # add the sample at the right
+            if vis_mask[y, right] == 0:
+                sm += vis[y, right]
+                cnt += 1
+            # check
+            if (cnt > 0) and (fabs(sm / cnt) > threshold):
+                for k in range(left, min(left+length, width)):
+                    tmp_mask[y, k] = 1
+            # subtract the sample at the left
+            if vis_mask[y, left] == 0:
+                sm -= vis[y, left]
+                cnt -= 1
+
+            left += 1
+            right += 1
+
+    # set to the new mask
+    for y in range(height):
+        for x in range(width):
+            vis_mask[y, x] = tmp_mask[y, x]
+
+
+@boundscheck(False)
+@wraparound(False)
+@cdivision(True)
+cdef void _vthreshold(float[:, :] vis, unsigned char[:, :] vis_mask, unsigned char[:, ::1] tmp_mask, int length, float threshold) nogil:
+    cdef int x, y, k
+    cdef int cnt, top, bottom
+    cdef float sm
+    cdef int height = vis.shape[0], width = vis.shape[1]
+
+    for y in range(height):
+        for x in range(width):
+            tmp_mask[y, x] = vis_mask[y, x]
+
+    for x in range(width):
+
+        # if all have been masked, continue
+        for y in range(height):
+            if vis_mask[y, x] == 0:
+                break
+        else:
+            continue
+
+        sm = 0.0
+        cnt = 0
+        top = 0
+        bottom = 0
+        for bottom in range(length-1):
+            if vis_mask[bottom, x] == 0:
+                sm += vis[bottom, x]
+                cnt += 1
+
+        while(bottom < height):
+            # add the sample at the bottom
+            if vis_mask[bottom, x] == 0:
+                sm += vis[bottom, x]
+                cnt += 1
+            # check
+            if (cnt > 0) and (fabs(sm / cnt) > threshold):
+                for k in range(top, min(top+length, height)):
+                    tmp_mask[k, x] = 1
+            # subtract the sample at the top
+            if vis_mask[top, x] == 0:
+                sm -= vis[top, x]
+                cnt -= 1
+
+            top += 1
+            bottom += 1
+
+    # set to the new mask
+    for y in range(height):
+        for x in range(width):
+            vis_mask[y, x] = tmp_mask[y, x]
+
+
+@boundscheck(False)
+@wraparound(False)
+def sum_threshold(float[:, :, :] vis, np.ndarray vis_mask, int[:] lengths, float[:, :] thresholds, bint vertical, int num_threads=1):
+    """Run the SumThreshold of all window lengths on a stack of 2D arrays.
+
+    The arrays are thresholded in parallel by `num_threads` threads without
+    holding the GIL, each one with all window `lengths` in turn, the same as
+    :func:`threshold_len1` for length 1 and :func:`vthreshold` (if
+    `vertical`) or :func:`hthreshold` for the others.
+
+    Parameters
+    ----------
+    vis : float32 array of shape (n, height, width)
+        The stack of arrays.
+    vis_mask : bool array of shape (n, height, width)
+        Mask of `vis`, which is updated in place.
+    lengths : int32 array of shape (m,)
+        Window lengths, those larger than the thresholded axis are skipped.
+    thresholds : float32 array of shape (n, m)
+        Threshold of each array and each length.
+    vertical : bool
+        Threshold along the height (time) axis if True, else along the width
+        (frequency) axis.
+    num_threads : integer, optional
+        Number of threads. Default 1.
+
+    """
+    cdef int n = vis.shape[0], height = vis.shape[1], width = vis.shape[2]
+    cdef int m = lengths.shape[0]
+    cdef int i, j, length, size
+    cdef unsigned char[:, :, :] mask = vis_mask.view(np.uint8)
+    # scratch mask of each thread, reused for all arrays it thresholds
+    cdef unsigned char[:, :, ::1] tmp_masks = np.empty((max(1, num_threads), height, width), dtype=np.uint8)
+
+    size = height if vertical else width
+    for i in prange(n, nogil=True, num_threads=max(1, num_threads), schedule='dynamic'):
+        for j in range(m):
+            length = lengths[j]
+            if length > size:
+                continue
+            if length == 1:
+                _threshold_len1(vis[i], mask[i], thresholds[i, j])
+            elif vertical:
+                _vthreshold(vis[i], mask[i], tmp_masks[threadid()], length, thresholds[i, j])
+            else:
+                _hthreshold(vis[i], mask[i], tmp_masks[threadid()], length, thresholds[i, j])
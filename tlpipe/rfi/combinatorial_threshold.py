@@ -29,7 +29,7 @@ class CombinatorialThreshold(object):
     def __init__(self, time_freq_vis, time_freq_vis_mask=None, first_threshold=6.0, exp_factor=1.5, distribution='Rayleigh', max_threshold_length=1024):
 
         self.vis = time_freq_vis
-        nt, nf = self.vis.shape
+        nt, nf = self.vis.shape[-2:]
 
         if time_freq_vis_mask is None:
             self.vis_mask = np.where(np.isfinite(self.vis), False, True)
@@ -71,16 +71,29 @@ class CombinatorialThreshold(object):
         """Abstract method that needs to be implemented by sub-classes."""
         return
 
-    def execute(self, sensitivity=1.0, direction=('time', 'freq')):
-        """Execute the thresholding method."""
-
+    def _factor(self, vis, vis_mask, sensitivity):
+        ### the factor of the thresholds of the data `vis`
         if self.distribution == 'Gaussian':
-            mean, std = winsorized_mean_and_std(np.ma.array(self.vis, mask=self.vis_mask))
+            mean, std = winsorized_mean_and_std(np.ma.array(vis, mask=vis_mask))
             factor = sensitivity if std == 0.0 else std * sensitivity
         elif self.distribution == 'Rayleigh':
-            mode = winsorized_mode(np.ma.array(self.vis, mask=self.vis_mask))
+            mode = winsorized_mode(np.ma.array(vis, mask=vis_mask))
             factor = sensitivity if mode == 0.0 else mode * sensitivity
         else:
             factor = sensitivity
 
+        return factor
+
+    def execute(self, sensitivity=1.0, direction=('time', 'freq')):
+        """Execute the thresholding method.
+
+        If the data is a stack of (time, freq) arrays, the thresholds of each
+        of them are scaled by its own statistics.
+        """
+
+        if self.vis.ndim == 3:
+            factor = np.array([ self._factor(vis, vis_mask, sensitivity) for (vis, vis_mask) in zip(self.vis, self.vis_mask) ])
+        else:
+            factor = self._factor(self.vis, self.vis_mask, sensitivity)
+
         self.execute_threshold(factor, direction)
\ No newline at end of file
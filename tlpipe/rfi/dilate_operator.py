@@ -51,7 +51,7 @@ def horizontal_dilate(mask, size, overwrite=True):
     return mask1
 
 
-def vertical_dilate(mask, eta, overwrite=True):
+def vertical_dilate(mask, size, overwrite=True):
 
     height, width = mask.shape
 
@@ -10,7 +10,6 @@ Inheritance diagram
 
 import surface_fit
 import numpy as np
-import scipy.ndimage as ndimage
 
 
 class GaussianFilter(surface_fit.SurfaceFitMethod):
@@ -32,6 +31,7 @@ class GaussianFilter(surface_fit.SurfaceFitMethod):
 
     def fit(self):
         """Fit the background."""
+        import scipy.ndimage as ndimage
 
         vis = np.where(self.vis_mask, self._fill_val, self.vis) # fill masked vals
         ndimage.gaussian_filter(vis, sigma=(self._vksize, self._hksize), order=0, output=self._background)
@@ -10,7 +10,6 @@ Inheritance diagram
 
 import surface_fit
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline
 
 
 class Interpolate(surface_fit.SurfaceFitMethod):
@@ -48,6 +47,7 @@ class Interpolate(surface_fit.SurfaceFitMethod):
 
 
     def interpolate_horizontally(self):
+        from scipy.interpolate import InterpolatedUnivariateSpline
 
         height, width = self.vis.shape
 
@@ -66,6 +66,7 @@ class Interpolate(surface_fit.SurfaceFitMethod):
 
 
     def interpolate_vertically(self):
+        from scipy.interpolate import InterpolatedUnivariateSpline
 
         height, width = self.vis.shape
 
@@ -0,0 +1,246 @@
+"""RFI flagging strategies.
+
+A strategy is a declarative chain of RFI flagging steps, in the spirit of the
+strategies of AOFlagger, which is run on the data of a baseline in a single
+pass, instead of passing all the data through each flagging method in turn.
+
+A strategy is a list of steps, each one is a tuple ``(name, kwargs)`` (or
+just a name if it has no arguments). A step works on the amplitude `image`
+of each polarization of the data, its fitted `background` and its `mask`:
+
+* ``'interpolate'``, ``'gaussian_filter'``, ``'local_average_fit'``,
+  ``'local_median_fit'``, ``'local_minimum_fit'``: fit the background by the
+  surface fitting method of the same name. The argument `input` is either
+  ``'image'`` (default) or ``'background'`` to fit the previous background
+  again, and `masked` (default True) is whether to use the mask in the fit,
+  other arguments are passed to the method;
+* ``'subtract'``: subtract the background from the image;
+* ``'sum_threshold'``: flag the image by the SumThreshold method, the
+  arguments `sensitivity` and `direction` are passed to its `execute`, other
+  arguments to the method. The images of all polarizations are flagged by a
+  single call of it;
+* ``'dilate'``: dilate the mask by `time_size` and `freq_size` points;
+* ``'sir'``: apply the SIR operator with the aggressiveness `eta` along
+  time (except for the noise source on points) and frequency;
+* ``'combine'``: flag a point in all polarizations if it is flagged in any
+  of them;
+* ``'iterate'``: run the sub-steps `steps` for `count` times.
+
+Steps of a polarization are skipped once all of its points have been flagged.
+
+Examples
+--------
+The flagging done by :class:`tlpipe.timestream.rfi_flagging.Flag` with its
+default parameters, followed by combining the masks and the SIR operator:
+
+>>> strategy = [ ('interpolate', {}),
+...              ('gaussian_filter', {'input': 'background', 'masked': False, 'time_kernal_size': 1.0, 'freq_kernal_size': 3.0}),
+...              ('subtract', {}),
+...              ('sum_threshold', {'max_threshold_length': 1}),
+...              ('iterate', {'count': 2, 'steps': [ ('gaussian_filter', {'time_kernal_size': 1.0, 'freq_kernal_size': 3.0}),
+...                                                  ('subtract', {}),
+...                                                  ('sum_threshold', {}) ]}),
+...              ('combine', {}),
+...              ('sir', {'eta': 0.2}) ]
+
+"""
+
+import threading
+import numpy as np
+import interpolate
+import gaussian_filter
+import local_average_fit
+import local_median_fit
+import local_minimum_fit
+import sum_threshold
+import dilate_operator
+import sir_operator
+
+
+# surface fitting methods usable as steps
+_fit_methods = {
+                 'interpolate': interpolate.Interpolate,
+                 'gaussian_filter': gaussian_filter.GaussianFilter,
+                 'local_average_fit': local_average_fit.LocalAverageFit,
+                 'local_median_fit': local_median_fit.LocalMedianFit,
+                 'local_minimum_fit': local_minimum_fit.LocalMinimumFit,
+               }
+
+_steps = tuple(_fit_methods.keys()) + ('subtract', 'sum_threshold', 'dilate', 'sir', 'combine', 'iterate')
+
+
+class ScratchPool(object):
+    """Arrays reused to hold intermediate results of each baseline.
+
+    Arrays are kept per thread, so a pool can be shared by threads that run
+    strategies in parallel.
+
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, name, shape, dtype):
+        """Return the array `name` of the calling thread, its contents are undefined."""
+        arrays = getattr(self._local, 'arrays', None)
+        if arrays is None:
+            arrays = self._local.arrays = {}
+        arr = arrays.get(name)
+        if arr is None or arr.shape != tuple(shape) or arr.dtype != np.dtype(dtype):
+            arr = arrays[name] = np.empty(shape, dtype=dtype)
+
+        return arr
+
+
+class _Context(object):
+    ### the data of a polarization a strategy works on
+
+    def __init__(self, image, mask):
+        self.image = image
+        self.background = None
+        self.mask = mask
+
+
+def _normalize(steps):
+    ### return steps as a list of (name, kwargs), check their names
+    result = []
+    for step in steps:
+        if isinstance(step, basestring):
+            name, kwargs = step, {}
+        else:
+            name, kwargs = step
+            kwargs = dict(kwargs)
+        if not name in _steps:
+            raise ValueError('Unknown RFI flagging step %s' % name)
+        if name == 'iterate':
+            kwargs['steps'] = _normalize(kwargs.get('steps', []))
+        result.append((name, kwargs))
+
+    return result
+
+
+class Strategy(object):
+    """An RFI flagging strategy.
+
+    Parameters
+    ----------
+    steps : list
+        Steps of the strategy, see the module docstring.
+
+    """
+
+    def __init__(self, steps):
+        self.steps = _normalize(steps)
+        self.pool = ScratchPool()
+
+    def run(self, vis, vis_mask, ns_on=None):
+        """Flag the data of a baseline.
+
+        Parameters
+        ----------
+        vis : np.ndarray
+            Data of a baseline, either of shape (time, freq) or (time, freq,
+            pol).
+        vis_mask : np.ndarray
+            Mask of `vis`, which is updated in place.
+        ns_on : None or np.ndarray, optional
+            Boolean array along time of the noise source on points, which are
+            not taken into account by the SIR operator along time. Default
+            None.
+
+        """
+        if vis.ndim == 2:
+            vis = vis[:, :, np.newaxis]
+            vis_mask = vis_mask[:, :, np.newaxis]
+        elif vis.ndim != 3:
+            raise ValueError('Invalid shape of vis: %s' % (vis.shape,))
+
+        # the data of all polarizations are stacked as (pol, time, freq)
+        shp = (vis.shape[2],) + vis.shape[:2]
+        rtype = np.abs(vis[:1, :1, 0]).dtype
+        images = self.pool.get('image', shp, rtype)
+        masks = self.pool.get('mask', shp, np.bool)
+        ctxs = []
+        for pi in xrange(vis.shape[2]):
+            # operate only on the amplitude
+            np.abs(vis[:, :, pi], out=images[pi])
+            masks[pi] = vis_mask[:, :, pi]
+            ctxs.append(_Context(images[pi], masks[pi]))
+
+        self._run_steps(self.steps, ctxs, (images, masks), ns_on)
+
+        for pi, ctx in enumerate(ctxs):
+            vis_mask[:, :, pi] = ctx.mask
+
+    def _run_steps(self, steps, ctxs, stack, ns_on):
+        ### run `steps` on the data of all polarizations `ctxs`, whose images
+        ### and masks are views of the arrays in `stack`
+        for name, kwargs in steps:
+            if name == 'iterate':
+                for cnt in xrange(int(kwargs.get('count', 1))):
+                    self._run_steps(kwargs['steps'], ctxs, stack, ns_on)
+            elif name == 'sum_threshold':
+                self._sum_threshold(kwargs, ctxs, stack)
+            elif name == 'combine':
+                combined = np.any([ ctx.mask for ctx in ctxs ], axis=0)
+                for ctx in ctxs:
+                    ctx.mask[:] = combined
+            else:
+                for ctx in ctxs:
+                    # no need to flag again if all have been masked
+                    if ctx.mask.all():
+                        continue
+                    if name in _fit_methods:
+                        self._fit(name, kwargs, ctx, ns_on)
+                    else:
+                        getattr(self, '_' + name)(kwargs, ctx, ns_on)
+
+    def _fit(self, name, kwargs, ctx, ns_on):
+        ### fit the background by a surface fitting method
+        kwargs = dict(kwargs)
+        src = ctx.background if kwargs.pop('input', 'image') == 'background' and ctx.background is not None else ctx.image
+        mask = ctx.mask if kwargs.pop('masked', True) else None
+        ctx.background = _fit_methods[name](src, mask, **kwargs).fit()
+
+    def _subtract(self, kwargs, ctx, ns_on):
+        ### subtract the background from the image
+        if ctx.background is not None:
+            np.subtract(ctx.image, ctx.background, out=ctx.image)
+            ctx.background = None
+
+    def _sum_threshold(self, kwargs, ctxs, stack):
+        ### flag the images of all polarizations by the SumThreshold method
+        # no need to flag again those that have been all masked
+        live = [ pi for pi, ctx in enumerate(ctxs) if not ctx.mask.all() ]
+        if len(live) == 0:
+            return
+        images, masks = stack
+        if len(live) < len(ctxs):
+            images, masks = images[live], masks[live]
+
+        kwargs = dict(kwargs)
+        sensitivity = kwargs.pop('sensitivity', 1.0)
+        direction = kwargs.pop('direction', ('time', 'freq'))
+        st = sum_threshold.SumThreshold(images, masks, **kwargs)
+        st.execute(sensitivity, direction)
+        for li, pi in enumerate(live):
+            ctxs[pi].mask[:] = st.vis_mask[li]
+
+    def _dilate(self, kwargs, ctx, ns_on):
+        ### dilate the mask along time and frequency
+        time_size = int(kwargs.get('time_size', 0))
+        freq_size = int(kwargs.get('freq_size', 0))
+        if time_size > 0:
+            dilate_operator.vertical_dilate(ctx.mask, time_size)
+        if freq_size > 0:
+            dilate_operator.horizontal_dilate(ctx.mask, freq_size)
+
+    def _sir(self, kwargs, ctx, ns_on):
+        ### apply the SIR operator along time and frequency
+        eta = kwargs.get('eta', 0.2)
+        if ns_on is not None:
+            ctx.mask[ns_on] = False
+        sir_operator.vertical_sir(ctx.mask, eta)
+        if ns_on is not None:
+            ctx.mask[ns_on] = True
+        sir_operator.horizontal_sir(ctx.mask, eta)
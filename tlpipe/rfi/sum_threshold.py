@@ -11,7 +11,7 @@ Inheritance diagram
 import warnings
 import numpy as np
 import combinatorial_threshold
-from _sum_threshold import threshold_len1, hthreshold, vthreshold
+from _sum_threshold import threshold_len1, hthreshold, vthreshold, sum_threshold
 
 
 class SumThreshold(combinatorial_threshold.CombinatorialThreshold):
@@ -20,13 +20,18 @@ class SumThreshold(combinatorial_threshold.CombinatorialThreshold):
     For more details, see Offringa et al., 2000, MNRAS, 405, 155,
     *Post-correlation radio frequency interference classification methods*.
 
+    The data can also be a stack of (time, freq) arrays of shape (n, time,
+    freq), e.g., of several baselines, they are thresholded by
+    `num_threads` threads in parallel.
+
     """
 
-    def __init__(self, time_freq_vis, time_freq_vis_mask=None, first_threshold=6.0, exp_factor=1.5, distribution='Rayleigh', max_threshold_length=1024, min_connected=1):
+    def __init__(self, time_freq_vis, time_freq_vis_mask=None, first_threshold=6.0, exp_factor=1.5, distribution='Rayleigh', max_threshold_length=1024, min_connected=1, num_threads=1):
 
         super(SumThreshold, self).__init__(time_freq_vis, time_freq_vis_mask, first_threshold, exp_factor, distribution, max_threshold_length)
 
         self.min_connected = max(1, int(min_connected))
+        self.num_threads = max(1, int(num_threads))
 
 
     def horizontal_sum_threshold(self, length, threshold):
@@ -54,13 +59,20 @@ class SumThreshold(combinatorial_threshold.CombinatorialThreshold):
             vthreshold(self.vis, self.vis_mask, height, width, length, threshold)
 
     def execute_threshold(self, factor, direction):
+        # all arrays and all lengths of a direction are thresholded by a single call
+        if self.vis.ndim == 2:
+            vis, vis_mask = self.vis[np.newaxis], self.vis_mask[np.newaxis]
+        else:
+            vis, vis_mask = self.vis, self.vis_mask
+        factor = factor * np.ones(vis.shape[0])
+
         for direct in direction:
             if direct == 'time':
-                for length, threshold in zip(self.time_lengths, self.time_thresholds):
-                    self.vertical_sum_threshold(length, factor*threshold) # first time
+                thresholds = np.outer(factor, self.time_thresholds).astype(np.float32)
+                sum_threshold(vis, vis_mask, self.time_lengths.astype(np.int32), thresholds, True, self.num_threads) # first time
             elif direct == 'freq':
-                for length, threshold in zip(self.freq_lengths, self.freq_thresholds):
-                    self.horizontal_sum_threshold(length, factor*threshold) # then freq
+                thresholds = np.outer(factor, self.freq_thresholds).astype(np.float32)
+                sum_threshold(vis, vis_mask, self.freq_lengths.astype(np.int32), thresholds, False, self.num_threads) # then freq
             else:
                 warnings.warn('Invalid direction: %s, no RFI thresholding will be done' % direct)
 
@@ -0,0 +1,152 @@
+"""Unit tests for the RFI flagging strategies.
+
+The compiled extensions of :mod:`tlpipe.rfi` must have been built, e.g., by
+``python setup.py build_ext --inplace``.
+
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tlpipe.rfi._sum_threshold')
+pytest.importorskip('tlpipe.rfi.sir_operator')
+
+from tlpipe.rfi import strategy
+from tlpipe.rfi import sir_operator
+from tlpipe.rfi import dilate_operator
+from tlpipe.timestream.rfi_flagging import Flag
+from tlpipe.timestream import rfi_strategy
+
+
+# the default strategy in the module docstring of tlpipe.rfi.strategy
+_docstring_strategy = [ ('interpolate', {}),
+                        ('gaussian_filter', {'input': 'background', 'masked': False, 'time_kernal_size': 1.0, 'freq_kernal_size': 3.0}),
+                        ('subtract', {}),
+                        ('sum_threshold', {'max_threshold_length': 1}),
+                        ('iterate', {'count': 2, 'steps': [ ('gaussian_filter', {'time_kernal_size': 1.0, 'freq_kernal_size': 3.0}),
+                                                            ('subtract', {}),
+                                                            ('sum_threshold', {}) ]}),
+                        ('combine', {}),
+                        ('sir', {'eta': 0.2}) ]
+
+
+def _data(nt=96, nf=48, npol=2, seed=0):
+    """Synthetic visibilities of a baseline with RFI, and the noise source on points."""
+
+    rs = np.random.RandomState(seed)
+    t = np.linspace(0, 1, nt)[:, np.newaxis, np.newaxis]
+    f = np.linspace(0, 1, nf)[np.newaxis, :, np.newaxis]
+    # a smooth background with noise
+    vis = (10.0 + 3.0 * np.sin(2*np.pi*t) * np.cos(np.pi*f)) * np.ones((1, 1, npol))
+    vis = vis + (rs.normal(size=(nt, nf, npol)) + 1.0J * rs.normal(size=(nt, nf, npol)))
+    # narrow band and broad band RFI, and some random spikes
+    vis[:, 7, 0] += 30.0
+    vis[40:43, :, -1] += 25.0
+    vis[rs.randint(0, nt, 20), rs.randint(0, nf, 20), rs.randint(0, npol, 20)] += 60.0
+    ns_on = np.zeros(nt, dtype=bool)
+    ns_on[10::30] = True
+    vis_mask = np.zeros(vis.shape, dtype=bool)
+    vis_mask[ns_on] = True
+
+    return vis.astype(np.complex64), vis_mask, ns_on
+
+
+def _flag(vis, vis_mask):
+    """The mask flagged by rfi_flagging.Flag of default parameters for each polarization."""
+
+    task = Flag({}, feedback=0)
+    mask = vis_mask.copy()
+    for pi in range(vis.shape[2]):
+        task.flag(vis[:, :, pi], mask[:, :, pi], 0, 0, None, None)
+
+    return mask
+
+
+def test_docstring_strategy_as_flag():
+    vis, vis_mask, ns_on = _data()
+    expected = _flag(vis, vis_mask)
+    # combine the masks and apply the SIR operator as the strategy does
+    combined = expected.any(axis=2)
+    combined[ns_on] = False
+    sir_operator.vertical_sir(combined, 0.2)
+    combined[ns_on] = True
+    sir_operator.horizontal_sir(combined, 0.2)
+    expected[:] = combined[:, :, np.newaxis]
+
+    mask = vis_mask.copy()
+    strategy.Strategy(_docstring_strategy).run(vis, mask, ns_on)
+
+    # the RFI has been flagged
+    assert mask[:, 7].all() and mask[40:43].all()
+    assert not mask.all()
+    assert np.array_equal(mask, expected)
+
+
+def test_task_default_as_flag():
+    vis, vis_mask, ns_on = _data(seed=1)
+    expected = _flag(vis, vis_mask)
+
+    task = rfi_strategy.Strategy({}, feedback=0)
+    task.strategy = strategy.Strategy(task.params['strategy'])
+    mask = vis_mask.copy()
+    task.flag(vis, mask, 0, 0, None, None, ns_on=ns_on)
+
+    assert np.array_equal(mask, expected)
+    # the polarizations are flagged separately
+    assert not np.array_equal(mask[:, :, 0], mask[:, :, 1])
+
+
+def test_iterate():
+    mask = np.zeros((20, 10, 1), dtype=bool)
+    mask[10, 5] = True
+    vis = np.ones(mask.shape, dtype=np.complex64)
+
+    expected = mask[:, :, 0].copy()
+    for cnt in range(3):
+        dilate_operator.vertical_dilate(expected, 1)
+    assert expected.sum() == 7
+
+    st = strategy.Strategy([ ('iterate', {'count': 3, 'steps': [ ('dilate', {'time_size': 1}) ]}) ])
+    st.run(vis, mask)
+    assert np.array_equal(mask[:, :, 0], expected)
+
+    # nested iterations run count times of count times
+    mask[:] = False
+    mask[10, 5] = True
+    st = strategy.Strategy([ ('iterate', {'count': 1, 'steps': [ ('iterate', {'count': 3, 'steps': [ ('dilate', {'time_size': 1}) ]}) ]}) ])
+    st.run(vis, mask)
+    assert np.array_equal(mask[:, :, 0], expected)
+
+    # no iterations
+    mask[:] = False
+    mask[10, 5] = True
+    strategy.Strategy([ ('iterate', {'count': 0, 'steps': [ 'combine', ('dilate', {'time_size': 1}) ]}) ]).run(vis, mask)
+    assert mask.sum() == 1
+
+
+def test_combine():
+    vis = np.ones((8, 6, 4), dtype=np.complex64)
+    vis_mask = np.zeros(vis.shape, dtype=bool)
+    vis_mask[1, 2, 0] = True
+    vis_mask[3, 4, 3] = True
+
+    strategy.Strategy([ 'combine' ]).run(vis, vis_mask)
+
+    for pi in range(4):
+        assert np.array_equal(np.where(vis_mask[:, :, pi]), ([1, 3], [2, 4]))
+
+
+def test_2d_data():
+    vis, vis_mask, ns_on = _data(npol=1, seed=2)
+    expected = _flag(vis, vis_mask)
+
+    task = rfi_strategy.Strategy({}, feedback=0)
+    mask = vis_mask[:, :, 0].copy()
+    strategy.Strategy(task.params['strategy']).run(vis[:, :, 0], mask)
+
+    assert np.array_equal(mask, expected[:, :, 0])
+
+
+def test_unknown_step():
+    with pytest.raises(ValueError):
+        strategy.Strategy([ ('iterate', {'steps': [ 'no_such_step' ]}) ])
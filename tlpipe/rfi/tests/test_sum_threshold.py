@@ -0,0 +1,75 @@
+"""Unit tests for the batched SumThreshold kernel.
+
+The compiled extensions of :mod:`tlpipe.rfi` must have been built, e.g., by
+``python setup.py build_ext --inplace``.
+
+"""
+
+import numpy as np
+import pytest
+
+_sum_threshold = pytest.importorskip('tlpipe.rfi._sum_threshold')
+
+from tlpipe.rfi.sum_threshold import SumThreshold
+
+
+def _stack(n=5, height=40, width=24, seed=0):
+    rs = np.random.RandomState(seed)
+    vis = rs.rayleigh(size=(n, height, width)).astype(np.float32)
+    # RFI of different extents
+    vis[:, 10:14, 5] += 3.0
+    vis[:, 20, 3:20] += 2.0
+    vis[1, 30, 7] += 20.0
+    vis_mask = rs.rand(n, height, width) > 0.9
+    # an array all masked, and another with a masked row
+    vis_mask[2] = True
+    vis_mask[3, 5] = True
+    return vis, vis_mask
+
+
+def _reference(vis, vis_mask, lengths, thresholds, vertical):
+    ### threshold each array with each length in turn by the kernels of a
+    ### single array
+    n, height, width = vis.shape
+    for i in range(n):
+        for j, length in enumerate(lengths):
+            if length > (height if vertical else width):
+                continue
+            if length == 1:
+                _sum_threshold.threshold_len1(vis[i], vis_mask[i], height, width, thresholds[i, j])
+            elif vertical:
+                _sum_threshold.vthreshold(vis[i], vis_mask[i], height, width, length, thresholds[i, j])
+            else:
+                _sum_threshold.hthreshold(vis[i], vis_mask[i], height, width, length, thresholds[i, j])
+
+
+@pytest.mark.parametrize('vertical', [ True, False ])
+@pytest.mark.parametrize('num_threads', [ 1, 3 ])
+def test_kernel(vertical, num_threads):
+    vis, vis_mask = _stack()
+    # lengths larger than the axis are skipped
+    lengths = np.array([ 1, 2, 4, 8, 16, 32, 64 ], dtype=np.int32)
+    thresholds = (np.linspace(1.0, 2.0, vis.shape[0])[:, np.newaxis] * 6.0 * 1.5**np.log2(lengths) / lengths).astype(np.float32)
+
+    expected = vis_mask.copy()
+    _reference(vis, expected, lengths, thresholds, vertical)
+
+    mask = vis_mask.copy()
+    _sum_threshold.sum_threshold(vis, mask, lengths, thresholds, vertical, num_threads)
+
+    assert np.array_equal(mask, expected)
+    # something has been flagged, and nothing unmasked
+    assert mask.sum() > vis_mask.sum()
+    assert np.all(mask[vis_mask])
+
+
+def test_stack_as_arrays():
+    vis, vis_mask = _stack(seed=1)
+    st = SumThreshold(vis, vis_mask, max_threshold_length=16, num_threads=2)
+    st.execute(1.0, ('time', 'freq'))
+    assert st.vis_mask.sum() > vis_mask.sum() and not st.vis_mask[0].all()
+
+    for i in range(vis.shape[0]):
+        st1 = SumThreshold(vis[i], vis_mask[i], max_threshold_length=16)
+        st1.execute(1.0, ('time', 'freq'))
+        assert np.array_equal(st.vis_mask[i], st1.vis_mask)
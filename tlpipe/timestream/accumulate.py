@@ -9,6 +9,7 @@ Inheritance diagram
 """
 
 import os
+import shutil
 import numpy as np
 import h5py
 import timestream_task
@@ -36,12 +37,108 @@ class Accum(timestream_task.TimestreamTask):
                     'load_data': None, # load data from disk first and accumulate to it if not None but a list of files
                     'cache_to_file': False, # cache the data to file instead of in memory
                     'cache_file_name': 'cache/accumulate.hdf5', # name of the cache file
+                    'merge_block': 64, # number of rows of the cache file merged at a time when running by groups of processes
+                    'checkpoint_file': 'checkpoint/accumulate.hdf5', # file to save the accumulated data to when the pipeline is checkpointed
                   }
 
     prefix = 'ac_'
 
+    # keeps the accumulated data between iterations
+    pure_process = False
+
     def setup(self):
         self.data = None
+        self.cache_file = None
+        self.checkpoint_ndays = 0
+        # snapshot files of the accumulated data saved by checkpoint
+        self.checkpoint_files = []
+
+    def _group_file_name(self, file_name):
+        # each group of processes has its own file
+        if self.ngroups > 1:
+            root, ext = os.path.splitext(file_name)
+            return '%s_group%d%s' % (root, self.group, ext)
+        else:
+            return file_name
+
+    def _cache_file_name(self):
+        return self._group_file_name(self.params['cache_file_name'])
+
+    def _save_snapshot(self, ndays, save):
+        """Save a snapshot of the data accumulated of `ndays` days by `save(filename)`."""
+
+        root, ext = os.path.splitext(self._group_file_name(self.params['checkpoint_file']))
+        checkpoint_file = output_path('%s_ndays%d%s' % (root, ndays, ext), mkdir=True)
+        # write to a temporary file first, so no incomplete snapshot is
+        # left if crashed when writing
+        tmp_file = checkpoint_file + '.tmp'
+        save(tmp_file)
+        if mpiutil.rank0:
+            os.rename(tmp_file, checkpoint_file)
+            # the last checkpoint in the journal may still refer to the
+            # previous snapshot until this one is journaled
+            for old_file in self.checkpoint_files[:-1]:
+                if os.path.isfile(old_file):
+                    os.remove(old_file)
+        mpiutil.barrier()
+        self.checkpoint_files = self.checkpoint_files[-1:] + [ checkpoint_file ]
+        self.checkpoint_ndays = ndays
+
+        return checkpoint_file
+
+    def checkpoint(self):
+        """Save a snapshot of the accumulated data and return where it is."""
+
+        state = super(Accum, self).checkpoint() or {}
+
+        if self.params['cache_to_file']:
+            if self.cache_file is not None:
+                ndays = None
+                if mpiutil.rank0:
+                    with h5py.File(self.cache_file, 'r') as f:
+                        ndays = f.attrs['ndays']
+                ndays = mpiutil.bcast(ndays, root=0)
+                # only save when more data has been accumulated, the cache
+                # file is updated in place, so copy it
+                if ndays != self.checkpoint_ndays:
+                    def save(filename):
+                        if mpiutil.rank0:
+                            shutil.copyfile(self.cache_file, filename)
+                    self._save_snapshot(ndays, save)
+                state['cache_file'] = self.cache_file
+                state['checkpoint_file'] = self.checkpoint_files[-1]
+                state['ndays'] = self.checkpoint_ndays
+        elif self.data is not None:
+            # only save when more data has been accumulated
+            if self.data.attrs['ndays'] != self.checkpoint_ndays:
+                self._save_snapshot(self.data.attrs['ndays'], self.data.to_files)
+            state['checkpoint_file'] = self.checkpoint_files[-1]
+            state['ndays'] = self.checkpoint_ndays
+            state['dist_axis'] = self.data.main_data_dist_axis
+
+        return state if len(state) > 0 else None
+
+    def restore_checkpoint(self, state):
+        """Restore the data accumulated before the checkpoint."""
+
+        super(Accum, self).restore_checkpoint(state)
+
+        if 'cache_file' in state:
+            # the cache file may have been partially updated after the
+            # checkpoint, so replace it by the snapshot
+            if mpiutil.rank0:
+                tmp_file = state['cache_file'] + '.tmp'
+                shutil.copyfile(state['checkpoint_file'], tmp_file)
+                os.rename(tmp_file, state['cache_file'])
+            mpiutil.barrier()
+            self.cache_file = state['cache_file']
+        elif 'checkpoint_file' in state:
+            self.data = Timestream(state['checkpoint_file'], mode='r', start=0, stop=None, dist_axis=state['dist_axis'], use_hints=True, comm=mpiutil.world)
+            self.data.load_all()
+
+        if 'checkpoint_file' in state:
+            self.checkpoint_files = [ state['checkpoint_file'] ]
+            self.checkpoint_ndays = state['ndays']
 
     def process(self, ts):
 
@@ -52,10 +149,10 @@ class Accum(timestream_task.TimestreamTask):
 
         # cache to file
         if self.params['cache_to_file']:
-            cache_file_name = input_path(self.params['cache_file_name'])
+            cache_file_name = input_path(self._cache_file_name())
             if not os.path.isfile(cache_file_name):
                 # write ts to cache_file_name
-                cache_file_name = output_path(self.params['cache_file_name'], mkdir=True)
+                cache_file_name = output_path(self._cache_file_name(), mkdir=True)
                 ts.apply_mask(fill_val=0) # apply mask, fill 0 to masked values
                 # create weight dataset
                 weight = np.logical_not(ts.local_vis_mask).astype(np.int16) # use int16 to save memory
@@ -82,13 +179,18 @@ class Accum(timestream_task.TimestreamTask):
                                 f['vis'][tuple(slc)] += ts.local_vis # accumulate vis
                                 f['weight'][tuple(slc)] += np.logical_not(ts.local_vis_mask).astype(np.int16) # update weight
                                 f['vis_mask'][tuple(slc)] = np.where(f['weight'][tuple(slc)] != 0, False, True) # update mask
-                            if rk == 0:
-                                f.attrs['ndays'] += 1
                     mpiutil.barrier(ts.comm)
+                # update ndays after all data has been written
+                if ts.rank == 0:
+                    with h5py.File(cache_file_name, 'r+') as f:
+                        f.attrs['ndays'] += 1
+                mpiutil.barrier(ts.comm)
 
                 # empty ts to release memory
                 ts.empty()
 
+            self.cache_file = cache_file_name
+
             return cache_file_name
 
         # accumulate in memory
@@ -112,6 +214,9 @@ class Accum(timestream_task.TimestreamTask):
         else:
             # make they are distributed along the same axis
             ts.redistribute(self.data.main_data_dist_axis)
+            # the accumulated data emitted last iteration may be shared by
+            # copies made by later tasks, do not change theirs
+            self.data.ensure_writable([ self.data.main_data_name, 'weight', 'vis_mask', 'ra_dec' ])
             # check for ra, dec
             ra_self = self.data['ra_dec'].local_data[:, 0]
             if mpiutil.rank0 and ra_self[0] > ra_self[1]:
@@ -140,3 +245,102 @@ class Accum(timestream_task.TimestreamTask):
 
 
         return super(Accum, self).process(self.data)
+
+    def plan_process(self, stage, ts):
+        """Plan accumulating the data with its weight."""
+
+        ts = ts.copy()
+        # weight is int16
+        ts.add_dataset('weight', ts.axes, 2)
+
+        if self.params['cache_to_file']:
+            # each iteration updates the data in the cache file
+            stage.hold(ts.local_nbytes(stage.nproc, [ 'weight' ]))
+            stage.read(ts)
+            stage.write(ts)
+            stage.note('the accumulated data is in the cache file %s' % self._cache_file_name())
+            return None
+
+        # the accumulated data is held in memory through all iterations
+        stage.hold(ts.local_nbytes(stage.nproc))
+
+        return ts
+
+    def merge_groups(self):
+        """Merge the data accumulated by all groups of processes.
+
+        The merged data is held by the first group that has accumulated any
+        data, which also writes it to `output_files` (without the iteration
+        tag) if given.
+
+        """
+
+        from mpi4py import MPI
+
+        # the groups that have accumulated some data
+        if self.params['cache_to_file']:
+            has_data = self.cache_file is not None
+        else:
+            has_data = self.data is not None
+        groups = [ gi for gi, hd in enumerate(self.merge_comm.allgather(has_data)) if hd ]
+        if len(groups) <= 1:
+            return
+
+        if self.params['cache_to_file']:
+            cache_files = self.merge_comm.allgather(self.cache_file)
+            if self.group == groups[0] and mpiutil.rank0:
+                # accumulate the cache files of other groups to this one
+                block = self.params['merge_block']
+                with h5py.File(self.cache_file, 'r+') as f:
+                    for gi in groups[1:]:
+                        with h5py.File(cache_files[gi], 'r') as fg:
+                            for st in range(0, f['vis'].shape[0], block):
+                                slc = slice(st, st+block)
+                                f['vis'][slc] += fg['vis'][slc]
+                                f['weight'][slc] += fg['weight'][slc]
+                                f['vis_mask'][slc] = np.where(f['weight'][slc] != 0, False, True)
+                            f.attrs['ndays'] += fg.attrs['ndays']
+            self.merge_comm.Barrier()
+            if self.group != groups[0]:
+                self.cache_file = None
+
+            return
+
+        # sum the data of the groups to the first one, the data must be
+        # distributed in the same way in all groups
+        comm = self.merge_comm.Split((0 if has_data else MPI.UNDEFINED), self.group)
+        if comm == MPI.COMM_NULL:
+            return
+
+        for arr in [ self.data.local_vis, self.data['weight'].local_data ]:
+            buf = np.ascontiguousarray(arr)
+            if comm.rank == 0:
+                comm.Reduce(MPI.IN_PLACE, buf, op=MPI.SUM, root=0)
+                arr[:] = buf
+            else:
+                comm.Reduce(buf, None, op=MPI.SUM, root=0)
+        ndays = comm.reduce(self.data.attrs['ndays'], op=MPI.SUM, root=0)
+        comm.Free()
+
+        if self.group != groups[0]:
+            self.data = None
+            return
+
+        self.data.local_vis_mask[:] = np.where(self.data['weight'].local_data != 0, False, True) # update mask
+        self.data.attrs['ndays'] = ndays
+
+        # write the merged data
+        if len(self.output_files) != 0:
+            if mpiutil.rank0:
+                for output_file in self.output_files:
+                    output_dir = os.path.dirname(output_file)
+                    if not os.path.exists(output_dir):
+                        os.makedirs(output_dir)
+            mpiutil.barrier()
+
+            tag_output_iter = self.params['tag_output_iter']
+            self.params['tag_output_iter'] = False
+            try:
+                self.write_output(self.data)
+            finally:
+                self.params['tag_output_iter'] = tag_output_iter
@@ -29,6 +29,8 @@ class Apply(timestream_task.TimestreamTask):
 
     prefix = 'ag_'
 
+    process_dist_axis = 'baseline'
+
     def process(self, ts):
 
         assert isinstance(ts, Timestream), '%s only works for Timestream object' % self.__class__.__name__
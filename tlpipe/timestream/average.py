@@ -28,6 +28,8 @@ class Average(timestream_task.TimestreamTask):
 
     prefix = 'av_'
 
+    pure_process = True
+
     def process(self, ts):
 
         if not 'weight' in ts.iterkeys():
@@ -57,3 +59,10 @@ class Average(timestream_task.TimestreamTask):
             ts.load_all()
 
         return super(Average, self).read_process_write(ts)
+
+    def plan_process(self, stage, ts):
+        """Plan dividing the weight, which is deleted after."""
+
+        ts.remove_dataset('weight')
+
+        return ts
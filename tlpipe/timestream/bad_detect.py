@@ -28,6 +28,10 @@ class Detect(timestream_task.TimestreamTask):
 
     prefix = 'bd_'
 
+    process_dist_axis = 'baseline'
+
+    pure_process = True
+
     def process(self, ts):
 
         ts.redistribute('baseline')
@@ -24,6 +24,8 @@ class Combine(timestream_task.TimestreamTask):
 
     prefix = 'cm_'
 
+    pure_process = True
+
     def process(self, ts):
 
         assert isinstance(ts, Timestream), '%s only works for Timestream object' % self.__class__.__name__
@@ -34,7 +36,7 @@ class Combine(timestream_task.TimestreamTask):
         show_progress = self.params['show_progress']
         progress_step = self.params['progress_step']
 
-        ts.bl_data_operate(self.combine, show_progress=show_progress, progress_step=progress_step,)
+        ts.bl_data_operate(self.combine, show_progress=show_progress, progress_step=progress_step, block_size=0)
 
         # set flag to indicate the combination
         ts['vis_mask'].attrs['combined_mask'] = True
@@ -42,6 +44,6 @@ class Combine(timestream_task.TimestreamTask):
         return super(Combine, self).process(ts)
 
     def combine(self, vis, vis_mask, li, gi, tf, ts, **kwargs):
-        """Function that does the combine operation."""
+        """Function that does the combine operation on a block of baselines."""
 
-        vis_mask[:] = np.sum(vis_mask, axis=2).astype(bool)[:, :, np.newaxis]
+        vis_mask[:] = np.any(vis_mask, axis=2)[:, :, np.newaxis]
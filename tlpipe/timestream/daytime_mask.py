@@ -21,6 +21,8 @@ class Mask(timestream_task.TimestreamTask):
 
     prefix = 'dm_'
 
+    pure_process = True
+
     def process(self, ts):
 
         mask_time_range = self.params['mask_time_range']
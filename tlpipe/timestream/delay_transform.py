@@ -10,15 +10,11 @@ Inheritance diagram
 
 from datetime import datetime, timedelta
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline
 import timestream_task
 from tlpipe.container.raw_timestream import RawTimestream
 from tlpipe.container.timestream import Timestream
 from tlpipe.utils.path_util import output_path
-import tlpipe.plot
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import MaxNLocator, AutoMinorLocator
+from tlpipe.utils.plot_util import setup_matplotlib
 
 
 class Delay(timestream_task.TimestreamTask):
@@ -52,6 +48,11 @@ class Delay(timestream_task.TimestreamTask):
 
     prefix = 'dl_'
 
+    process_dist_axis = 'baseline'
+
+    # writes figures
+    pure_process = False
+
     def process(self, ts):
 
         ts.redistribute('baseline')
@@ -64,12 +65,20 @@ class Delay(timestream_task.TimestreamTask):
         show_progress = self.params['show_progress']
         progress_step = self.params['progress_step']
 
-        func(self.transform, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False)
+        # plotting with matplotlib is not thread-safe
+        num_threads = 1 if self.params['plot_delay'] else self.params['num_threads']
+
+        func(self.transform, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False, num_threads=num_threads)
 
         return super(Delay, self).process(ts)
 
     def transform(self, vis, vis_mask, li, gi, bl, ts, **kwargs):
         """Function that does the delay transform."""
+        from scipy.interpolate import InterpolatedUnivariateSpline
+        setup_matplotlib()
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+        from matplotlib.ticker import MaxNLocator, AutoMinorLocator
 
         bl_incl = self.params['bl_incl']
         bl_excl = self.params['bl_excl']
@@ -34,6 +34,8 @@ class Detect(timestream_task.TimestreamTask):
 
     prefix = 'dt_'
 
+    pure_process = True
+
     def process(self, rt):
 
         assert isinstance(rt, RawTimestream), '%s only works for RawTimestream object currently' % self.__class__.__name__
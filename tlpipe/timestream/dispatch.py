@@ -12,6 +12,9 @@ import itertools
 import numpy as np
 import h5py
 import timestream_task
+from tlpipe.container import container
+from tlpipe.container import file_index
+from tlpipe.container.time_window import TimeWindow
 from tlpipe.core import constants as const
 
 from caput import mpiutil
@@ -44,10 +47,18 @@ class Dispatch(timestream_task.TimestreamTask):
                     'extra_inttime': 150, # extra int time to ensure smooth transition in the two ends
                     'exclude_bad': True, # exclude bad channels
                     'drop_days': 0.0, # drop data if time is less than this factor of days
+                    'reuse_overlap': True, # keep the time points shared with the next iteration in memory instead of reading them again
+                    'prefetch': False, # read data of the next iteration in a background thread while this one is processed
                   }
 
     prefix = 'dp_'
 
+    cache_exclude_params = timestream_task.TimestreamTask.cache_exclude_params + ('reuse_overlap', 'prefetch')
+
+    packed_mask_support = True
+    # keeps the position in the input files between iterations
+    pure_process = False
+
     def __init__(self, parameter_file_or_dict=None, feedback=2):
 
         super(Dispatch, self).__init__(parameter_file_or_dict, feedback)
@@ -63,6 +74,26 @@ class Dispatch(timestream_task.TimestreamTask):
         # record start RA for later use
         self.start_ra = None
 
+        # data kept or prefetched for the next iteration
+        self.window = TimeWindow()
+
+    def checkpoint(self):
+        """Return the iterations run and the file group being dispatched."""
+
+        state = super(Dispatch, self).checkpoint()
+        if state is not None:
+            state.update({'grp_cnt': self.grp_cnt, 'next_grp': self.next_grp, 'abs_start': self.abs_start, 'abs_stop': self.abs_stop, 'int_time': self.int_time, 'start_ra': self.start_ra})
+
+        return state
+
+    def restore_checkpoint(self, state):
+        """Continue dispatching from the checkpoint."""
+
+        super(Dispatch, self).restore_checkpoint(state)
+        if self.iterable:
+            for key in ('grp_cnt', 'next_grp', 'abs_start', 'abs_stop', 'int_time', 'start_ra'):
+                setattr(self, key, state[key])
+
     def _init_input_files(self):
         input_files = self.params['input_files']
         start = self.params['start']
@@ -178,6 +209,7 @@ class Dispatch(timestream_task.TimestreamTask):
             if mpiutil.rank0:
                 print 'Start file group %d of %d...' % (self.grp_cnt, ngrp)
             self.restart_iteration() # re-start iteration for each group
+            self.window.clear()
             self.next_grp = False
             self.abs_start = None
             self.abs_stop = None
@@ -186,16 +218,17 @@ class Dispatch(timestream_task.TimestreamTask):
         start = self.start[self.grp_cnt]
         stop = self.stop[self.grp_cnt]
 
+        if self.int_time is None or self.abs_start is None or self.abs_stop is None:
+            # get metadata from the file index instead of opening all files
+            files_info = file_index.get_file_info(input_files)
+
         if self.int_time is None:
             # NOTE: here assume all files have the same int_time
-            with h5py.File(self.input_files[0], 'r') as f:
-                self.int_time = f.attrs['inttime']
+            self.int_time = files_info[0]['inttime']
 
         if self.abs_start is None or self.abs_stop is None:
-            tmp_tod = self._Tod_class(input_files, mode, start, stop, dist_axis)
-            self.abs_start = tmp_tod.main_data_start
-            self.abs_stop = tmp_tod.main_data_stop
-            del tmp_tod
+            num_ts = file_index.num_time_points(files_info, self._Tod_class._main_data_name_)
+            _, _, self.abs_start, self.abs_stop = container.select_time_range(num_ts, start, stop)
 
         iteration = self.iteration if self.iterable else 0
         this_start = self.abs_start + np.int(np.around(iteration * days * const.sday / self.int_time))
@@ -219,11 +252,21 @@ class Dispatch(timestream_task.TimestreamTask):
             return None
 
         tod = self._Tod_class(input_files, mode, this_start, this_stop, dist_axis)
+        if self.params['lazy']:
+            tod.enable_lazy_load(self.params['lazy_cache_size'], self.params['lazy_block_size'])
+        tod.use_read_planner = self.params['read_planner']
+        tod.redistribute_slab_size = self.params['redistribute_slab_size']
+        if self.iterable:
+            tod.time_window = self.window
+            tod.time_window_offset = this_start
 
         tod, _ = self.data_select(tod)
 
         tod.load_all() # load in all data
 
+        if self.iterable:
+            self._keep_window(tod, input_files, iteration, this_stop)
+
         if self.start_ra is None: # the first iteration
             if 'time' == tod.main_data_axes[tod.main_data_dist_axis]:
                 # ra_dec is distributed among processes
@@ -245,10 +288,87 @@ class Dispatch(timestream_task.TimestreamTask):
             else:
                 self.start_ra = ra_dec[extra_inttime, 0]
 
+            if iteration != 0:
+                # the first iteration of this group of processes is not the
+                # first one, shift back by the sidereal days passed
+                self.start_ra = (self.start_ra - 2*np.pi*days*iteration) % (2*np.pi)
+
         tod.vis.attrs['start_ra'] = self.start_ra # used for re_order
 
+        if self.params['pack_mask']:
+            tod.pack_mask()
+
         return tod
 
+    def _keep_window(self, tod, input_files, iteration, this_stop):
+        ### keep the time points of `tod` shared with the next iteration of
+        ### this group of processes, and prefetch the others
+
+        days = self.params['days']
+        extra_inttime = self.params['extra_inttime']
+
+        next_iteration = iteration + self.iter_step
+        next_start = self.abs_start + np.int(np.around(next_iteration * days * const.sday / self.int_time))
+        next_stop = min(self.abs_stop, self.abs_start + np.int(np.around((next_iteration+1) * days * const.sday / self.int_time)) + 2*extra_inttime)
+        if self.next_grp or next_start >= next_stop or (self.iter_num is not None and self._iter_cnt + 1 >= self.iter_num):
+            # no next iteration in this group
+            self.window.clear()
+            return
+
+        if self.params['reuse_overlap']:
+            self.window.keep(tod, next_start)
+        else:
+            self.window.clear()
+        if self.params['prefetch']:
+            self.window.prefetch(tod, input_files, next_start, next_stop, max(next_start, this_stop) if self.params['reuse_overlap'] else next_start)
+
+    def finish(self):
+        """Drop the data kept for the next iteration."""
+
+        self.window.clear()
+
+        super(Dispatch, self).finish()
+
+    def plan_iterations(self):
+        """Number of iterations to dispatch all groups of files."""
+
+        if not self.iterable:
+            return None
+
+        days = self.params['days']
+        niter = 0
+        for input_files, start, stop in zip(self.input_grps, self.start, self.stop):
+            files_info = file_index.get_file_info(input_files)
+            num_ts = file_index.num_time_points(files_info, self._Tod_class._main_data_name_)
+            _, _, abs_start, abs_stop = container.select_time_range(num_ts, start, stop)
+            num_int = days * const.sday / files_info[0]['inttime']
+            niter += int(np.ceil((abs_stop - abs_start) / num_int))
+        if self.iter_num is not None:
+            niter = min(niter, self.iter_num)
+
+        return niter
+
+    def plan_read(self, stage):
+        """Shape of the data dispatched in the first iteration, from the metadata of the files only."""
+
+        if len(self.input_grps) == 0:
+            return None
+
+        files_info = file_index.get_file_info(self.input_grps[0])
+        num_ts = file_index.num_time_points(files_info, self._Tod_class._main_data_name_)
+        _, _, abs_start, abs_stop = container.select_time_range(num_ts, self.start[0], self.stop[0])
+        nt = abs_stop - abs_start
+        if self.iterable:
+            num_int = np.int(np.around(self.params['days'] * const.sday / files_info[0]['inttime']))
+            nt = min(nt, num_int + 2*self.params['extra_inttime'])
+
+        shape = self.plan_shape(files_info, nt, stage)
+        if self.params['exclude_bad']:
+            stage.note('bad channels are not excluded in the plan')
+        stage.read(shape)
+
+        return shape
+
     def data_select(self, tod):
         """Data select."""
         tod, full_data = super(Dispatch, self).data_select(tod)
@@ -27,10 +27,17 @@ class Flag(timestream_task.TimestreamTask):
     params_init = {
                     'sigma': 3.0,
                     'freq_points': 10, # minima freq point to do the flag
+                    'block_size': 64, # number of time points (and baselines) flagged at once
                   }
 
     prefix = 'ff_'
 
+    process_dist_axis = 'time'
+
+    packed_mask_support = True
+    mutated_datasets = ('vis_mask',)
+    pure_process = True
+
     def process(self, ts):
 
         freq_points = self.params['freq_points']
@@ -48,22 +55,27 @@ class Flag(timestream_task.TimestreamTask):
             show_progress = self.params['show_progress']
             progress_step = self.params['progress_step']
 
-            func(self.flag, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False)
+            func(self.flag, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False, block_size=self.params['block_size'])
         else:
             warnings.warn('Not enough frequency points to do the flag')
 
         return super(Flag, self).process(ts)
 
     def flag(self, vis, vis_mask, li, gi, tbl, ts, **kwargs):
-        """Function that does the actual flag."""
+        """Function that does the actual flag on a block of data.
+
+        Each slice along the frequency axis (axis 1) of the block is flagged
+        independently.
+        """
 
         sigma = self.params['sigma']
         freq_points = self.params['freq_points']
 
         vis_abs = np.ma.abs(np.ma.array(vis, mask=vis_mask))
-        if vis_abs.count() >= freq_points:
-            median = np.ma.median(vis_abs)
-            abs_diff = np.ma.abs(vis_abs - median)
-            mad = np.ma.median(abs_diff) / 0.6745
-            inds = np.ma.where(abs_diff > sigma*mad)[0] # masked inds
-            vis_mask[inds] = True # set mask
+        # only flag slices that have enough valid frequency points
+        enough = np.expand_dims(vis_abs.count(axis=1) >= freq_points, 1)
+        median = np.ma.expand_dims(np.ma.median(vis_abs, axis=1), 1)
+        abs_diff = np.ma.abs(vis_abs - median)
+        mad = np.ma.expand_dims(np.ma.median(abs_diff, axis=1), 1) / 0.6745
+        inds = (abs_diff > sigma*mad).filled(False) & enough # masked inds
+        vis_mask[inds] = True # set mask
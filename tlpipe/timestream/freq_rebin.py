@@ -31,6 +31,10 @@ class Rebin(timestream_task.TimestreamTask):
 
     prefix = 'rb_'
 
+    process_dist_axis = 'baseline'
+
+    pure_process = True
+
     def process(self, ts):
 
         assert isinstance(ts, Timestream), '%s only works for Timestream object' % self.__class__.__name__
@@ -80,3 +84,18 @@ class Rebin(timestream_task.TimestreamTask):
             ts.attrs['freqstep'] = nfreq * ts.attrs['freqstep'] / bin_number
 
         return super(Rebin, self).process(ts)
+
+    def plan_process(self, stage, ts):
+        """Plan rebinning the frequency channels."""
+
+        ts = super(Rebin, self).plan_process(stage, ts)
+
+        bin_number = self.params['bin_number']
+        if bin_number < ts.lengths['frequency']:
+            # the rebinned vis and vis_mask are created before replacing the original ones
+            rebinned = ts.copy()
+            rebinned.resize('frequency', bin_number)
+            stage.hold(rebinned.local_nbytes(stage.nproc, ['vis', 'vis_mask']))
+            ts.resize('frequency', bin_number)
+
+        return ts
@@ -14,7 +14,6 @@ from tlpipe.container.timestream import Timestream
 
 from caput import mpiutil
 from tlpipe.utils.path_util import output_path
-from tlpipe.map.drift.core import beamtransfer
 
 
 class GenBeam(timestream_task.TimestreamTask):
@@ -36,7 +35,10 @@ class GenBeam(timestream_task.TimestreamTask):
 
     prefix = 'gb_'
 
+    process_dist_axis = 'baseline'
+
     def process(self, ts):
+        from tlpipe.map.drift.core import beamtransfer
 
         tsys = self.params['tsys']
         accuracy_boost = self.params['accuracy_boost']
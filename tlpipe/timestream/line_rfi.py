@@ -10,14 +10,12 @@ Inheritance diagram
 
 import warnings
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline
 import timestream_task
 from tlpipe.container.raw_timestream import RawTimestream
 from tlpipe.container.timestream import Timestream
 from tlpipe.utils.sg_filter import savitzky_golay
 from tlpipe.utils.path_util import output_path
-import tlpipe.plot
-import matplotlib.pyplot as plt
+from tlpipe.utils.plot_util import setup_matplotlib
 
 
 class Flag(timestream_task.TimestreamTask):
@@ -41,6 +39,13 @@ class Flag(timestream_task.TimestreamTask):
 
     prefix = 'lf_'
 
+    process_dist_axis = 'baseline'
+
+    packed_mask_support = True
+    mutated_datasets = ('vis_mask',)
+    # writes figures
+    pure_process = False
+
     def process(self, ts):
 
         freq_window = self.params['freq_window']
@@ -82,12 +87,18 @@ class Flag(timestream_task.TimestreamTask):
         show_progress = self.params['show_progress']
         progress_step = self.params['progress_step']
 
-        func(self.flag, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False, freq_flag=freq_flag, time_flag=time_flag)
+        # plotting with matplotlib is not thread-safe
+        num_threads = 1 if self.params['plot_fit'] else self.params['num_threads']
+
+        func(self.flag, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False, num_threads=num_threads, freq_flag=freq_flag, time_flag=time_flag)
 
         return super(Flag, self).process(ts)
 
     def flag(self, vis, vis_mask, li, gi, bl, ts, **kwargs):
         """Function that does the actual flag."""
+        from scipy.interpolate import InterpolatedUnivariateSpline
+        setup_matplotlib()
+        import matplotlib.pyplot as plt
 
         freq_window = self.params['freq_window']
         time_window = self.params['time_window']
@@ -11,21 +11,15 @@ Inheritance diagram
 import os
 import time
 import numpy as np
-from scipy.linalg import eigh
-from scipy.interpolate import interp1d, Rbf
 import h5py
-import aipy as a
 import timestream_task
 from tlpipe.container.timestream import Timestream
 
 from caput import mpiutil
 from caput import mpiarray
 from caput import memh5
-from cora.util import hputil
 from tlpipe.utils.np_util import unique, average
 from tlpipe.utils.path_util import output_path
-from tlpipe.map.drift.core import beamtransfer
-from tlpipe.map.drift.pipeline import timestream
 
 
 class MapMaking(timestream_task.TimestreamTask):
@@ -69,7 +63,13 @@ class MapMaking(timestream_task.TimestreamTask):
 
     prefix = 'mm_'
 
+    process_dist_axis = 'baseline'
+
     def process(self, ts):
+        from scipy.interpolate import interp1d, Rbf
+        from cora.util import hputil
+        from tlpipe.map.drift.core import beamtransfer
+        from tlpipe.map.drift.pipeline import timestream
 
         mask_daytime = self.params['mask_daytime']
         mask_time_range = self.params['mask_time_range']
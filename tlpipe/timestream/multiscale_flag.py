@@ -37,6 +37,12 @@ class Flag(timestream_task.TimestreamTask):
 
     prefix = 'mf_'
 
+    process_dist_axis = 'baseline'
+
+    packed_mask_support = True
+    mutated_datasets = ('vis_mask',)
+    pure_process = True
+
     def process(self, ts):
 
         ts.redistribute('baseline')
@@ -46,7 +52,7 @@ class Flag(timestream_task.TimestreamTask):
         elif isinstance(ts, Timestream):
             func = ts.pol_and_bl_data_operate
 
-        func(self.flag, full_data=True, keep_dist_axis=False)
+        func(self.flag, full_data=True, keep_dist_axis=False, num_threads=self.params['num_threads'], schedule=self.params['schedule'])
 
         return super(Flag, self).process(ts)
 
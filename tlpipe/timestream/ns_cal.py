@@ -11,17 +11,13 @@ Inheritance diagram
 import os
 from datetime import datetime, timedelta
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline
 import h5py
 from caput import mpiutil
 from caput import mpiarray
 import timestream_task
 from tlpipe.container.raw_timestream import RawTimestream
 from tlpipe.utils.path_util import output_path
-import tlpipe.plot
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import MaxNLocator, AutoMinorLocator
+from tlpipe.utils.plot_util import setup_matplotlib
 
 
 class NsCal(timestream_task.TimestreamTask):
@@ -82,6 +78,11 @@ class NsCal(timestream_task.TimestreamTask):
 
     prefix = 'nc_'
 
+    process_dist_axis = 'baseline'
+
+    # writes gain files and figures
+    pure_process = False
+
     def process(self, rt):
 
         assert isinstance(rt, RawTimestream), '%s only works for RawTimestream object currently' % self.__class__.__name__
@@ -188,6 +189,11 @@ class NsCal(timestream_task.TimestreamTask):
 
     def cal(self, vis, vis_mask, li, gi, fbl, rt, **kwargs):
         """Function that does the actual cal."""
+        from scipy.interpolate import InterpolatedUnivariateSpline
+        setup_matplotlib()
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+        from matplotlib.ticker import MaxNLocator, AutoMinorLocator
 
         unmasked_only = self.params['unmasked_only']
         phs_only = self.params['phs_only']
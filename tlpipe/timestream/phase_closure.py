@@ -11,14 +11,11 @@ Inheritance diagram
 import os
 import itertools
 import numpy as np
-from scipy import optimize
 import h5py
-import aipy as a
 import timestream_task
 from caput import mpiutil
 from tlpipe.utils.path_util import output_path
-import tlpipe.plot
-import matplotlib.pyplot as plt
+from tlpipe.utils.plot_util import setup_matplotlib
 
 
 # make cache to speed the visibility getting
@@ -46,6 +43,8 @@ def mk_cache(cache, bl, bls, vis):
 
 # Equation for Gaussian
 def f(x, a, b, c):
+    import aipy as a
+
     return a * np.exp(-(x - b)**2.0 / (2 * c**2))
 
 
@@ -72,7 +71,16 @@ class Closure(timestream_task.TimestreamTask):
 
     prefix = 'pcl_'
 
+    process_dist_axis = 'frequency'
+
+    # writes figures
+    pure_process = False
+
     def process(self, ts):
+        from scipy import optimize
+        import aipy as a
+        setup_matplotlib()
+        import matplotlib.pyplot as plt
 
         calibrator = self.params['calibrator']
         catalog = self.params['catalog']
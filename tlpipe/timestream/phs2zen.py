@@ -9,8 +9,6 @@ Inheritance diagram
 """
 
 import numpy as np
-import ephem
-import aipy as a
 import timestream_task
 from tlpipe.utils.date_util import get_ephdate
 from caput import mpiutil
@@ -32,11 +30,16 @@ class Phs2zen(timestream_task.TimestreamTask):
     params_init = {
                     'source': 'cyg', # <src_name> or <ra XX[:XX:xx]>_<dec XX[:XX:xx]> or <time y/m/d h:m:s> (array pointing of this local time)
                     'catalog': 'misc', # or helm,nvss
+                    'block_size': 64, # number of time points (and baselines) phased at once
                   }
 
     prefix = 'p2z_'
 
+    pure_process = True
+
     def process(self, ts):
+        import ephem
+        import aipy as a
 
         source = self.params['source']
         catalog = self.params['catalog']
@@ -87,29 +90,29 @@ class Phs2zen(timestream_task.TimestreamTask):
         show_progress = self.params['show_progress']
         progress_step = self.params['progress_step']
 
-        ts.time_and_bl_data_operate(self.phs, show_progress=show_progress, progress_step=progress_step, aa=aa, s=s)
+        ts.time_and_bl_data_operate(self.phs, show_progress=show_progress, progress_step=progress_step, block_size=self.params['block_size'], aa=aa, s=s)
 
         return super(Phs2zen, self).process(ts)
 
     def phs(self, vis, vis_mask, li, gi, tbl, ts, **kwargs):
-        """Function that does the actual phs."""
+        """Function that does the actual phs on a block of time points and baselines."""
 
-        t = tbl[0]
-        ai, aj = tbl[1]
+        times, bls = tbl
         aa = kwargs.get('aa')
         s = kwargs.get('s')
 
         feedno = ts['feedno'][:].tolist()
-        i = feedno.index(ai)
-        j = feedno.index(aj)
-
-        aa.set_jultime(t)
-        s.compute(aa)
-        # get fluxes vs. freq of the calibrator
-        # Sc = s.get_jys()
-        # get the topocentric coordinate of the calibrator at the current time
-        s_top = s.get_crds('top', ncrd=3)
-        # aa.sim_cache(cat.get_crds('eq', ncrd=3)) # for compute bm_response and sim
-        uij = aa.gen_uvw(i, j, src='z').squeeze() # (rj - ri)/lambda
-
-        vis[:] = vis * np.exp(-2.0J * np.pi * np.dot(s_top, uij))[:, np.newaxis]
+        # uvw of the baselines of this block, (nbl, 3, nfreq)
+        uijs = np.array([ aa.gen_uvw(feedno.index(ai), feedno.index(aj), src='z').reshape(3, -1) for (ai, aj) in bls ]) # (rj - ri)/lambda
+
+        for ti, t in enumerate(times):
+            aa.set_jultime(t)
+            s.compute(aa)
+            # get fluxes vs. freq of the calibrator
+            # Sc = s.get_jys()
+            # get the topocentric coordinate of the calibrator at the current time
+            s_top = s.get_crds('top', ncrd=3)
+            # aa.sim_cache(cat.get_crds('eq', ncrd=3)) # for compute bm_response and sim
+            phs = np.exp(-2.0J * np.pi * np.tensordot(s_top, uijs, axes=(0, 1))).T # (nfreq, nbl)
+
+            vis[ti] *= phs[:, np.newaxis, :]
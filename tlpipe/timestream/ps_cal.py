@@ -12,10 +12,7 @@ import re
 import itertools
 import time
 import numpy as np
-from scipy import linalg as la
-import ephem
 import h5py
-import aipy as a
 import timestream_task
 from tlpipe.container.timestream import Timestream
 from tlpipe.core import constants as const
@@ -25,8 +22,7 @@ from caput import mpiarray
 from tlpipe.utils.path_util import output_path
 from tlpipe.utils import progress
 from tlpipe.utils import rpca_decomp
-import tlpipe.plot
-import matplotlib.pyplot as plt
+from tlpipe.utils.plot_util import setup_matplotlib
 
 
 class PsCal(timestream_task.TimestreamTask):
@@ -83,7 +79,17 @@ class PsCal(timestream_task.TimestreamTask):
 
     prefix = 'pc_'
 
+    process_dist_axis = 'baseline'
+
+    # writes gain files and figures
+    pure_process = False
+
     def process(self, ts):
+        from scipy import linalg as la
+        import ephem
+        import aipy as a
+        setup_matplotlib()
+        import matplotlib.pyplot as plt
 
         assert isinstance(ts, Timestream), '%s only works for Timestream object' % self.__class__.__name__
 
@@ -10,18 +10,18 @@ Inheritance diagram
 
 import os
 import numpy as np
-import ephem
-import aipy as a
 import timestream_task
 from tlpipe.container.timestream import Timestream
 from caput import mpiutil
 from tlpipe.utils.path_util import output_path
 from tlpipe.core import constants as const
-import tlpipe.plot
-import matplotlib.pyplot as plt
+from tlpipe.utils.plot_util import setup_matplotlib
 
 
 def fit(vis_obs, vis_mask, vis_sim, start_ind, end_ind, num_shift, idx, plot_fit, fig_prefix, iteration, tag_output_iter, bls_plt, freq_plt):
+    setup_matplotlib()
+    import matplotlib.pyplot as plt
+
     vis_obs = np.ma.array(vis_obs, mask=vis_mask)
     num_nomask = vis_obs.count()
     if num_nomask == 0: # no valid vis data
@@ -130,7 +130,14 @@ class PsFit(timestream_task.TimestreamTask):
 
     prefix = 'pf_'
 
+    process_dist_axis = 'baseline'
+
+    # writes figures
+    pure_process = False
+
     def process(self, ts):
+        import ephem
+        import aipy as a
 
         assert isinstance(ts, Timestream), '%s only works for Timestream object' % self.__class__.__name__
 
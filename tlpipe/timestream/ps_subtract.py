@@ -9,7 +9,6 @@ Inheritance diagram
 """
 
 import numpy as np
-import aipy as a
 import timestream_task
 from tlpipe.core import constants as const
 from caput import mpiutil
@@ -32,7 +31,12 @@ class PsSub(timestream_task.TimestreamTask):
 
     prefix = 'ps_'
 
+    process_dist_axis = 'baseline'
+
+    pure_process = True
+
     def process(self, ts):
+        import aipy as a
 
         ps = self.params['ps']
         catalog = self.params['catalog']
@@ -28,6 +28,10 @@ class ReOrder(timestream_task.TimestreamTask):
 
     prefix = 'ro_'
 
+    process_dist_axis = 'baseline'
+
+    pure_process = True
+
     def process(self, ts):
 
         assert isinstance(ts, Timestream), '%s only works for Timestream object' % self.__class__.__name__
@@ -121,3 +125,22 @@ class ReOrder(timestream_task.TimestreamTask):
                 dset.local_data[:] = np.concatenate([ dset.local_data[sel1], dset.local_data[sel2] ], axis=time_axis)
 
         return super(ReOrder, self).process(ts)
+
+    def plan_process(self, stage, ts):
+        """Plan re-ordering the data of a sidereal day."""
+
+        int_time = ts.attrs['inttime']
+        if ts.lengths['time'] * int_time < self.params['discard_less'] * const.sday:
+            stage.note('data less than %s sidereal day will be discarded' % self.params['discard_less'])
+            return None
+
+        ts = super(ReOrder, self).plan_process(stage, ts)
+
+        # the re-ordered vis and vis_mask are created before replacing the original ones
+        num_int = np.int(np.around(1.0 * const.sday / int_time))
+        reordered = ts.copy()
+        reordered.resize('time', num_int)
+        stage.hold(reordered.local_nbytes(stage.nproc, ['vis', 'vis_mask']))
+        ts.resize('time', num_int)
+
+        return ts
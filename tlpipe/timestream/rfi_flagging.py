@@ -39,6 +39,12 @@ class Flag(timestream_task.TimestreamTask):
 
     prefix = 'rf_'
 
+    process_dist_axis = 'baseline'
+
+    packed_mask_support = True
+    mutated_datasets = ('vis_mask',)
+    pure_process = True
+
     def process(self, ts):
 
         ts.redistribute('baseline')
@@ -51,7 +57,7 @@ class Flag(timestream_task.TimestreamTask):
         show_progress = self.params['show_progress']
         progress_step = self.params['progress_step']
 
-        func(self.flag, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False)
+        func(self.flag, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False, num_threads=self.params['num_threads'], schedule=self.params['schedule'])
 
         return super(Flag, self).process(ts)
 
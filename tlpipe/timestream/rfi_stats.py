@@ -12,11 +12,8 @@ from datetime import datetime, timedelta
 import numpy as np
 import timestream_task
 from tlpipe.utils.path_util import output_path
-import tlpipe.plot
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import MaxNLocator, AutoMinorLocator
 from caput import mpiutil
+from tlpipe.utils.plot_util import setup_matplotlib
 
 
 class Stats(timestream_task.TimestreamTask):
@@ -35,7 +32,16 @@ class Stats(timestream_task.TimestreamTask):
 
     prefix = 'rs_'
 
+    process_dist_axis = 'baseline'
+
+    # writes figures
+    pure_process = False
+
     def process(self, ts):
+        setup_matplotlib()
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+        from matplotlib.ticker import MaxNLocator, AutoMinorLocator
 
         excl_auto = self.params['excl_auto']
         plot_stats = self.params['plot_stats']
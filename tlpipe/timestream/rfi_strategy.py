@@ -0,0 +1,72 @@
+"""RFI flagging by a strategy run in a single pass.
+
+Inheritance diagram
+-------------------
+
+.. inheritance-diagram:: Strategy
+   :parts: 2
+
+"""
+
+import timestream_task
+from tlpipe.container.timestream import Timestream
+from tlpipe.rfi import strategy
+
+
+class Strategy(timestream_task.TimestreamTask):
+    """RFI flagging by a strategy run in a single pass.
+
+    This runs a chain of RFI flagging steps, see :mod:`tlpipe.rfi.strategy`,
+    on the data of each baseline (all polarizations of it for a
+    :class:`~tlpipe.container.timestream.Timestream`) in turn, so the data is
+    redistributed and passed through only once, instead of once for each of
+    the RFI flagging tasks chained in the pipe file.
+
+    The default strategy does the same flagging as
+    :class:`~tlpipe.timestream.rfi_flagging.Flag`.
+
+    """
+
+    params_init = {
+                    'strategy': [ ('interpolate', {}),
+                                  ('gaussian_filter', {'input': 'background', 'masked': False, 'time_kernal_size': 1.0, 'freq_kernal_size': 3.0}),
+                                  ('subtract', {}),
+                                  ('sum_threshold', {'max_threshold_length': 1}),
+                                  ('iterate', {'count': 2, 'steps': [ ('gaussian_filter', {'time_kernal_size': 1.0, 'freq_kernal_size': 3.0}),
+                                                                      ('subtract', {}),
+                                                                      ('sum_threshold', {'max_threshold_length': 1024}) ]}),
+                                ],
+                  }
+
+    prefix = 'rs_'
+
+    process_dist_axis = 'baseline'
+
+    packed_mask_support = True
+    mutated_datasets = ('vis_mask',)
+    pure_process = True
+
+    def process(self, ts):
+
+        ts.redistribute('baseline')
+
+        # check the strategy before running it
+        self.strategy = strategy.Strategy(self.params['strategy'])
+
+        ns_on = ts['ns_on'][:] if 'ns_on' in ts.iterkeys() else None
+
+        show_progress = self.params['show_progress']
+        progress_step = self.params['progress_step']
+
+        ts.bl_data_operate(self.flag, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False, num_threads=self.params['num_threads'], schedule=self.params['schedule'], ns_on=ns_on)
+
+        if isinstance(ts, Timestream) and 'combine' in [ name for (name, _) in self.strategy.steps ]:
+            # set flag to indicate the combination
+            ts['vis_mask'].attrs['combined_mask'] = True
+
+        return super(Strategy, self).process(ts)
+
+    def flag(self, vis, vis_mask, li, gi, bl, ts, **kwargs):
+        """Function that runs the strategy on the data of a baseline."""
+
+        self.strategy.run(vis, vis_mask, kwargs.get('ns_on'))
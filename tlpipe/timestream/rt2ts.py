@@ -9,6 +9,8 @@ Inheritance diagram
 """
 
 import timestream_task
+from tlpipe.container.timestream import Timestream
+from tlpipe.pipeline import planner
 
 
 class Rt2ts(timestream_task.TimestreamTask):
@@ -31,8 +33,40 @@ class Rt2ts(timestream_task.TimestreamTask):
 
     prefix = 'r2t_'
 
+    pure_process = True
+
     def process(self, rt):
 
         ts = rt.separate_pol_and_bl(self.params['keep_dist_axis'], self.params['destroy_rt'])
 
-        return super(Rt2ts, self).process(ts)
\ No newline at end of file
+        return super(Rt2ts, self).process(ts)
+
+    def plan_process(self, stage, rt):
+        """Plan separating the polarization and baseline as done by
+        :meth:`~tlpipe.container.raw_timestream.RawTimestream.separate_pol_and_bl`."""
+
+        # can not separate if the dist axis is baseline
+        if rt.dist_axis_name == 'baseline':
+            stage.redistribute(rt, 'time', int(self.params['redistribute_slab_size'] * 2**20))
+
+        nfeed = rt.dataset_shape('feedno')[0]
+        lengths = dict(rt.lengths, polarization=4, baseline=nfeed*(nfeed+1)/2)
+        ts = planner.ProductShape('Timestream', Timestream._main_data_axes_, lengths, rt.dist_axis)
+        ts.attrs = dict(rt.attrs)
+        # other datasets share data with rt
+        for name, (dims, itemsize) in rt.datasets.items():
+            if not 'baseline' in dims and name != 'channo':
+                ts.add_dataset(name, dims, itemsize)
+        ts.add_dataset('vis', ts.axes, rt.datasets['vis'][1])
+        ts.add_dataset('vis_mask', ts.axes, rt.datasets['vis_mask'][1])
+        ts.add_dataset('pol', ('polarization',), 4)
+        ts.add_dataset('blorder', ('baseline', 2), rt.datasets['blorder'][1])
+
+        # vis and vis_mask are separated one after another, the original one is
+        # deleted after separated if destroy_rt
+        for name in ('vis', 'vis_mask'):
+            stage.hold(ts.local_nbytes(stage.nproc, [ name ]))
+            if self.params['destroy_rt']:
+                stage.release(rt.local_nbytes(stage.nproc, [ name ]))
+
+        return ts
\ No newline at end of file
@@ -30,6 +30,10 @@ class Sir(timestream_task.TimestreamTask):
 
     prefix = 'sir_'
 
+    process_dist_axis = 'baseline'
+
+    pure_process = True
+
     def process(self, ts):
 
         ts.redistribute('baseline')
@@ -45,7 +49,7 @@ class Sir(timestream_task.TimestreamTask):
             else:
                 func = ts.pol_and_bl_data_operate
 
-        func(self.operate, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False)
+        func(self.operate, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False, num_threads=self.params['num_threads'], schedule=self.params['schedule'])
 
         return super(Sir, self).process(ts)
 
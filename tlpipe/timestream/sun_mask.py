@@ -9,8 +9,6 @@ Inheritance diagram
 """
 
 import numpy as np
-import ephem
-import aipy as a
 import timestream_task
 
 
@@ -23,7 +21,11 @@ class Mask(timestream_task.TimestreamTask):
 
     prefix = 'sm_'
 
+    pure_process = True
+
     def process(self, ts):
+        import ephem
+        import aipy as a
 
         span = self.params['span']
 
@@ -25,6 +25,8 @@ class Convert(timestream_task.TimestreamTask):
 
     prefix = 'tc_'
 
+    pure_process = True
+
     def process(self, ts):
         if 'unit' in ts.vis.attrs.keys() and ts.vis.attrs['unit'] == 'K':
             if mpiutil.rank0:
@@ -0,0 +1,152 @@
+"""Unit tests for the tasks operating on blocks of data by data_operate.
+
+The callbacks of these tasks operate on blocks of slices at once, they are
+compared with the per-slice callbacks they replaced.
+
+"""
+
+import numpy as np
+import pytest
+from caput import mpiutil
+from caput import mpiarray
+from tlpipe.container.timestream import Timestream
+from tlpipe.timestream import combine_mask
+from tlpipe.timestream import freq_flag
+from tlpipe.timestream import phs2zen
+from tlpipe.timestream import phs2src
+
+
+shape = (5, 16, 2, 4) # time, frequency, polarization, baseline
+feedno = [ 3, 5, 8 ]
+blorder = np.array([ [3, 3], [3, 5], [5, 8], [3, 8] ])
+
+
+def _local(data, axis):
+    arr = mpiarray.MPIArray(data.shape, axis=axis, comm=mpiutil.world, dtype=data.dtype)
+    sel = [ slice(None) ] * data.ndim
+    sel[axis] = slice(arr.local_offset[axis], arr.local_offset[axis] + arr.shape[axis])
+    arr.local_array[:] = data[tuple(sel)]
+    return arr
+
+
+def _ts():
+    rs = np.random.RandomState(0)
+    vis = (rs.normal(size=shape) + 1.0J * rs.normal(size=shape)).astype(np.complex128)
+    # some outliers along the frequency axis
+    vis[rs.rand(*shape) > 0.9] *= 20.0
+    vis_mask = rs.rand(*shape) > 0.85
+    # too few valid frequency points to flag
+    vis_mask[1, 2:, 0, 1] = True
+    ts = Timestream(dist_axis=0, comm=mpiutil.world)
+    ts.create_dataset('vis', data=_local(vis, 0))
+    ts.create_dataset('vis_mask', data=_local(vis_mask, 0))
+    ts.create_dataset('jul_date', data=_local(2458000.0 + 0.01 * np.arange(shape[0]), 0))
+    ts.create_dataset('freq', data=700.0 + np.arange(shape[1]))
+    ts.create_dataset('pol', data=np.array([ ts.pol_dict[p] for p in ('xx', 'yy') ]), dtype='i4')
+    ts['pol'].attrs['pol_type'] = 'linear'
+    ts.create_dataset('blorder', data=blorder)
+    ts.create_dataset('feedno', data=np.array(feedno))
+    return ts
+
+
+def _local_data(ts):
+    return np.asarray(ts.local_vis), np.asarray(ts.local_vis_mask)
+
+
+def test_combine_mask():
+    task = combine_mask.Combine({}, feedback=0)
+
+    def combine(vis, vis_mask, li, gi, tf, ts, **kwargs):
+        vis_mask[:] = np.sum(vis_mask, axis=2).astype(bool)[:, :, np.newaxis]
+
+    ts = _ts()
+    ts.bl_data_operate(combine)
+    expected = _local_data(ts)
+    ts = _ts()
+    ts.bl_data_operate(task.combine, block_size=0)
+    result = _local_data(ts)
+
+    assert np.array_equal(result[1], expected[1])
+
+
+@pytest.mark.parametrize('block_size', [ 1, 2, 64 ])
+def test_freq_flag(block_size):
+    task = freq_flag.Flag({}, feedback=0)
+    sigma = task.params['sigma']
+    freq_points = task.params['freq_points']
+
+    def flag(vis, vis_mask, li, gi, tbl, ts, **kwargs):
+        vis_abs = np.ma.abs(np.ma.array(vis, mask=vis_mask))
+        if vis_abs.count() >= freq_points:
+            median = np.ma.median(vis_abs)
+            abs_diff = np.ma.abs(vis_abs - median)
+            mad = np.ma.median(abs_diff) / 0.6745
+            inds = np.ma.where(abs_diff > sigma*mad)[0] # masked inds
+            vis_mask[inds] = True # set mask
+
+    ts = _ts()
+    ts.time_pol_and_bl_data_operate(flag, full_data=True)
+    expected = _local_data(ts)
+    ts = _ts()
+    ts.time_pol_and_bl_data_operate(task.flag, full_data=True, block_size=block_size)
+    result = _local_data(ts)
+
+    assert np.array_equal(result[1], expected[1])
+    # something has been flagged
+    assert result[1].sum() > _ts()['vis_mask'].local_data.sum() or result[1].size == 0
+
+
+class _AntennaArray(object):
+    ### the parts of an aipy AntennaArray used by the phasing tasks
+    def __init__(self):
+        self.pos = np.array([ [0.0, 0.0, 0.0], [3.0, -1.0, 0.5], [-2.0, 4.0, 0.2] ])
+        self.t = None
+    def set_jultime(self, t):
+        self.t = t
+    def gen_uvw(self, i, j, src='z'):
+        # (3, 1, nfreq) in wavelength, as aipy does
+        f = (700.0 + np.arange(shape[1])) / 300.0
+        return ((self.pos[j] - self.pos[i])[:, np.newaxis] * f)[:, np.newaxis, :]
+
+
+class _Source(object):
+    ### the parts of an aipy source used by the phasing tasks
+    def compute(self, aa):
+        self.t = aa.t
+    def get_crds(self, crdsys, ncrd=3):
+        a = 100.0 * (self.t - 2458000.0)
+        return np.array([ np.sin(a), np.cos(a) * 0.6, np.cos(a) * 0.8 ])
+
+
+def _phs(sign):
+    ### the per-slice phs of phs2zen (sign 1) or phs2src (sign -1)
+    def phs(vis, vis_mask, li, gi, tbl, ts, **kwargs):
+        t = tbl[0]
+        ai, aj = tbl[1]
+        aa = kwargs.get('aa')
+        s = kwargs.get('s')
+        fn = ts['feedno'][:].tolist()
+        i = fn.index(ai)
+        j = fn.index(aj)
+        aa.set_jultime(t)
+        s.compute(aa)
+        s_top = s.get_crds('top', ncrd=3)
+        uij = aa.gen_uvw(i, j, src='z').squeeze() # (rj - ri)/lambda
+        vis[:] = vis * np.exp(-2.0J * np.pi * np.dot(s_top, uij))[:, np.newaxis]**sign
+    return phs
+
+
+@pytest.mark.parametrize('module, sign', [ (phs2zen, 1), (phs2src, -1) ])
+@pytest.mark.parametrize('block_size', [ 1, 3, 64 ])
+def test_phs(module, sign, block_size):
+    task = getattr(module, module.__name__.split('.')[-1].capitalize())({}, feedback=0)
+
+    ts = _ts()
+    ts.time_and_bl_data_operate(_phs(sign), aa=_AntennaArray(), s=_Source())
+    expected = _local_data(ts)
+    ts = _ts()
+    ts.time_and_bl_data_operate(task.phs, block_size=block_size, aa=_AntennaArray(), s=_Source())
+    result = _local_data(ts)
+
+    assert np.allclose(result[0], expected[0], rtol=1e-12, atol=0)
+    assert not np.allclose(result[0], _local_data(_ts())[0])
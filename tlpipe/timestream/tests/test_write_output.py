@@ -0,0 +1,83 @@
+"""Unit tests for writing the output of the timestream tasks.
+
+The tests run in a single process, or by several processes with e.g.::
+
+    $ mpirun -np 2 python -m pytest test_write_output.py
+
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import h5py
+import pytest
+from caput import mpiutil
+from caput import mpiarray
+from tlpipe.container.timestream import Timestream
+from tlpipe.container import packed_mask
+from tlpipe.timestream import combine_mask
+from tlpipe.timestream import freq_flag
+
+
+shape = (5, 3, 2, 4) # time, frequency, polarization, baseline
+
+
+@pytest.fixture
+def outdir(monkeypatch):
+    # shared by all procs
+    dirname = mpiutil.bcast(tempfile.mkdtemp() if mpiutil.rank0 else None)
+    monkeypatch.setenv('TL_OUTPUT', dirname + '/')
+    yield dirname
+    mpiutil.barrier()
+    if mpiutil.rank0:
+        shutil.rmtree(dirname)
+
+
+def _ts():
+    vis_mask = np.random.RandomState(0).rand(*shape) > 0.6
+    ts = Timestream(dist_axis=0, comm=mpiutil.world)
+    vis = mpiarray.MPIArray(shape, axis=0, comm=mpiutil.world, dtype=np.complex64)
+    vis.local_array[:] = 1.0
+    ts.create_dataset('vis', data=vis)
+    mask = mpiarray.MPIArray(shape, axis=0, comm=mpiutil.world, dtype=bool)
+    st = mask.local_offset[0]
+    mask.local_array[:] = vis_mask[st:st+mask.shape[0]]
+    ts.create_dataset('vis_mask', data=mask)
+    ts.create_dataset('freq', data=700.0 + np.arange(shape[1]))
+    return ts, vis_mask
+
+
+def _check_file(filename, vis_mask):
+    with h5py.File(filename, 'r') as f:
+        assert packed_mask.is_packed(f['vis_mask'])
+        assert np.array_equal(packed_mask.read_packed(f['vis_mask'], [ slice(None) ] * len(shape)), vis_mask)
+
+
+@pytest.mark.parametrize('async_write', [ False, True ])
+def test_pack_only_written_mask(outdir, async_write):
+    # Combine can not work with a packed mask
+    task = combine_mask.Combine({'cm_pack_mask': True, 'cm_output_files': 'out.hdf5', 'cm_check_status': False, 'cm_async_write': async_write}, feedback=0)
+    assert not task.packed_mask_support
+    ts, vis_mask = _ts()
+    task.write_output(ts)
+    # the output handed to the later tasks is not packed
+    assert not ts.mask_packed
+    st = ts['vis_mask'].local_offset[0]
+    assert np.array_equal(ts.local_vis_mask, vis_mask[st:st+ts.local_vis_mask.shape[0]])
+    task.finish()
+    mpiutil.barrier()
+
+    _check_file(os.path.join(outdir, 'out.hdf5'), vis_mask)
+
+
+def test_pack_supported(outdir):
+    task = freq_flag.Flag({'ff_pack_mask': True, 'ff_output_files': 'out.hdf5', 'ff_check_status': False}, feedback=0)
+    assert task.packed_mask_support
+    ts, vis_mask = _ts()
+    task.write_output(ts)
+    # kept packed
+    assert ts.mask_packed
+    mpiutil.barrier()
+
+    _check_file(os.path.join(outdir, 'out.hdf5'), vis_mask)
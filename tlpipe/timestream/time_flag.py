@@ -10,7 +10,6 @@ Inheritance diagram
 
 import warnings
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline
 import timestream_task
 from tlpipe.container.raw_timestream import RawTimestream
 from tlpipe.container.timestream import Timestream
@@ -32,6 +31,12 @@ class Flag(timestream_task.TimestreamTask):
 
     prefix = 'tf_'
 
+    process_dist_axis = 'baseline'
+
+    packed_mask_support = True
+    mutated_datasets = ('vis_mask',)
+    pure_process = True
+
     def process(self, ts):
 
         time_window = self.params['time_window']
@@ -54,7 +59,7 @@ class Flag(timestream_task.TimestreamTask):
             show_progress = self.params['show_progress']
             progress_step = self.params['progress_step']
 
-            func(self.flag, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False)
+            func(self.flag, full_data=True, show_progress=show_progress, progress_step=progress_step, keep_dist_axis=False, num_threads=self.params['num_threads'], schedule=self.params['schedule'])
         else:
             warnings.warn('Not enough time points to do the smoothing')
 
@@ -62,6 +67,7 @@ class Flag(timestream_task.TimestreamTask):
 
     def flag(self, vis, vis_mask, li, gi, tbl, ts, **kwargs):
         """Function that does the actual flag."""
+        from scipy.interpolate import InterpolatedUnivariateSpline
 
         sigma = self.params['sigma']
         time_window = self.params['time_window']
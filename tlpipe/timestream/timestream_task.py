@@ -11,12 +11,16 @@ Inheritance diagram
 import sys, traceback
 from os import path
 import logging
-import h5py
+import numpy as np
+from tlpipe.container import container
 from tlpipe.container.timestream_common import TimestreamCommon
 from tlpipe.container.raw_timestream import RawTimestream
 from tlpipe.container.timestream import Timestream
+from tlpipe.container import file_index
+from tlpipe.container.async_writer import AsyncWriter
 from tlpipe.utils.path_util import input_path, output_path
 from tlpipe.pipeline.pipeline import OneAndOne
+from tlpipe.pipeline import planner
 from caput import mpiutil
 
 
@@ -24,6 +28,24 @@ from caput import mpiutil
 logger = logging.getLogger(__name__)
 
 
+def _select_len(value, n):
+    ### number of points selected by the data selection `value` out of `n`
+    if isinstance(value, tuple):
+        return len(xrange(*slice(*value).indices(n)))
+    else:
+        return len(value)
+
+
+def _num_baselines(nfeed, corr, Tod_class):
+    ### number of baselines of `nfeed` selected feeds
+    if Tod_class == RawTimestream:
+        # xx, yy, xy of each feed, and 4 channel pairs of each pair of feeds
+        nauto, ncross = 3 * nfeed, 2 * nfeed * (nfeed - 1)
+    else:
+        nauto, ncross = nfeed, nfeed * (nfeed - 1) / 2
+    return { 'auto': nauto, 'cross': ncross, 'all': nauto + ncross }[corr]
+
+
 class TimestreamTask(OneAndOne):
     """Task that provides raw timestream or timestream IO and data selection operations.
 
@@ -41,6 +63,28 @@ class TimestreamTask(OneAndOne):
 
     _Tod_class = TimestreamCommon
 
+    # whether `process` can work with a bit-packed vis_mask, i.e., it only
+    # accesses vis_mask through data_operate, else vis_mask will be unpacked
+    # before `process`
+    packed_mask_support = False
+
+    # names of datasets that `process` may modify in place, only these will
+    # be copied by `copy_input` when `copy` is True, other datasets share
+    # data with the input by read-only views until they are made writable by
+    # ensure_writable; None to copy all datasets. Shared datasets of an input
+    # in this list are made writable by `cast_input` before `process`
+    mutated_datasets = None
+
+    # the axis that `process` redistributes the data along, used to plan the
+    # resources of the pipeline; None if it works with any distribution
+    process_dist_axis = None
+
+    # whether `process` is a pure transform of its input and parameters,
+    # i.e., it keeps no state between iterations and has no side effects
+    # such as writing gain files or figures; only the outputs of such tasks
+    # are cached by the result cache of the pipeline
+    pure_process = False
+
     params_init = {
                     'mode': 'r',
                     'start': 0,
@@ -53,7 +97,18 @@ class TimestreamTask(OneAndOne):
                     'chunk_vis': False, # chunk vis and vis_mask in saved files
                     'chunk_shape': None,
                     'chunk_size': 64, # KB
+                    'write_mode': 'auto', # 'auto', 'mpio', 'staging' or 'serial'
+                    'lazy': False, # keep vis and vis_mask backed by the input files
+                    'lazy_cache_size': 1024, # MB
+                    'lazy_block_size': None, # number of points along dist axis of a lazy block
+                    'read_planner': False, # read data by chunk-aligned coalesced reads
+                    'pack_mask': False, # hold vis_mask bit-packed in memory and output files
+                    'redistribute_slab_size': 64, # MB, max size of a slab moved in each step of redistribute
+                    'num_threads': 1, # number of threads to run data operations of tasks that support it
+                    'schedule': 'static', # or 'dynamic' to balance the load of data operations of tasks that support it
                     'output_failed_continue': False, # continue to run if output to files failed
+                    'async_write': False, # write output in a background thread while the pipeline moves on
+                    'async_write_queue': 1, # max number of outputs waiting to be written in the background
                     'time_select': (0, None),
                     'freq_select': (0, None),
                     'pol_select': (0, None), # only useful for ts
@@ -68,9 +123,21 @@ class TimestreamTask(OneAndOne):
 
     prefix = 'tt_'
 
+    # parameters that only affect how the data is held, read, operated on or
+    # written, but not the output data
+    cache_exclude_params = OneAndOne.cache_exclude_params + ('mode', 'check_status', 'write_hints', 'libver', 'chunk_vis', 'chunk_shape', 'chunk_size', 'write_mode', 'lazy', 'lazy_cache_size', 'lazy_block_size', 'read_planner', 'redistribute_slab_size', 'num_threads', 'schedule', 'output_failed_continue', 'async_write', 'async_write_queue', 'exclude', 'show_progress', 'progress_step', 'show_info', 'tag_output_iter')
+
+    _async_writer = None
+    _output_owned = False
+
     def read_process_write(self, tod):
         """Reads input, executes any processing and writes output."""
 
+        # the output can be taken over by the async writer if it is not shared
+        # with other tasks, i.e., read from files or a copy of the input, and
+        # will not be passed to later tasks
+        self._output_owned = (tod is None or self.params['copy']) and len(self._out_keys) == 0
+
         # determine if rt or ts from the input tod, and set the correct _Tod_class
         if self._no_input:
             if not tod is None:
@@ -99,8 +166,7 @@ class TimestreamTask(OneAndOne):
                         self.stop_iteration(True)
                         return None
                 # see 'vis' dataset from the first input file
-                with h5py.File(input_files[0], 'r') as f:
-                    vis_shp = f['vis'].shape
+                vis_shp = file_index.get_file_info(input_files[:1])[0]['shapes']['vis']
                 if len(vis_shp) == 3:
                     self._Tod_class = RawTimestream
                 elif len(vis_shp) == 4:
@@ -116,12 +182,28 @@ class TimestreamTask(OneAndOne):
                 else:
                     raise ValueError('Invaid input %s, need either a RawTimestream or Timestream object' % tod)
 
+                if tod.mask_packed and not self.packed_mask_support:
+                    tod.unpack_mask()
+                tod.redistribute_slab_size = self.params['redistribute_slab_size']
+
                 tod, full_data = self.subset_select(tod)
                 if not full_data:
                     tod = tod.subset(return_copy=False)
 
         return super(TimestreamTask, self).read_process_write(tod)
 
+    @property
+    def cacheable(self):
+        return self.pure_process
+
+    def _cache_input_files(self):
+        """Input files of the current iteration, used for result caching."""
+
+        if self.iterable and self.params['tag_input_iter']:
+            return input_path(self.input_files, iteration=self.iteration)
+        else:
+            return self.input_files
+
     def read_input(self):
         """Method for reading time ordered data input."""
 
@@ -136,11 +218,18 @@ class TimestreamTask(OneAndOne):
         else:
             input_files = self.input_files
         tod = self._Tod_class(input_files, mode, start, stop, dist_axis)
+        if self.params['lazy']:
+            tod.enable_lazy_load(self.params['lazy_cache_size'], self.params['lazy_block_size'])
+        tod.use_read_planner = self.params['read_planner']
+        tod.redistribute_slab_size = self.params['redistribute_slab_size']
 
         tod, full_data = self.data_select(tod)
 
         tod.load_all()
 
+        if self.params['pack_mask'] and self.packed_mask_support:
+            tod.pack_mask()
+
         return tod
 
     def full_data_select(self):
@@ -196,9 +285,105 @@ class TimestreamTask(OneAndOne):
 
         return tod, full_data
 
+    def read_output(self, filenames):
+        """Method for reading the cached output written by :meth:`write_cache`."""
+
+        # see 'vis' dataset from the first file
+        vis_shp = file_index.get_file_info(filenames[:1])[0]['shapes']['vis']
+        if len(vis_shp) == 3:
+            tod = RawTimestream(filenames, 'r', 0, None, self.params['dist_axis'])
+        else:
+            tod = Timestream(filenames, 'r', 0, None, self.params['dist_axis'])
+        tod.redistribute_slab_size = self.params['redistribute_slab_size']
+        tod.load_all()
+
+        if self.params['pack_mask'] and self.packed_mask_support:
+            tod.pack_mask()
+
+        return tod
+
+    def write_cache(self, output, filenames):
+        """Method for writing the output to the result cache."""
+
+        output.to_files(filenames, exclude=[], check_status=self.params['check_status'], write_hints=True, libver=self.params['libver'], write_mode=self.params['write_mode'])
+
     def copy_input(self, tod):
         """Return a copy of tod, so the original tod would not be changed."""
-        return tod.copy()
+        return tod.copy(copy_datasets=self.mutated_datasets)
+
+    def cast_input(self, tod):
+        """Make the datasets `process` may modify writable, copying those
+        still shared with another container."""
+        tod.ensure_writable(self.mutated_datasets)
+
+        return tod
+
+    def plan_read(self, stage):
+        """Shape of the data read from the input files, from their metadata only."""
+
+        input_files = self._cache_input_files()
+        # may be written by an earlier task in the pipeline
+        for infile in input_files:
+            if not path.exists(infile):
+                return None
+
+        files_info = file_index.get_file_info(input_files)
+        num_ts = file_index.num_time_points(files_info, 'vis')
+        _, _, start, stop = container.select_time_range(num_ts, self.params['start'], self.params['stop'])
+        shape = self.plan_shape(files_info, stop - start, stage)
+        stage.read(shape)
+
+        return shape
+
+    def plan_shape(self, files_info, nt, stage):
+        """Shape of `nt` time points of data in files of metadata `files_info` after the data selection."""
+
+        info = files_info[0]
+        vis_shp = info['shapes']['vis']
+        Tod_class = RawTimestream if len(vis_shp) == 3 else Timestream
+        axes = Tod_class._main_data_axes_
+
+        lengths = dict(zip(axes, [ nt ] + list(vis_shp[1:])))
+        lengths['time'] = _select_len(self.params['time_select'], lengths['time'])
+        lengths['frequency'] = _select_len(self.params['freq_select'], lengths['frequency'])
+        if Tod_class == Timestream:
+            lengths['polarization'] = _select_len(self.params['pol_select'], lengths['polarization'])
+        if self.params['feed_select'] != (0, None) and self.params['corr'] != 'all':
+            nfeed = _select_len(self.params['feed_select'], info['shapes']['feedno'][0])
+            lengths['baseline'] = _num_baselines(nfeed, self.params['corr'], Tod_class)
+
+        shape = planner.ProductShape(Tod_class.__name__, axes, lengths)
+        shape.attrs['inttime'] = info['inttime']
+        dist_axis = self.params['dist_axis'] if stage.dist_axis is None else stage.dist_axis
+        shape.dist_axis = shape.axis_index(dist_axis)
+
+        ordered = dict(Tod_class._time_ordered_datasets_, **Tod_class._main_axes_ordered_datasets_)
+        for name, shp in info['shapes'].items():
+            order = ordered.get(name, ())
+            dims = [ (axes[order[ai]] if ai < len(order) and order[ai] is not None else n) for ai, n in enumerate(shp) ]
+            shape.add_dataset(name, dims, np.dtype(str(info['dtypes'][name])).itemsize)
+
+        # datasets created when loading if not in the files
+        mask_itemsize = 1.0 / 8 if self.params['pack_mask'] and self.packed_mask_support else 1
+        for name, dims, itemsize in [ ('vis_mask', axes, mask_itemsize),
+                                      ('freq', ('frequency',), 8),
+                                      ('sec1970', ('time',), 8),
+                                      ('jul_date', ('time',), 8),
+                                      ('local_hour', ('time',), 8),
+                                      ('az_alt', ('time', 2), 8),
+                                      ('ra_dec', ('time', 2), 8) ]:
+            if not name in shape.datasets:
+                shape.add_dataset(name, dims, itemsize)
+
+        return shape
+
+    def plan_process(self, stage, tod):
+        """Plan the redistribution of the data by `process`."""
+
+        if self.process_dist_axis is not None:
+            stage.redistribute(tod, self.process_dist_axis, int(self.params['redistribute_slab_size'] * 2**20))
+
+        return tod
 
     def process(self, tod):
 
@@ -219,6 +404,7 @@ class TimestreamTask(OneAndOne):
         chunk_vis = self.params['chunk_vis']
         chunk_shape = self.params['chunk_shape']
         chunk_size = self.params['chunk_size']
+        write_mode = self.params['write_mode']
         output_failed_continue = self.params['output_failed_continue']
         tag_output_iter = self.params['tag_output_iter']
 
@@ -227,12 +413,49 @@ class TimestreamTask(OneAndOne):
         else:
             output_files = self.output_files
 
-        try:
-            output.to_files(output_files, exclude, check_status, write_hints, libver, chunk_vis, chunk_shape, chunk_size)
-        except Exception as e:
-            if output_failed_continue:
-                msg = 'Process %d writing output to files failed...' % mpiutil.rank
-                logger.warning(msg)
-                traceback.print_exc(file=sys.stdout)
-            else:
-                raise e
+        # the mask is packed for writing only if this task can not work with
+        # a packed mask, it is unpacked again for the later tasks
+        unpack = self.params['pack_mask'] and not (self.packed_mask_support or self._output_owned or output.mask_packed)
+        if self.params['pack_mask']:
+            output.pack_mask()
+
+        if self.params['async_write']:
+            if self._async_writer is None:
+                self._async_writer = AsyncWriter(self.params['async_write_queue'], output.comm)
+            # the queued snapshot keeps the packed mask
+            self._async_writer.write(output, output_files, self._output_owned, output_failed_continue, exclude=exclude, check_status=check_status, write_hints=write_hints, libver=libver, chunk_vis=chunk_vis, chunk_shape=chunk_shape, chunk_size=chunk_size, write_mode=write_mode)
+        else:
+            try:
+                output.to_files(output_files, exclude, check_status, write_hints, libver, chunk_vis, chunk_shape, chunk_size, write_mode)
+            except Exception as e:
+                if output_failed_continue:
+                    msg = 'Process %d writing output to files failed...' % mpiutil.rank
+                    logger.warning(msg)
+                    traceback.print_exc(file=sys.stdout)
+                else:
+                    raise e
+
+        if unpack:
+            output.unpack_mask()
+
+    def checkpoint(self):
+        """Wait until all outputs written in the background are on disk."""
+
+        # keep the writer and its thread for the following iterations
+        if self._async_writer is not None:
+            self._async_writer.flush()
+
+        return super(TimestreamTask, self).checkpoint()
+
+    def finish(self):
+        """Wait until all outputs written in the background are on disk.
+
+        Subclasses that override this should call it.
+
+        """
+
+        if self._async_writer is not None:
+            self._async_writer.close()
+            self._async_writer = None
+
+        super(TimestreamTask, self).finish()
@@ -1,6 +1,4 @@
 import numpy as np
-from scipy.ndimage import convolve1d
-from scipy.ndimage import median_filter
 from robust_stats import MAD
 
 
@@ -20,6 +18,8 @@ def up_sampling(a):
 
 def convolve(a, phi):
     """Convolve `a` along each axis sequentially by `phi`."""
+    from scipy.ndimage import convolve1d
+
     for ax in xrange(a.ndim):
         a = convolve1d(a, phi, axis=ax, mode='reflect')
 
@@ -74,6 +74,7 @@ def starlet_detrend(a, level=None, phi=_phi):
 
 def multiscale_median_transform(a, level=None, scale=2, approx_only=False):
     """Multiscale median transform."""
+    from scipy.ndimage import median_filter
 
     if level == None:
         level = int(np.ceil(np.log2(np.min(a.shape))))
@@ -108,6 +109,7 @@ def multiscale_median_detrend(a, level=None, scale=2):
 
 def median_wavelet_transform(a, level=None, scale=2, tau=5.0, approx_only=False, phi=_phi):
     """Median-wavelet transfrom."""
+    from scipy.ndimage import median_filter
 
     if level == None:
         level = int(np.ceil(np.log2(np.min(a.shape))))
@@ -149,6 +151,7 @@ def median_wavelet_detrend(a, level=None, scale=2, tau=5.0, phi=_phi):
 
 
 def multiscale_median_flag(a, level=None, scale=2, tau=5.0, return_mask=True):
+    from scipy.ndimage import median_filter
 
     if level == None:
         level = int(np.ceil(np.log2(np.min(a.shape))))
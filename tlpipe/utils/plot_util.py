@@ -0,0 +1,19 @@
+"""Matplotlib setup of the plotting functions."""
+
+
+_setup = False
+
+def setup_matplotlib():
+    """Set up matplotlib to plot to files with the non-interactive Agg backend.
+
+    Plotting functions call this when they run before importing
+    `matplotlib.pyplot`, so matplotlib is only loaded by the tasks that plot.
+    """
+    global _setup
+    if _setup:
+        return
+
+    import matplotlib
+    matplotlib.rcParams.update({'figure.max_open_warning': 0})
+    matplotlib.use('Agg')
+    _setup = True
@@ -23,7 +23,6 @@ with :math:`\\gamma = 0.1`.
 """
 
 import numpy as np
-from scipy.stats.mstats import winsorize
 
 
 
@@ -37,6 +36,8 @@ def MAD(a):
 
 
 def _winsorize(a, limits=None, inclusive=(True, True)):
+    from scipy.stats.mstats import winsorize
+
     # drop masked data
     a1 = np.ma.compressed(a)
 
@@ -1,5 +1,4 @@
 import numpy as np
-from scipy import linalg as la
 
 
 def mad(a):
@@ -50,6 +49,7 @@ def shrink(a, lmbda):
 
 def decompose(M, rank=1, S=None, lmbda=None, threshold='hard', max_iter=100, tol=1.0e-8, check_hermitian=False, debug=False):
     """Stable principal component decomposition of an Hermitian matrix."""
+    from scipy import linalg as la
 
     if check_hermitian:
         if not np.allclose(M, M.T.conj()):
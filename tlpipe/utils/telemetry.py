@@ -0,0 +1,160 @@
+"""Per-task performance telemetry.
+
+The data containers count the bytes they read from and write to files, move
+by redistribution and gather between processes by :func:`count`, and the time
+blocked in :func:`caput.mpiutil.barrier` is counted once :func:`enable` has
+been called. :class:`Recorder` takes the differences of these counters, the
+wall time, the CPU time and the peak resident memory over each stage of a
+task, and appends them to a JSON Lines file, one record for each process,
+which can be aggregated across runs to catch performance regressions.
+
+The counters are shared by all threads of a process, e.g., the bytes written
+by the background thread of :class:`~tlpipe.container.async_writer.AsyncWriter`
+are counted in the stage running while it writes.
+
+"""
+
+import json
+import time
+import socket
+import resource
+import threading
+import collections
+from caput import mpiutil
+
+
+# counters of this process, see count
+_counters = collections.defaultdict(int)
+# counters are updated by several threads, e.g., the async writer
+_lock = threading.Lock()
+
+# the original mpiutil.barrier before it is wrapped by enable
+_barrier = None
+
+# names of the counters written in the records
+COUNTERS = ('bytes_read', 'bytes_written', 'bytes_redistributed', 'bytes_gathered', 'barrier_time')
+
+
+def count(name, value):
+    """Add `value` to the counter `name` of this process."""
+    with _lock:
+        _counters[name] += value
+
+
+def counters():
+    """Return a copy of the counters of this process."""
+    with _lock:
+        return dict(_counters)
+
+
+def enable():
+    """Count the time blocked in :func:`caput.mpiutil.barrier`."""
+
+    global _barrier
+
+    if _barrier is not None:
+        return
+    _barrier = mpiutil.barrier
+
+    def barrier(comm=None):
+        # pass the communicator explicitly so the current default one is used
+        comm = mpiutil.world if comm is None else comm
+        st = time.time()
+        _barrier(comm=comm)
+        count('barrier_time', time.time() - st)
+
+    mpiutil.barrier = barrier
+
+
+def disable():
+    """Stop counting the time blocked in :func:`caput.mpiutil.barrier`."""
+
+    global _barrier
+
+    if _barrier is not None:
+        mpiutil.barrier = _barrier
+        _barrier = None
+
+
+def _peak_rss():
+    ### peak resident memory of this process in bytes, ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_time():
+    ### user and system CPU time of this process in seconds
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+class Recorder(object):
+    """Record the performance of each stage of the pipeline tasks.
+
+    Parameters
+    ----------
+    filename : string
+        The JSON Lines file the records are appended to.
+    run_id : None or string, optional
+        Identifier of this run written in all records. Default None to use the
+        start time of the run.
+
+    """
+
+    def __init__(self, filename, run_id=None):
+        if run_id is None:
+            run_id = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.filename = filename
+        self.run_id = mpiutil.bcast(run_id, root=0)
+        # rank in the communicator of all processes, which may be split later
+        self.rank = mpiutil.rank
+        self.host = socket.gethostname()
+
+    def start(self):
+        """Return the state at the start of a stage, pass it to :meth:`record`."""
+        return (time.time(), _cpu_time(), counters())
+
+    def record(self, task, stage, start, iteration=None):
+        """Record a stage of `task` started at `start`.
+
+        This must be called by all processes of the current default
+        communicator, the records of which are written by its rank 0.
+
+        Parameters
+        ----------
+        task : :class:`~tlpipe.pipeline.pipeline.TaskBase`
+            The task.
+        stage : string
+            'setup', 'next' or 'finish'.
+        start : tuple
+            The state at the start of the stage returned by :meth:`start`.
+        iteration : None or integer, optional
+            The iteration of the task.
+
+        """
+
+        wall0, cpu0, counters0 = start
+        now = counters()
+        rec = collections.OrderedDict([
+                ('run', self.run_id),
+                ('task', '%s.%s' % (task.__module__, task.__class__.__name__)),
+                ('prefix', task.prefix),
+                ('stage', stage),
+                ('iteration', iteration),
+                ('rank', self.rank),
+                ('nproc', mpiutil.size),
+                ('host', self.host),
+                ('start', wall0),
+                ('wall_time', time.time() - wall0),
+                ('cpu_time', _cpu_time() - cpu0),
+                ('peak_rss', _peak_rss()),
+              ])
+        for name in COUNTERS:
+            rec[name] = now.get(name, 0) - counters0.get(name, 0)
+
+        recs = mpiutil.world.gather(rec, root=0) if mpiutil.size > 1 else [ rec ]
+        if mpiutil.rank0:
+            lines = ''.join([ json.dumps(r) + '\n' for r in recs ])
+            # a single write of all lines, so the records of several groups of
+            # processes appending to the same file are not interleaved
+            with open(self.filename, 'a') as f:
+                f.write(lines)
@@ -0,0 +1,64 @@
+"""Unit tests for the vectorized time conversions, compared with the
+per-sample ephem computations they replace."""
+
+from datetime import datetime, timedelta
+import numpy as np
+import ephem
+from tlpipe.utils import date_util
+
+
+# site of the Tianlai arrays
+lat = np.radians(44.152614)
+lon = np.radians(91.80603)
+
+# one sample every 7 hours 13 min from 2016 to 2020
+sec1970 = np.arange(1451606400.0, 1577836800.0, 7*3600.0 + 13*60.0 + 0.25)
+
+arcmin = np.radians(1.0 / 60)
+
+
+def _observer():
+    # as the aipy antenna array, no refraction
+    obs = ephem.Observer()
+    obs.lat, obs.lon = lat, lon
+    obs.pressure = 0
+    return obs
+
+
+def test_juldate():
+    jd = date_util.sec1970_to_juldate(sec1970[::50])
+    ref = [ date_util.get_juldate(datetime.utcfromtimestamp(s), tzone='UTC+00h') for s in sec1970[::50] ]
+    assert np.allclose(jd, ref, rtol=0, atol=1.0e-6) # 0.1 s
+
+
+def test_hour():
+    hour = date_util.sec1970_to_hour(sec1970)
+    def _hour(t):
+        return t.hour + t.minute/60.0 + t.second/3600.0 + t.microsecond/3.6e9
+    ref = [ _hour((datetime.utcfromtimestamp(s) + timedelta(hours=8)).time()) for s in sec1970 ]
+    assert np.allclose(hour, ref, rtol=0, atol=1.0e-9)
+
+
+def _check_radec(az, alt):
+    ra, dec = date_util.azalt_to_radec(az, alt, sec1970, lat, lon)
+    obs = _observer()
+    ref = np.zeros((len(sec1970), 2))
+    for ti, jd in enumerate(date_util.sec1970_to_juldate(sec1970)):
+        obs.date = jd - 2415020 # Dublin Julian date, as aipy set_jultime
+        ref[ti] = obs.radec_of(ephem.degrees(az), ephem.degrees(alt))
+    # angular separation
+    cos_sep = np.sin(dec) * np.sin(ref[:, 1]) + np.cos(dec) * np.cos(ref[:, 1]) * np.cos(ra - ref[:, 0])
+    sep = np.arccos(np.clip(cos_sep, -1.0, 1.0))
+    assert sep.max() < arcmin
+    assert np.all((ra >= 0) & (ra < 2*np.pi))
+
+
+def test_radec_zenith():
+    # pointing of the dish and cylinder arrays
+    _check_radec(0.0, np.pi/2)
+    _check_radec(np.pi/2, np.pi/2)
+
+
+def test_radec_off_zenith():
+    for az, alt in [ (0.0, np.radians(60.0)), (np.radians(135.0), np.radians(45.0)), (np.radians(270.0), np.radians(80.0)) ]:
+        _check_radec(az, alt)
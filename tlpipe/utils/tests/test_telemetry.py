@@ -0,0 +1,120 @@
+"""Unit tests for the performance telemetry.
+
+The tests run in a single process, or by several processes with e.g.::
+
+    $ mpirun -np 2 python -m pytest test_telemetry.py
+
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import collections
+import pytest
+from caput import mpiutil
+from tlpipe.utils import telemetry
+
+
+def test_count_threads():
+    before = telemetry.counters().get('bytes_written', 0)
+
+    def _write():
+        for i in xrange(20000):
+            telemetry.count('bytes_written', 3)
+
+    threads = [ threading.Thread(target=_write) for i in range(4) ]
+    for th in threads:
+        th.start()
+    # snapshots are taken while the counters are being updated
+    for i in xrange(1000):
+        telemetry.counters()
+    for th in threads:
+        th.join()
+
+    assert telemetry.counters()['bytes_written'] - before == 4 * 20000 * 3
+
+
+class _Task(object):
+    ### the parts of a task used by the recorder
+    prefix = 'tt_'
+
+
+@pytest.fixture
+def outdir():
+    # shared by all procs
+    dirname = mpiutil.bcast(tempfile.mkdtemp() if mpiutil.rank0 else None)
+    yield dirname
+    mpiutil.barrier()
+    if mpiutil.rank0:
+        shutil.rmtree(dirname)
+
+
+def test_record(outdir):
+    filename = os.path.join(outdir, 'telemetry.jsonl')
+    recorder = telemetry.Recorder(filename, run_id='run%d' % mpiutil.rank)
+
+    for iteration in (0, 1):
+        start = recorder.start()
+        telemetry.count('bytes_read', 100 * (mpiutil.rank + 1))
+        telemetry.count('bytes_gathered', 7)
+        recorder.record(_Task(), 'next', start, iteration=iteration)
+    mpiutil.barrier()
+
+    with open(filename) as f:
+        lines = f.readlines()
+    # one line for each process in each record
+    assert len(lines) == 2 * mpiutil.size
+    recs = [ json.loads(line, object_pairs_hook=collections.OrderedDict) for line in lines ]
+    fields = [ 'run', 'task', 'prefix', 'stage', 'iteration', 'rank', 'nproc', 'host', 'start', 'wall_time', 'cpu_time', 'peak_rss' ] + list(telemetry.COUNTERS)
+    for ri, rec in enumerate(recs):
+        assert list(rec.keys()) == fields
+        # the run id of rank 0
+        assert rec['run'] == 'run0'
+        assert rec['task'] == '%s._Task' % __name__
+        assert rec['prefix'] == 'tt_'
+        assert rec['stage'] == 'next'
+        assert rec['iteration'] == ri // mpiutil.size
+        assert rec['rank'] == ri % mpiutil.size
+        assert rec['nproc'] == mpiutil.size
+        assert rec['wall_time'] >= 0 and rec['cpu_time'] >= 0 and rec['peak_rss'] > 0
+        # the differences of the counters over the stage
+        assert rec['bytes_read'] == 100 * (rec['rank'] + 1)
+        assert rec['bytes_gathered'] == 7
+        assert rec['bytes_written'] == 0
+
+
+def test_enable_disable(monkeypatch):
+    calls = []
+
+    def barrier(comm=None):
+        calls.append(comm)
+        time.sleep(0.01)
+
+    monkeypatch.setattr(mpiutil, 'barrier', barrier)
+    before = telemetry.counters().get('barrier_time', 0)
+
+    telemetry.enable()
+    try:
+        wrapper = mpiutil.barrier
+        assert wrapper is not barrier
+        # enabled only once
+        telemetry.enable()
+        assert mpiutil.barrier is wrapper
+
+        mpiutil.barrier()
+        assert calls == [ mpiutil.world ]
+        assert telemetry.counters()['barrier_time'] - before >= 0.01
+    finally:
+        telemetry.disable()
+
+    assert mpiutil.barrier is barrier
+    # not counted once disabled
+    before = telemetry.counters()['barrier_time']
+    mpiutil.barrier()
+    assert telemetry.counters()['barrier_time'] == before
+    # disabling again does nothing
+    telemetry.disable()
+    assert mpiutil.barrier is barrier